@@ -2,8 +2,13 @@ import subprocess
 import os
 from datetime import datetime
 
+from utils.checksum import checksum_file
+from utils.pipeline import DEFAULT_CHUNK_SIZE, iter_process
+from utils.throttle import APPLICATION_NAME
+
 class FullBackup:
-    def __init__(self, db_type, db_name, output_dir, db_user, db_password):
+    def __init__(self, db_type, db_name, output_dir, db_user, db_password, db_host="localhost", db_port=None,
+                 dump_args=()):
         """
         Initialize the FullBackup class.
 
@@ -12,28 +17,68 @@ class FullBackup:
         :param output_dir: Directory to save the backup file.
         :param db_user: Database username.
         :param db_password: Database password.
+        :param db_host: Database host.
+        :param db_port: Database port, or None for the tool's default.
+        :param dump_args: Additional options for every dump (e.g. --master-data=2).
         """
         self.db_type = db_type
         self.db_name = db_name
         self.output_dir = output_dir
         self.db_user = db_user
         self.db_password = db_password
+        self.db_host = db_host
+        self.db_port = db_port
+        self.dump_args = tuple(dump_args)
 
-    def backup(self):
+    def backup_filename(self):
+        """Generates a timestamped filename for the uncompressed dump."""
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        backup_file = os.path.join(self.output_dir, f"{self.db_name}_full_{timestamp}.sql")
-        
+        return f"{self.db_name}_full_{timestamp}.sql"
+
+    def dump_command(self, extra_args=()):
+        """
+        Builds the dump command for the configured database type.
+
+        The password is passed through the environment rather than the
+        command line so it does not show up in the process list.
+
+        :param extra_args: Additional options for the dump tool (e.g. --table).
+        :return: Tuple of (argument list, environment).
+        """
+        env = dict(os.environ)
         if self.db_type == "mysql":
             # Use mysqldump to create a backup
-            command = f"mysqldump --user={self.db_user} --password={self.db_password} {self.db_name} > {backup_file}"
+            command = ["mysqldump", f"--host={self.db_host}", f"--user={self.db_user}"]
+            if self.db_port:
+                command.append(f"--port={self.db_port}")
+            command.extend(self.dump_args + tuple(extra_args))
+            command.append(self.db_name)
+            env["MYSQL_PWD"] = self.db_password or ""
         elif self.db_type == "postgresql":
             # Use pg_dump to create a backup for PostgreSQL
-            command = f"pg_dump --host=localhost --username={self.db_user} --password={self.db_password} --dbname={self.db_name} --file={backup_file}"
-
+            command = ["pg_dump", f"--host={self.db_host}", f"--username={self.db_user}", "--no-password"]
+            if self.db_port:
+                command.append(f"--port={self.db_port}")
+            command.extend(self.dump_args + tuple(extra_args))
+            command.append(f"--dbname={self.db_name}")
+            env["PGPASSWORD"] = self.db_password or ""
+            env["PGAPPNAME"] = APPLICATION_NAME
         else:
             raise ValueError(f"Unsupported database type: {self.db_type}")
+        return command, env
+
+    def iter_dump(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Streams the dump tool's output in chunks without writing a file."""
+        command, env = self.dump_command()
+        return iter_process(command, env=env, chunk_size=chunk_size)
+
+    def backup(self):
+        backup_file = os.path.join(self.output_dir, self.backup_filename())
+        command, env = self.dump_command()
         try:
-            subprocess.run(command, shell=True, check=True)
+            with open(backup_file, "wb") as f:
+                subprocess.run(command, stdout=f, env=env, check=True)
         except subprocess.CalledProcessError as e:
             raise RuntimeError(f"Failed to execute: {e}")
-        return backup_file
\ No newline at end of file
+        checksum_file(backup_file)
+        return backup_file
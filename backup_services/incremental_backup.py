@@ -0,0 +1,241 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+import time
+from datetime import datetime
+
+from backup_services.sqlite_backup import consistent_snapshot
+from utils.checksum import checksum_file
+from utils.defaults import BACKUP_TYPES
+
+HASH_SIZE = 16
+MANIFEST_FILE = "manifest.json"
+HASHES_FILE = "hashes.bin"
+PAGES_FILE = "pages.gz"
+
+_PAGE_HEADER = struct.Struct(">I")
+
+
+def _hash_page(page):
+    return hashlib.blake2b(page, digest_size=HASH_SIZE).digest()
+
+
+def read_manifest(backup_path):
+    with open(os.path.join(backup_path, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def _read_hashes(backup_path):
+    with open(os.path.join(backup_path, HASHES_FILE), "rb") as f:
+        data = f.read()
+    return [data[i:i + HASH_SIZE] for i in range(0, len(data), HASH_SIZE)]
+
+
+class SQLiteIncrementalBackup:
+    """
+    Page-level full, incremental and differential backups of a SQLite database.
+
+    Every backup is a directory holding a manifest, the hash of every page in
+    the database (the page hash index) and a gzip stream of the pages that
+    changed. A full backup stores every page; an incremental stores the pages
+    that differ from the most recent backup of any type; a differential
+    stores the pages that differ from the most recent full backup. Unchanged
+    pages are only hashed, never written.
+
+    :param db_path: Path to the SQLite database file.
+    :param output_dir: Directory holding the backup chain.
+    :param connection: Already-open connection to reuse (e.g. SQLiteConnector.connection).
+    :param level: gzip level for the page stream.
+    :param throttle: Optional Throttle limiting how fast the database file is read.
+    :param catalog: Optional BackupCatalog; parents are then looked up in it
+        instead of by reading every manifest in output_dir, and new backups
+        are recorded in it.
+    :param name: Name of the database in backup names, manifests and the
+        catalog; defaults to its file name.
+    :param db_file: Database file held open with connection (SQLiteConnector.db_file),
+        which pages are read through; see consistent_snapshot().
+    """
+
+    def __init__(self, db_path, output_dir, connection=None, level=6, throttle=None, catalog=None, name=None,
+                 db_file=None):
+        self.db_path = db_path
+        self.output_dir = output_dir
+        self.connection = connection
+        self.level = level
+        self.throttle = throttle
+        self.catalog = catalog
+        self.db_name = name or os.path.basename(db_path)
+        self.db_file = db_file
+        self.stats = {}
+
+    def list_backups(self):
+        """Returns (path, manifest) pairs for this database, oldest first."""
+        backups = []
+        if not os.path.isdir(self.output_dir):
+            return backups
+        for name in os.listdir(self.output_dir):
+            path = os.path.join(self.output_dir, name)
+            if not os.path.isfile(os.path.join(path, MANIFEST_FILE)):
+                continue
+            manifest = read_manifest(path)
+            if manifest.get("db") == self.db_name:
+                backups.append((path, manifest))
+        return sorted(backups, key=lambda backup: backup[1]["created"])
+
+    def _find_parent(self, backup_type):
+        if self.catalog is not None:
+            parent = self.catalog.latest(self.db_name, backup_type="full" if backup_type == "differential" else None,
+                                         backup_format="pages")
+            # The catalog may cover other directories; only a chain in output_dir can be extended
+            if parent is not None and os.path.isdir(parent["location"]) \
+                    and os.path.samefile(os.path.dirname(parent["location"]), self.output_dir):
+                return parent["location"]
+            # Chains started before the catalog existed are found by scanning the directory
+        backups = self.list_backups()
+        if backup_type == "differential":
+            backups = [backup for backup in backups if backup[1]["type"] == "full"]
+        return backups[-1][0] if backups else None
+
+    def backup(self, backup_type="incremental"):
+        """
+        Creates a backup of the given type.
+
+        Incremental and differential backups fall back to a full backup when
+        no suitable parent exists yet.
+
+        :return: Path of the new backup directory.
+        """
+        if backup_type not in BACKUP_TYPES:
+            raise ValueError(f"Unsupported backup type: {backup_type}")
+        parent_path = None if backup_type == "full" else self._find_parent(backup_type)
+        if parent_path is None:
+            backup_type = "full"
+            parent_hashes = []
+        else:
+            parent_hashes = _read_hashes(parent_path)
+
+        created = datetime.now()
+        name = f"{self.db_name}_{backup_type}_{created.strftime('%Y%m%d%H%M%S%f')}"
+        backup_path = os.path.join(self.output_dir, name)
+        temp_path = backup_path + ".part"
+        os.makedirs(temp_path)
+
+        started = time.perf_counter()
+        # Opened before and closed after this backup's own connection; see consistent_snapshot()
+        db_file = self.db_file or open(self.db_path, "rb")
+        connection = self.connection or sqlite3.connect(self.db_path)
+        try:
+            with consistent_snapshot(connection, self.db_path, db_file) as snapshot:
+                page_size = snapshot.page_size
+                hashes, changed = self._write_pages(temp_path, snapshot, parent_hashes)
+        except BaseException:
+            for file_name in os.listdir(temp_path):
+                os.remove(os.path.join(temp_path, file_name))
+            os.rmdir(temp_path)
+            raise
+        finally:
+            if connection is not self.connection:
+                connection.close()
+            if db_file is not self.db_file:
+                db_file.close()
+
+        with open(os.path.join(temp_path, HASHES_FILE), "wb") as f:
+            f.write(b"".join(hashes))
+        self.stats = {
+            "pages": len(hashes),
+            "changed_pages": changed,
+            "seconds": round(time.perf_counter() - started, 6),
+        }
+        manifest = {
+            "db": self.db_name,
+            "type": backup_type,
+            "created": created.isoformat(),
+            "page_size": page_size,
+            "page_count": len(hashes),
+            "changed_pages": changed,
+            "parent": os.path.basename(parent_path) if parent_path else None,
+            "hash": "blake2b-128",
+        }
+        with open(os.path.join(temp_path, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=2)
+        for file_name in (PAGES_FILE, HASHES_FILE, MANIFEST_FILE):
+            checksum_file(os.path.join(temp_path, file_name))
+        os.replace(temp_path, backup_path)
+        if self.catalog is not None:
+            self.catalog.record(backup_path, self.db_name, "sqlite")
+        return backup_path
+
+    def _write_pages(self, backup_path, snapshot, parent_hashes):
+        hashes = []
+        changed = 0
+        page_size = snapshot.page_size
+        with gzip.open(os.path.join(backup_path, PAGES_FILE), "wb", compresslevel=self.level) as pages_file:
+            page_number = 0
+            for data in snapshot.iter_chunks(1024 * 1024):
+                if self.throttle is not None:
+                    self.throttle.throttle(len(data), ops=len(data) // page_size)
+                view = memoryview(data)
+                for offset in range(0, len(data), page_size):
+                    page = view[offset:offset + page_size]
+                    digest = _hash_page(page)
+                    hashes.append(digest)
+                    if page_number >= len(parent_hashes) or parent_hashes[page_number] != digest:
+                        pages_file.write(_PAGE_HEADER.pack(page_number))
+                        pages_file.write(page)
+                        changed += 1
+                    page_number += 1
+        return hashes, changed
+
+
+def backup_chain(backup_path):
+    """Returns the backup paths needed to restore backup_path, full backup first."""
+    chain = []
+    path = backup_path
+    while path is not None:
+        manifest = read_manifest(path)
+        chain.append(path)
+        if manifest["type"] == "full":
+            break
+        if manifest["parent"] is None:
+            raise ValueError(f"Backup {path} has no parent")
+        path = os.path.join(os.path.dirname(path), manifest["parent"])
+    return list(reversed(chain))
+
+
+def restore_chain(backup_path, output_file, verify=True):
+    """
+    Rebuilds the exact database file captured by backup_path.
+
+    Applies the pages of the full backup, then each incremental or
+    differential backup in the chain, and truncates the file to the
+    recorded page count.
+
+    :raises ValueError: If verification against the page hash index fails.
+    """
+    manifest = read_manifest(backup_path)
+    page_size = manifest["page_size"]
+    temp_file = output_file + ".part"
+    with open(temp_file, "wb") as out:
+        for path in backup_chain(backup_path):
+            with gzip.open(os.path.join(path, PAGES_FILE), "rb") as pages_file:
+                while True:
+                    header = pages_file.read(_PAGE_HEADER.size)
+                    if not header:
+                        break
+                    (page_number,) = _PAGE_HEADER.unpack(header)
+                    out.seek(page_number * page_size)
+                    out.write(pages_file.read(page_size))
+        out.truncate(manifest["page_count"] * page_size)
+
+    if verify:
+        expected = _read_hashes(backup_path)
+        with open(temp_file, "rb") as f:
+            for page_number, digest in enumerate(expected):
+                if _hash_page(f.read(page_size)) != digest:
+                    os.remove(temp_file)
+                    raise ValueError(f"Restored page {page_number} does not match the backup's page hash index")
+    os.replace(temp_file, output_file)
+    return output_file
@@ -0,0 +1,236 @@
+import math
+
+from utils.defaults import DEFAULT_CHUNK_ROWS
+
+DEFAULT_BATCH_ROWS = 1000
+DEFAULT_MAX_STATEMENT_BYTES = 1024 * 1024
+OUTPUT_CHUNK_BYTES = 1024 * 1024
+
+# Server error for a statement it does not know, e.g. SHOW MASTER STATUS on MySQL 8.4
+ER_PARSE_ERROR = 1064
+# Routine, trigger and event bodies contain ';', so the statements recreating them end with this instead
+OBJECT_DELIMITER = ";;"
+
+INTEGER_TYPES = ("tinyint", "smallint", "mediumint", "int", "integer", "bigint")
+
+
+def quote_mysql(identifier):
+    return "`" + identifier.replace("`", "``") + "`"
+
+
+def open_snapshot_connections(connector, count):
+    """
+    Opens count connections that all see the same consistent snapshot.
+
+    ``FLUSH TABLES WITH READ LOCK`` is held on the connector's own
+    connection only while each new connection starts its transaction.
+    The binlog coordinates are read under the same lock, so they mark
+    the snapshot's position for a later binlog replay.
+
+    :return: Tuple of (list of connected connectors, (binlog file,
+        position) or None if binary logging is off or unreadable); the caller
+        disconnects the connectors.
+    """
+    coordinator = connector.connection.cursor()
+    connectors = []
+    # Blocks writes only while the worker transactions are being started
+    coordinator.execute("FLUSH TABLES WITH READ LOCK")
+    try:
+        for _ in range(count):
+            worker = type(connector)(connector.host, connector.port, connector.user, connector.password,
+                                     connector.database)
+            if not worker.connect():
+                raise RuntimeError("Failed to open a MySQL worker connection")
+            connectors.append(worker)
+            cursor = worker.connection.cursor()
+            cursor.execute("SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+            cursor.close()
+        binlog = binlog_coordinates(coordinator)
+    except BaseException:
+        for worker in connectors:
+            worker.disconnect()
+        raise
+    finally:
+        coordinator.execute("UNLOCK TABLES")
+        coordinator.close()
+    return connectors, binlog
+
+
+def binlog_coordinates(cursor):
+    """
+    Returns the server's current (binlog file, position), or None if binary
+    logging is off or the backup user may not read it (REPLICATION CLIENT
+    is only needed for --binlog-position, so its absence must not fail a
+    dump).
+    """
+    import pymysql.err
+
+    try:
+        try:
+            cursor.execute("SHOW MASTER STATUS")
+        except pymysql.err.ProgrammingError as e:
+            # MySQL 8.4 only knows the new name; other errors (privileges) are not retried
+            if e.args[0] != ER_PARSE_ERROR:
+                raise
+            cursor.execute("SHOW BINARY LOG STATUS")
+        row = cursor.fetchone()
+    except (pymysql.err.OperationalError, pymysql.err.ProgrammingError):
+        return None
+    return (row[0], int(row[1])) if row else None
+
+
+def integer_primary_key(cursor, database, table):
+    """Returns the table's primary key column if it is a single integer column, else None."""
+    cursor.execute(
+        "SELECT k.column_name, c.data_type FROM information_schema.key_column_usage k "
+        "JOIN information_schema.columns c ON c.table_schema = k.table_schema "
+        "AND c.table_name = k.table_name AND c.column_name = k.column_name "
+        "WHERE k.table_schema = %s AND k.table_name = %s AND k.constraint_name = 'PRIMARY'",
+        (database, table),
+    )
+    columns = cursor.fetchall()
+    if len(columns) == 1 and columns[0][1].lower() in INTEGER_TYPES:
+        return columns[0][0]
+    return None
+
+
+def schema_objects(cursor, database):
+    """
+    Returns the statements recreating the database's stored routines,
+    views, triggers and events, each preceded by a DROP ... IF EXISTS.
+
+    Routines come first since views may call stored functions; triggers
+    and events come last, as they belong after the table data is loaded.
+
+    :raises RuntimeError: If the user may not read a routine's definition.
+    """
+    statements = []
+    cursor.execute("SELECT routine_type, routine_name FROM information_schema.routines "
+                   "WHERE routine_schema = %s ORDER BY routine_name", (database,))
+    for kind, name in cursor.fetchall():
+        cursor.execute(f"SHOW CREATE {kind} {quote_mysql(name)}")
+        definition = cursor.fetchone()[2]
+        if definition is None:
+            raise RuntimeError(f"Not allowed to read the definition of {kind.lower()} {name}")
+        statements += [f"DROP {kind} IF EXISTS {quote_mysql(name)}", definition]
+    cursor.execute("SELECT table_name FROM information_schema.views WHERE table_schema = %s ORDER BY table_name",
+                   (database,))
+    for (name,) in cursor.fetchall():
+        cursor.execute(f"SHOW CREATE VIEW {quote_mysql(name)}")
+        statements += [f"DROP VIEW IF EXISTS {quote_mysql(name)}", cursor.fetchone()[1]]
+    cursor.execute("SELECT trigger_name FROM information_schema.triggers WHERE trigger_schema = %s "
+                   "ORDER BY event_object_table, action_timing, event_manipulation, action_order", (database,))
+    for (name,) in cursor.fetchall():
+        cursor.execute(f"SHOW CREATE TRIGGER {quote_mysql(name)}")
+        statements += [f"DROP TRIGGER IF EXISTS {quote_mysql(name)}", cursor.fetchone()[2]]
+    cursor.execute("SELECT event_name FROM information_schema.events WHERE event_schema = %s ORDER BY event_name",
+                   (database,))
+    for (name,) in cursor.fetchall():
+        cursor.execute(f"SHOW CREATE EVENT {quote_mysql(name)}")
+        statements += [f"DROP EVENT IF EXISTS {quote_mysql(name)}", cursor.fetchone()[3]]
+    return statements
+
+
+def format_objects(statements):
+    """Writes schema_objects() statements as a script the mysql client can also run."""
+    script = "".join(f"{statement} {OBJECT_DELIMITER}\n" for statement in statements)
+    return f"DELIMITER {OBJECT_DELIMITER}\n{script}DELIMITER ;\n".encode()
+
+
+class MySQLTableExporter:
+    """
+    Streams MySQL tables as batched multi-row INSERT statements.
+
+    Rows are read through pymysql's unbuffered ``SSCursor``, so a table of
+    any size is exported in constant memory; the default buffered cursor
+    would load the whole result set first. Statements hold up to
+    batch_rows rows and never exceed max_statement_bytes, keeping them
+    under the server's max_allowed_packet on restore.
+
+    Tables with a single-column integer primary key are split into
+    primary-key ranges of about chunk_rows rows, so one table can be
+    exported by several workers at once.
+    """
+
+    def __init__(self, batch_rows=DEFAULT_BATCH_ROWS, max_statement_bytes=DEFAULT_MAX_STATEMENT_BYTES,
+                 chunk_rows=DEFAULT_CHUNK_ROWS):
+        self.batch_rows = batch_rows
+        self.max_statement_bytes = max_statement_bytes
+        self.chunk_rows = chunk_rows
+
+    def plan_parts(self, cursor, database, table, estimated_rows):
+        """
+        Splits a table into primary-key ranges.
+
+        :return: List of parts; each is a dict with "key" and "bounds"
+            (inclusive low/high) or, for unsplittable tables, None for both.
+        """
+        whole = [{"key": None, "bounds": None}]
+        if not estimated_rows or estimated_rows <= self.chunk_rows:
+            return whole
+        key = integer_primary_key(cursor, database, table)
+        if key is None:
+            return whole
+        cursor.execute(f"SELECT MIN({quote_mysql(key)}), MAX({quote_mysql(key)}) FROM {quote_mysql(table)}")
+        low, high = cursor.fetchone()
+        if low is None:
+            return whole
+        count = math.ceil(estimated_rows / self.chunk_rows)
+        width = max(1, math.ceil((high - low + 1) / count))
+        return [
+            {"key": key, "bounds": [start, min(start + width - 1, high)]}
+            for start in range(low, high + 1, width)
+        ]
+
+    def iter_inserts(self, connection, table, part=None, stats=None):
+        """
+        Yields the INSERT statements for a table or one part of it.
+
+        :param connection: pymysql connection, usually inside a snapshot transaction.
+        :param part: Part from plan_parts(); None exports the whole table.
+        :param stats: Optional dict that receives the exported row count.
+        """
+        import pymysql.cursors
+
+        quoted = quote_mysql(table)
+        query = f"SELECT * FROM {quoted}"
+        params = None
+        if part and part["bounds"]:
+            query += f" WHERE {quote_mysql(part['key'])} BETWEEN %s AND %s"
+            params = tuple(part["bounds"])
+        if stats is not None:
+            stats["rows"] = 0
+
+        prefix = f"INSERT INTO {quoted} VALUES ".encode()
+        output = bytearray(b"SET NAMES utf8mb4;\n")
+        values = []
+        values_bytes = 0
+        cursor = connection.cursor(pymysql.cursors.SSCursor)
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(self.batch_rows)
+                if not rows:
+                    break
+                if stats is not None:
+                    stats["rows"] += len(rows)
+                for row in rows:
+                    # surrogateescape round-trips the raw bytes pymysql puts in _binary literals
+                    value = connection.escape(row).encode("utf-8", "surrogateescape")
+                    if values and (len(values) >= self.batch_rows
+                                   or len(prefix) + values_bytes + len(value) + 2 > self.max_statement_bytes):
+                        output += prefix + b",".join(values) + b";\n"
+                        values = []
+                        values_bytes = 0
+                    values.append(value)
+                    values_bytes += len(value) + 1
+                if len(output) >= OUTPUT_CHUNK_BYTES:
+                    yield bytes(output)
+                    output = bytearray()
+            if values:
+                output += prefix + b",".join(values) + b";\n"
+            if output:
+                yield bytes(output)
+        finally:
+            cursor.close()
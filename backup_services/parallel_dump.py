@@ -0,0 +1,289 @@
+import json
+import os
+import queue
+import re
+import shutil
+import time
+from contextlib import nullcontext
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from backup_services.full_backup import FullBackup
+from backup_services.mysql_export import (MySQLTableExporter, format_objects, open_snapshot_connections, quote_mysql,
+                                          schema_objects)
+from storages.local_storage import LocalStorage
+from utils.compression import GzipCompressor, NullCompressor
+from utils.defaults import CONTAINER_EXTENSION
+from utils.pipeline import StreamingPipeline, iter_process
+
+DEFAULT_WORKERS = 4
+MANIFEST_FILE = "manifest.json"
+
+
+def table_filename(name, extension, kind="sql"):
+    return re.sub(r"[^\w.-]", "_", name) + "." + kind + extension
+
+
+def quote_postgresql(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def postgresql_tables(cursor, include_partitioned=True):
+    """
+    Returns (schema, table, total size in bytes) for every user table.
+
+    :param include_partitioned: Also return partitioned parents, which hold
+        no rows themselves.
+    """
+    relkinds = "('r', 'p')" if include_partitioned else "('r')"
+    cursor.execute(
+        "SELECT n.nspname, c.relname, pg_total_relation_size(c.oid) "
+        "FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        f"WHERE c.relkind IN {relkinds} AND n.nspname NOT IN ('pg_catalog', 'information_schema') "
+        "AND n.nspname NOT LIKE 'pg_toast%'"
+    )
+    return cursor.fetchall()
+
+
+class ParallelDump:
+    """
+    Dumps every table of a MySQL or PostgreSQL database concurrently.
+
+    All workers read from one consistent snapshot: PostgreSQL exports a
+    snapshot from the coordinating connection and passes it to each
+    ``pg_dump --snapshot`` worker; MySQL holds ``FLUSH TABLES WITH READ LOCK``
+    just long enough for every worker connection to start a transaction
+    with a consistent snapshot and reads rows in-process through a
+    MySQLTableExporter, which also splits large tables into primary-key
+    ranges; its views, routines, triggers and events are read with
+    SHOW CREATE into a post-data schema file. Tables are scheduled largest first so one big table does not
+    become the tail of the run.
+
+    The result is a directory with the schema, one compressed file per
+    table and a manifest describing them, or with container=True a single
+    random-access container holding the same files as entries and the
+    manifest in its index.
+
+    :param db_type: "mysql" or "postgresql".
+    :param connector: Connected MySQLConnector or PostgreSQLConnector.
+    :param output_dir: Directory in which the backup directory is created.
+    :param workers: Number of tables dumped concurrently.
+    :param compressor: Pipeline compressor; defaults to gzip.
+    :param table_exporter: MySQLTableExporter controlling batching and chunking.
+    :param container: Write a container file instead of a directory.
+    :param throttle: Optional Throttle shared by all workers.
+    :param metrics: Optional BackupMetrics receiving the stages of every table's pipeline.
+    :param pool: Optional ConnectionPool the connector came from; the worker
+        connections (or pg_dump processes) count against its per-host limit,
+        and fewer workers run when the host has fewer slots free.
+    """
+
+    def __init__(self, db_type, connector, output_dir, workers=DEFAULT_WORKERS, compressor=None,
+                 table_exporter=None, container=False, throttle=None, metrics=None, pool=None):
+        if db_type not in ("mysql", "postgresql"):
+            raise ValueError(f"Unsupported database type: {db_type}")
+        self.db_type = db_type
+        self.connector = connector
+        self.output_dir = output_dir
+        self.workers = workers
+        self.compressor = compressor or GzipCompressor()
+        self.table_exporter = table_exporter or MySQLTableExporter()
+        self.container = container
+        self.throttle = throttle
+        self.metrics = metrics
+        self.pool = pool
+        if container:
+            # The container compresses its own blocks; entries are streamed into it uncompressed
+            self.container_compressor, self.compressor = self.compressor, NullCompressor()
+
+    def backup_dirname(self):
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        return f"{self.connector.database}_parallel_{timestamp}"
+
+    def backup(self):
+        """
+        Runs the parallel dump.
+
+        :return: Path of the backup directory or container file.
+        """
+        started = time.perf_counter()
+        if self.container:
+            container = LocalStorage(self.output_dir).open_container(
+                self.backup_dirname() + CONTAINER_EXTENSION, self.container_compressor, threads=self.workers)
+            try:
+                manifest = self._backup(container)
+                self._describe(manifest, started)
+            except BaseException:
+                container.abort()
+                raise
+            return container.commit({"manifest": manifest})
+
+        backup_path = os.path.join(self.output_dir, self.backup_dirname())
+        temp_path = backup_path + ".part"
+        os.makedirs(temp_path)
+        try:
+            manifest = self._backup(LocalStorage(temp_path))
+        except BaseException:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise
+        self._describe(manifest, started)
+        with open(os.path.join(temp_path, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temp_path, backup_path)
+        return backup_path
+
+    def _backup(self, storage):
+        slots = nullcontext(self.workers) if self.pool is None else self.pool.reserve(self.connector, self.workers)
+        with slots as workers:
+            if self.db_type == "postgresql":
+                manifest = self._backup_postgresql(storage, workers)
+            else:
+                manifest = self._backup_mysql(storage, workers)
+        manifest["workers"] = workers
+        return manifest
+
+    def _describe(self, manifest, started):
+        manifest.update({
+            "db_type": self.db_type,
+            "database": self.connector.database,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "compression": self.compressor.name,
+            "seconds": round(time.perf_counter() - started, 3),
+        })
+
+    def _stream(self, storage, filename, source):
+        if self.throttle is not None:
+            source = self.throttle.iter_chunks(source)
+        pipeline = StreamingPipeline(source, storage.open(filename), self.compressor)
+        pipeline.run()
+        if self.metrics is not None:
+            self.metrics.add_pipeline(pipeline)
+        return {
+            "bytes_in": pipeline.stats["dump"].bytes_in,
+            "bytes_out": pipeline.stats["store"].bytes_out,
+        }
+
+    def _run_tables(self, tables, dump_table, workers):
+        """Dumps tables (or table parts) on workers threads, largest first, stopping at the first failure."""
+        tables.sort(key=lambda table: table["estimated_bytes"], reverse=True)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dump") as executor:
+            futures = [executor.submit(dump_table, table) for table in tables]
+            done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in pending:
+                future.cancel()
+            for future in done:
+                future.result()
+
+    def _worker_backup(self):
+        connector = self.connector
+        return FullBackup(self.db_type, connector.database, self.output_dir, connector.user, connector.password,
+                          db_host=connector.host, db_port=connector.port)
+
+    def _backup_postgresql(self, storage, workers):
+        connection = self.connector.connection
+        autocommit = connection.autocommit
+        connection.autocommit = True
+        cursor = connection.cursor()
+        try:
+            # The exported snapshot stays valid while this transaction is open
+            cursor.execute("BEGIN ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            cursor.execute("SELECT pg_export_snapshot()")
+            snapshot = cursor.fetchone()[0]
+            tables = [
+                {
+                    "name": f"{schema}.{table}",
+                    "file": table_filename(f"{schema}.{table}", self.compressor.extension),
+                    "estimated_bytes": size,
+                    "quoted": f"{quote_postgresql(schema)}.{quote_postgresql(table)}",
+                }
+                for schema, table, size in postgresql_tables(cursor)
+            ]
+
+            backup = self._worker_backup()
+            schema_files = {}
+            for section in ("pre-data", "post-data"):
+                filename = f"schema-{section}.sql{self.compressor.extension}"
+                command, env = backup.dump_command([f"--section={section}", f"--snapshot={snapshot}"])
+                self._stream(storage, filename, iter_process(command, env=env))
+                schema_files[section] = filename
+
+            def dump_table(table):
+                started = time.perf_counter()
+                command, env = backup.dump_command(["--data-only", f"--snapshot={snapshot}", f"--table={table['quoted']}"])
+                table.update(self._stream(storage, table["file"], iter_process(command, env=env)))
+                table["seconds"] = round(time.perf_counter() - started, 3)
+
+            self._run_tables(tables, dump_table, workers)
+        finally:
+            cursor.execute("ROLLBACK")
+            cursor.close()
+            connection.autocommit = autocommit
+
+        for table in tables:
+            del table["quoted"]
+        return {"snapshot": snapshot, "schema": schema_files, "tables": tables}
+
+    def _backup_mysql(self, storage, workers):
+        connectors, binlog = open_snapshot_connections(self.connector, workers)
+        try:
+            cursor = connectors[0].connection.cursor()
+            cursor.execute(
+                "SELECT table_name, COALESCE(data_length, 0) + COALESCE(index_length, 0), COALESCE(table_rows, 0) "
+                "FROM information_schema.tables WHERE table_schema = %s AND table_type = 'BASE TABLE'",
+                (self.connector.database,),
+            )
+            tables = [
+                {"name": name, "estimated_bytes": size, "estimated_rows": rows}
+                for name, size, rows in cursor.fetchall()
+            ]
+            statements = ["SET FOREIGN_KEY_CHECKS=0;\n"]
+            parts = []
+            for table in tables:
+                cursor.execute(f"SHOW CREATE TABLE {quote_mysql(table['name'])}")
+                statements.append(f"DROP TABLE IF EXISTS {quote_mysql(table['name'])};\n")
+                statements.append(cursor.fetchone()[1] + ";\n")
+                table["parts"] = self.table_exporter.plan_parts(cursor, self.connector.database, table["name"],
+                                                                table["estimated_rows"])
+                for number, part in enumerate(table["parts"]):
+                    kind = f"part{number:04d}.sql" if len(table["parts"]) > 1 else "sql"
+                    part["file"] = table_filename(table["name"], self.compressor.extension, kind=kind)
+                    part["estimated_bytes"] = table["estimated_bytes"] // len(table["parts"])
+                    part["table"] = table["name"]
+                    parts.append(part)
+            objects = schema_objects(cursor, self.connector.database)
+            cursor.close()
+            schema_files = {"pre-data": f"schema.sql{self.compressor.extension}",
+                            "post-data": f"schema-post-data.sql{self.compressor.extension}"}
+            self._stream(storage, schema_files["pre-data"], ["".join(statements).encode()])
+            self._stream(storage, schema_files["post-data"], [format_objects(objects)])
+
+            available = queue.Queue()
+            for connector in connectors:
+                available.put(connector.connection)
+
+            def dump_part(part):
+                started = time.perf_counter()
+                connection = available.get()
+                try:
+                    source = self.table_exporter.iter_inserts(connection, part["table"], part, stats=part)
+                    part.update(self._stream(storage, part["file"], source))
+                finally:
+                    available.put(connection)
+                part["seconds"] = round(time.perf_counter() - started, 3)
+
+            # Parts of one table are scheduled independently, so a huge table is spread over workers
+            self._run_tables(parts, dump_part, workers)
+        finally:
+            for connector in connectors:
+                connector.connection.rollback()
+                connector.disconnect()
+
+        for table in tables:
+            table["rows"] = sum(part["rows"] for part in table["parts"])
+            for part in table["parts"]:
+                del part["table"]
+        manifest = {"schema": schema_files, "tables": tables}
+        if binlog is not None:
+            # Where archived binlogs resume when the backup is rolled forward
+            manifest["binlog"] = {"file": binlog[0], "position": binlog[1]}
+        return manifest
@@ -0,0 +1,177 @@
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+
+from backup_services.full_backup import FullBackup
+from backup_services.parallel_dump import MANIFEST_FILE, quote_postgresql, table_filename, postgresql_tables
+from storages.local_storage import LocalStorage
+from utils.compression import GzipCompressor, NullCompressor
+from utils.defaults import CONTAINER_EXTENSION
+from utils.pipeline import PushSource, StreamingPipeline, iter_process
+
+COPY_FORMATS = ("binary", "text")
+
+
+class PostgreSQLCopyExport:
+    """
+    In-process PostgreSQL exporter built on ``COPY ... TO STDOUT``.
+
+    Table data is read over the existing PostgreSQLConnector connection
+    and streamed straight into the compression/storage pipeline, so no
+    dump process is spawned for the data, nothing is formatted as SQL text
+    and no temporary file is written. The schema is captured separately
+    with ``pg_dump --section`` against the same exported snapshot; the
+    password is passed through the environment only.
+
+    :param connector: Connected PostgreSQLConnector.
+    :param output_dir: Directory in which the backup directory is created.
+    :param compressor: Pipeline compressor; defaults to gzip.
+    :param copy_format: "binary" (fastest) or "text".
+    :param container: Write a single random-access container instead of a directory.
+    :param throttle: Optional Throttle limiting the export.
+    :param metrics: Optional BackupMetrics receiving the stages of every table's pipeline.
+    """
+
+    def __init__(self, connector, output_dir, compressor=None, copy_format="binary", container=False,
+                 throttle=None, metrics=None):
+        if copy_format not in COPY_FORMATS:
+            raise ValueError(f"Unsupported COPY format: {copy_format}")
+        self.connector = connector
+        self.output_dir = output_dir
+        self.compressor = compressor or GzipCompressor()
+        self.copy_format = copy_format
+        self.container = container
+        self.throttle = throttle
+        self.metrics = metrics
+        if container:
+            # The container compresses its own blocks; entries are streamed into it uncompressed
+            self.container_compressor, self.compressor = self.compressor, NullCompressor()
+
+    def backup_dirname(self):
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        return f"{self.connector.database}_copy_{timestamp}"
+
+    def backup(self):
+        """
+        Exports the schema and every table.
+
+        :return: Path of the backup directory or container file.
+        """
+        started = time.perf_counter()
+        if self.container:
+            container = LocalStorage(self.output_dir).open_container(
+                self.backup_dirname() + CONTAINER_EXTENSION, self.container_compressor)
+            try:
+                manifest = self._export(container)
+                self._describe(manifest, started)
+            except BaseException:
+                container.abort()
+                raise
+            return container.commit({"manifest": manifest})
+
+        backup_path = os.path.join(self.output_dir, self.backup_dirname())
+        temp_path = backup_path + ".part"
+        os.makedirs(temp_path)
+        try:
+            manifest = self._export(LocalStorage(temp_path))
+        except BaseException:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise
+        self._describe(manifest, started)
+        with open(os.path.join(temp_path, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temp_path, backup_path)
+        return backup_path
+
+    def _describe(self, manifest, started):
+        manifest.update({
+            "db_type": "postgresql",
+            "database": self.connector.database,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "format": f"copy-{self.copy_format}",
+            "compression": self.compressor.name,
+            "seconds": round(time.perf_counter() - started, 3),
+        })
+
+    def _stream(self, storage, filename, source):
+        if self.throttle is not None:
+            source = self.throttle.iter_chunks(source)
+        pipeline = StreamingPipeline(source, storage.open(filename), self.compressor)
+        pipeline.run()
+        if self.metrics is not None:
+            self.metrics.add_pipeline(pipeline)
+        return pipeline
+
+    def _export(self, storage):
+        connection = self.connector.connection
+        autocommit = connection.autocommit
+        connection.autocommit = True
+        cursor = connection.cursor()
+        try:
+            cursor.execute("BEGIN ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            cursor.execute("SELECT pg_export_snapshot()")
+            snapshot = cursor.fetchone()[0]
+            schema_files = self._export_schema(storage, snapshot)
+            tables = []
+            for schema, table, size in sorted(postgresql_tables(cursor, include_partitioned=False)):
+                tables.append(self._export_table(storage, cursor, schema, table, size))
+        finally:
+            cursor.execute("ROLLBACK")
+            cursor.close()
+            connection.autocommit = autocommit
+        return {"snapshot": snapshot, "schema": schema_files, "tables": tables}
+
+    def _export_schema(self, storage, snapshot):
+        connector = self.connector
+        backup = FullBackup("postgresql", connector.database, self.output_dir, connector.user, connector.password,
+                            db_host=connector.host, db_port=connector.port)
+        schema_files = {}
+        for section in ("pre-data", "post-data"):
+            filename = f"schema-{section}.sql{self.compressor.extension}"
+            command, env = backup.dump_command([f"--section={section}", f"--snapshot={snapshot}"])
+            self._stream(storage, filename, iter_process(command, env=env))
+            schema_files[section] = filename
+        return schema_files
+
+    def _export_table(self, storage, cursor, schema, table, size):
+        started = time.perf_counter()
+        quoted = f"{quote_postgresql(schema)}.{quote_postgresql(table)}"
+        cursor.execute(
+            "SELECT attname FROM pg_attribute WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped "
+            "ORDER BY attnum",
+            (quoted,),
+        )
+        columns = [row[0] for row in cursor.fetchall()]
+        column_list = ", ".join(quote_postgresql(column) for column in columns)
+
+        name = f"{schema}.{table}"
+        filename = table_filename(name, self.compressor.extension, kind=f"copy-{self.copy_format}")
+        source = PushSource()
+        chunks = self.throttle.iter_chunks(source) if self.throttle is not None else source
+        pipeline = StreamingPipeline(chunks, storage.open(filename), self.compressor)
+        wait = pipeline.run_in_thread()
+        try:
+            cursor.copy_expert(f"COPY {quoted} ({column_list}) TO STDOUT (FORMAT {self.copy_format})", source)
+        except BaseException as e:
+            # If the pipeline broke first, wait() raises its error as the root cause
+            source.fail(e)
+            wait()
+            raise
+        try:
+            source.close()
+        finally:
+            wait()
+        if self.metrics is not None:
+            self.metrics.add_pipeline(pipeline)
+        return {
+            "name": name,
+            "file": filename,
+            "columns": columns,
+            "rows": cursor.rowcount,
+            "estimated_bytes": size,
+            "bytes_in": pipeline.stats["dump"].bytes_in,
+            "bytes_out": pipeline.stats["store"].bytes_out,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
@@ -1,16 +1,321 @@
-import shutil
 import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
 from datetime import datetime
 
+from backup_services.sqlite_online_backup import DEFAULT_PAGES_PER_STEP, DEFAULT_STEP_SLEEP, SQLiteOnlineBackup
+from backup_services.sqlite_wal import FRAME_HEADER, WAL_HEADER, parse_wal_header
+from utils.checksum import checksum_file
+from utils.pipeline import DEFAULT_CHUNK_SIZE, iter_file
+
+# Seconds consistent_snapshot() waits for another connection's write lock
+DEFAULT_LOCK_TIMEOUT = 30.0
+
+
 class SQLiteBackup:
-    def __init__(self, db_path, output_dir):
+    def __init__(self, db_path, output_dir, connection=None, pages_per_step=DEFAULT_PAGES_PER_STEP,
+                 step_sleep=DEFAULT_STEP_SLEEP, throttle=None, name=None, db_file=None):
+        """
+        Initialize the SQLiteBackup class.
+
+        :param db_path: Path to the SQLite database file.
+        :param output_dir: Directory to save the backup file.
+        :param connection: Already-open connection to reuse (e.g. SQLiteConnector.connection).
+        :param db_file: Database file held open with connection (SQLiteConnector.db_file),
+            which snapshots are read through; see consistent_snapshot().
+        :param pages_per_step: Pages copied per online backup step.
+        :param step_sleep: Seconds to sleep between online backup steps.
+        :param throttle: Optional Throttle limiting the page copy.
+        :param name: Name used in backup file names instead of the database's file name.
+        """
         self.db_path = db_path
+        self.name = name or os.path.basename(db_path)
         self.output_dir = output_dir
+        self.connection = connection
+        self.pages_per_step = pages_per_step
+        self.step_sleep = step_sleep
+        self.throttle = throttle
+        self.db_file = db_file
+        self.stats = {}
+        self.tables = None
 
-    def backup(self):
+    def backup_filename(self):
+        """Generates a timestamped filename for the backup copy."""
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        backup_file = os.path.join(self.output_dir, f"{os.path.basename(self.db_path)}_backup_{timestamp}.db")
-        
-        # Copy the SQLite database file to the backup location
-        shutil.copy2(self.db_path, backup_file)
-        return backup_file
\ No newline at end of file
+        return f"{self.name}_backup_{timestamp}.db"
+
+    def _copy_online(self, target_path):
+        connection = self.connection or sqlite3.connect(self.db_path)
+        try:
+            engine = SQLiteOnlineBackup(connection, self.pages_per_step, self.step_sleep, throttle=self.throttle)
+            self.stats = engine.copy_to(target_path)
+        finally:
+            if connection is not self.connection:
+                connection.close()
+
+    def backup(self):
+        backup_file = os.path.join(self.output_dir, self.backup_filename())
+
+        # Copy the live database page by page without blocking writers
+        self._copy_online(backup_file)
+        # SQLite writes the copy itself, so it is hashed afterwards while still in the page cache
+        checksum_file(backup_file)
+        return backup_file
+
+    def iter_snapshot(self, chunk_size=DEFAULT_CHUNK_SIZE, count_rows=False):
+        """
+        Takes an online snapshot now and returns an iterator over its bytes.
+
+        The snapshot is taken in the calling thread. In WAL mode its pages
+        are streamed straight from the database and the WAL (see
+        consistent_snapshot()); in rollback-journal mode, where a long read
+        would block writers, the online backup copies it into a private
+        temporary directory first, which is removed once the iterator is
+        exhausted or closed, or if the copy fails.
+
+        :param count_rows: Also count the rows of every table of the
+            snapshot into self.tables (see table_rows()).
+        """
+        stack = ExitStack()
+        try:
+            connection, db_file = self._open(stack)
+            wal_mode = connection.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+            if wal_mode:
+                snapshot = stack.enter_context(consistent_snapshot(connection, self.db_path, db_file))
+                if count_rows:
+                    self.tables = table_rows(connection)
+                return self._iter_stream(snapshot, chunk_size, stack)
+        except BaseException:
+            stack.close()
+            raise
+        stack.close()
+        temp_dir = tempfile.mkdtemp(prefix="sqlite-snapshot-")
+        snapshot_path = os.path.join(temp_dir, self.backup_filename())
+        try:
+            self._copy_online(snapshot_path)
+            if count_rows:
+                copy = sqlite3.connect(snapshot_path)
+                try:
+                    self.tables = table_rows(copy)
+                finally:
+                    copy.close()
+        except BaseException:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+        return _iter_and_remove(snapshot_path, temp_dir, chunk_size)
+
+    def _open(self, stack):
+        """
+        Opens a connection to take a snapshot with; stack closes it.
+
+        Without self.db_file the database file is opened as well, and closed
+        only after the connection.
+
+        :return: Tuple of (connection, open database file).
+        """
+        db_file = self.db_file
+        if db_file is None:
+            db_file = stack.enter_context(open(self.db_path, "rb"))
+        connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        stack.callback(connection.close)
+        return connection, db_file
+
+    def _iter_stream(self, snapshot, chunk_size, stack):
+        with stack:
+            for chunk in snapshot.iter_chunks(chunk_size):
+                if self.throttle is not None:
+                    self.throttle.throttle(len(chunk), ops=len(chunk) // snapshot.page_size)
+                yield chunk
+
+    def iter_pages(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Streams the database in whole pages as of one read transaction.
+
+        See consistent_snapshot() for how the pages stay consistent in both
+        rollback-journal and WAL mode.
+        """
+        with ExitStack() as stack:
+            connection, db_file = self._open(stack)
+            with consistent_snapshot(connection, self.db_path, db_file) as snapshot:
+                yield from snapshot.iter_chunks(chunk_size)
+
+
+def table_rows(connection):
+    """
+    Counts the rows of every table in the database, in the connection's current transaction.
+
+    :return: List of {"name", "rows"} in name order; rows is None for a
+        table that cannot be read (e.g. a virtual table whose module is not loaded).
+    """
+    names = [row[0] for row in connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+    tables = []
+    for name in names:
+        quoted = name.replace('"', '""')
+        try:
+            rows = connection.execute(f'SELECT count(*) FROM "{quoted}"').fetchone()[0]
+        except sqlite3.Error:
+            rows = None
+        tables.append({"name": name, "rows": rows})
+    return tables
+
+
+class DatabaseSnapshot:
+    """
+    The pages of a database as of one read transaction.
+
+    Pages written to the WAL before the transaction started are read from
+    the WAL, all others from the database file.
+
+    :param db_file: Open database file.
+    :param page_size: Page size in bytes.
+    :param page_count: Number of pages in the snapshot.
+    :param frames: {page number: offset of its newest page image in the WAL}.
+    :param wal_file: Open WAL file, or None when no page is read from it.
+    :param wal_position: Position just past the snapshot's last WAL frame,
+        in the form read_transactions() takes, or None if the snapshot
+        includes no WAL frame.
+    :param wal_checkpointed: Whether every frame of the snapshot was
+        already checkpointed, so a writer may restart the WAL at any time.
+    """
+
+    def __init__(self, db_file, page_size, page_count, frames=None, wal_file=None, wal_position=None,
+                 wal_checkpointed=True):
+        self.db_file = db_file
+        self.page_size = page_size
+        self.page_count = page_count
+        self.frames = frames or {}
+        self.wal_file = wal_file
+        self.wal_position = wal_position
+        self.wal_checkpointed = wal_checkpointed
+
+    def iter_chunks(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Yields the snapshot in chunks of whole pages."""
+        page_size = self.page_size
+        pages_per_chunk = max(1, chunk_size // page_size)
+        db_fd = self.db_file.fileno()
+        for first in range(1, self.page_count + 1, pages_per_chunk):
+            last = min(first + pages_per_chunk, self.page_count + 1)
+            chunk = bytearray(os.pread(db_fd, (last - first) * page_size, (first - 1) * page_size))
+            # Pages past the end of the file only exist in the WAL
+            chunk.extend(bytes((last - first) * page_size - len(chunk)))
+            for page_number in range(first, last):
+                offset = self.frames.get(page_number)
+                if offset is not None:
+                    start = (page_number - first) * page_size
+                    chunk[start:start + page_size] = os.pread(self.wal_file.fileno(), page_size, offset)
+            yield bytes(chunk)
+
+
+@contextmanager
+def consistent_snapshot(connection, db_path, db_file, end_transaction=True, timeout=DEFAULT_LOCK_TIMEOUT):
+    """
+    Starts a read transaction on connection and yields a DatabaseSnapshot of it.
+
+    In rollback-journal mode the transaction's shared lock keeps writers
+    from committing, so the database file is the snapshot. In WAL mode
+    nothing is waited for but the write lock, taken by a second connection
+    just long enough to start the read transaction and look up how far the
+    WAL reaches. A passive checkpoint reports that (and how much of it is
+    already in the database file) without waiting for readers; SQLite never
+    checkpoints past an active reader's snapshot, so pages in the rest of
+    the WAL are read from the WAL and all others from the database file.
+
+    :param db_file: Database file the pages are read from. Closing any
+        descriptor of a file drops all of the process's POSIX locks on it,
+        SQLite's included, so the caller keeps it open for as long as its
+        connections to the database, e.g. SQLiteConnector.db_file.
+    :param end_transaction: Roll the read transaction back on exit; False
+        leaves it to the caller, e.g. to keep the WAL from restarting.
+    :param timeout: Seconds to wait for the write lock.
+    :raises RuntimeError: If another connection held the write lock, or
+        kept checkpointing, for longer than timeout.
+    """
+    wal_mode = connection.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+    wal_file = None
+    try:
+        position = None
+        log = checkpointed = 0
+        if wal_mode:
+            blocker = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+            try:
+                try:
+                    blocker.execute("BEGIN IMMEDIATE")
+                except sqlite3.OperationalError as e:
+                    raise RuntimeError(f"Could not get a consistent read of {db_path}: another connection held "
+                                       f"the write lock for over {timeout}s ({e})") from e
+                connection.execute("BEGIN")
+                connection.execute("SELECT count(*) FROM sqlite_master").fetchone()
+                log, checkpointed = _wal_extent(db_path, timeout)
+                if log:
+                    # Read while writers are held off: once everything is checkpointed one may restart the WAL
+                    wal_file = open(db_path + "-wal", "rb")
+                    position = _wal_position(wal_file, log)
+            finally:
+                blocker.close()
+        else:
+            connection.execute("BEGIN")
+            connection.execute("SELECT count(*) FROM sqlite_master").fetchone()
+        try:
+            page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+            page_count = connection.execute("PRAGMA page_count").fetchone()[0]
+            frames = {}
+            if checkpointed < log:
+                frames = _wal_frames(wal_file, page_size, checkpointed, log)
+            yield DatabaseSnapshot(db_file, page_size, page_count, frames, wal_file, position,
+                                   wal_checkpointed=checkpointed == log)
+        finally:
+            if end_transaction and connection.in_transaction:
+                connection.rollback()
+    finally:
+        if wal_file is not None:
+            wal_file.close()
+
+
+def _wal_extent(db_path, timeout, retry_delay=0.05):
+    """Returns (frames in the WAL, frames of it checkpointed) from a passive checkpoint."""
+    checkpointer = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            _, log, checkpointed = checkpointer.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+            # -1 while another connection is checkpointing
+            if log >= 0:
+                return log, checkpointed
+            if time.monotonic() >= deadline:
+                raise RuntimeError(f"Could not get a consistent read of {db_path}: another connection kept "
+                                   f"checkpointing for over {timeout}s")
+            time.sleep(retry_delay)
+    finally:
+        checkpointer.close()
+
+
+def _wal_position(wal_file, frame):
+    """Returns the read_transactions() position just past the given WAL frame."""
+    header = parse_wal_header(os.pread(wal_file.fileno(), WAL_HEADER.size, 0))
+    frame_size = FRAME_HEADER.size + header["page_size"]
+    offset = WAL_HEADER.size + (frame - 1) * frame_size
+    frame_header = FRAME_HEADER.unpack(os.pread(wal_file.fileno(), FRAME_HEADER.size, offset))
+    return dict(header, checksum=frame_header[4:6], offset=offset + frame_size)
+
+
+def _wal_frames(wal_file, page_size, first, last):
+    """Maps each page written in WAL frames first+1..last to the offset of its newest image."""
+    frames = {}
+    frame_size = FRAME_HEADER.size + page_size
+    fd = wal_file.fileno()
+    for frame in range(first, last):
+        offset = WAL_HEADER.size + frame * frame_size
+        page_number = FRAME_HEADER.unpack(os.pread(fd, FRAME_HEADER.size, offset))[0]
+        frames[page_number] = offset + FRAME_HEADER.size
+    return frames
+
+
+def _iter_and_remove(path, temp_dir, chunk_size):
+    try:
+        yield from iter_file(path, chunk_size)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
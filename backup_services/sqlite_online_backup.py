@@ -0,0 +1,94 @@
+import os
+import sqlite3
+import time
+
+from utils.defaults import DEFAULT_PAGES_PER_STEP, DEFAULT_STEP_SLEEP
+
+DEFAULT_MAX_RESTARTS = 10
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+class SQLiteOnlineBackup:
+    """
+    Online backup engine built on the sqlite3 backup API.
+
+    The source is copied a few pages at a time and the read lock is released
+    between steps, so writers are only blocked for the duration of a single
+    step. When another connection writes to the source mid-copy, SQLite
+    restarts the copy from the first page; after ``max_restarts`` restarts
+    the remaining copy is finished in a single step so the backup always
+    terminates.
+
+    :param connection: Open sqlite3 connection to the source database.
+    :param pages_per_step: Number of pages copied per step (-1 copies all at once).
+    :param step_sleep: Seconds to sleep between steps to leave room for writers.
+    :param max_restarts: Restarts tolerated before finishing in one step.
+    :param throttle: Optional Throttle; each step counts its pages as read operations.
+    """
+
+    def __init__(self, connection, pages_per_step=DEFAULT_PAGES_PER_STEP, step_sleep=DEFAULT_STEP_SLEEP,
+                 max_restarts=DEFAULT_MAX_RESTARTS, throttle=None):
+        if pages_per_step == 0:
+            raise ValueError("pages_per_step must be positive or -1")
+        self.connection = connection
+        self.pages_per_step = pages_per_step
+        self.step_sleep = step_sleep
+        self.max_restarts = max_restarts
+        self.throttle = throttle
+        self.stats = {}
+
+    def copy_to(self, target_path):
+        """
+        Copies the source database to target_path.
+
+        The copy is written to a temporary file and renamed into place once
+        complete.
+
+        :return: Dictionary with pages, steps, restarts and seconds.
+        """
+        temp_path = target_path + ".part"
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        stats = {"pages": 0, "steps": 0, "restarts": 0, "seconds": 0.0}
+        last_remaining = [None]
+        page_size = self.connection.execute("PRAGMA page_size").fetchone()[0] if self.throttle else 0
+
+        def progress(status, remaining, total):
+            stats["steps"] += 1
+            stats["pages"] = total
+            copied = total - remaining if last_remaining[0] is None else last_remaining[0] - remaining
+            if last_remaining[0] is not None and remaining > last_remaining[0]:
+                # The source was modified by another connection and SQLite
+                # started over from the first page
+                stats["restarts"] += 1
+                if stats["restarts"] > self.max_restarts:
+                    raise _TooManyRestarts()
+                copied = total - remaining
+            last_remaining[0] = remaining
+            if self.throttle is not None and remaining:
+                # Called between steps, so no lock on the source is held while waiting
+                self.throttle.throttle(copied * page_size, ops=copied)
+            if remaining and self.step_sleep:
+                time.sleep(self.step_sleep)
+
+        started = time.perf_counter()
+        target = sqlite3.connect(temp_path)
+        try:
+            try:
+                self.connection.backup(target, pages=self.pages_per_step, progress=progress)
+            except _TooManyRestarts:
+                # Give up on stepping and copy the rest under a single lock
+                self.connection.backup(target, pages=-1)
+            target.close()
+            os.replace(temp_path, target_path)
+        except BaseException:
+            target.close()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        stats["seconds"] = time.perf_counter() - started
+        self.stats = stats
+        return stats
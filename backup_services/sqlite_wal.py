@@ -0,0 +1,92 @@
+import struct
+
+# Low bit of the magic number set: checksums are computed on big-endian words
+WAL_MAGIC = 0x377F0682
+WAL_HEADER = struct.Struct(">8I")
+FRAME_HEADER = struct.Struct(">6I")
+
+
+def wal_checksum(data, s0=0, s1=0, big_endian=True):
+    """Continues SQLite's cumulative WAL checksum over data (a multiple of 8 bytes)."""
+    count = len(data) // 4
+    words = struct.unpack(f"{'>' if big_endian else '<'}{count}I", data)
+    for i in range(0, count, 2):
+        s0 = (s0 + words[i] + s1) & 0xFFFFFFFF
+        s1 = (s1 + words[i + 1] + s0) & 0xFFFFFFFF
+    return s0, s1
+
+
+def parse_wal_header(data):
+    """
+    Parses the 32-byte header of a WAL file.
+
+    :return: Position just past the header (page_size, salts, big_endian,
+        checksum, offset), or None if the header does not check out (e.g.
+        while a writer is rewriting it).
+    """
+    if len(data) < WAL_HEADER.size:
+        return None
+    magic, _, page_size, _, salt1, salt2, checksum1, checksum2 = WAL_HEADER.unpack(data[:WAL_HEADER.size])
+    if magic & ~1 != WAL_MAGIC:
+        return None
+    big_endian = bool(magic & 1)
+    if wal_checksum(data[:24], big_endian=big_endian) != (checksum1, checksum2):
+        return None
+    return {"page_size": page_size, "salts": (salt1, salt2), "big_endian": big_endian,
+            "checksum": (checksum1, checksum2), "offset": WAL_HEADER.size}
+
+
+def read_wal_header(wal_path):
+    """
+    Reads the header of a WAL file.
+
+    :return: See parse_wal_header(); None also if the file is missing or empty.
+    """
+    try:
+        with open(wal_path, "rb") as f:
+            data = f.read(WAL_HEADER.size)
+    except FileNotFoundError:
+        return None
+    return parse_wal_header(data)
+
+
+def read_transactions(wal_path, position):
+    """
+    Reads the transactions committed to a WAL file after position.
+
+    Frames are accepted while their salts match the header and their
+    cumulative checksums verify, which is how SQLite itself recovers a
+    WAL; frames of a transaction that has not committed yet are left for
+    the next call.
+
+    :param position: From read_wal_header() or an earlier call.
+    :return: (list of (database size in pages, {page number: page}), new position)
+    """
+    page_size = position["page_size"]
+    frame_size = FRAME_HEADER.size + page_size
+    with open(wal_path, "rb") as f:
+        f.seek(position["offset"])
+        data = f.read()
+    transactions = []
+    pages = {}
+    checksum = position["checksum"]
+    offset = 0
+    committed = dict(position)
+    while offset + frame_size <= len(data):
+        header = data[offset:offset + FRAME_HEADER.size]
+        page_number, db_size, salt1, salt2, checksum1, checksum2 = FRAME_HEADER.unpack(header)
+        if page_number == 0 or (salt1, salt2) != position["salts"]:
+            break
+        page = data[offset + FRAME_HEADER.size:offset + frame_size]
+        checksum = wal_checksum(header[:8], *checksum, position["big_endian"])
+        checksum = wal_checksum(page, *checksum, position["big_endian"])
+        if checksum != (checksum1, checksum2):
+            break
+        pages[page_number] = page
+        offset += frame_size
+        if db_size:
+            # Commit frame
+            transactions.append((db_size, pages))
+            pages = {}
+            committed.update(offset=position["offset"] + offset, checksum=checksum)
+    return transactions, committed
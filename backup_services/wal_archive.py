@@ -0,0 +1,676 @@
+import json
+import os
+import re
+import shutil
+import sqlite3
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from backup_services.sqlite_backup import consistent_snapshot
+from backup_services.sqlite_wal import FRAME_HEADER, read_transactions, read_wal_header
+from utils.compression import COMPRESSORS, codec_for_filename, get_compressor, iter_decompress
+from utils.pipeline import DEFAULT_CHUNK_SIZE, StreamingPipeline, feed_process, iter_file, iter_process
+
+GENERATION_FILE = "generation.json"
+BINLOG_DIRECTORY = "binlog"
+PG_WAL_DIRECTORY = "pg_wal"
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_SEGMENT_SECONDS = 10.0
+DEFAULT_SEGMENT_BYTES = 16 * 1024 * 1024
+DEFAULT_CHECKPOINT_FRAMES = 1000
+
+# Archived transaction: capture time, database size in pages after commit, number of pages
+_TRANSACTION = struct.Struct(">dII")
+_PAGE_NUMBER = struct.Struct(">I")
+
+_BINLOG_POSITION = re.compile(
+    r"CHANGE (?:MASTER|REPLICATION SOURCE) TO (?:MASTER|SOURCE)_LOG_FILE='([^']+)', (?:MASTER|SOURCE)_LOG_POS=(\d+)")
+
+
+def _timestamp(value):
+    """Epoch seconds of a datetime or ISO 8601 string."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+def _write_compressed(storage, name, data, compressor):
+    """Compresses data into a new storage object; returns (location, compressed size)."""
+    compressobj = compressor.compressobj()
+    compressed = compressobj.compress(data) + compressobj.flush()
+    writer = storage.open(name)
+    try:
+        writer.write(compressed)
+        return writer.commit(), len(compressed)
+    except BaseException:
+        writer.abort()
+        raise
+
+
+def _read_decompressed(path):
+    return b"".join(iter_decompress(iter_file(path), codec_for_filename(path)))
+
+
+class SQLiteWALArchiver:
+    """
+    Continuously archives the transactions committed to a SQLite WAL database.
+
+    Each archive starts a generation: a base snapshot of the database file
+    taken with the WAL empty, followed by segments holding every
+    transaction committed since, read straight from the WAL file. Segments
+    are compressed and written to storage once they reach segment_bytes or
+    are segment_seconds old, so the small, continuous writes of a busy
+    database turn into a few storage objects a minute.
+
+    To make sure no frame is overwritten before it is read, the archiver
+    keeps a read transaction open: SQLite restarts the WAL from the
+    beginning only when no reader needs its frames. Every checkpoint_frames
+    frames it checkpoints the WAL itself while holding the write lock, so
+    everything is archived before the next writer restarts the WAL. A WAL
+    that was reset behind the archiver's back (e.g. while it was not
+    running) is detected from the salts in its header and starts a new
+    generation.
+
+    The WAL does not record commit times, so transactions are stamped with
+    the time they were captured: a restore to a point in time is as
+    precise as the poll interval.
+
+    :param db_path: Database in WAL mode.
+    :param storage: Storage backend the generations are written to.
+    :param compressor: Codec for the base snapshot and segments; defaults to gzip.
+    :param segment_bytes: Uncompressed size at which a segment is written.
+    :param segment_seconds: Age at which a segment is written however small.
+    :param checkpoint_frames: WAL growth in frames after which the archiver checkpoints.
+    :param catalog: Optional BackupCatalog recording each generation.
+    :param clock: Returns the current time in epoch seconds.
+    """
+
+    def __init__(self, db_path, storage, compressor=None, segment_bytes=DEFAULT_SEGMENT_BYTES,
+                 segment_seconds=DEFAULT_SEGMENT_SECONDS, checkpoint_frames=DEFAULT_CHECKPOINT_FRAMES,
+                 catalog=None, clock=time.time):
+        self.db_path = db_path
+        self.wal_path = db_path + "-wal"
+        self.storage = storage
+        self.compressor = compressor or get_compressor("gzip")
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.checkpoint_frames = checkpoint_frames
+        self.catalog = catalog
+        self.clock = clock
+        self.generation = None
+        self.stats = {"generations": 0, "transactions": 0, "pages": 0, "segments": 0, "bytes_in": 0, "bytes_out": 0,
+                      "checkpoints": 0}
+        self._reader = self._writer = self._checkpointer = None
+        self._db_file = None
+        self._position = None
+        self._expect_restart = False
+        self._checkpointed_offset = 0
+        self._pending = []
+        self._pending_bytes = 0
+        self._pending_since = None
+        self._sequence = 0
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+
+    def start(self):
+        """
+        Opens the archiver's connections and starts a new generation.
+
+        :raises ValueError: If the database is not in WAL mode.
+        """
+        # Closing any descriptor of a file drops all of the process's POSIX locks on it, SQLite's
+        # included; the base snapshots are read through this one, which stays open until close()
+        self._db_file = open(self.db_path, "rb")
+        self._reader, self._writer, self._checkpointer = self._connect(), self._connect(), self._connect()
+        if self._writer.execute("PRAGMA journal_mode").fetchone()[0].lower() != "wal":
+            self.close()
+            raise ValueError(f"{self.db_path} is not in WAL mode; continuous archiving needs journal_mode=WAL")
+        self._new_generation()
+        return self
+
+    def _hold_reader(self):
+        self._reader.execute("BEGIN")
+        self._reader.execute("SELECT count(*) FROM sqlite_master").fetchone()
+
+    def _release_reader(self):
+        if self._reader.in_transaction:
+            self._reader.execute("ROLLBACK")
+
+    def _new_generation(self):
+        self.flush()
+        self._release_reader()
+        created = datetime.fromtimestamp(self.clock())
+        self.generation = f"{os.path.basename(self.db_path)}_wal_{created.strftime('%Y%m%d%H%M%S%f')}"
+        base_name = "base.db" + self.compressor.extension
+        # The reader's transaction outlives the snapshot, so the WAL cannot restart before the frames after it are
+        # archived
+        with consistent_snapshot(self._reader, self.db_path, db_file=self._db_file,
+                                 end_transaction=False) as snapshot:
+            base = StreamingPipeline(snapshot.iter_chunks(), self.storage.open(f"{self.generation}/{base_name}"),
+                                     self.compressor).run()
+        manifest = {"db": os.path.basename(self.db_path), "page_size": snapshot.page_size,
+                    "created": created.isoformat(), "codec": codec_for_filename(base_name), "base": base_name}
+        writer = self.storage.open(f"{self.generation}/{GENERATION_FILE}")
+        writer.write(json.dumps(manifest, indent=2).encode())
+        writer.commit()
+        # Archiving resumes with the first frame the snapshot does not include; once all of the snapshot's frames
+        # are checkpointed a writer may restart the WAL instead
+        self._position = snapshot.wal_position
+        self._expect_restart = snapshot.wal_checkpointed
+        self._checkpointed_offset = 0
+        self._sequence = 0
+        self.stats["generations"] += 1
+        location = base[:-len(base_name) - 1]
+        if self.catalog is not None:
+            self.catalog.add(manifest["db"], location, backup_type="wal", backup_format="wal", created=created,
+                             storage=self.storage.name, db_type="sqlite")
+        return location
+
+    def _capture(self):
+        """
+        Reads newly committed transactions into the pending segment.
+
+        :return: Number of transactions read, or None if the WAL was reset
+            before everything in it was archived.
+        """
+        header = read_wal_header(self.wal_path)
+        if header is None:
+            return 0
+        if self._position is None or self._expect_restart and header["salts"] != self._position["salts"]:
+            self._position = header
+            self._expect_restart = False
+            self._checkpointed_offset = header["offset"]
+        elif header["salts"] != self._position["salts"]:
+            return None
+        captured = self.clock()
+        transactions, self._position = read_transactions(self.wal_path, self._position)
+        if transactions:
+            # Appended to the same WAL, which cannot restart until a checkpoint has copied these frames back
+            self._expect_restart = False
+        for db_size, pages in transactions:
+            record = [_TRANSACTION.pack(captured, db_size, len(pages))]
+            for page_number, page in pages.items():
+                record.append(_PAGE_NUMBER.pack(page_number))
+                record.append(page)
+            record = b"".join(record)
+            self._pending.append(record)
+            self._pending_bytes += len(record)
+            self._pending_since = self._pending_since or captured
+            self.stats["pages"] += len(pages)
+        self.stats["transactions"] += len(transactions)
+        return len(transactions)
+
+    def poll(self):
+        """
+        Archives the transactions committed since the last poll.
+
+        Writes the pending segment when it is due and checkpoints the WAL
+        when it has grown by checkpoint_frames frames.
+
+        :return: Number of transactions captured.
+        """
+        captured = self._capture()
+        if captured is None:
+            self._new_generation()
+            return 0
+        if self._pending and (self._pending_bytes >= self.segment_bytes or
+                              self.clock() - self._pending_since >= self.segment_seconds):
+            self.flush()
+        if self._position is not None:
+            frame_size = FRAME_HEADER.size + self._position["page_size"]
+            if (self._position["offset"] - self._checkpointed_offset) // frame_size >= self.checkpoint_frames:
+                self.checkpoint()
+        return captured
+
+    def checkpoint(self):
+        """
+        Checkpoints the WAL once everything in it is archived.
+
+        The write lock is held from before the final capture until the
+        checkpoint is done, so the WAL that the next writer restarts holds
+        nothing the archive is missing.
+        """
+        self._writer.execute("BEGIN IMMEDIATE")
+        try:
+            if self._capture() is None:
+                gap = True
+            else:
+                gap = False
+                self._release_reader()
+                self._checkpointer.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+                # Read again before writers resume: at most one restart can happen until the next checkpoint
+                self._hold_reader()
+                self._expect_restart = True
+                if self._position is not None:
+                    self._checkpointed_offset = self._position["offset"]
+                self.stats["checkpoints"] += 1
+        finally:
+            self._writer.execute("ROLLBACK")
+        if gap:
+            self._new_generation()
+
+    def flush(self):
+        """Writes the pending transactions as a segment; returns its location, or None if there were none."""
+        if not self._pending:
+            return None
+        data = b"".join(self._pending)
+        self._sequence += 1
+        location, size = _write_compressed(self.storage, f"{self.generation}/{self._sequence:08d}.wal"
+                                           f"{self.compressor.extension}", data, self.compressor)
+        self.stats["segments"] += 1
+        self.stats["bytes_in"] += len(data)
+        self.stats["bytes_out"] += size
+        self._pending, self._pending_bytes, self._pending_since = [], 0, None
+        return location
+
+    def run(self, interval=DEFAULT_POLL_INTERVAL, stop=None):
+        """
+        Polls the WAL every interval seconds until stop is set.
+
+        :param stop: threading.Event ending the loop; the pending segment is written before returning.
+        """
+        stop = stop or threading.Event()
+        if self._reader is None:
+            self.start()
+        try:
+            while not stop.is_set():
+                self.poll()
+                stop.wait(interval)
+        finally:
+            self.close()
+
+    def close(self):
+        """Writes the pending segment and closes the archiver's connections."""
+        try:
+            if self.generation is not None:
+                self._capture()
+                self.flush()
+        finally:
+            for connection in (self._reader, self._writer, self._checkpointer):
+                if connection is not None:
+                    connection.close()
+            if self._db_file is not None:
+                self._db_file.close()
+            self._reader = self._writer = self._checkpointer = self._db_file = None
+
+
+def find_generation(archive_dir, db, until=None):
+    """
+    Returns the newest archived WAL generation of db started at or before until, or None.
+
+    :param db: File name of the archived database.
+    """
+    limit = _timestamp(until) if until is not None else None
+    found = []
+    for name in os.listdir(archive_dir):
+        path = os.path.join(archive_dir, name)
+        manifest_path = os.path.join(path, GENERATION_FILE)
+        if not os.path.exists(manifest_path):
+            continue
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        created = _timestamp(manifest["created"])
+        if manifest["db"] == db and (limit is None or created <= limit):
+            found.append((created, path))
+    return max(found)[1] if found else None
+
+
+def replay_generation(generation_path, output_file, until=None):
+    """
+    Rebuilds a database from an archived WAL generation.
+
+    The base snapshot is written to output_file and the archived
+    transactions are applied in commit order, stopping at the first one
+    captured after until.
+
+    :param until: datetime or ISO 8601 string; defaults to everything archived.
+    :return: Statistics: transactions applied and the capture time of the last one.
+    """
+    with open(os.path.join(generation_path, GENERATION_FILE)) as f:
+        manifest = json.load(f)
+    page_size = manifest["page_size"]
+    limit = _timestamp(until) if until is not None else None
+    with open(output_file, "wb") as out:
+        for chunk in iter_decompress(iter_file(os.path.join(generation_path, manifest["base"])), manifest["codec"]):
+            out.write(chunk)
+
+    stats = {"transactions": 0, "last": None}
+    segments = sorted(name for name in os.listdir(generation_path)
+                      if name[:8].isdigit() and ".wal" in name and not name.endswith((".part", ".json")))
+    with open(output_file, "r+b") as out:
+        for name in segments:
+            data = memoryview(_read_decompressed(os.path.join(generation_path, name)))
+            offset = 0
+            while offset < len(data):
+                captured, db_size, count = _TRANSACTION.unpack_from(data, offset)
+                if limit is not None and captured > limit:
+                    return stats
+                offset += _TRANSACTION.size
+                for _ in range(count):
+                    page_number, = _PAGE_NUMBER.unpack_from(data, offset)
+                    offset += _PAGE_NUMBER.size
+                    out.seek((page_number - 1) * page_size)
+                    out.write(data[offset:offset + page_size])
+                    offset += page_size
+                out.truncate(db_size * page_size)
+                stats["transactions"] += 1
+                stats["last"] = datetime.fromtimestamp(captured).isoformat()
+    return stats
+
+
+class PostgreSQLBaseBackup:
+    """
+    Streams a physical base backup of a PostgreSQL cluster with pg_basebackup.
+
+    The cluster is written as a single tar stream without WAL; the WAL
+    needed to make it consistent, and to roll it forward to a point in
+    time, comes from the segments archived by PostgreSQLWALArchiver.
+    Clusters with additional tablespaces cannot be streamed this way.
+    """
+
+    def __init__(self, db_name, output_dir, db_user, db_password, db_host="localhost", db_port=None):
+        self.db_name = db_name
+        self.output_dir = output_dir
+        self.db_user = db_user
+        self.db_password = db_password
+        self.db_host = db_host
+        self.db_port = db_port
+
+    def backup_filename(self):
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        return f"{self.db_name}_base_{timestamp}.tar"
+
+    def iter_dump(self):
+        command = ["pg_basebackup", f"--host={self.db_host}", f"--username={self.db_user}", "--no-password",
+                   "--pgdata=-", "--format=tar", "--wal-method=none", "--checkpoint=fast"]
+        if self.db_port:
+            command.append(f"--port={self.db_port}")
+        env = dict(os.environ)
+        env["PGPASSWORD"] = self.db_password or ""
+        return iter_process(command, env=env)
+
+
+class PostgreSQLWALArchiver:
+    """
+    archive_command and restore_command for PostgreSQL WAL segments.
+
+    PostgreSQL hands every completed 16 MiB WAL segment to archive_command
+    and asks for them back through restore_command during recovery; both
+    are this utility (``--archive-wal-segment %p`` and
+    ``--restore-wal-segment %f %p``). Segments are stored compressed under
+    ``pg_wal/`` in the storage backend and read back from the same one.
+
+    :param storage: Storage backend the segments are written to.
+    :param compressor: Segment codec; defaults to gzip.
+    """
+
+    def __init__(self, storage, compressor=None):
+        self.storage = storage
+        self.compressor = compressor or get_compressor("gzip")
+
+    def archive_segment(self, path):
+        """
+        Stores the WAL segment (or timeline history file) at path and returns its location.
+
+        PostgreSQL may recycle the segment as soon as this returns, so a
+        local storage should be created with sync=True.
+        """
+        name = f"{PG_WAL_DIRECTORY}/{os.path.basename(path)}{self.compressor.extension}"
+        return StreamingPipeline(iter_file(path), self.storage.open(name), self.compressor).run()
+
+    def restore_segment(self, name, destination):
+        """
+        Writes the archived segment called name to destination.
+
+        :return: False if the segment is not archived (PostgreSQL then ends recovery).
+        """
+        # The archive's own codec first; segments archived with another one are still found
+        extensions = [self.compressor.extension] + [compressor.extension for compressor in COMPRESSORS.values()]
+        for extension in dict.fromkeys(extensions):
+            source = f"{PG_WAL_DIRECTORY}/{name}{extension}"
+            try:
+                chunks = self.storage.read(source)
+            except FileNotFoundError:
+                continue
+            temp_path = destination + ".part"
+            with open(temp_path, "wb") as f:
+                for chunk in iter_decompress(chunks, codec_for_filename(source)):
+                    f.write(chunk)
+            os.replace(temp_path, destination)
+            return True
+        return False
+
+
+def write_recovery_config(data_dir, restore_command, until=None):
+    """
+    Configures a restored PostgreSQL data directory for archive recovery.
+
+    Writes ``recovery.signal`` and appends the restore command and, with
+    until, the recovery target to ``postgresql.auto.conf``; the server
+    replays the archived WAL up to that time on its next start and then
+    promotes itself.
+    """
+    def quote(value):
+        return "'" + str(value).replace("'", "''") + "'"
+
+    settings = [f"restore_command = {quote(restore_command)}"]
+    if until is not None:
+        if not isinstance(until, str):
+            until = until.isoformat(sep=" ")
+        settings += [f"recovery_target_time = {quote(until)}", "recovery_target_action = 'promote'"]
+    with open(os.path.join(data_dir, "postgresql.auto.conf"), "a") as f:
+        f.write("\n".join(settings) + "\n")
+    open(os.path.join(data_dir, "recovery.signal"), "w").close()
+
+
+class MySQLBinlogArchiver:
+    """
+    Streams a MySQL server's binary logs into storage.
+
+    ``mysqlbinlog --read-from-remote-server --raw --stop-never`` copies the
+    binlogs byte for byte into a local spool directory as the server
+    writes them. Each file is compressed into the ``binlog/`` directory of
+    the storage backend once the server has rotated to the next one; the
+    file still being written is uploaded as ``<name>.partial`` every
+    segment_seconds, which bounds how much a lost host can take with it.
+
+    :param connector: Connected MySQLConnector; its credentials are passed on to mysqlbinlog.
+    :param storage: Storage backend the binlogs are written to.
+    :param spool_dir: Local directory mysqlbinlog writes into.
+    :param compressor: Binlog codec; defaults to gzip.
+    """
+
+    def __init__(self, connector, storage, spool_dir, compressor=None, segment_seconds=DEFAULT_SEGMENT_SECONDS):
+        self.connector = connector
+        self.storage = storage
+        self.spool_dir = spool_dir
+        self.compressor = compressor or get_compressor("gzip")
+        self.segment_seconds = segment_seconds
+        self.stats = {"binlogs": 0, "partial_uploads": 0, "restarts": 0}
+        self._process = None
+        self._partial_uploaded = 0
+
+    def _spooled(self):
+        return sorted(name for name in os.listdir(self.spool_dir) if not name.startswith("."))
+
+    def _first_binlog(self):
+        spooled = self._spooled()
+        if spooled:
+            # Fetched again from the start: the spooled copy may be incomplete
+            return spooled[-1]
+        with self.connector.connection.cursor() as cursor:
+            cursor.execute("SHOW MASTER STATUS")
+            row = cursor.fetchone()
+        if not row:
+            raise RuntimeError("Binary logging is not enabled on the MySQL server")
+        return row[0]
+
+    def _spawn(self):
+        command = ["mysqlbinlog", "--read-from-remote-server", f"--host={self.connector.host}",
+                   f"--port={self.connector.port}", f"--user={self.connector.user}", "--raw", "--stop-never",
+                   f"--result-file={self.spool_dir}{os.sep}", self._first_binlog()]
+        env = dict(os.environ)
+        env["MYSQL_PWD"] = self.connector.password or ""
+        self._process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+
+    def start(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._spawn()
+        return self
+
+    def _archive(self, name, partial=False):
+        target = f"{BINLOG_DIRECTORY}/{name}{'.partial' if partial else ''}{self.compressor.extension}"
+        return StreamingPipeline(iter_file(os.path.join(self.spool_dir, name)), self.storage.open(target),
+                                 self.compressor).run()
+
+    def poll(self):
+        """Archives rotated binlogs and, when due, the one being written; restarts mysqlbinlog if it died."""
+        if self._process.poll() is not None:
+            self.stats["restarts"] += 1
+            self._spawn()
+        spooled = self._spooled()
+        for name in spooled[:-1]:
+            self._archive(name)
+            os.remove(os.path.join(self.spool_dir, name))
+            self.stats["binlogs"] += 1
+        if spooled and time.monotonic() - self._partial_uploaded >= self.segment_seconds:
+            self._archive(spooled[-1], partial=True)
+            self._partial_uploaded = time.monotonic()
+            self.stats["partial_uploads"] += 1
+
+    def run(self, interval=DEFAULT_POLL_INTERVAL, stop=None):
+        stop = stop or threading.Event()
+        if self._process is None:
+            self.start()
+        try:
+            while not stop.is_set():
+                self.poll()
+                stop.wait(interval)
+        finally:
+            self.close()
+
+    def close(self):
+        """Stops mysqlbinlog and uploads the binlog it was writing."""
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+            self._process.wait()
+        spooled = self._spooled()
+        if spooled:
+            self._archive(spooled[-1], partial=True)
+
+
+def binlog_position(dump_path):
+    """
+    Reads the binlog coordinates recorded in a backup: the manifest of a
+    parallel dump (directory or container), or a mysqldump taken with
+    ``--master-data=2``.
+
+    :return: (binlog file name, position)
+    :raises ValueError: If the backup does not record them.
+    """
+    # Parallel dumps and containers are only read here; the archivers themselves never need them
+    from backup_services.parallel_dump import MANIFEST_FILE
+    from storages.container import ContainerReader, is_container
+
+    manifest = None
+    if os.path.isdir(dump_path):
+        with open(os.path.join(dump_path, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+    elif is_container(dump_path):
+        reader = ContainerReader(dump_path)
+        try:
+            manifest = reader.metadata.get("manifest")
+            if manifest is None:
+                chunks = reader.iter_entry(reader.list()[0]["name"])
+                position = _dump_binlog_position(chunks)
+        finally:
+            reader.close()
+    else:
+        position = _dump_binlog_position(iter_decompress(iter_file(dump_path), codec_for_filename(dump_path)))
+    if manifest is not None:
+        binlog = manifest.get("binlog")
+        position = (binlog["file"], binlog["position"]) if binlog else None
+    if position is None:
+        raise ValueError(f"{dump_path} does not record a binlog position; take MySQL dumps with --binlog-position")
+    return position
+
+
+def _dump_binlog_position(chunks):
+    read = 0
+    text = b""
+    for chunk in chunks:
+        text += chunk
+        read += len(chunk)
+        match = _BINLOG_POSITION.search(text.decode(errors="replace"))
+        if match:
+            return match.group(1), int(match.group(2))
+        # The coordinates are written in the dump's header
+        if read >= 1024 * 1024:
+            break
+    return None
+
+
+def archived_binlogs(archive_dir, start_file):
+    """
+    Returns the archived binlogs to replay from start_file on, oldest first.
+
+    A complete copy of a binlog is preferred over its ``.partial`` upload.
+
+    :return: List of (binlog file name, archived path).
+    """
+    directory = os.path.join(archive_dir, BINLOG_DIRECTORY)
+    found = {}
+    for entry in os.listdir(directory):
+        if entry.endswith(".part") or entry.endswith(".json"):
+            continue
+        codec = codec_for_filename(entry)
+        extension = get_compressor(codec).extension
+        name = entry[:-len(extension)] if extension else entry
+        partial = name.endswith(".partial")
+        name = name[:-len(".partial")] if partial else name
+        if name >= start_file and (name not in found or found[name][0]):
+            found[name] = (partial, os.path.join(directory, entry))
+    return [(name, found[name][1]) for name in sorted(found)]
+
+
+def replay_binlogs(archive_dir, dump_path, client_command, until=None, temp_dir=None):
+    """
+    Rolls a restored MySQL dump forward with the archived binlogs.
+
+    Replay starts at the binlog position recorded in the dump and stops
+    before the first event after until; ``mysqlbinlog`` decodes the events
+    and the ``mysql`` client applies them.
+
+    :param client_command: (argument list, environment) of the mysql client, as from client_command().
+    :param until: datetime or ISO 8601 string, in the server's time zone.
+    :return: Number of binlog files replayed.
+    """
+    start_file, start_position = binlog_position(dump_path)
+    binlogs = archived_binlogs(archive_dir, start_file)
+    if not binlogs:
+        return 0
+    work_dir = tempfile.mkdtemp(dir=temp_dir)
+    try:
+        files = []
+        for name, path in binlogs:
+            # mysqlbinlog reads files by name, so the archived copies are decompressed first
+            target = os.path.join(work_dir, name)
+            with open(target, "wb") as f:
+                for chunk in iter_decompress(iter_file(path), codec_for_filename(path)):
+                    f.write(chunk)
+            files.append(target)
+        command = ["mysqlbinlog", f"--start-position={start_position}"]
+        if until is not None:
+            if isinstance(until, str):
+                until = datetime.fromisoformat(until)
+            command.append(f"--stop-datetime={until.strftime('%Y-%m-%d %H:%M:%S')}")
+        client, env = client_command
+        feed_process(client, iter_process(command + files), env=env)
+        return len(files)
+    finally:
+        shutil.rmtree(work_dir)
@@ -0,0 +1,101 @@
+# benchmarks/bench_compression.py
+"""
+Compression throughput benchmark.
+
+Compresses a synthetic SQL dump with every available codec, level and
+thread count and prints MB/s and compression ratio. Codecs whose optional
+packages are not installed are skipped.
+
+    python -m benchmarks.bench_compression --size-mb 64 --threads 1 4 8
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+from utils.compression import get_compressor
+
+LEVELS = {
+    "gzip": [1, 6, 9],
+    "zstd": [1, 3, 9],
+    "lz4": [0, 3, 9],
+}
+
+
+def synthetic_dump(size):
+    """Generates mysqldump-like INSERT statements totalling about size bytes."""
+    rng = random.Random(42)
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta"]
+    lines = []
+    total = 0
+    row_id = 0
+    while total < size:
+        rows = []
+        for _ in range(100):
+            row_id += 1
+            name = " ".join(rng.choice(words) for _ in range(4))
+            rows.append(f"({row_id},'{name}',{rng.randint(0, 10 ** 6)},'{rng.random():.8f}')")
+        line = "INSERT INTO `test_table` VALUES " + ",".join(rows) + ";\n"
+        lines.append(line)
+        total += len(line)
+    return "".join(lines).encode()[:size]
+
+
+def measure(data, codec, level, threads, chunk_size=1024 * 1024):
+    compressobj = get_compressor(codec, level, threads).compressobj()
+    compressed = 0
+    started = time.perf_counter()
+    for offset in range(0, len(data), chunk_size):
+        compressed += len(compressobj.compress(data[offset:offset + chunk_size]))
+    compressed += len(compressobj.flush())
+    seconds = time.perf_counter() - started
+    return {
+        "codec": codec,
+        "level": level,
+        "threads": threads,
+        "input_bytes": len(data),
+        "output_bytes": compressed,
+        "ratio": round(len(data) / compressed, 3),
+        "seconds": round(seconds, 4),
+        "mb_per_s": round(len(data) / seconds / 1e6, 1),
+    }
+
+
+def run(size_mb, thread_counts, codecs=None):
+    data = synthetic_dump(size_mb * 1024 * 1024)
+    results = []
+    for codec, levels in LEVELS.items():
+        if codecs and codec not in codecs:
+            continue
+        try:
+            get_compressor(codec)
+        except ImportError as e:
+            print(f"Skipping {codec}: {e}")
+            continue
+        for level in levels:
+            for threads in thread_counts:
+                results.append(measure(data, codec, level, threads))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compression throughput benchmark")
+    parser.add_argument("--size-mb", type=int, default=32, help="Size of the synthetic dump in MB")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, os.cpu_count() or 1],
+                        help="Thread counts to measure")
+    parser.add_argument("--codecs", nargs="+", help="Restrict to these codecs")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args.size_mb, sorted(set(args.threads)), args.codecs)
+    print(f"{'codec':<6} {'level':>5} {'threads':>7} {'MB/s':>8} {'ratio':>7}")
+    for r in results:
+        print(f"{r['codec']:<6} {r['level']:>5} {r['threads']:>7} {r['mb_per_s']:>8} {r['ratio']:>7}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
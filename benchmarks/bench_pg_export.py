@@ -0,0 +1,119 @@
+# benchmarks/bench_pg_export.py
+"""
+Compares the pg_dump text path with the in-process COPY exporter.
+
+Needs a reachable PostgreSQL server and pg_dump on PATH. With --rows the
+benchmark (re)creates a ``bench_rows`` table of that size first.
+
+    python -m benchmarks.bench_pg_export --database bench --user postgres --password secret --rows 2000000
+"""
+import argparse
+import json
+import resource
+import shutil
+import tempfile
+import time
+
+from backup_services.full_backup import FullBackup
+from backup_services.postgresql_copy_export import PostgreSQLCopyExport
+from db_connectors.postgresql_connector import PostgreSQLConnector
+from storages.local_storage import LocalStorage
+from utils.compression import get_compressor
+from utils.pipeline import StreamingPipeline
+
+
+def _cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime, children.ru_utime + children.ru_stime
+
+
+def _measure(name, run):
+    own_before, children_before = _cpu_seconds()
+    started = time.perf_counter()
+    raw_bytes, stored_bytes = run()
+    seconds = time.perf_counter() - started
+    own_after, children_after = _cpu_seconds()
+    return {
+        "path": name,
+        "raw_bytes": raw_bytes,
+        "stored_bytes": stored_bytes,
+        "seconds": round(seconds, 3),
+        "mb_per_s": round(raw_bytes / seconds / 1e6, 1),
+        "cpu_self": round(own_after - own_before, 3),
+        "cpu_children": round(children_after - children_before, 3),
+    }
+
+
+def populate(connector, rows):
+    cursor = connector.connection.cursor()
+    cursor.execute("DROP TABLE IF EXISTS bench_rows")
+    cursor.execute(
+        "CREATE TABLE bench_rows (id bigint PRIMARY KEY, name text, amount numeric(12, 2), created timestamptz)"
+    )
+    cursor.execute(
+        "INSERT INTO bench_rows SELECT g, md5(g::text), g * 0.01, now() - g * interval '1 second' "
+        "FROM generate_series(1, %s) g",
+        (rows,),
+    )
+    connector.connection.commit()
+    cursor.close()
+
+
+def run(connector, codec, work_dir):
+    compressor = get_compressor(codec)
+    results = []
+
+    def dump_path():
+        backup = FullBackup("postgresql", connector.database, work_dir, connector.user, connector.password,
+                            db_host=connector.host, db_port=connector.port)
+        sink = LocalStorage(work_dir).open(backup.backup_filename() + compressor.extension)
+        pipeline = StreamingPipeline(backup.iter_dump(), sink, compressor)
+        pipeline.run()
+        return pipeline.stats["dump"].bytes_in, pipeline.stats["store"].bytes_out
+
+    def copy_path():
+        backup_path = PostgreSQLCopyExport(connector, work_dir, compressor=compressor).backup()
+        with open(f"{backup_path}/manifest.json") as f:
+            tables = json.load(f)["tables"]
+        return sum(t["bytes_in"] for t in tables), sum(t["bytes_out"] for t in tables)
+
+    results.append(_measure("pg_dump text", dump_path))
+    results.append(_measure("COPY binary", copy_path))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pg_dump vs COPY exporter benchmark")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5432)
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--password", default="")
+    parser.add_argument("--database", required=True)
+    parser.add_argument("--rows", type=int, default=0, help="Create a bench_rows table with this many rows")
+    parser.add_argument("--codec", default="none", help="Compression codec applied to both paths")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    connector = PostgreSQLConnector(args.host, args.port, args.user, args.password, args.database)
+    if not connector.connect():
+        raise SystemExit("Could not connect to PostgreSQL")
+    work_dir = tempfile.mkdtemp()
+    try:
+        if args.rows:
+            populate(connector, args.rows)
+        results = run(connector, args.codec, work_dir)
+    finally:
+        connector.disconnect()
+        shutil.rmtree(work_dir)
+
+    print(f"{'path':<14} {'MB/s':>8} {'seconds':>8} {'cpu self':>9} {'cpu child':>10}")
+    for r in results:
+        print(f"{r['path']:<14} {r['mb_per_s']:>8} {r['seconds']:>8} {r['cpu_self']:>9} {r['cpu_children']:>10}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
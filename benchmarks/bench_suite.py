@@ -0,0 +1,506 @@
+# benchmarks/bench_suite.py
+"""
+Backup, compression, storage and restore throughput benchmark suite.
+
+Generates synthetic SQLite databases of the requested sizes and row
+shapes (cached in --data-dir, so large ones are only built once) and
+measures MB/s and peak memory for:
+
+    sqlite_backup    SQLiteBackup online copy
+    compress_file    compress_file() for every codec and thread count
+    storage_save     copying a finished backup into LocalStorage, fsynced
+    storage_stream   streaming pipeline into LocalStorage per codec/threads
+    restore          SQLiteRestore of a compressed backup per codec
+    startup          interpreter start, importing main.py, and a whole
+                     command-line backup of a tiny SQLite file (the
+                     cron-driven case, where startup dominates)
+
+With --servers, MySQL and PostgreSQL dumps (dump tool and in-process
+exporter, per worker count) are measured against throwaway local server
+instances when their binaries are installed.
+
+Every case runs in a fresh process so its peak RSS is its own. Results
+are written as JSON; --baseline compares them with an earlier run and
+reports cases that got slower than --tolerance.
+
+    python -m benchmarks.bench_suite --sizes-mb 100 1000 --shapes narrow blob --json results.json
+    python -m benchmarks.bench_suite --sizes-mb 100 --baseline results.json
+    python -m benchmarks.bench_suite --startup-only --startup-runs 50
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from backup_services.sqlite_backup import SQLiteBackup
+from benchmarks.servers import SERVERS
+from restore_services.sqlite_restore import SQLiteRestore
+from storages.local_storage import LocalStorage
+from utils.compression import COMPRESSORS, compress_file, get_compressor
+from utils.metrics import peak_rss_bytes
+from utils.pipeline import StreamingPipeline, iter_file
+
+SHAPES = {
+    # Small rows with an index: many pages of B-tree overhead
+    "narrow": "CREATE TABLE rows (id INTEGER PRIMARY KEY, account INTEGER, amount REAL, created TEXT)",
+    # Many mixed columns per row
+    "wide": "CREATE TABLE rows (id INTEGER PRIMARY KEY, " + ", ".join(
+        f"c{i} {'INTEGER' if i % 2 else 'TEXT'}" for i in range(20)) + ")",
+    # Compressible prose
+    "text": "CREATE TABLE rows (id INTEGER PRIMARY KEY, title TEXT, body TEXT)",
+    # Incompressible payloads
+    "blob": "CREATE TABLE rows (id INTEGER PRIMARY KEY, payload BLOB)",
+}
+# Four rows fill a 4 KiB page with random bytes; 2 KiB rows left half of each page zeroed, which compresses
+BLOB_BYTES = 1000
+WORDS = ("backup restore database page index table column value commit rollback query "
+         "snapshot stream block chunk checksum replica primary storage archive").split()
+BATCH_ROWS = 10000
+DEFAULT_CASE_TIMEOUT = 3600.0
+# Part of the cached databases' names; bump it when the generated data changes
+DATA_VERSION = 2
+
+
+def _row_factory(shape, rng):
+    sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 16))) for _ in range(4096)]
+    if shape == "narrow":
+        return lambda i: (i, rng.randrange(100000), rng.random() * 1000, f"2024-01-01T00:{i % 60:02d}:00")
+    if shape == "wide":
+        return lambda i: (i,) + tuple(rng.randrange(10 ** 9) if c % 2 else sentences[rng.randrange(4096)][:24]
+                                      for c in range(20))
+    if shape == "text":
+        return lambda i: (i, sentences[rng.randrange(4096)],
+                          ". ".join(sentences[rng.randrange(4096)] for _ in range(10)))
+    return lambda i: (i, rng.randbytes(BLOB_BYTES))
+
+
+def generate_database(path, size, shape, seed=0):
+    """
+    Builds a SQLite database of about size bytes with the given row shape.
+
+    Rows come from a seeded generator, so the same size, shape and seed
+    always produce the same data.
+    """
+    temp_path = path + ".part"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    connection = sqlite3.connect(temp_path)
+    try:
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.execute(SHAPES[shape])
+        if shape in ("narrow", "wide"):
+            connection.execute(f"CREATE INDEX rows_second ON rows ({'account' if shape == 'narrow' else 'c1'})")
+        make_row = _row_factory(shape, random.Random(seed))
+        sample = make_row(0)
+        placeholders = ", ".join("?" * len(sample))
+        # Keep batches to about 1% of the target so small databases don't overshoot
+        row_bytes = sum(len(value) if isinstance(value, (str, bytes)) else 8 for value in sample)
+        batch_rows = max(1, min(BATCH_ROWS, size // 100 // row_bytes))
+        page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+        next_id = 1
+        while connection.execute("PRAGMA page_count").fetchone()[0] * page_size < size:
+            rows = [make_row(i) for i in range(next_id, next_id + batch_rows)]
+            connection.executemany(f"INSERT INTO rows VALUES ({placeholders})", rows)
+            connection.commit()
+            next_id += batch_rows
+    finally:
+        connection.close()
+    os.replace(temp_path, path)
+    return path
+
+
+def cached_database(data_dir, size_mb, shape):
+    path = os.path.join(data_dir, f"bench-{shape}-{size_mb}mb-v{DATA_VERSION}.db")
+    if not os.path.exists(path):
+        started = time.perf_counter()
+        generate_database(path, size_mb * 1024 * 1024, shape)
+        print(f"Generated {path} in {time.perf_counter() - started:.1f}s")
+    return path
+
+
+def case_sqlite_backup(db_path, work_dir, pages_per_step):
+    backup = SQLiteBackup(db_path, work_dir, pages_per_step=pages_per_step)
+    started = time.perf_counter()
+    path = backup.backup()
+    seconds = time.perf_counter() - started
+    os.remove(path)
+    size = os.path.getsize(db_path)
+    return {"bytes_in": size, "bytes_out": size, "seconds": seconds}
+
+
+def case_compress_file(db_path, work_dir, codec, threads):
+    output = os.path.join(work_dir, "compressed" + get_compressor(codec).extension)
+    started = time.perf_counter()
+    compress_file(db_path, output, codec, threads=threads)
+    seconds = time.perf_counter() - started
+    result = {"bytes_in": os.path.getsize(db_path), "bytes_out": os.path.getsize(output), "seconds": seconds}
+    os.remove(output)
+    return result
+
+
+def case_storage_save(db_path, work_dir):
+    # LocalStorage.save() of a staged file is a rename, which measures nothing; copy the bytes instead
+    started = time.perf_counter()
+    sink = LocalStorage(os.path.join(work_dir, "store"), sync=True).open("saved.db")
+    try:
+        for chunk in iter_file(db_path):
+            sink.write(chunk)
+    except BaseException:
+        sink.abort()
+        raise
+    saved = sink.commit()
+    seconds = time.perf_counter() - started
+    size = os.path.getsize(saved)
+    LocalStorage(os.path.dirname(saved)).delete([saved])
+    return {"bytes_in": size, "bytes_out": size, "seconds": seconds}
+
+
+def case_storage_stream(db_path, work_dir, codec, threads):
+    compressor = get_compressor(codec, None, threads)
+    sink = LocalStorage(os.path.join(work_dir, "store")).open("stream.db" + compressor.extension)
+    pipeline = StreamingPipeline(iter_file(db_path), sink, compressor)
+    started = time.perf_counter()
+    path = pipeline.run()
+    seconds = time.perf_counter() - started
+    os.remove(path)
+    return {"bytes_in": pipeline.stats["dump"].bytes_in, "bytes_out": pipeline.stats["store"].bytes_out,
+            "seconds": seconds}
+
+
+def case_restore(db_path, work_dir, codec, backup_file):
+    target = os.path.join(work_dir, "restored.db")
+    started = time.perf_counter()
+    SQLiteRestore(target).restore(backup_file)
+    seconds = time.perf_counter() - started
+    os.remove(target)
+    return {"bytes_in": os.path.getsize(backup_file), "bytes_out": os.path.getsize(db_path), "seconds": seconds}
+
+
+def case_server_dump(db_type, connection, work_dir, exporter, workers):
+    from backup_services.full_backup import FullBackup
+    from backup_services.parallel_dump import ParallelDump
+    from db_connectors.mysql_connector import MySQLConnector
+    from db_connectors.postgresql_connector import PostgreSQLConnector
+
+    connector_class = MySQLConnector if db_type == "mysql" else PostgreSQLConnector
+    connector = connector_class(*connection)
+    if not connector.connect():
+        raise RuntimeError(f"Could not connect to the throwaway {db_type} server")
+    compressor = get_compressor("gzip", 1)
+    started = time.perf_counter()
+    try:
+        if exporter == "dump":
+            host, port, user, password, database = connection
+            backup = FullBackup(db_type, database, work_dir, user, password, db_host=host, db_port=port)
+            sink = LocalStorage(work_dir).open(backup.backup_filename() + compressor.extension)
+            pipeline = StreamingPipeline(backup.iter_dump(), sink, compressor)
+            os.remove(pipeline.run())
+            bytes_in, bytes_out = pipeline.stats["dump"].bytes_in, pipeline.stats["store"].bytes_out
+        else:
+            path = ParallelDump(db_type, connector, work_dir, workers=workers, compressor=compressor).backup()
+            with open(os.path.join(path, "manifest.json")) as f:
+                tables = json.load(f)["tables"]
+            parts = [part for table in tables for part in table.get("parts") or [table]]
+            bytes_in, bytes_out = sum(p.get("bytes_in", 0) for p in parts), sum(p.get("bytes_out", 0) for p in parts)
+            shutil.rmtree(path)
+    finally:
+        connector.disconnect()
+    return {"bytes_in": bytes_in, "bytes_out": bytes_out, "seconds": time.perf_counter() - started}
+
+
+CASES = {
+    "sqlite_backup": case_sqlite_backup,
+    "compress_file": case_compress_file,
+    "storage_save": case_storage_save,
+    "storage_stream": case_storage_stream,
+    "restore": case_restore,
+    "server_dump": case_server_dump,
+}
+
+
+def _peak_rss():
+    # ru_maxrss survives exec on Linux, so a spawned child would report its parent's peak; VmHWM does not
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return peak_rss_bytes()
+
+
+def _child(results, case, kwargs):
+    baseline = _peak_rss()
+    try:
+        result = CASES[case](**kwargs)
+    except Exception as e:
+        results.put({"error": f"{type(e).__name__}: {e}"})
+        return
+    result["peak_rss_bytes"] = _peak_rss()
+    result["peak_rss_delta_bytes"] = result["peak_rss_bytes"] - baseline if baseline is not None else None
+    results.put(result)
+
+
+def run_isolated(case, timeout=DEFAULT_CASE_TIMEOUT, **kwargs):
+    """
+    Runs one case in a fresh process and returns its measurements.
+
+    A case that crashes (e.g. killed by the OOM killer) or runs longer than
+    timeout seconds is recorded with an error instead of hanging the suite.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_child, args=(results, case, kwargs))
+    process.start()
+    deadline = time.monotonic() + timeout
+    result = None
+    while result is None:
+        try:
+            result = results.get(timeout=1)
+        except queue.Empty:
+            if not process.is_alive():
+                try:
+                    # The result may have arrived just before the process exited
+                    result = results.get(timeout=1)
+                except queue.Empty:
+                    result = {"error": f"Case process exited with code {process.exitcode} without a result"}
+            elif time.monotonic() > deadline:
+                process.terminate()
+                result = {"error": f"Case timed out after {timeout}s"}
+    process.join()
+    if process.exitcode and "error" not in result:
+        result["error"] = f"Case process exited with code {process.exitcode}"
+    return result
+
+
+def _record(case, params, result):
+    record = {"case": case, **params, **result}
+    if "seconds" in result:
+        record["seconds"] = round(result["seconds"], 4)
+        # Throughput is always over the uncompressed data, i.e. the output of a restore
+        logical = result["bytes_out"] if case == "restore" else result["bytes_in"]
+        record["mb_per_s"] = round(logical / result["seconds"] / 1e6, 1) if result["seconds"] else None
+        record["ratio"] = round(result["bytes_in"] / result["bytes_out"], 3) if result["bytes_out"] else None
+    return record
+
+
+def run_sqlite(data_dir, work_dir, sizes_mb, shapes, codecs, thread_counts):
+    results = []
+    for size_mb in sizes_mb:
+        for shape in shapes:
+            db_path = cached_database(data_dir, size_mb, shape)
+            base = {"size_mb": size_mb, "shape": shape}
+
+            def measure(case, extra=None, **params):
+                record = _record(case, dict(base, **params),
+                                 run_isolated(case, db_path=db_path, work_dir=work_dir, **params, **(extra or {})))
+                results.append(record)
+                print(json.dumps(record))
+
+            for pages_per_step in (256, -1):
+                measure("sqlite_backup", pages_per_step=pages_per_step)
+            measure("storage_save")
+            for codec in codecs:
+                for threads in thread_counts:
+                    measure("compress_file", codec=codec, threads=threads)
+                    measure("storage_stream", codec=codec, threads=threads)
+                backup_file = os.path.join(work_dir, "restore-source.db" + get_compressor(codec).extension)
+                compress_file(db_path, backup_file, codec, threads=max(thread_counts))
+                measure("restore", {"backup_file": backup_file}, codec=codec)
+                os.remove(backup_file)
+    return results
+
+
+def run_servers(work_dir, sizes_mb, worker_counts):
+    results = []
+    for db_type, server_class in SERVERS.items():
+        if not server_class.available():
+            print(f"Skipping {db_type}: server binaries or driver not installed")
+            continue
+        for size_mb in sizes_mb:
+            with server_class() as server:
+                server.populate(size_mb * 1024 * 1024)
+                connection = (server.host, server.port, server.user, server.password, server.database)
+                for exporter, workers in [("dump", 1)] + [("native", count) for count in worker_counts]:
+                    params = {"db_type": db_type, "size_mb": size_mb, "exporter": exporter, "workers": workers}
+                    record = _record("server_dump", params, run_isolated(
+                        "server_dump", db_type=db_type, connection=connection, work_dir=work_dir,
+                        exporter=exporter, workers=workers))
+                    results.append(record)
+                    print(json.dumps(record))
+    return results
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules that a SQLite-only run must not import
+DRIVER_MODULES = ("pymysql", "psycopg2", "boto3", "zstandard", "lz4", "asyncio", "multiprocessing", "http.server",
+                  "concurrent.futures")
+
+
+def _time_command(command, runs):
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    # The first run writes the bytecode caches, as the first cron invocation would
+    subprocess.run(command, check=True, env=env, cwd=REPO_DIR, stdout=subprocess.DEVNULL)
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(command, check=True, env=env, cwd=REPO_DIR, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - started)
+    return {"seconds": statistics.median(timings), "min_seconds": round(min(timings), 4)}
+
+
+def run_startup(work_dir, runs):
+    """
+    Measures process startup of the command-line tool, median of runs.
+
+    Records the interpreter alone, importing main.py, and a whole SQLite
+    backup of a tiny database, with the share of the backup's runtime
+    spent before it starts working, and which heavy modules main.py
+    imports for a SQLite run.
+    """
+    db_path = os.path.join(work_dir, "tiny.db")
+    generate_database(db_path, 64 * 1024, "narrow")
+    output_dir = os.path.join(work_dir, "startup")
+    commands = {
+        "interpreter": [sys.executable, "-c", "pass"],
+        "import": [sys.executable, "-c", "import main"],
+        "sqlite_backup": [sys.executable, os.path.join(REPO_DIR, "main.py"), "--db-type", "sqlite",
+                          "--db-path", db_path, "--output-dir", output_dir,
+                          "--log-file", os.path.join(work_dir, "startup.log")],
+    }
+    measured = {name: _time_command(command, runs) for name, command in commands.items()}
+    probe = subprocess.run([sys.executable, "-c", "import json, sys, main; print(json.dumps(sorted(sys.modules)))"],
+                           check=True, capture_output=True, text=True, env=dict(os.environ, PYTHONPATH=REPO_DIR),
+                           cwd=REPO_DIR)
+    modules = json.loads(probe.stdout)
+    results = []
+    for name, timing in measured.items():
+        record = {"case": "startup", "command": name, "seconds": round(timing["seconds"], 4),
+                  "min_seconds": timing["min_seconds"]}
+        if name == "import":
+            record["modules"] = len(modules)
+            record["heavy_modules"] = [module for module in DRIVER_MODULES if module in modules]
+        if name == "sqlite_backup":
+            startup = measured["import"]["seconds"]
+            record["startup_share"] = round(startup / timing["seconds"], 3) if timing["seconds"] else None
+        results.append(record)
+        print(json.dumps(record))
+    shutil.rmtree(output_dir, ignore_errors=True)
+    return results
+
+
+def environment():
+    try:
+        version = subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                                 cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        version = None
+    return {
+        "version": version,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def _case_key(record):
+    return tuple(sorted((key, value) for key, value in record.items()
+                        if key in ("case", "size_mb", "shape", "codec", "threads", "pages_per_step", "db_type",
+                                   "exporter", "workers", "command")))
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the cases whose throughput dropped, or whose time grew for
+    cases without a throughput (startup), by more than tolerance (a
+    fraction) against baseline.
+    """
+    previous = {_case_key(record): record for record in baseline["results"]
+                if record.get("mb_per_s") or record.get("case") == "startup"}
+    regressions = []
+    for record in results:
+        before = previous.get(_case_key(record))
+        if not before:
+            continue
+        if record.get("mb_per_s") is not None and before.get("mb_per_s"):
+            if record["mb_per_s"] < before["mb_per_s"] * (1 - tolerance):
+                regressions.append({"case": dict(_case_key(record)), "mb_per_s": record["mb_per_s"],
+                                    "baseline_mb_per_s": before["mb_per_s"]})
+        elif record["case"] == "startup" and record["seconds"] > before["seconds"] * (1 + tolerance):
+            regressions.append({"case": dict(_case_key(record)), "seconds": record["seconds"],
+                                "baseline_seconds": before["seconds"]})
+    return regressions
+
+
+def main():
+    available = []
+    for codec in sorted(COMPRESSORS):
+        try:
+            get_compressor(codec)
+            available.append(codec)
+        except ImportError:
+            pass
+    parser = argparse.ArgumentParser(description="Backup, compression, storage and restore benchmark suite")
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[100], help="Database sizes in MB (100 to 50000)")
+    parser.add_argument("--shapes", nargs="+", default=sorted(SHAPES), choices=sorted(SHAPES), help="Row shapes")
+    parser.add_argument("--codecs", nargs="+", default=available, help="Codecs to measure")
+    parser.add_argument("--threads", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1}),
+                        help="Compression thread counts")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4], help="Worker counts for server dumps")
+    parser.add_argument("--servers", action="store_true", help="Also benchmark throwaway MySQL/PostgreSQL servers")
+    parser.add_argument("--startup-runs", type=int, default=20,
+                        help="Runs of each startup measurement (0 skips them)")
+    parser.add_argument("--startup-only", action="store_true", help="Only measure startup")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "dbbackup-bench"),
+                        help="Where generated databases are cached")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Report cases more than this fraction slower than the baseline")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(dir=args.data_dir)
+    try:
+        results = run_startup(work_dir, args.startup_runs) if args.startup_runs else []
+        if not args.startup_only:
+            results += run_sqlite(args.data_dir, work_dir, args.sizes_mb, args.shapes, args.codecs, args.threads)
+            if args.servers:
+                results += run_servers(work_dir, args.sizes_mb, args.workers)
+    finally:
+        shutil.rmtree(work_dir)
+
+    report = {"environment": environment(), "results": results}
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(results, json.load(f), args.tolerance)
+        for regression in report["regressions"]:
+            if "mb_per_s" in regression:
+                print(f"REGRESSION {regression['case']}: {regression['baseline_mb_per_s']} -> "
+                      f"{regression['mb_per_s']} MB/s")
+            else:
+                print(f"REGRESSION {regression['case']}: {regression['baseline_seconds']} -> "
+                      f"{regression['seconds']} s")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if report.get("regressions"):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# benchmarks/servers.py
+"""
+Throwaway local MySQL and PostgreSQL servers for the benchmarks.
+
+Each server is initialised in a temporary directory, listens on a free
+port on 127.0.0.1 and is deleted on exit, so benchmarks never touch a real
+instance. A server is only available when its binaries are installed
+(``initdb``/``pg_ctl`` on PATH or under /usr/lib/postgresql, ``mysqld``
+on PATH) together with the Python driver.
+"""
+import glob
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _find_binary(name, patterns=()):
+    path = shutil.which(name)
+    if path:
+        return path
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if matches:
+            return matches[-1]
+    return None
+
+
+class ThrowawayPostgres:
+    """Temporary PostgreSQL cluster with a ``bench`` database, used as a context manager."""
+
+    user = "bench"
+    password = ""
+    database = "bench"
+    host = "127.0.0.1"
+
+    def __init__(self):
+        self.initdb = _find_binary("initdb", ["/usr/lib/postgresql/*/bin/initdb"])
+        self.pg_ctl = _find_binary("pg_ctl", ["/usr/lib/postgresql/*/bin/pg_ctl"])
+        self.port = None
+        self.data_dir = None
+
+    @classmethod
+    def available(cls):
+        try:
+            import psycopg2  # noqa: F401
+        except ImportError:
+            return False
+        server = cls()
+        return bool(server.initdb and server.pg_ctl and shutil.which("pg_dump"))
+
+    def __enter__(self):
+        self.data_dir = tempfile.mkdtemp(prefix="bench-pg-")
+        try:
+            self._start()
+        except BaseException:
+            # __exit__ only runs once __enter__ has returned
+            self.__exit__()
+            raise
+        return self
+
+    def _start(self):
+        self.port = _free_port()
+        subprocess.run([self.initdb, "-D", self.data_dir, "-U", self.user, "--auth=trust"], check=True,
+                       stdout=subprocess.DEVNULL)
+        options = f"-p {self.port} -k {self.data_dir} -c listen_addresses={self.host} -c fsync=off"
+        subprocess.run([self.pg_ctl, "-D", self.data_dir, "-o", options, "-l", os.path.join(self.data_dir, "log"),
+                        "-w", "start"], check=True, stdout=subprocess.DEVNULL)
+        import psycopg2
+        connection = psycopg2.connect(host=self.host, port=self.port, user=self.user, dbname="postgres")
+        connection.autocommit = True
+        connection.cursor().execute(f"CREATE DATABASE {self.database}")
+        connection.close()
+
+    def __exit__(self, *exc_info):
+        if os.path.exists(os.path.join(self.data_dir, "postmaster.pid")):
+            subprocess.run([self.pg_ctl, "-D", self.data_dir, "-m", "immediate", "stop"], stdout=subprocess.DEVNULL)
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def populate(self, size):
+        """Creates a bench_rows table of roughly size bytes."""
+        from benchmarks.bench_pg_export import populate
+        from db_connectors.postgresql_connector import PostgreSQLConnector
+
+        connector = PostgreSQLConnector(self.host, self.port, self.user, self.password, self.database)
+        if not connector.connect():
+            raise RuntimeError("Could not connect to the throwaway PostgreSQL server")
+        try:
+            # About 90 bytes per row on disk
+            populate(connector, max(1, size // 90))
+        finally:
+            connector.disconnect()
+
+
+class ThrowawayMySQL:
+    """Temporary MySQL server with a ``bench`` database, used as a context manager."""
+
+    user = "root"
+    password = ""
+    database = "bench"
+    host = "127.0.0.1"
+
+    def __init__(self):
+        self.mysqld = _find_binary("mysqld", ["/usr/sbin/mysqld"])
+        self.port = None
+        self.base_dir = None
+        self.process = None
+
+    @classmethod
+    def available(cls):
+        try:
+            import pymysql  # noqa: F401
+        except ImportError:
+            return False
+        return bool(cls().mysqld and shutil.which("mysqldump"))
+
+    def _connect(self, database=None):
+        import pymysql
+        return pymysql.connect(host=self.host, port=self.port, user=self.user, password=self.password,
+                               database=database)
+
+    def __enter__(self):
+        self.base_dir = tempfile.mkdtemp(prefix="bench-mysql-")
+        try:
+            self._start()
+        except BaseException:
+            # __exit__ only runs once __enter__ has returned
+            self.__exit__()
+            raise
+        return self
+
+    def _start(self):
+        data_dir = os.path.join(self.base_dir, "data")
+        self.port = _free_port()
+        subprocess.run([self.mysqld, "--no-defaults", "--initialize-insecure", f"--datadir={data_dir}"], check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.process = subprocess.Popen(
+            [self.mysqld, "--no-defaults", f"--datadir={data_dir}", f"--port={self.port}", f"--bind-address={self.host}",
+             f"--socket={os.path.join(self.base_dir, 'mysqld.sock')}", "--mysqlx=OFF",
+             "--innodb-flush-log-at-trx-commit=0"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                connection = self._connect()
+                break
+            except Exception:
+                if time.monotonic() > deadline or self.process.poll() is not None:
+                    raise RuntimeError("The throwaway MySQL server did not start")
+                time.sleep(0.5)
+        connection.cursor().execute(f"CREATE DATABASE {self.database}")
+        connection.close()
+
+    def __exit__(self, *exc_info):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+            self.process = None
+        shutil.rmtree(self.base_dir, ignore_errors=True)
+
+    def populate(self, size):
+        """Creates a bench_rows table of roughly size bytes."""
+        connection = self._connect(self.database)
+        try:
+            cursor = connection.cursor()
+            cursor.execute("DROP TABLE IF EXISTS bench_rows")
+            cursor.execute("CREATE TABLE bench_rows (id BIGINT PRIMARY KEY, name VARCHAR(32), "
+                           "amount DECIMAL(12, 2), created DATETIME)")
+            cursor.execute("SET SESSION cte_max_recursion_depth = 100000000")
+            rows = max(1, size // 90)
+            for start in range(0, rows, 100000):
+                cursor.execute(
+                    "INSERT INTO bench_rows "
+                    "WITH RECURSIVE seq (n) AS (SELECT %s UNION ALL SELECT n + 1 FROM seq WHERE n < %s) "
+                    "SELECT n, MD5(n), n * 0.01, NOW() - INTERVAL n SECOND FROM seq",
+                    (start + 1, min(rows, start + 100000)),
+                )
+            connection.commit()
+        finally:
+            connection.close()
+
+
+SERVERS = {
+    "postgresql": ThrowawayPostgres,
+    "mysql": ThrowawayMySQL,
+}
@@ -0,0 +1,97 @@
+import os
+import signal
+import sqlite3
+import sys
+import threading
+
+from controllers.backup import get_connector
+from controllers.catalog import get_catalog
+from controllers.storage import get_storage
+from loggings.logger import log_error, log_info
+from utils.compression import get_compressor
+from utils.plugins import BACKUP_SERVICES
+
+
+def run_archive(args):
+    """
+    Archives the database's committed transactions continuously until interrupted (Ctrl-C or SIGTERM).
+
+    :return: Archiver statistics, or None if archiving could not run.
+    """
+    from backup_services.wal_archive import DEFAULT_POLL_INTERVAL, DEFAULT_SEGMENT_SECONDS
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    compressor = get_compressor(args.compression, args.compression_level)
+    segment_seconds = args.archive_segment_seconds or DEFAULT_SEGMENT_SECONDS
+    connector = None
+    try:
+        if args.db_type == "sqlite":
+            archiver = BACKUP_SERVICES.load("sqlite-wal")(args.db_path, get_storage(args), compressor,
+                                                          segment_seconds=segment_seconds,
+                                                          catalog=get_catalog(args))
+        elif args.db_type == "mysql":
+            connector = get_connector(args)
+            if not connector.connect():
+                log_error("Failed to connect to mysql database")
+                return None
+            archiver = BACKUP_SERVICES.load("mysql-binlog")(connector, get_storage(args),
+                                                            os.path.join(args.output_dir, ".binlog-spool"), compressor,
+                                                            segment_seconds=segment_seconds)
+        elif args.db_type == "postgresql":
+            log_error("PostgreSQL hands WAL segments to archive_command; "
+                      "set archive_command = '... --archive-wal-segment %p' instead")
+            return None
+        else:
+            log_error(f"Unsupported database type: {args.db_type}")
+            return None
+        archiver.start()
+        log_info(f"Archiving {args.db_type} transactions to {args.storage} storage")
+        try:
+            archiver.run(args.archive_interval or DEFAULT_POLL_INTERVAL, stop)
+        except KeyboardInterrupt:
+            pass
+    except (RuntimeError, ValueError, OSError, ImportError, sqlite3.Error) as e:
+        log_error(f"Archiving failed: {e}")
+        return None
+    finally:
+        if connector is not None:
+            connector.disconnect()
+    log_info(f"Archiving stopped: {archiver.stats}")
+    return archiver.stats
+
+
+def run_pg_wal_command(args):
+    """Runs the PostgreSQL archive_command, restore_command or recovery setup selected by args."""
+    archiver_class = BACKUP_SERVICES.load("postgresql-wal")
+    try:
+        if args.archive_wal_segment:
+            # PostgreSQL recycles the segment once archive_command succeeds, so local copies are fsynced first
+            archiver = archiver_class(get_storage(args, sync=True),
+                                      get_compressor(args.compression, args.compression_level))
+            log_info(f"Archived WAL segment {archiver.archive_segment(args.archive_wal_segment)}")
+        elif args.restore_wal_segment:
+            name, destination = args.restore_wal_segment
+            archiver = archiver_class(get_storage(args), get_compressor(args.compression))
+            # A missing segment is the normal end of recovery, so it is not logged as an error
+            return archiver.restore_segment(name, destination)
+        else:
+            command = (f"{sys.executable} {os.path.abspath(sys.argv[0])} --output-dir {os.path.abspath(args.output_dir)} "
+                       f"--log-file {os.path.abspath(args.log_file)} --storage {args.storage} "
+                       f"--compression {args.compression}")
+            if args.storage != "local":
+                command += f" --bucket {args.bucket}"
+                if args.prefix:
+                    command += f" --prefix {args.prefix}"
+                if args.endpoint_url:
+                    command += f" --endpoint-url {args.endpoint_url}"
+            command += " --restore-wal-segment %f %p"
+            from backup_services.wal_archive import write_recovery_config
+
+            write_recovery_config(args.recovery_config, command, until=args.restore_time)
+            log_info(f"{args.recovery_config} will replay the archived WAL"
+                     f"{' up to ' + args.restore_time if args.restore_time else ''} when the server starts")
+    except (RuntimeError, ValueError, OSError, ImportError) as e:
+        log_error(f"PostgreSQL WAL archiving failed: {e}")
+        return False
+    return True
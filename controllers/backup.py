@@ -0,0 +1,276 @@
+import os
+import sqlite3
+
+from controllers.catalog import catalog_backup, get_catalog
+from controllers.storage import get_storage, mib, path_size, upload_backup
+from loggings.logger import log_error, log_info, log_metrics
+from utils.compression import get_compressor
+from utils.defaults import CONTAINER_EXTENSION
+from utils.pipeline import StreamingPipeline
+from utils.plugins import BACKUP_SERVICES, CONNECTORS
+
+
+def run_backup(args, pool=None, metrics=None, events=None, job=None):
+    """
+    Connects to the database described by args and runs the selected backup.
+
+    :param pool: Optional ConnectionPool; MySQL and PostgreSQL connections are
+        then borrowed from it instead of opened and closed for this backup.
+    :param metrics: Optional BackupMetrics to record the stages in; they are
+        logged as JSON records once the backup finishes.
+    :param events: Optional EventBus to publish the backup's start, finished
+        stages and outcome to.
+    :param job: Name the events are published under; defaults to the database.
+    :return: Path of the backup, or None if it failed.
+    """
+    if metrics is None:
+        from utils.metrics import BackupMetrics
+
+        metrics = BackupMetrics({"db_type": args.db_type, "database": args.database or args.db_path})
+    if events is None:
+        return connect_and_backup(args, pool, metrics)
+    from notifications.notifications import EVENT_COMPLETED, EVENT_FAILED, EVENT_STAGE, EVENT_STARTED
+
+    job = job or args.database or args.db_path
+    events.publish(EVENT_STARTED, job, db_type=args.db_type, backup_type=args.backup_type)
+    # The scheduler labels its metrics with the job, which the event carries already
+    metrics.on_stage = lambda record: events.publish(EVENT_STAGE, job, **{key: value for key, value in record.items()
+                                                                         if key != "job"})
+    try:
+        backup_path = connect_and_backup(args, pool, metrics)
+    except Exception as e:
+        events.publish(EVENT_FAILED, job, db_type=args.db_type, error=f"{type(e).__name__}: {e}")
+        raise
+    if backup_path is None:
+        events.publish(EVENT_FAILED, job, db_type=args.db_type, error="backup failed; see the log for details")
+    else:
+        events.publish(EVENT_COMPLETED, job, db_type=args.db_type, location=backup_path, **metrics.totals())
+    return backup_path
+
+
+def get_connector(args):
+    """
+    Returns a connector for the database described by args; only the selected
+    database's driver is imported.
+
+    :raises ValueError: For an unsupported database type.
+    :raises ImportError: If the database's driver is not installed.
+    """
+    connector_class = CONNECTORS.load(args.db_type)
+    if args.db_type == "sqlite":
+        return connector_class(args.db_path)
+    return connector_class(args.host, args.port, args.user, args.password, args.database)
+
+
+def connect_and_backup(args, pool, metrics):
+    try:
+        connector = get_connector(args)
+    except (ValueError, ImportError) as e:
+        log_error(str(e))
+        return None
+
+    if args.backup_type != "full" and args.db_type != "sqlite":
+        log_error(f"{args.backup_type.capitalize()} backups are not supported for {args.db_type}")
+        return None
+
+    if pool is not None and args.db_type != "sqlite":
+        backup_path = run_pooled_backup(args, connector, pool, metrics)
+        log_metrics(metrics)
+        return backup_path
+
+    with metrics.stage("connect"):
+        connected = connector.connect()
+    if connected:
+        log_info(f"Connected to {args.db_type} database")
+        try:
+            return dispatch_backup(args, connector, metrics)
+        finally:
+            connector.disconnect()
+            log_info(f"Disconnected from {args.db_type} database")
+            log_metrics(metrics)
+    else:
+        log_error(f"Failed to connect to {args.db_type} database")
+        return None
+
+
+def run_pooled_backup(args, connector, pool, metrics):
+    try:
+        with metrics.stage("connect"):
+            connector = pool.acquire(connector)
+    except (ConnectionError, TimeoutError) as e:
+        log_error(f"Failed to connect to {args.db_type} database: {e}")
+        return None
+    log_info(f"Using pooled {args.db_type} connection (pool: {pool.stats()})")
+    try:
+        backup_path = dispatch_backup(args, connector, metrics, pool=pool)
+    except BaseException:
+        pool.release(connector, discard=True)
+        raise
+    pool.release(connector, discard=backup_path is None)
+    return backup_path
+
+
+def dispatch_backup(args, connector, metrics=None, pool=None):
+    from utils.metrics import BackupMetrics
+    from utils.throttle import DEFAULT_BUSY_THRESHOLD, LoadMonitor, Throttle
+
+    metrics = metrics or BackupMetrics()
+    monitor = None
+    if args.adaptive_throttle and args.db_type != "sqlite":
+        try:
+            monitor = LoadMonitor(connector, busy_threshold=args.busy_threshold or DEFAULT_BUSY_THRESHOLD,
+                                  sessions=args.workers or 1).start()
+        except (RuntimeError, ValueError) as e:
+            log_error(f"Adaptive throttling disabled: {e}")
+    throttle = None
+    if args.max_read_rate or args.max_read_iops or monitor:
+        throttle = Throttle(mib(args.max_read_rate), args.max_read_iops, monitor=monitor)
+    streamed = False
+    try:
+        if args.backup_type != "full":
+            backup_path = run_page_backup(args, connector, throttle, metrics)
+        elif args.exporter == "native" and args.db_type == "postgresql":
+            backup_path = run_native_export(args, connector, throttle, metrics)
+        elif (args.workers or args.exporter == "native") and args.db_type != "sqlite":
+            backup_path = run_parallel_backup(args, connector, throttle, metrics, pool=pool)
+        else:
+            # Streams straight into the selected storage
+            backup_path = run_streaming_backup(args, connector, throttle, metrics)
+            streamed = True
+    finally:
+        if monitor is not None:
+            monitor.stop()
+        if throttle is not None:
+            log_info(f"Read throttle: {throttle.stats}")
+    location = backup_path
+    if backup_path and args.storage != "local" and not streamed:
+        location = upload_backup(args, backup_path, metrics)
+    if location and not args.dedup:
+        catalog_backup(args, location, backup_path)
+    return location
+
+
+def run_streaming_backup(args, connector, throttle=None, metrics=None):
+    from utils.metrics import BackupMetrics
+
+    metrics = metrics or BackupMetrics()
+    # Set for SQL dumps, which containers split into one entry per table
+    dump_type = None
+    if args.db_type == "sqlite":
+        backup = BACKUP_SERVICES.load("sqlite")(args.db_path, args.output_dir, connection=connector.connection,
+                                                name=args.name, pages_per_step=args.sqlite_pages_per_step,
+                                                step_sleep=args.sqlite_step_sleep, throttle=throttle,
+                                                db_file=connector.db_file)
+        # The online snapshot is taken up front; its time counts towards the dump stage
+        with metrics.stage("dump"):
+            source = backup.iter_snapshot(count_rows=args.format == "container")
+    else:
+        if args.base_backup and args.db_type == "postgresql":
+            backup = BACKUP_SERVICES.load("postgresql-base")(args.database, args.output_dir, args.user,
+                                                             args.password, db_host=args.host or "localhost",
+                                                             db_port=args.port)
+        else:
+            # With the binlog position recorded, the dump is the starting point for binlog replay
+            dump_args = ["--single-transaction", "--master-data=2"] if args.binlog_position and \
+                args.db_type == "mysql" else []
+            backup = BACKUP_SERVICES.load("dump")(args.db_type, args.database, args.output_dir, args.user,
+                                                  args.password, db_host=args.host or "localhost", db_port=args.port,
+                                                  dump_args=dump_args)
+            dump_type = args.db_type
+        source = backup.iter_dump()
+        if throttle is not None:
+            # Reading the dump's stdout slower makes the dump tool itself wait on the pipe
+            source = throttle.iter_chunks(source)
+
+    # Stream dump -> compressor -> storage without an intermediate uncompressed file
+    storage = get_storage(args)
+    if args.dedup:
+        # Chunks are compressed individually; a compressed stream would defeat deduplication
+        compressor = get_compressor("none")
+        chunking = "fixed" if args.db_type == "sqlite" else "cdc"
+        sink = storage.chunk_store(chunking).open(backup.backup_filename())
+    elif args.format == "container":
+        # The container compresses independent blocks itself, so the pipeline passes data through
+        compressor = get_compressor("none")
+        # A SQLite snapshot stays one entry, whose index record lists the tables' row counts
+        sink = storage.open_container(backup.backup_filename() + CONTAINER_EXTENSION,
+                                      get_compressor(args.compression, args.compression_level),
+                                      threads=args.compress_threads, split_dump=dump_type)
+        if args.db_type == "sqlite":
+            sink.default_attributes["tables"] = backup.tables
+    else:
+        compressor = get_compressor(args.compression, args.compression_level, args.compress_threads)
+        sink = storage.open(backup.backup_filename() + compressor.extension)
+    pipeline = StreamingPipeline(source, sink, compressor)
+    try:
+        try:
+            backup_file = pipeline.run()
+        finally:
+            metrics.add_pipeline(pipeline)
+        log_info(f"Backup saved to {args.storage} storage: {backup_file}")
+        for stats in pipeline.stats.values():
+            log_info(f"Stage {stats.name}: {stats.bytes_in} bytes in, {stats.bytes_out} bytes out, {stats.seconds:.2f}s")
+        if args.dedup:
+            log_info(f"Chunk store: {sink.stats}")
+        return backup_file
+    except RuntimeError as e:
+        log_error(str(e))
+        return None
+
+
+def run_parallel_backup(args, connector, throttle=None, metrics=None, pool=None):
+    compressor = get_compressor(args.compression, args.compression_level, args.compress_threads)
+    # MySQL tables are always exported in-process here; large ones are split into primary-key ranges, and the
+    # views, routines, triggers and events go into a post-data script
+    table_exporter = BACKUP_SERVICES.load("mysql-table-export")(chunk_rows=args.mysql_chunk_rows)
+    backup = BACKUP_SERVICES.load("parallel-dump")(args.db_type, connector, args.output_dir, workers=args.workers or 1,
+                                                   compressor=compressor, table_exporter=table_exporter,
+                                                   container=args.format == "container", throttle=throttle,
+                                                   metrics=metrics, pool=pool)
+    try:
+        backup_path = backup.backup()
+        log_info(f"Backup saved to local storage: {backup_path}")
+        return backup_path
+    except RuntimeError as e:
+        log_error(str(e))
+        return None
+
+
+def run_native_export(args, connector, throttle=None, metrics=None):
+    compressor = get_compressor(args.compression, args.compression_level, args.compress_threads)
+    backup = BACKUP_SERVICES.load("postgresql-copy")(connector, args.output_dir, compressor=compressor,
+                                                     container=args.format == "container", throttle=throttle,
+                                                     metrics=metrics)
+    try:
+        backup_path = backup.backup()
+        log_info(f"Backup saved to local storage: {backup_path}")
+        return backup_path
+    except RuntimeError as e:
+        log_error(str(e))
+        return None
+
+
+def run_page_backup(args, connector, throttle=None, metrics=None):
+    from utils.metrics import BackupMetrics
+
+    metrics = metrics or BackupMetrics()
+    try:
+        catalog = get_catalog(args)
+    except sqlite3.Error as e:
+        log_error(f"Backup catalog unavailable, scanning {args.output_dir} for the parent backup: {e}")
+        catalog = None
+    backup = BACKUP_SERVICES.load("sqlite-incremental")(args.db_path, args.output_dir,
+                                                        connection=connector.connection, name=args.name,
+                                                        throttle=throttle, catalog=catalog,
+                                                        db_file=connector.db_file)
+    try:
+        with metrics.stage("dump") as counts:
+            counts["bytes_in"] = os.path.getsize(args.db_path)
+            backup_path = backup.backup(args.backup_type)
+            counts["bytes_out"] = path_size(backup_path)
+        log_info(f"Backup saved to local storage: {backup_path} "
+                 f"({backup.stats['changed_pages']} of {backup.stats['pages']} pages changed)")
+        return backup_path
+    except RuntimeError as e:
+        log_error(str(e))
+        return None
@@ -0,0 +1,83 @@
+import os
+import sqlite3
+
+from controllers.storage import get_storage
+from loggings.logger import log_error, log_info
+from utils.plugins import STORAGES
+
+
+def get_catalog(args):
+    """
+    Opens the backup catalog selected by args.
+
+    A catalog created in an output directory that already holds backups
+    starts out with those backups recorded.
+    """
+    from storages.catalog import CATALOG_FILE, BackupCatalog
+
+    path = args.catalog or os.path.join(args.output_dir, CATALOG_FILE)
+    catalog = BackupCatalog(path)
+    if args.output_dir:
+        catalog.initialize(args.output_dir)
+    return catalog
+
+
+def catalog_name(args):
+    """Name under which the database's backups are cataloged; SQLite databases go by --name or their file name."""
+    return args.database or args.name or os.path.basename(args.db_path)
+
+
+def retention_policy(args):
+    policy = {"keep_last": args.keep_last, "daily": args.keep_daily, "weekly": args.keep_weekly,
+              "monthly": args.keep_monthly}
+    return policy if any(policy.values()) else None
+
+
+def catalog_backup(args, location, local_path):
+    """Records a finished backup in the catalog and applies the retention policy, if any."""
+    try:
+        catalog = get_catalog(args)
+        catalog.record(local_path, catalog_name(args), args.db_type, args.storage, location)
+        if retention_policy(args):
+            prune_backups(args, catalog, [catalog_name(args)])
+    except (sqlite3.Error, ValueError, OSError, RuntimeError) as e:
+        log_error(f"Could not update the backup catalog: {e}")
+
+
+def prune_backups(args, catalog, databases):
+    """Deletes the backups of databases that the retention policy expires, in one batch per storage."""
+    def delete(backups):
+        local = [backup["location"] for backup in backups if backup["storage"] == "local"]
+        remote = [backup["location"] for backup in backups if backup["storage"] != "local"]
+        if remote and args.storage == "local":
+            raise ValueError("Expired backups are in remote storage; pass --storage and --bucket to delete them")
+        if local:
+            STORAGES.load("local")(args.output_dir).delete(local)
+        if remote:
+            get_storage(args).delete(remote)
+
+    expired = []
+    for database in databases:
+        pruned = catalog.prune(database, delete, dry_run=args.dry_run, **retention_policy(args))
+        for backup in pruned:
+            log_info(f"{'Would delete' if args.dry_run else 'Deleted'} {backup['type']} backup of {database} "
+                     f"from {backup['created']}: {backup['location']}")
+        expired.extend(pruned)
+    return expired
+
+
+def run_prune(args):
+    """
+    Applies the retention policy to the backups in the catalog.
+
+    :return: The expired backups, or None if pruning failed.
+    """
+    try:
+        catalog = get_catalog(args)
+        databases = [catalog_name(args)] if args.db_path or args.database else catalog.databases()
+        expired = prune_backups(args, catalog, databases)
+    except (sqlite3.Error, ValueError, OSError, RuntimeError) as e:
+        log_error(f"Pruning failed: {e}")
+        return None
+    log_info(f"{'Would prune' if args.dry_run else 'Pruned'} {len(expired)} backups")
+    return expired
@@ -0,0 +1,36 @@
+import os
+
+from loggings.logger import log_error
+
+
+def start_notifications(args):
+    """
+    Starts delivering backup events to the --notify-* sinks.
+
+    :return: (EventBus, NotificationDispatcher), or (None, None) if no sink was given.
+    """
+    if not (args.notify_webhook or args.notify_slack or args.notify_file):
+        return None, None
+    from notifications.notifications import EventBus, FileSink, NotificationDispatcher, SlackSink, WebhookSink
+
+    sinks = [WebhookSink(url) for url in args.notify_webhook] + [SlackSink(url) for url in args.notify_slack]
+    if args.notify_file:
+        sinks.append(FileSink(args.notify_file))
+    spool_dir = args.notify_spool or (os.path.join(args.output_dir, ".notifications") if args.output_dir else None)
+    options = {"rate_limit": args.notify_rate} if args.notify_rate is not None else {}
+    dispatcher = NotificationDispatcher(sinks, spool_dir=spool_dir, **options).start()
+    events = EventBus()
+    events.subscribe(dispatcher)
+    return events, dispatcher
+
+
+def stop_notifications(args, dispatcher):
+    if dispatcher is None:
+        return
+    from notifications.notifications import DEFAULT_CLOSE_TIMEOUT
+
+    timeout = args.notify_timeout if args.notify_timeout is not None else DEFAULT_CLOSE_TIMEOUT
+    for sink, stats in dispatcher.close(timeout).items():
+        if stats["spooled"] or stats["dropped"]:
+            log_error(f"Notifications to {sink}: {stats['delivered']} delivered, {stats['spooled']} spooled, "
+                      f"{stats['dropped']} dropped")
@@ -0,0 +1,81 @@
+import os
+import sqlite3
+
+from controllers.backup import get_connector
+from controllers.catalog import catalog_name, get_catalog
+from loggings.logger import log_error, log_info
+from utils.plugins import STORAGES
+
+
+def run_restore(args):
+    """
+    Restores args.restore into the database described by args.
+
+    :return: Restore statistics, or None if it failed.
+    """
+    if args.restore_time and not args.restore:
+        try:
+            catalog = get_catalog(args)
+            backup = None
+            if args.db_type == "sqlite":
+                # An archived WAL generation can be replayed right up to the requested time
+                backup = catalog.latest(catalog_name(args), before=args.restore_time, backup_format="wal",
+                                        storage="local")
+            backup = backup or catalog.latest(catalog_name(args), before=args.restore_time, storage="local")
+        except (sqlite3.Error, ValueError) as e:
+            log_error(f"Backup catalog lookup failed: {e}")
+            return None
+        if backup is None:
+            log_error(f"No local backup of {catalog_name(args)} taken at or before {args.restore_time}")
+            return None
+        log_info(f"Restoring {backup['location']} ({backup['type']} backup from {backup['created']})")
+        args.restore = backup["location"]
+    chunks = None
+    if args.dedup:
+        # Chunk store backups are named after the file they would have been written to
+        store = STORAGES.load("local")(args.output_dir or os.path.dirname(args.restore) or ".").chunk_store()
+        chunks = store.iter_backup(os.path.basename(args.restore))
+
+    if args.db_type == "sqlite":
+        from restore_services.sqlite_restore import SQLiteRestore
+
+        restore = SQLiteRestore(args.db_path, tables=args.tables, until=args.restore_time)
+        try:
+            stats = restore.restore_stream(chunks) if chunks is not None else restore.restore(args.restore)
+        except (RuntimeError, ValueError, OSError) as e:
+            log_error(f"Restore failed: {e}")
+            return None
+        log_info(f"Restored {args.restore} into {args.db_path}: {stats}")
+        return stats
+
+    from restore_services.sql_restore import DEFAULT_WORKERS as DEFAULT_RESTORE_WORKERS, SQLRestore, client_command
+
+    try:
+        connector = get_connector(args)
+    except (ValueError, ImportError) as e:
+        log_error(str(e))
+        return None
+    if not connector.connect():
+        log_error(f"Failed to connect to {args.db_type} database")
+        return None
+    restore = SQLRestore(args.db_type, connector, workers=args.workers or DEFAULT_RESTORE_WORKERS, tables=args.tables)
+    try:
+        if chunks is not None:
+            restore.restore_stream(chunks)
+            stats = {"files": 1}
+        else:
+            stats = restore.restore(args.restore)
+        log_info(f"Restored {args.restore} into {args.db_type} database {args.database}: {stats}")
+        archive_dir = args.output_dir or os.path.dirname(args.restore)
+        from backup_services.wal_archive import BINLOG_DIRECTORY, replay_binlogs
+
+        if args.restore_time and args.db_type == "mysql" and os.path.isdir(os.path.join(archive_dir, BINLOG_DIRECTORY)):
+            replayed = replay_binlogs(archive_dir, args.restore, client_command("mysql", connector),
+                                      until=args.restore_time)
+            log_info(f"Rolled {args.database} forward to {args.restore_time} with {replayed} archived binlogs")
+        return stats
+    except (RuntimeError, ValueError, OSError) as e:
+        log_error(f"Restore failed: {e}")
+        return None
+    finally:
+        connector.disconnect()
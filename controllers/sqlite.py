@@ -4,14 +4,25 @@ import gzip
 import shutil
 from datetime import datetime
 
+from backup_services.sqlite_online_backup import DEFAULT_PAGES_PER_STEP, DEFAULT_STEP_SLEEP, SQLiteOnlineBackup
+from utils.checksum import checksum_file
+
 class SQLiteBackupUtility:
     """
     Utility class for backing up SQLite databases with compression and local storage.
+
+    With a BackupCatalog, every backup is recorded in it, so it can be found
+    by database and time rather than by its file name.
     """
 
-    def __init__(self, db_path, backup_dir):
+    def __init__(self, db_path, backup_dir, connection=None, pages_per_step=DEFAULT_PAGES_PER_STEP,
+                 step_sleep=DEFAULT_STEP_SLEEP, catalog=None):
         self.db_path = db_path
         self.backup_dir = backup_dir
+        self.connection = connection
+        self.pages_per_step = pages_per_step
+        self.step_sleep = step_sleep
+        self.catalog = catalog
 
     def _validate_paths(self):
         """Validates the database path and ensures the backup directory exists."""
@@ -31,11 +42,21 @@ class SQLiteBackupUtility:
         with open(source, 'rb') as src_file:
             with gzip.open(destination, 'wb') as gz_file:
                 shutil.copyfileobj(src_file, gz_file)
+        checksum_file(destination)
+
+    def _copy_database(self, destination):
+        """Copies the live database with the online backup API."""
+        connection = self.connection or sqlite3.connect(self.db_path)
+        try:
+            SQLiteOnlineBackup(connection, self.pages_per_step, self.step_sleep).copy_to(destination)
+        finally:
+            if connection is not self.connection:
+                connection.close()
 
     def backup(self):
         """
         Performs the backup operation:
-        - Copies the database file.
+        - Copies the database file online, page by page.
         - Compresses the backup.
         - Saves the compressed file to the backup directory.
         """
@@ -44,7 +65,7 @@ class SQLiteBackupUtility:
 
             # Create a temporary backup file
             temp_backup_path = self._generate_backup_filename().replace('.gz', '')
-            shutil.copy2(self.db_path, temp_backup_path)
+            self._copy_database(temp_backup_path)
 
             # Compress the backup file
             compressed_backup_path = temp_backup_path + ".gz"
@@ -53,6 +74,9 @@ class SQLiteBackupUtility:
             # Remove the uncompressed temporary backup file
             os.remove(temp_backup_path)
 
+            if self.catalog is not None:
+                self.catalog.record(compressed_backup_path, os.path.basename(self.db_path), "sqlite")
+
             print(f"Backup completed successfully: {compressed_backup_path}")
             return compressed_backup_path
 
@@ -0,0 +1,51 @@
+import os
+
+from loggings.logger import log_error, log_info
+from utils.plugins import STORAGES
+
+
+def path_size(path):
+    """Size of a backup file, or of all files of a backup directory."""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def mib(value):
+    return int(value * 1024 * 1024) if value else None
+
+
+def get_storage(args, sync=False):
+    """
+    Returns the storage backend selected by args.
+
+    :param sync: fsync local files on commit; S3 objects are durable once their upload completes.
+    """
+    if args.storage == "local":
+        return STORAGES.load("local")(args.output_dir, sync=sync)
+    from storages.s3_storage import DEFAULT_CONCURRENCY, DEFAULT_PART_SIZE, GCS_ENDPOINT
+    from utils.throttle import Throttle
+
+    endpoint_url = args.endpoint_url or (GCS_ENDPOINT if args.storage == "gcs" else None)
+    part_size = args.upload_part_size * 1024 * 1024 if args.upload_part_size else DEFAULT_PART_SIZE
+    # Upload state lives next to the local backups so interrupted uploads can be resumed
+    return STORAGES.load(args.storage)(args.bucket, prefix=args.prefix, endpoint_url=endpoint_url,
+                                       part_size=part_size, concurrency=args.upload_concurrency or DEFAULT_CONCURRENCY,
+                                       state_dir=os.path.join(args.output_dir, ".uploads"),
+                                       throttle=Throttle(mib(args.max_upload_rate)) if args.max_upload_rate else None)
+
+
+def upload_backup(args, backup_path, metrics=None):
+    """Uploads a backup written to the output directory; the local copy is kept."""
+    from utils.metrics import BackupMetrics
+
+    metrics = metrics or BackupMetrics()
+    try:
+        with metrics.stage("upload") as counts:
+            counts["bytes_in"] = counts["bytes_out"] = path_size(backup_path)
+            url = get_storage(args).save(backup_path)
+    except Exception as e:
+        log_error(f"Upload of {backup_path} failed (resume with --upload {backup_path}): {e}")
+        return None
+    log_info(f"Backup uploaded to {args.storage} storage: {url}")
+    return url
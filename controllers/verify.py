@@ -0,0 +1,27 @@
+from loggings.logger import log_error, log_info, log_metrics
+
+
+def run_verify(args):
+    """
+    Verifies the backups under args.verify against their checksum manifests.
+
+    :return: True if every backup verified (backups without a checksum are
+        reported but do not fail the run).
+    """
+    from restore_services.verify import DEFAULT_WORKERS as DEFAULT_VERIFY_WORKERS, BackupVerifier
+    from utils.metrics import BackupMetrics
+
+    metrics = BackupMetrics({"command": "verify"})
+    verifier = BackupVerifier(workers=args.verify_workers or DEFAULT_VERIFY_WORKERS, quick_check=args.quick_check)
+    with metrics.stage("verify") as counts:
+        results = verifier.verify(args.verify)
+        counts["bytes_in"] = counts["bytes_out"] = verifier.stats["bytes"]
+    for result in results:
+        if not result["ok"]:
+            log_error(f"Verification failed for {result['path']}: "
+                      f"{result.get('error') or 'PRAGMA quick_check: ' + result['quick_check']}")
+        elif result["status"] == "unverified":
+            log_info(f"No checksum for {result['path']}; {result['bytes']} bytes hash to {result['digest']}")
+    log_info(f"Verified {verifier.stats['files']} backups: {verifier.stats}")
+    log_metrics(metrics)
+    return verifier.stats["failed"] == 0
@@ -3,12 +3,16 @@ import pymysql
 from pymysql import Error
 
 class MySQLConnector:
-    def __init__(self, host, port, user, password, database):
+    DEFAULT_PORT = 3306
+
+    def __init__(self, host, port, user, password, database, connect_timeout=10):
         self.host = host
-        self.port = int(port)
+        # DSNs and command lines may leave the port out
+        self.port = int(port) if port else self.DEFAULT_PORT
         self.user = user
         self.password = password
         self.database = database
+        self.connect_timeout = connect_timeout
         self.connection = None
 
     def connect(self):
@@ -18,13 +22,24 @@ class MySQLConnector:
                 port=self.port,
                 user=self.user,
                 password=self.password,
-                database=self.database
+                database=self.database,
+                connect_timeout=self.connect_timeout
             )
             return True
         except Error as e:
             print(f"Error connecting to MySQL database: {e}")
             return False
 
+    def ping(self):
+        """Cheap liveness check; returns False if the server connection is gone."""
+        if not self.connection:
+            return False
+        try:
+            self.connection.ping(reconnect=False)
+            return True
+        except Error:
+            return False
+
     def disconnect(self):
         if self.connection:
             self.connection.close()
\ No newline at end of file
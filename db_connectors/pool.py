@@ -0,0 +1,247 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_MAX_PER_HOST = 4
+DEFAULT_MAX_IDLE_SECONDS = 300.0
+DEFAULT_ACQUIRE_TIMEOUT = 60.0
+DEFAULT_CONNECT_RETRIES = 4
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 30.0
+
+
+def connector_key(connector):
+    """Identifies connectors that can share connections: same class and connection parameters."""
+    params = tuple(getattr(connector, name, None) for name in ("host", "port", "user", "password", "database", "db_path"))
+    return (type(connector).__name__,) + params
+
+
+class ConnectionPool:
+    """
+    Reuses connected MySQL, PostgreSQL and SQLite connectors across backup jobs.
+
+    Connectors are keyed by class and connection parameters. A released
+    connector is kept idle and handed to the next job asking for the same
+    key after a cheap ``ping()``, which saves the TCP, TLS and
+    authentication handshake of a fresh connection. Dead connectors are
+    dropped and replaced.
+
+    At most max_per_host connectors (idle or in use) exist per host,
+    counting the slots held through reserve() for connections opened
+    outside the pool; further acquires wait for one to be released.
+    Failed connection attempts are retried with exponential backoff and
+    jitter.
+
+    sqlite3 connections may only be used by the thread that opened them,
+    so pooled SQLite connectors fail their ping from another thread and are
+    simply reopened.
+
+    :param max_per_host: Connector limit per database host.
+    :param max_idle_seconds: Idle connectors older than this are closed.
+    :param acquire_timeout: Seconds to wait for a free slot before TimeoutError.
+    :param retries: Connection attempts after the first one fails.
+    :param backoff: Delay before the first retry; doubled for each further retry.
+    :param max_backoff: Upper bound for the retry delay.
+    """
+
+    def __init__(self, max_per_host=DEFAULT_MAX_PER_HOST, max_idle_seconds=DEFAULT_MAX_IDLE_SECONDS,
+                 acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT, retries=DEFAULT_CONNECT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 max_backoff=DEFAULT_MAX_BACKOFF):
+        self.max_per_host = max_per_host
+        self.max_idle_seconds = max_idle_seconds
+        self.acquire_timeout = acquire_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.idle = {}
+        self.open_per_host = {}
+        self.condition = threading.Condition()
+        self.closed = False
+        self.metrics = {"hits": 0, "misses": 0, "ping_failures": 0, "connect_failures": 0, "waits": 0}
+
+    @staticmethod
+    def _host(connector):
+        return getattr(connector, "host", None) or "local"
+
+    def _take_idle(self, key):
+        """Pops the most recently released idle connector for key, closing expired ones."""
+        entries = self.idle.get(key, [])
+        now = time.monotonic()
+        while entries:
+            connector, released = entries.pop()
+            if now - released <= self.max_idle_seconds:
+                return connector
+            self._close(connector)
+        return None
+
+    def _close(self, connector):
+        self.open_per_host[self._host(connector)] -= 1
+        try:
+            connector.disconnect()
+        except Exception:
+            pass
+
+    def _evict_idle(self, host):
+        """Closes the oldest idle connector of host to make room for another key."""
+        oldest = None
+        for key, entries in self.idle.items():
+            for entry in entries:
+                if self._host(entry[0]) == host and (oldest is None or entry[1] < oldest[2][1]):
+                    oldest = (key, entries, entry)
+        if oldest is None:
+            return False
+        oldest[1].remove(oldest[2])
+        self._close(oldest[2][0])
+        return True
+
+    def acquire(self, connector):
+        """
+        Returns a connected connector equivalent to the given, unconnected one.
+
+        :param connector: Connector instance describing the connection; it is
+            connected and used only when no idle connector can be reused.
+        :raises TimeoutError: If the host stays at its limit for acquire_timeout.
+        :raises ConnectionError: If connecting fails after all retries.
+        """
+        key = connector_key(connector)
+        host = self._host(connector)
+        deadline = time.monotonic() + self.acquire_timeout
+        with self.condition:
+            while True:
+                pooled = self._take_idle(key)
+                if pooled is not None:
+                    break
+                if self.open_per_host.get(host, 0) < self.max_per_host or self._evict_idle(host):
+                    self.open_per_host[host] = self.open_per_host.get(host, 0) + 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No connection slot free for {host} after {self.acquire_timeout}s")
+                self.metrics["waits"] += 1
+                self.condition.wait(remaining)
+
+        if pooled is not None:
+            # Ping outside the lock; a round trip to a slow host must not block other keys
+            if pooled.ping():
+                with self.condition:
+                    self.metrics["hits"] += 1
+                return pooled
+            with self.condition:
+                self.metrics["ping_failures"] += 1
+            try:
+                pooled.disconnect()
+            except Exception:
+                pass
+            connector = pooled
+
+        with self.condition:
+            self.metrics["misses"] += 1
+        try:
+            self._connect(connector)
+        except BaseException:
+            with self.condition:
+                self.open_per_host[host] -= 1
+                self.condition.notify()
+            raise
+        return connector
+
+    def _connect(self, connector):
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            if connector.connect():
+                return
+            with self.condition:
+                self.metrics["connect_failures"] += 1
+            if attempt < self.retries:
+                time.sleep(delay * random.uniform(0.5, 1.0))
+                delay = min(delay * 2, self.max_backoff)
+        raise ConnectionError(f"Could not connect to {self._host(connector)} after {self.retries + 1} attempts")
+
+    def release(self, connector, discard=False):
+        """
+        Returns a connector to the pool.
+
+        :param discard: Close it instead, e.g. after an error left the session in an unknown state.
+        """
+        if not discard:
+            try:
+                # Never hand an open transaction to the next job
+                connector.connection.rollback()
+            except Exception:
+                discard = True
+        with self.condition:
+            if discard or self.closed:
+                self._close(connector)
+            else:
+                self.idle.setdefault(connector_key(connector), []).append((connector, time.monotonic()))
+            self.condition.notify()
+
+    @contextmanager
+    def connection(self, connector):
+        """Context manager form of acquire()/release(); the connector is discarded on error."""
+        pooled = self.acquire(connector)
+        try:
+            yield pooled
+        except BaseException:
+            self.release(pooled, discard=True)
+            raise
+        self.release(pooled)
+
+    @contextmanager
+    def reserve(self, connector, count):
+        """
+        Holds up to count connection slots of the connector's host.
+
+        For connections the pool cannot hand out itself: the worker
+        connections of a parallel dump or restore, which need their own
+        snapshot transaction, or pg_dump processes. Waits until at least one
+        slot is free (closing idle connectors of the host if needed), then
+        takes as many as are free, up to count.
+
+        Yields the number of slots granted; the caller opens no more
+        connections than that.
+
+        :raises TimeoutError: If no slot frees up within acquire_timeout.
+        """
+        host = self._host(connector)
+        deadline = time.monotonic() + self.acquire_timeout
+        with self.condition:
+            granted = 0
+            while granted < count:
+                if self.open_per_host.get(host, 0) < self.max_per_host or self._evict_idle(host):
+                    self.open_per_host[host] = self.open_per_host.get(host, 0) + 1
+                    granted += 1
+                    continue
+                if granted:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No connection slot free for {host} after {self.acquire_timeout}s")
+                self.metrics["waits"] += 1
+                self.condition.wait(remaining)
+        try:
+            yield granted
+        finally:
+            with self.condition:
+                self.open_per_host[host] -= granted
+                self.condition.notify_all()
+
+    def stats(self):
+        """Returns the hit/miss counters and the number of open and idle connectors."""
+        with self.condition:
+            stats = dict(self.metrics)
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else None
+            stats["open"] = sum(self.open_per_host.values())
+            stats["idle"] = sum(len(entries) for entries in self.idle.values())
+        return stats
+
+    def close(self):
+        """Closes every idle connector; connectors still in use are closed when released."""
+        with self.condition:
+            self.closed = True
+            for entries in self.idle.values():
+                for connector, _ in entries:
+                    self._close(connector)
+            self.idle.clear()
@@ -1,13 +1,19 @@
 import psycopg2
 from psycopg2 import Error
 
+from utils.throttle import APPLICATION_NAME
+
 class PostgreSQLConnector:
-    def __init__(self, host, port, user, password, database):
+    DEFAULT_PORT = 5432
+
+    def __init__(self, host, port, user, password, database, connect_timeout=10):
         self.host = host
-        self.port = int(port)
+        # DSNs and command lines may leave the port out
+        self.port = int(port) if port else self.DEFAULT_PORT
         self.user = user
         self.password = password
         self.database = database
+        self.connect_timeout = connect_timeout
         self.connection = None
 
     def connect(self):
@@ -17,13 +23,28 @@ class PostgreSQLConnector:
                 port=self.port,
                 user=self.user,
                 password=self.password,
-                database=self.database
+                database=self.database,
+                connect_timeout=self.connect_timeout,
+                application_name=APPLICATION_NAME
             )
             return True
         except Error as e:
             print(f"Error connecting to PostgreSQL database: {e}")
             return False
 
+    def ping(self):
+        """Cheap liveness check; returns False if the server connection is gone."""
+        if not self.connection or self.connection.closed:
+            return False
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            self.connection.rollback()
+            return True
+        except Error:
+            return False
+
     def disconnect(self):
         if self.connection:
             self.connection.close()
\ No newline at end of file
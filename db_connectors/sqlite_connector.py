@@ -5,15 +5,32 @@ class SQLiteConnector:
     def __init__(self, db_path):
         self.db_path = db_path
         self.connection = None
+        # Read by snapshots while connected: closing a descriptor of the database file
+        # would drop the connection's locks on it (see consistent_snapshot())
+        self.db_file = None
 
     def connect(self):
         try:
             self.connection = sqlite3.connect(self.db_path)
+            self.db_file = open(self.db_path, "rb")
             return True
-        except Error as e:
+        except (Error, OSError) as e:
             print(f"Error connecting to SQLite database: {e}")
             return False
 
+    def ping(self):
+        """Cheap liveness check; returns False if the connection is closed or unusable."""
+        if not self.connection:
+            return False
+        try:
+            self.connection.execute("SELECT 1")
+            return True
+        except Error:
+            return False
+
     def disconnect(self):
         if self.connection:
-            self.connection.close()
\ No newline at end of file
+            self.connection.close()
+        if self.db_file:
+            self.db_file.close()
+            self.db_file = None
\ No newline at end of file
@@ -1,3 +1,4 @@
+import json
 import logging
 
 def setup_logger(log_file):
@@ -11,4 +12,9 @@ def log_info(message):
     logging.info(message)
 
 def log_error(message):
-    logging.error(message)
\ No newline at end of file
+    logging.error(message)
+
+def log_metrics(metrics):
+    """Logs each stage of a BackupMetrics as a JSON record."""
+    for record in metrics.records() + [metrics.summary()]:
+        logging.info(json.dumps(dict(record, event="backup_stage")))
@@ -1,60 +1,220 @@
 import argparse
-from db_connectors.mysql_connector import MySQLConnector
-from db_connectors.sqlite_connector import SQLiteConnector
-from db_connectors.postgresql_connector import PostgreSQLConnector
-from backup_services.full_backup import FullBackup
-from backup_services.sqlite_backup import SQLiteBackup
-from storages.local_storage import LocalStorage
-from utils.compression import compress_file
-from loggings.logger import setup_logger, log_info, log_error
+import os
+import sys
+from controllers.catalog import retention_policy, run_prune
+from controllers.notifications import start_notifications, stop_notifications
+from controllers.storage import upload_backup
+from controllers.verify import run_verify
+from utils.defaults import (BACKUP_TYPES, COMPRESSION_CODECS, DEFAULT_CHUNK_ROWS, DEFAULT_PAGES_PER_STEP,
+                            DEFAULT_STEP_SLEEP)
+from loggings.logger import setup_logger
 
-def main():
+def build_parser():
     parser = argparse.ArgumentParser(description="Database Backup Utility")
-    parser.add_argument("--db-type", required=True, help="Type of database (e.g., mysql, sqlite)")
+    parser.add_argument("--db-type", help="Type of database (e.g., mysql, sqlite); required unless verifying")
     parser.add_argument("--host", help="Database host (required for MySQL, PostgreSQL, Mongodb)")
-    parser.add_argument("--port", type=int, help="Database port (required for MySQL, PostgreSQL, Mongodb)")
+    parser.add_argument("--port", type=int, help="Database port (default: 3306 for MySQL, 5432 for PostgreSQL)")
     parser.add_argument("--user", help="Database user (required for MySQL, PostgreSQL, Mongodb)")
     parser.add_argument("--password", help="Database password (required for MySQL, PostgreSQL, Mongodb)")
     parser.add_argument("--database", help="Database name (required for MySQL, PostgreSQL, Mongodb)")
     parser.add_argument("--db-path", help="Path to SQLite database file (required for SQLite)")
-    parser.add_argument("--output-dir", required=True, help="Output directory for backups")
+    parser.add_argument("--name",
+                        help="Name of the SQLite database in backup file names and the catalog "
+                             "(default: the file name of --db-path)")
+    parser.add_argument("--backup-type", default="full", choices=BACKUP_TYPES,
+                        help="Backup type; incremental and differential are page-level and SQLite only")
+    parser.add_argument("--sqlite-pages-per-step", type=int, default=DEFAULT_PAGES_PER_STEP,
+                        help="Pages copied per SQLite online backup step (-1 copies everything in one step)")
+    parser.add_argument("--sqlite-step-sleep", type=float, default=DEFAULT_STEP_SLEEP,
+                        help="Seconds to pause between SQLite online backup steps")
+    parser.add_argument("--compression", default="gzip", choices=COMPRESSION_CODECS,
+                        help="Compression codec for the backup file")
+    parser.add_argument("--compression-level", type=int, help="Codec-specific compression level")
+    parser.add_argument("--compress-threads", type=int, default=os.cpu_count() or 1,
+                        help="Number of threads used for compression (default: all cores)")
+    parser.add_argument("--exporter", default="dump", choices=["dump", "native"],
+                        help="Use the dump tool or the in-process exporter (PostgreSQL COPY, MySQL batched INSERTs)")
+    parser.add_argument("--workers", type=int,
+                        help="Dump MySQL/PostgreSQL tables in parallel with this many workers (MySQL tables are "
+                             "then always exported in-process; views, routines, triggers and events are included)")
+    parser.add_argument("--mysql-chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS,
+                        help="Split MySQL tables with an integer primary key into ranges of about this many rows")
+    parser.add_argument("--format", default="file", choices=["file", "container"],
+                        help="Write compressed files, or a random-access container with a block index")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Store the backup in the deduplicating chunk store instead of a single file")
+    parser.add_argument("--restore", metavar="BACKUP",
+                        help="Restore this backup file or directory (or chunk store backup name with --dedup) "
+                             "instead of taking a backup")
+    parser.add_argument("--restore-time", metavar="TIME",
+                        help="Restore the latest local backup taken at or before this ISO 8601 time, "
+                             "looked up in the backup catalog (for SQLite, --database names the source file), "
+                             "and roll it forward to that time with the archived SQLite WAL or MySQL binlogs")
+    parser.add_argument("--tables", nargs="+", help="Restore only these tables")
+    parser.add_argument("--upload", metavar="BACKUP",
+                        help="Upload (or resume uploading) this local backup to --storage instead of taking a backup")
+    parser.add_argument("--verify", metavar="PATH", nargs="+",
+                        help="Verify these backup files, or every backup under these directories (files without a "
+                             "checksum are reported as unverified), instead of taking a backup")
+    parser.add_argument("--verify-workers", type=int,
+                        help="Number of backups hashed (and quick-checked) in parallel (default: one per CPU)")
+    parser.add_argument("--quick-check", action="store_true",
+                        help="With --verify, also restore SQLite backups to a temporary file and run PRAGMA quick_check")
+    parser.add_argument("--archive-wal", action="store_true",
+                        help="Continuously archive committed SQLite WAL frames or MySQL binlogs to --storage until "
+                             "interrupted, instead of taking a backup")
+    parser.add_argument("--archive-interval", type=float,
+                        help="Seconds between checks for newly committed transactions (default: 1)")
+    parser.add_argument("--archive-segment-seconds", type=float,
+                        help="Write archived transactions to storage at least this often (default: 10)")
+    parser.add_argument("--archive-wal-segment", metavar="PATH",
+                        help="Archive one PostgreSQL WAL segment (archive_command = '... --archive-wal-segment %%p')")
+    parser.add_argument("--restore-wal-segment", metavar=("NAME", "DEST"), nargs=2,
+                        help="Fetch an archived PostgreSQL WAL segment from --output-dir "
+                             "(restore_command = '... --restore-wal-segment %%f %%p')")
+    parser.add_argument("--recovery-config", metavar="DATA_DIR",
+                        help="Set up a restored PostgreSQL base backup in DATA_DIR to replay the archived WAL "
+                             "from --output-dir, up to --restore-time if given")
+    parser.add_argument("--base-backup", action="store_true",
+                        help="Take a physical PostgreSQL base backup with pg_basebackup (for WAL replay) "
+                             "instead of a pg_dump")
+    parser.add_argument("--binlog-position", action="store_true",
+                        help="Take MySQL dumps in a single transaction and record the binlog position, "
+                             "so they can be rolled forward with archived binlogs")
+    parser.add_argument("--batch", metavar="MANIFEST",
+                        help="Back up every target of this JSON manifest (SQLite paths or globs, MySQL/PostgreSQL "
+                             "DSNs) concurrently instead of a single database")
+    parser.add_argument("--batch-processes", type=int,
+                        help="Processes backing up SQLite targets of a batch (default: one per CPU)")
+    parser.add_argument("--batch-threads", type=int,
+                        help="Threads backing up MySQL/PostgreSQL targets of a batch (default: 4)")
+    parser.add_argument("--batch-report", metavar="PATH", help="Write the batch summary as JSON to this file")
+    parser.add_argument("--notify-webhook", action="append", default=[], metavar="URL",
+                        help="POST backup events (started, stage finished, failed, completed) as JSON to this URL; "
+                             "may be given more than once")
+    parser.add_argument("--notify-slack", action="append", default=[], metavar="URL",
+                        help="Post completions and failures to this Slack-compatible incoming webhook")
+    parser.add_argument("--notify-file", metavar="PATH", help="Append backup events as JSON lines to this file")
+    parser.add_argument("--notify-spool",
+                        help="Directory keeping notifications a slow or unreachable sink has not taken yet "
+                             "(default: .notifications in --output-dir)")
+    parser.add_argument("--notify-rate", type=float,
+                        help="Deliveries per second to each notification sink (default: 1)")
+    parser.add_argument("--notify-timeout", type=float,
+                        help="Seconds to wait for pending notifications at exit before spooling them (default: 5)")
+    parser.add_argument("--output-dir", help="Output directory for backups (required unless restoring or verifying)")
+    parser.add_argument("--catalog", help="Backup catalog database (default: catalog.sqlite in --output-dir)")
+    parser.add_argument("--keep-last", type=int, default=0, help="Retention: keep the newest N backups")
+    parser.add_argument("--keep-daily", type=int, default=0,
+                        help="Retention: keep the newest backup of each of the last N days")
+    parser.add_argument("--keep-weekly", type=int, default=0,
+                        help="Retention: keep the newest backup of each of the last N weeks")
+    parser.add_argument("--keep-monthly", type=int, default=0,
+                        help="Retention: keep the newest backup of each of the last N months")
+    parser.add_argument("--prune", action="store_true",
+                        help="Apply the --keep-* retention policy to the cataloged backups instead of taking a backup "
+                             "(of --database/--db-path, or of every database in the catalog)")
+    parser.add_argument("--dry-run", action="store_true", help="With --prune, only report what would be deleted")
+    parser.add_argument("--storage", default="local", choices=["local", "s3", "gcs"],
+                        help="Where backups are stored; s3 and gcs stream uploads as the backup runs")
+    parser.add_argument("--bucket", help="Bucket name (required for s3 and gcs storage)")
+    parser.add_argument("--prefix", default="", help="Key prefix for backups in the bucket")
+    parser.add_argument("--endpoint-url", help="S3-compatible endpoint, e.g. a MinIO server")
+    parser.add_argument("--upload-concurrency", type=int,
+                        help="Number of multipart upload parts sent at the same time (default: 4)")
+    parser.add_argument("--upload-part-size", type=int, help="Multipart upload part size in MiB (default: 64)")
+    parser.add_argument("--max-read-rate", type=float,
+                        help="Limit reading from the database (dump output, SQLite pages) to this many MiB/s")
+    parser.add_argument("--max-read-iops", type=float,
+                        help="Limit read operations (dump chunks, SQLite pages) per second")
+    parser.add_argument("--max-upload-rate", type=float, help="Limit uploads to s3/gcs to this many MiB/s")
+    parser.add_argument("--adaptive-throttle", action="store_true",
+                        help="Slow the backup down while the MySQL/PostgreSQL server is busy")
+    parser.add_argument("--busy-threshold", type=int,
+                        help="Number of active server sessions above which the adaptive throttle slows down "
+                             "(default: 8)")
     parser.add_argument("--log-file", required=True, help="Log file path")
+    return parser
 
+def main():
+    parser = build_parser()
     args = parser.parse_args()
+    if args.verify:
+        setup_logger(args.log_file)
+        if not run_verify(args):
+            sys.exit(1)
+        return
+    if args.prune:
+        if not retention_policy(args):
+            parser.error("--prune needs at least one of --keep-last, --keep-daily, --keep-weekly, --keep-monthly")
+        if not args.output_dir and not args.catalog:
+            parser.error("--prune needs --output-dir or --catalog")
+        setup_logger(args.log_file)
+        if run_prune(args) is None:
+            sys.exit(1)
+        return
+    if args.batch:
+        from controllers.batch import run_batch
 
-    setup_logger(args.log_file)
-
-      
-    if args.db_type == "mysql":        
-        connector = MySQLConnector(args.host, args.port, args.user, args.password, args.database)
-    elif args.db_type == "sqlite":       
-        connector = SQLiteConnector(args.db_path)   
-    elif args.db_type == "postgresql":
-        connector = PostgreSQLConnector(args.host, args.port, args.user, args.password, args.database) 
-    else:
-        log_error(f"Unsupported database type: {args.db_type}")
+        setup_logger(args.log_file)
+        events, dispatcher = start_notifications(args)
+        try:
+            summary = run_batch(args, events)
+        finally:
+            stop_notifications(args, dispatcher)
+        if summary is None or summary["failed"]:
+            sys.exit(1)
         return
+    if args.archive_wal_segment or args.restore_wal_segment or args.recovery_config:
+        if not args.output_dir:
+            parser.error("PostgreSQL WAL archiving needs --output-dir")
+        from controllers.archive import run_pg_wal_command
 
-    if connector.connect():
-        log_info(f"Connected to {args.db_type} database")
-        backup = FullBackup(args.db_type, args.database, args.output_dir)
-        backup_file = backup.backup()
-        log_info(f"Backup completed: {backup_file}")
+        setup_logger(args.log_file)
+        if not run_pg_wal_command(args):
+            sys.exit(1)
+        return
+    if not args.db_type:
+        parser.error("--db-type is required unless --verify or --prune is given")
+    if args.restore_time and not args.restore and not args.output_dir and not args.catalog:
+        parser.error("--restore-time needs --output-dir or --catalog")
+    if not args.restore and not args.restore_time and not args.output_dir:
+        parser.error("--output-dir is required unless --restore is given")
+    if args.upload and args.storage == "local":
+        parser.error("--upload needs --storage s3 or gcs")
+    if args.dedup and args.format == "container":
+        parser.error("--dedup and --format container cannot be combined")
+    if args.dedup and not args.restore and args.db_type != "sqlite" and (args.workers or args.exporter == "native"):
+        # Parallel and native exports write their own files, which never go through the chunk store
+        parser.error("--dedup cannot be combined with --workers or --exporter native")
+    if args.storage != "local" and not args.restore:
+        if not args.bucket:
+            parser.error(f"--bucket is required for {args.storage} storage")
+        if args.dedup:
+            parser.error("--dedup is only supported with local storage")
 
-        compressed_file = f"{backup_file}.gz"
-        compress_file(backup_file, compressed_file)
-        log_info(f"Backup compressed: {compressed_file}")
+    setup_logger(args.log_file)
+    if args.archive_wal:
+        from controllers.archive import run_archive
 
-        storage = LocalStorage(args.output_dir)
-        storage.save(compressed_file)
-        log_info(f"Backup saved to local storage: {args.output_dir}")
+        if run_archive(args) is None:
+            sys.exit(1)
+    elif args.restore or args.restore_time:
+        from controllers.restore import run_restore
 
-        connector.disconnect()
-        log_info(f"Disconnected from {args.db_type} database")
+        run_restore(args)
+    elif args.upload:
+        upload_backup(args, args.upload)
     else:
-        log_error(f"Failed to connect to {args.db_type} database")
+        # The backup handlers import the compressors and the pipeline, which only a backup needs
+        from controllers.backup import run_backup
+
+        events, dispatcher = start_notifications(args)
+        try:
+            run_backup(args, events=events)
+        finally:
+            stop_notifications(args, dispatcher)
 
-    
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,614 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where spool files are only safe within one process
+    fcntl = None
+
+EVENT_STARTED = "backup.started"
+EVENT_STAGE = "backup.stage"
+EVENT_FAILED = "backup.failed"
+EVENT_COMPLETED = "backup.completed"
+EVENT_BATCH_COMPLETED = "batch.completed"
+
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_BATCH_INTERVAL = 1.0
+DEFAULT_RATE_LIMIT = 1.0
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 30.0
+DEFAULT_MAX_PENDING = 1000
+DEFAULT_HTTP_TIMEOUT = 10.0
+DEFAULT_CLOSE_TIMEOUT = 5.0
+
+logger = logging.getLogger(__name__)
+
+
+class Event:
+    """
+    Something that happened to a backup job.
+
+    :param type: One of the EVENT_* names.
+    :param job: Database or job the event is about.
+    :param data: JSON-serializable details (stage figures, error, location, ...).
+    """
+
+    def __init__(self, type, job=None, data=None, timestamp=None, id=None):
+        self.type = type
+        self.job = job
+        self.data = data or {}
+        self.timestamp = timestamp or datetime.now().isoformat(timespec="milliseconds")
+        # Lets receivers drop duplicates: delivery is at least once
+        self.id = id or uuid.uuid4().hex
+
+    def as_dict(self):
+        return {"id": self.id, "type": self.type, "job": self.job, "timestamp": self.timestamp, "data": self.data}
+
+    @classmethod
+    def from_dict(cls, record):
+        return cls(record["type"], record.get("job"), record.get("data"), record.get("timestamp"), record.get("id"))
+
+    def __repr__(self):
+        return f"Event({self.type!r}, {self.job!r})"
+
+
+class EventBus:
+    """
+    Fans published events out to subscribers.
+
+    publish() calls every subscriber in the publishing thread, so
+    subscribers must return immediately (the NotificationDispatcher only
+    hands the event to its own thread). A subscriber that raises is
+    logged and skipped; publishing never fails the backup.
+    """
+
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        """Registers callback(event); returns it, so it can be used as a decorator."""
+        with self._lock:
+            self._subscribers.append(callback)
+        return callback
+
+    def publish(self, event_type, job=None, **data):
+        return self.publish_event(Event(event_type, job, data))
+
+    def publish_event(self, event):
+        """Publishes an existing Event, e.g. one forwarded from a worker process."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(event)
+            except Exception:
+                logger.exception("Event subscriber %r failed on %r", callback, event)
+        return event
+
+
+class QueueEventBus:
+    """
+    Stand-in for an EventBus in a worker process.
+
+    publish() puts the event on a multiprocessing queue (e.g. a Manager
+    queue, which can be passed to a process pool); forward_events() in the
+    parent publishes it from there on the real EventBus, with its id and
+    timestamp unchanged.
+    """
+
+    def __init__(self, events_queue):
+        self.queue = events_queue
+
+    def publish(self, event_type, job=None, **data):
+        event = Event(event_type, job, data)
+        try:
+            self.queue.put(event.as_dict())
+        except Exception:
+            logger.exception("Could not forward %r", event)
+        return event
+
+
+def forward_events(events_queue, events):
+    """Publishes the events put on events_queue by QueueEventBus instances on events until None is put."""
+    while True:
+        record = events_queue.get()
+        if record is None:
+            return
+        events.publish_event(Event.from_dict(record))
+
+
+class DeliveryError(Exception):
+    """
+    A sink could not deliver a batch.
+
+    :param retryable: False for errors that a retry cannot fix (e.g. HTTP 400),
+        which drop the batch instead of retrying it.
+    """
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class Sink:
+    """
+    Destination for notifications.
+
+    deliver() receives a batch of events and runs in a worker thread of
+    the dispatcher, so it may block; it raises DeliveryError (or OSError)
+    when the batch was not delivered.
+
+    :param name: Unique name; it also names the sink's spool file.
+    :param event_types: Event types this sink receives; None for all.
+    """
+
+    def __init__(self, name, event_types=None):
+        self.name = name
+        self.event_types = set(event_types) if event_types is not None else None
+
+    def accepts(self, event):
+        return self.event_types is None or event.type in self.event_types
+
+    def deliver(self, events):
+        raise NotImplementedError
+
+
+class FileSink(Sink):
+    """Appends events to a local file, one JSON object per line."""
+
+    def __init__(self, path, name=None, event_types=None):
+        super().__init__(name or f"file-{os.path.basename(path)}", event_types)
+        self.path = path
+
+    def deliver(self, events):
+        with open(self.path, "a") as f:
+            f.write("".join(json.dumps(event.as_dict()) + "\n" for event in events))
+
+
+class WebhookSink(Sink):
+    """
+    POSTs each batch as JSON (``{"events": [...]}``) to a URL.
+
+    Connection errors, timeouts, HTTP 429 and 5xx responses are retried;
+    other HTTP errors drop the batch.
+
+    :param headers: Extra request headers (e.g. Authorization).
+    :param timeout: Seconds to wait for the server.
+    """
+
+    def __init__(self, url, name=None, event_types=None, headers=None, timeout=DEFAULT_HTTP_TIMEOUT):
+        super().__init__(name or f"webhook-{url}", event_types)
+        self.url = url
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+
+    def payload(self, events):
+        return {"events": [event.as_dict() for event in events]}
+
+    def deliver(self, events):
+        body = json.dumps(self.payload(events)).encode()
+        request = urllib.request.Request(self.url, data=body, method="POST",
+                                         headers=dict({"Content-Type": "application/json"}, **self.headers))
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+        except urllib.error.HTTPError as e:
+            raise DeliveryError(f"{self.url} answered HTTP {e.code}", retryable=e.code == 429 or e.code >= 500)
+        except (urllib.error.URLError, OSError) as e:
+            raise DeliveryError(f"{self.url} unreachable: {e}")
+
+
+def format_event(event):
+    """One line of text describing an event, as posted to chat."""
+    data = event.data
+    if event.type == EVENT_STARTED:
+        return f"Backup of {event.job} started"
+    if event.type == EVENT_STAGE:
+        return (f"Backup of {event.job}: {data.get('stage')} took {data.get('wall_seconds', 0):.2f}s "
+                f"({data.get('bytes_in', 0)} bytes in, {data.get('bytes_out', 0)} bytes out)")
+    if event.type == EVENT_FAILED:
+        return f":x: Backup of {event.job} failed: {data.get('error')}"
+    if event.type == EVENT_COMPLETED:
+        return (f":white_check_mark: Backup of {event.job} completed in {data.get('wall_seconds', 0):.1f}s "
+                f"({data.get('bytes_in', 0)} bytes in, {data.get('bytes_out', 0)} bytes out): {data.get('location')}")
+    if event.type == EVENT_BATCH_COMPLETED:
+        failed = f", {data.get('failed')} failed" if data.get("failed") else ""
+        return (f"Batch finished: {data.get('succeeded')} of {data.get('targets')} databases backed up in "
+                f"{data.get('wall_seconds', 0):.1f}s{failed}")
+    return f"{event.type}: {event.job}"
+
+
+class SlackSink(WebhookSink):
+    """
+    Posts each batch as one message to a Slack incoming webhook (or any
+    Slack-compatible endpoint, e.g. Mattermost).
+
+    Only completions and failures are posted unless event_types says otherwise.
+    """
+
+    def __init__(self, url, name=None, event_types=(EVENT_COMPLETED, EVENT_FAILED, EVENT_BATCH_COMPLETED),
+                 timeout=DEFAULT_HTTP_TIMEOUT):
+        super().__init__(url, name or f"slack-{url}", event_types, timeout=timeout)
+
+    def payload(self, events):
+        return {"text": "\n".join(format_event(event) for event in events)}
+
+
+class _RateLimiter:
+    """Spaces out deliveries to at most rate per second (no bursts)."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+
+    async def wait(self):
+        now = time.monotonic()
+        delay = self._next - now
+        self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class _DaemonWorker:
+    """
+    Runs blocking calls for the event loop one at a time, in order, on a daemon thread.
+
+    Unlike the threads of a ThreadPoolExecutor, which the interpreter joins
+    at exit, a call stuck on a hung sink cannot keep the process alive.
+    """
+
+    def __init__(self, name):
+        self._calls = queue.Queue()
+        threading.Thread(target=self._run, name=name, daemon=True).start()
+
+    def _run(self):
+        while True:
+            call = self._calls.get()
+            if call is None:
+                return
+            loop, future, function, args = call
+            try:
+                result, error = function(*args), None
+            except Exception as e:
+                result, error = None, e
+            try:
+                loop.call_soon_threadsafe(_resolve, future, result, error)
+            except RuntimeError:
+                # The loop is closed; nobody waits for the result any more
+                pass
+
+    def run(self, loop, function, *args):
+        """Queues function(*args); returns an asyncio future of its result."""
+        future = loop.create_future()
+        self._calls.put((loop, future, function, args))
+        return future
+
+    def stop(self):
+        """Lets the thread exit once the calls queued so far are done."""
+        self._calls.put(None)
+
+
+def _resolve(future, result, error):
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+@contextmanager
+def _spool_lock(spool_path):
+    """Serializes access to a spool file between processes sharing the spool directory."""
+    if fcntl is None:
+        yield
+        return
+    with open(spool_path + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _count_spool(spool_path):
+    with _spool_lock(spool_path):
+        try:
+            with open(spool_path) as f:
+                return sum(1 for _ in f)
+        except FileNotFoundError:
+            return 0
+
+
+def _write_spool(spool_path, events, front):
+    lines = "".join(json.dumps(event.as_dict()) + "\n" for event in events)
+    with _spool_lock(spool_path):
+        if front and os.path.exists(spool_path):
+            with open(spool_path) as f:
+                lines += f.read()
+            with open(spool_path + ".part", "w") as f:
+                f.write(lines)
+            os.replace(spool_path + ".part", spool_path)
+        else:
+            with open(spool_path, "a") as f:
+                f.write(lines)
+
+
+def _read_spool(spool_path, count):
+    """Takes up to count events from the front of the spool; returns (events, lines left)."""
+    with _spool_lock(spool_path):
+        with open(spool_path) as f:
+            lines = f.readlines()
+        taken, rest = lines[:count], lines[count:]
+        with open(spool_path + ".part", "w") as f:
+            f.writelines(rest)
+        os.replace(spool_path + ".part", spool_path)
+    return [Event.from_dict(json.loads(line)) for line in taken if line.strip()], len(rest)
+
+
+class _SinkState:
+    def __init__(self, sink, spool_path, rate_limit, spooled=0):
+        self.sink = sink
+        self.spool_path = spool_path
+        self.queue = deque()
+        self.in_flight = []
+        self.wakeup = asyncio.Event()
+        self.limiter = _RateLimiter(rate_limit)
+        self.delivery = _DaemonWorker(f"notify-{sink.name}")
+        self.task = None
+        # Lines in the spool file, counting writes still queued on the spool thread
+        self.spooled = spooled
+        self.stats = {"delivered": 0, "batches": 0, "retries": 0, "spooled": 0, "dropped": 0}
+
+    @property
+    def spooling(self):
+        # Once events go to the spool, later ones follow them there so order is kept
+        return self.spooled > 0
+
+
+class NotificationDispatcher:
+    """
+    Delivers events to sinks from an asyncio loop in a background thread.
+
+    submit() only hands the event to the loop thread, so publishing costs
+    the backup a few microseconds however slow a sink is. Each sink has its
+    own queue and worker:
+
+    * events are batched, up to batch_size per delivery or whatever
+      arrived within batch_interval of the first one;
+    * deliveries are rate-limited to rate_limit per second per sink;
+    * a failed delivery is retried with exponential backoff and jitter,
+      and after max_retries the batch goes to the spool;
+    * a sink that falls max_pending events behind (slow or down) gets new
+      events appended to a JSON-lines spool file in spool_dir instead of
+      holding them in memory, and the spool is drained in order once the
+      sink catches up (on a later run if need be).
+
+    Blocking deliveries run on one daemon thread per sink and spool file
+    I/O on another, so neither stalls the loop, close() never waits longer
+    than its timeout for a hung sink (whatever is still undelivered then is
+    spooled) and a hung sink cannot keep the process from exiting. Spool
+    files are locked while they are read or written, so processes sharing
+    a spool directory do not lose each other's events. Delivery is at
+    least once: a batch cut off by close() may be delivered again from the
+    spool.
+
+    :param sinks: Sink instances with unique names.
+    :param spool_dir: Directory for the spool files; without one, overflowing events are dropped.
+    :param max_pending: In-memory events per sink before spooling.
+    """
+
+    def __init__(self, sinks, spool_dir=None, batch_size=DEFAULT_BATCH_SIZE, batch_interval=DEFAULT_BATCH_INTERVAL,
+                 rate_limit=DEFAULT_RATE_LIMIT, max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF,
+                 max_backoff=DEFAULT_MAX_BACKOFF, max_pending=DEFAULT_MAX_PENDING):
+        names = [sink.name for sink in sinks]
+        if len(set(names)) != len(names):
+            raise ValueError("Notification sink names must be unique")
+        self.sinks = sinks
+        self.spool_dir = spool_dir
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.rate_limit = rate_limit
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_pending = max_pending
+        self.states = {}
+        self._loop = None
+        self._thread = None
+        self._closing = None
+        self._spool_worker = None
+        self._last_spool = None
+        self._started = threading.Event()
+
+    def _spool_path(self, sink):
+        if self.spool_dir is None:
+            return None
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in sink.name)
+        return os.path.join(self.spool_dir, f"{safe}.jsonl")
+
+    def start(self):
+        if self.spool_dir is not None:
+            os.makedirs(self.spool_dir, exist_ok=True)
+        self._spool_worker = _DaemonWorker("notify-spool")
+        self._thread = threading.Thread(target=self._run_loop, name="notifications", daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._closing = asyncio.Event()
+        for sink in self.sinks:
+            spool_path = self._spool_path(sink)
+            spooled = _count_spool(spool_path) if spool_path is not None else 0
+            state = self.states[sink.name] = _SinkState(sink, spool_path, self.rate_limit, spooled)
+            state.task = self._loop.create_task(self._worker(state))
+        self._started.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    def submit(self, event):
+        """Queues an event for every sink accepting it; safe to call from any thread and never blocks."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(self._enqueue, event)
+        except RuntimeError:
+            # The loop closed in the meantime
+            pass
+
+    __call__ = submit
+
+    def _enqueue(self, event):
+        for state in self.states.values():
+            if not state.sink.accepts(event):
+                continue
+            if state.spooling or len(state.queue) >= self.max_pending:
+                self._spool(state, [event])
+            else:
+                state.queue.append(event)
+                state.wakeup.set()
+
+    def _spool(self, state, events, front=False):
+        """
+        Queues events to be appended to the sink's spool file on the spool thread.
+
+        :param front: Put them before what is already spooled, for events
+            that were queued or in flight before the spooled ones arrived.
+        """
+        if state.spool_path is None:
+            state.stats["dropped"] += len(events)
+            logger.warning("Dropped %d notifications for %s: no spool directory", len(events), state.sink.name)
+            return
+        state.spooled += len(events)
+        state.stats["spooled"] += len(events)
+        future = self._spool_worker.run(self._loop, _write_spool, state.spool_path, events, front)
+        future.add_done_callback(lambda done: done.cancelled() or done.exception() is None or logger.error(
+            "Could not spool %d notifications for %s: %s", len(events), state.sink.name, done.exception()))
+        self._last_spool = future
+
+    async def _unspool(self, state):
+        """Moves up to max_pending events from the spool file back into the queue."""
+        before = state.spooled
+        read = self._spool_worker.run(self._loop, _read_spool, state.spool_path, self.max_pending)
+        try:
+            await asyncio.shield(read)
+        except asyncio.CancelledError:
+            # close() cut the worker off while the spool thread was taking the events out of the file;
+            # they still go into the queue, which close() spools again
+            await asyncio.wait([read])
+            raise
+        finally:
+            if read.done() and read.exception() is None:
+                events, left = read.result()
+                # Writes queued meanwhile run after the read and add to what it left
+                state.spooled = left + state.spooled - before
+                state.queue.extend(events)
+
+    async def _worker(self, state):
+        while True:
+            if not state.queue and state.spooling:
+                await self._unspool(state)
+            if not state.queue:
+                if self._closing.is_set():
+                    return
+                state.wakeup.clear()
+                await state.wakeup.wait()
+                continue
+            if len(state.queue) < self.batch_size and not self._closing.is_set():
+                # Give the batch a moment to fill up
+                try:
+                    await asyncio.wait_for(self._closing.wait(), self.batch_interval)
+                except asyncio.TimeoutError:
+                    pass
+            state.in_flight = [state.queue.popleft() for _ in range(min(self.batch_size, len(state.queue)))]
+            await state.limiter.wait()
+            delivered = await self._deliver(state, state.in_flight)
+            state.in_flight = []
+            if not delivered and self._closing.is_set():
+                return
+
+    async def _deliver(self, state, batch):
+        """Delivers batch with retries; returns False if it was spooled instead."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                await state.delivery.run(self._loop, state.sink.deliver, batch)
+                state.stats["delivered"] += len(batch)
+                state.stats["batches"] += 1
+                return True
+            except Exception as e:
+                retryable = getattr(e, "retryable", True)
+                if not retryable:
+                    state.stats["dropped"] += len(batch)
+                    logger.error("Dropped %d notifications for %s: %s", len(batch), state.sink.name, e)
+                    return True
+                if attempt == self.max_retries:
+                    # The sink is down: park everything pending on disk, oldest first
+                    pending = batch + list(state.queue)
+                    state.queue.clear()
+                    logger.warning("Spooling %d notifications for %s: %s", len(pending), state.sink.name, e)
+                    self._spool(state, pending, front=True)
+                    return False
+                state.stats["retries"] += 1
+                await asyncio.sleep(min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0))
+
+    async def _close(self, timeout):
+        self._closing.set()
+        for state in self.states.values():
+            state.wakeup.set()
+        tasks = [state.task for state in self.states.values()]
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for state in self.states.values():
+            # Whatever a cut-off worker still held goes to the spool for the next run
+            leftover = state.in_flight + list(state.queue)
+            if leftover:
+                self._spool(state, leftover, front=True)
+            state.in_flight, state.queue = [], deque()
+        if self._last_spool is not None:
+            # Spool writes run in order, so the last one finishing means all are on disk
+            await asyncio.wait([self._last_spool])
+
+    def close(self, timeout=DEFAULT_CLOSE_TIMEOUT):
+        """
+        Delivers what is queued, waiting at most timeout seconds, spools the rest and stops the loop.
+
+        :return: Per-sink statistics (delivered, batches, retries, spooled, dropped).
+        """
+        if self._loop is None or self._loop.is_closed():
+            return self.stats
+        future = asyncio.run_coroutine_threadsafe(self._close(timeout), self._loop)
+        future.result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        # A delivery thread stuck on a hung sink is left to time out on its own; it is a daemon thread
+        for state in self.states.values():
+            state.delivery.stop()
+        self._spool_worker.stop()
+        return self.stats
+
+    @property
+    def stats(self):
+        return {name: dict(state.stats) for name, state in self.states.items()}
@@ -0,0 +1,495 @@
+import json
+import os
+import queue
+import re
+import time
+from contextlib import nullcontext
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+from backup_services.mysql_export import OBJECT_DELIMITER
+from backup_services.parallel_dump import MANIFEST_FILE, quote_postgresql
+from storages.container import ContainerReader, is_container
+from utils.compression import codec_for_filename, iter_decompress
+from utils.dump_sections import FOOTER, HEADER, iter_dump_sections
+from utils.pipeline import IterReader, feed_process, iter_file, iter_prefetch
+
+DEFAULT_WORKERS = 4
+MYSQL_COMMIT_STATEMENTS = 50
+# Server error for a view selecting from a table or view that does not exist (yet)
+ER_NO_SUCH_TABLE = 1146
+
+_MYSQL_TABLE_STATEMENT = re.compile(r"^(?:DROP TABLE IF EXISTS|CREATE TABLE) `((?:[^`]|``)+)`")
+_MYSQL_DEFERRED_DEFINITION = re.compile(r"^(?:UNIQUE |FULLTEXT |SPATIAL )?KEY |^CONSTRAINT ")
+_MYSQL_AUTO_INCREMENT_COLUMN = re.compile(r"^`((?:[^`]|``)+)`.* AUTO_INCREMENT\b")
+_MYSQL_KEY_FIRST_COLUMN = re.compile(r"^(?:UNIQUE )?KEY `(?:[^`]|``)+` \(`((?:[^`]|``)+)`")
+_MYSQL_DEFINITIONS_END = re.compile(r"^\)")
+
+
+def client_command(db_type, connector):
+    """
+    Builds the command-line client command that executes SQL read from stdin.
+
+    The password is passed through the environment, as for the dump tools.
+
+    :return: Tuple of (argument list, environment).
+    """
+    env = dict(os.environ)
+    if db_type == "mysql":
+        command = ["mysql", f"--host={connector.host}", f"--user={connector.user}"]
+        if connector.port:
+            command.append(f"--port={connector.port}")
+        command.append(connector.database)
+        env["MYSQL_PWD"] = connector.password or ""
+    elif db_type == "postgresql":
+        command = ["psql", f"--host={connector.host}", f"--username={connector.user}", "--no-password", "--quiet",
+                   "--set=ON_ERROR_STOP=1"]
+        if connector.port:
+            command.append(f"--port={connector.port}")
+        command.append(f"--dbname={connector.database}")
+        env["PGPASSWORD"] = connector.password or ""
+    else:
+        raise ValueError(f"Unsupported database type: {db_type}")
+    return command, env
+
+
+def iter_statements(chunks, delimiter=b";"):
+    """
+    Splits a SQL stream written by the MySQL exporter into statements.
+
+    A statement ends with a line ending in the delimiter. Row values never
+    span lines because escaped string literals encode newlines as ``\\n``.
+    """
+    pending = b""
+    statement = []
+    for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            statement.append(line)
+            if line.endswith(delimiter):
+                yield b"\n".join(statement)
+                statement = []
+    if pending:
+        statement.append(pending)
+    if any(line.strip() for line in statement):
+        yield b"\n".join(statement)
+
+
+def defer_mysql_indexes(create_statement):
+    """
+    Moves secondary indexes and constraints out of a SHOW CREATE TABLE statement.
+
+    Loading into a table that only has its primary key and then building
+    the other indexes in one ALTER TABLE is much faster than maintaining
+    them row by row. An index on an AUTO_INCREMENT column is kept, since
+    MySQL requires one.
+
+    :return: Tuple of (CREATE TABLE statement, ALTER TABLE statement or None).
+    """
+    lines = create_statement.split("\n")
+    header = _MYSQL_TABLE_STATEMENT.match(lines[0])
+    if len(lines) < 3 or header is None or not lines[0].startswith("CREATE TABLE"):
+        return create_statement, None
+    # The column list ends at the first line starting with ")"; table options and partitioning follow it
+    close = next((index for index, line in enumerate(lines) if index and _MYSQL_DEFINITIONS_END.match(line)), None)
+    if close is None:
+        return create_statement, None
+    definitions = [line.strip().rstrip(",") for line in lines[1:close]]
+    auto_increment = None
+    for definition in definitions:
+        match = _MYSQL_AUTO_INCREMENT_COLUMN.match(definition)
+        if match:
+            auto_increment = match.group(1)
+    kept = []
+    deferred = []
+    for definition in definitions:
+        key = _MYSQL_KEY_FIRST_COLUMN.match(definition)
+        if _MYSQL_DEFERRED_DEFINITION.match(definition) and not (key and key.group(1) == auto_increment):
+            deferred.append(definition)
+        else:
+            kept.append(definition)
+    if not deferred:
+        return create_statement, None
+    create = "\n".join([lines[0], ",\n".join(f"  {definition}" for definition in kept)] + lines[close:])
+    alter = f"ALTER TABLE `{header.group(1)}` " + ", ".join(f"ADD {definition}" for definition in deferred)
+    return create, alter
+
+
+class _DirectoryBackup:
+    """Per-table backup stored as a directory of compressed files and a manifest."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        self.codec = self.manifest.get("compression", "gzip")
+
+    def size(self, filename):
+        return os.path.getsize(os.path.join(self.path, filename))
+
+    def open(self, filename):
+        return iter_decompress(iter_file(os.path.join(self.path, filename)), self.codec)
+
+    def close(self):
+        pass
+
+
+class _ContainerBackup:
+    """Per-table backup stored as entries of a container; entries are found through its index."""
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.manifest = reader.metadata["manifest"]
+
+    def size(self, filename):
+        return self.reader.entry(filename)["stored_bytes"]
+
+    def open(self, filename):
+        return self.reader.iter_entry(filename)
+
+    def close(self):
+        self.reader.close()
+
+
+class SQLRestore:
+    """
+    Restores MySQL and PostgreSQL backups.
+
+    Single-file dumps are decompressed on the fly and piped into the
+    ``mysql`` or ``psql`` client; nothing is written to disk.
+
+    Per-table backups (parallel dumps and native exports, as directories
+    or containers) are restored in
+    three phases: the table definitions, then the table data loaded in
+    parallel over workers connections, largest files first, and finally the
+    indexes and constraints. PostgreSQL gets them from the post-data
+    section; for MySQL secondary indexes and foreign keys are stripped from
+    the CREATE TABLE statements and added back in one ALTER TABLE per table,
+    and its views, routines, triggers and events are created last.
+
+    Selective restore reads only the named tables' files, found through the
+    backup manifest or, for containers, seeking straight to their blocks
+    through the container index; single dumps in containers are stored
+    one entry per table. A dump file is split at its table boundaries on
+    the fly (see iter_dump_sections()). Only the named tables' sections,
+    with the dump's session settings, reach the client.
+    MySQL recreates just those tables; PostgreSQL loads
+    their data into the existing tables, since its schema sections cannot be
+    split per table.
+
+    :param db_type: "mysql" or "postgresql".
+    :param connector: Connected MySQLConnector or PostgreSQLConnector for the target database.
+    :param workers: Number of tables loaded concurrently.
+    :param tables: Optional table names to restore; PostgreSQL names may omit the schema.
+    :param pool: Optional ConnectionPool whose per-host limit the worker
+        connections count against; fewer workers run when the host has
+        fewer slots free.
+    """
+
+    def __init__(self, db_type, connector, workers=DEFAULT_WORKERS, tables=None, pool=None):
+        if db_type not in ("mysql", "postgresql"):
+            raise ValueError(f"Unsupported database type: {db_type}")
+        self.db_type = db_type
+        self.connector = connector
+        self.workers = workers
+        self.tables = tables
+        self.pool = pool
+        self.stats = {}
+
+    def restore(self, backup_path):
+        """
+        Restores a single-file dump, a per-table backup directory or a container.
+
+        :return: Statistics: files, tables, bytes_in (compressed bytes read) and seconds.
+        """
+        started = time.perf_counter()
+        if os.path.isdir(backup_path):
+            self.stats = self._restore_tables(_DirectoryBackup(backup_path))
+        elif is_container(backup_path):
+            reader = ContainerReader(backup_path)
+            if "manifest" in reader.metadata:
+                self.stats = self._restore_tables(_ContainerBackup(reader))
+            elif "dump" in reader.metadata:
+                try:
+                    tables = self._restore_sections(reader)
+                finally:
+                    reader.close()
+                self.stats = {"files": 1, "tables": tables, "bytes_in": os.path.getsize(backup_path)}
+            else:
+                try:
+                    tables = self._restore_dump(reader.iter_entry(reader.list()[0]["name"]))
+                finally:
+                    reader.close()
+                self.stats = {"files": 1, "tables": tables, "bytes_in": os.path.getsize(backup_path)}
+        else:
+            codec = codec_for_filename(backup_path)
+            tables = self._restore_dump(iter_decompress(iter_file(backup_path), codec))
+            self.stats = {"files": 1, "tables": tables, "bytes_in": os.path.getsize(backup_path)}
+        self.stats["seconds"] = round(time.perf_counter() - started, 3)
+        return self.stats
+
+    def restore_stream(self, chunks):
+        """Executes an uncompressed SQL dump stream through the command-line client."""
+        command, env = client_command(self.db_type, self.connector)
+        return feed_process(command, iter_prefetch(chunks), env=env)
+
+    def _restore_dump(self, chunks):
+        """
+        Restores a single mysqldump or pg_dump stream, or only the selected tables' sections of it.
+
+        :return: Number of tables restored, or None for a whole dump.
+        :raises ValueError: If a selected table is not in the dump; the
+            tables that are have been restored by then.
+        """
+        if not self.tables:
+            self.restore_stream(chunks)
+            return None
+        wanted = set(self.tables)
+        found = set()
+        restored = set()
+
+        def selected():
+            for section, data in iter_dump_sections(chunks, self.db_type):
+                if section.table is None:
+                    # The session settings around the tables, but not the other objects
+                    if section.name in (HEADER, FOOTER):
+                        yield data
+                    continue
+                names = {section.table, section.table.split(".", 1)[-1]} & wanted
+                if names:
+                    found.update(names)
+                    restored.add(section.table)
+                    yield data
+
+        self.restore_stream(selected())
+        missing = [name for name in self.tables if name not in found]
+        if missing:
+            raise ValueError(f"Tables not found in the backup: {', '.join(missing)}")
+        return len(restored)
+
+    def _restore_sections(self, reader):
+        """
+        Restores a dump stored as one container entry per section, in dump order.
+
+        Selective restore only decompresses the named tables' entries, with
+        the dump's session settings.
+
+        :return: Number of tables restored, or None for a whole dump.
+        """
+        entries = reader.list()
+        if self.tables:
+            tables = [{"name": entry["table"], "entry": entry["name"]} for entry in entries if "table" in entry]
+            selected = {table["entry"] for table in self._select_tables(tables)}
+            entries = [entry for entry in entries
+                       if entry["name"] in selected or entry.get("section") in (HEADER, FOOTER)]
+        self.restore_stream(chunk for entry in entries for chunk in reader.iter_entry(entry["name"]))
+        return len(selected) if self.tables else None
+
+    def _select_tables(self, tables):
+        if not self.tables:
+            return tables
+        by_name = {table["name"]: table for table in tables}
+        # PostgreSQL tables are recorded as schema.table; allow the bare name when it is unambiguous
+        short_names = {}
+        for table in tables:
+            short_names.setdefault(table["name"].split(".", 1)[-1], []).append(table)
+        for short_name, matches in short_names.items():
+            if len(matches) == 1:
+                by_name.setdefault(short_name, matches[0])
+        missing = [name for name in self.tables if name not in by_name]
+        if missing:
+            raise ValueError(f"Tables not found in the backup: {', '.join(missing)}")
+        selected = []
+        for name in self.tables:
+            if by_name[name] not in selected:
+                selected.append(by_name[name])
+        return selected
+
+    def _restore_tables(self, backup):
+        try:
+            manifest = backup.manifest
+            if manifest["db_type"] != self.db_type:
+                raise ValueError(f"Backup is a {manifest['db_type']} backup, not {self.db_type}")
+            tables = self._select_tables(manifest["tables"])
+            files = []
+            for table in tables:
+                for part in table.get("parts") or [table]:
+                    files.append({"table": table, "file": part["file"], "size": backup.size(part["file"])})
+
+            if self.db_type == "mysql":
+                self._restore_mysql(backup, tables, files)
+            else:
+                self._restore_postgresql(backup, files)
+        finally:
+            backup.close()
+        return {
+            "files": len(files),
+            "tables": len(tables),
+            "bytes_in": sum(entry["size"] for entry in files),
+        }
+
+    def _open_workers(self, count):
+        connectors = []
+        try:
+            for _ in range(count):
+                worker = type(self.connector)(self.connector.host, self.connector.port, self.connector.user,
+                                              self.connector.password, self.connector.database)
+                if not worker.connect():
+                    raise RuntimeError(f"Failed to open a {self.db_type} worker connection")
+                connectors.append(worker)
+        except BaseException:
+            for worker in connectors:
+                worker.disconnect()
+            raise
+        return connectors
+
+    def _run_parallel(self, tasks, run):
+        """Runs run(connection, task) on the worker connections, largest task first."""
+        if not tasks:
+            return
+        tasks = sorted(tasks, key=lambda task: task.get("size", 0), reverse=True)
+        count = min(self.workers, len(tasks))
+        slots = nullcontext(count) if self.pool is None else self.pool.reserve(self.connector, count)
+        with slots as count:
+            self._run_workers(tasks, run, count)
+
+    def _run_workers(self, tasks, run, count):
+        connectors = self._open_workers(count)
+        available = queue.Queue()
+        for connector in connectors:
+            available.put(connector.connection)
+
+        def target(task):
+            connection = available.get()
+            try:
+                run(connection, task)
+            except BaseException:
+                connection.rollback()
+                raise
+            finally:
+                available.put(connection)
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(connectors), thread_name_prefix="restore") as executor:
+                futures = [executor.submit(target, task) for task in tasks]
+                done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+                for future in pending:
+                    future.cancel()
+                for future in done:
+                    future.result()
+        finally:
+            for connector in connectors:
+                connector.disconnect()
+
+    def _read(self, backup, filename):
+        # Reading and decompressing run in a separate thread from the database writes
+        return iter_prefetch(backup.open(filename))
+
+    def _restore_mysql(self, backup, tables, files):
+        names = {table["name"] for table in tables}
+        alters = []
+        cursor = self.connector.connection.cursor()
+        try:
+            for statement in iter_statements(self._read(backup, backup.manifest["schema"]["pre-data"])):
+                statement = statement.decode("utf-8", "surrogateescape")
+                match = _MYSQL_TABLE_STATEMENT.match(statement)
+                if match:
+                    name = match.group(1).replace("``", "`")
+                    if name not in names:
+                        continue
+                    statement, alter = defer_mysql_indexes(statement)
+                    if alter:
+                        alters.append({"table": name, "statement": alter})
+                cursor.execute(statement)
+            self.connector.connection.commit()
+        finally:
+            cursor.close()
+
+        def load(connection, entry):
+            cursor = connection.cursor()
+            try:
+                cursor.execute("SET SESSION foreign_key_checks = 0, unique_checks = 0")
+                for count, statement in enumerate(iter_statements(self._read(backup, entry["file"])), 1):
+                    cursor.execute(statement.decode("utf-8", "surrogateescape"))
+                    if count % MYSQL_COMMIT_STATEMENTS == 0:
+                        connection.commit()
+                connection.commit()
+            finally:
+                cursor.close()
+
+        def add_indexes(connection, entry):
+            cursor = connection.cursor()
+            try:
+                cursor.execute("SET SESSION foreign_key_checks = 0")
+                cursor.execute(entry["statement"])
+            finally:
+                cursor.close()
+
+        self._run_parallel(files, load)
+        # Foreign keys may reference tables loaded by other workers, so indexes come after all data
+        for alter in alters:
+            alter["size"] = sum(entry["size"] for entry in files if entry["table"]["name"] == alter["table"])
+        self._run_parallel(alters, add_indexes)
+        # Triggers must not fire while the data is loaded, so views, routines, triggers and events come last
+        if not self.tables and "post-data" in backup.manifest["schema"]:
+            self._create_mysql_objects(self._read(backup, backup.manifest["schema"]["post-data"]))
+
+    def _create_mysql_objects(self, chunks):
+        """
+        Runs the post-data script of a MySQL parallel dump.
+
+        A view selecting from another view fails until that one exists, so
+        statements failing for a missing table are retried as long as
+        others succeed.
+        """
+        import pymysql.err
+
+        pending = [statement.decode("utf-8", "surrogateescape")[:-len(OBJECT_DELIMITER)].rstrip()
+                   for statement in iter_statements(chunks, OBJECT_DELIMITER.encode())
+                   if not statement.startswith(b"DELIMITER ")]
+        cursor = self.connector.connection.cursor()
+        try:
+            while pending:
+                failed = []
+                for statement in pending:
+                    try:
+                        cursor.execute(statement)
+                    except pymysql.err.ProgrammingError as e:
+                        if e.args[0] != ER_NO_SUCH_TABLE:
+                            raise
+                        failed.append((statement, e))
+                if len(failed) == len(pending):
+                    raise failed[0][1]
+                pending = [statement for statement, _ in failed]
+        finally:
+            cursor.close()
+
+    def _restore_postgresql(self, backup, files):
+        command, env = client_command(self.db_type, self.connector)
+        schema = backup.manifest.get("schema", {})
+        if not self.tables and "pre-data" in schema:
+            feed_process(command, self._read(backup, schema["pre-data"]), env=env)
+
+        data_format = backup.manifest.get("format", "")
+        copy_format = data_format[len("copy-"):] if data_format.startswith("copy-") else None
+
+        def load(connection, entry):
+            table = entry["table"]
+            if copy_format is None:
+                # pg_dump --data-only output; psql runs its COPY ... FROM stdin blocks
+                feed_process(command, self._read(backup, entry["file"]), env=env)
+                return
+            schema_name, table_name = table["name"].split(".", 1)
+            quoted = f"{quote_postgresql(schema_name)}.{quote_postgresql(table_name)}"
+            columns = ", ".join(quote_postgresql(column) for column in table["columns"])
+            cursor = connection.cursor()
+            try:
+                reader = IterReader(self._read(backup, entry["file"]))
+                cursor.copy_expert(f"COPY {quoted} ({columns}) FROM STDIN (FORMAT {copy_format})", reader)
+                connection.commit()
+            finally:
+                cursor.close()
+
+        self._run_parallel(files, load)
+        if not self.tables and "post-data" in schema:
+            feed_process(command, self._read(backup, schema["post-data"]), env=env)
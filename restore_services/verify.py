@@ -0,0 +1,166 @@
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from utils.checksum import CHECKSUM_SUFFIX, hash_file, is_checksum, read_checksum
+from utils.compression import COMPRESSORS, codec_for_filename
+from utils.defaults import CONTAINER_EXTENSION
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+
+def find_backups(paths):
+    """
+    Expands files and directories into the backup files to verify.
+
+    Directories are searched recursively. Files without a checksum
+    manifest are returned as well, so that they are reported as
+    unverified; hidden files and directories (upload state, spools),
+    files still being written, the backup catalog and the chunk store,
+    whose chunks are named after their digests, are skipped.
+    """
+    from storages.catalog import CATALOG_FILE, IN_PROGRESS_SUFFIXES
+    from storages.local_storage import CHUNK_STORE_DIRECTORY
+
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, directories, files in os.walk(path):
+                directories[:] = sorted(name for name in directories
+                                        if not name.startswith(".") and name != CHUNK_STORE_DIRECTORY)
+                for name in sorted(files):
+                    if is_checksum(name):
+                        found.append(os.path.join(root, name[:-len(CHECKSUM_SUFFIX)]))
+                    elif not (name.startswith(".") or name.endswith(IN_PROGRESS_SUFFIXES)
+                              or name.startswith(CATALOG_FILE)):
+                        found.append(os.path.join(root, name))
+        elif is_checksum(path):
+            found.append(path[:-len(CHECKSUM_SUFFIX)])
+        else:
+            found.append(path)
+    return list(dict.fromkeys(found))
+
+
+def is_sqlite_backup(path):
+    """Whether path looks like a SQLite snapshot backup (``.db`` in any codec, or a container of one)."""
+    name = path[:-len(CONTAINER_EXTENSION)] if path.endswith(CONTAINER_EXTENSION) else path
+    extension = COMPRESSORS[codec_for_filename(name)].extension
+    if extension and name.endswith(extension):
+        name = name[:-len(extension)]
+    return name.endswith(".db")
+
+
+def quick_check(backup_path, temp_dir=None):
+    """
+    Rebuilds a SQLite backup into a temporary file and runs ``PRAGMA quick_check`` on it.
+
+    Runs in a worker process of BackupVerifier, so the result is a plain string.
+
+    :return: "ok", or the problems reported by SQLite (or the error raised
+        while rebuilding the database).
+    """
+    # Rebuilding pulls in the restore chain (WAL replay, page backups), needed only with --quick-check
+    from restore_services.sqlite_restore import write_snapshot
+
+    fd, temp_path = tempfile.mkstemp(suffix=".db", dir=temp_dir)
+    os.close(fd)
+    try:
+        write_snapshot(backup_path, temp_path)
+        connection = sqlite3.connect(temp_path)
+        try:
+            return "; ".join(row[0] for row in connection.execute("PRAGMA quick_check"))
+        finally:
+            connection.close()
+    except (sqlite3.DatabaseError, ValueError, OSError, EOFError) as e:
+        return f"{type(e).__name__}: {e}"
+    finally:
+        os.remove(temp_path)
+
+
+class BackupVerifier:
+    """
+    Verifies backup files against the checksum manifests written alongside them.
+
+    Files are re-hashed in a thread pool through memory maps (hashlib
+    releases the GIL, so hashing scales with the threads); a file whose
+    size already differs from its manifest is reported without hashing.
+    With quick_check, every SQLite backup whose checksum matched is also
+    rebuilt into a temporary database and checked with
+    ``PRAGMA quick_check`` in a process pool.
+
+    :param workers: Number of hashing threads.
+    :param quick_check: Also run ``PRAGMA quick_check`` on SQLite backups.
+    :param quick_check_workers: Number of quick_check processes; defaults to workers.
+    :param temp_dir: Directory for the temporary databases; defaults to the system one.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, quick_check=False, quick_check_workers=None, temp_dir=None):
+        self.workers = max(1, workers)
+        self.quick_check = quick_check
+        self.quick_check_workers = max(1, quick_check_workers or self.workers)
+        self.temp_dir = temp_dir
+        self.stats = {}
+
+    def verify_file(self, path):
+        """
+        Checks one backup file against its checksum manifest.
+
+        :return: Result with path, status ("ok", "mismatch", "unverified" when
+            there is no manifest, or "error"), bytes, digest and seconds.
+        """
+        started = time.perf_counter()
+        result = {"path": path, "status": "ok", "bytes": 0, "digest": None}
+        try:
+            expected = read_checksum(path)
+            size = os.path.getsize(path)
+            result["bytes"] = size
+            if expected is not None and expected["bytes"] != size:
+                result["status"] = "mismatch"
+                result["error"] = f"size is {size} bytes, expected {expected['bytes']}"
+            else:
+                result["digest"], _ = hash_file(path, expected["algorithm"] if expected else "sha256")
+                if expected is None:
+                    result["status"] = "unverified"
+                elif result["digest"] != expected["digest"]:
+                    result["status"] = "mismatch"
+                    result["error"] = f"{expected['algorithm']} is {result['digest']}, expected {expected['digest']}"
+        except (OSError, ValueError, KeyError) as e:
+            result["status"] = "error"
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        return result
+
+    def verify(self, paths):
+        """
+        Verifies every backup found under paths (see find_backups()).
+
+        :return: One result per backup file, in the order found.
+        """
+        started = time.perf_counter()
+        backups = find_backups(paths)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="verify") as executor:
+            results = list(executor.map(self.verify_file, backups))
+
+        if self.quick_check:
+            candidates = [result for result in results
+                          if result["status"] in ("ok", "unverified") and is_sqlite_backup(result["path"])]
+            if candidates:
+                with ProcessPoolExecutor(max_workers=min(self.quick_check_workers, len(candidates))) as executor:
+                    checks = executor.map(quick_check, [result["path"] for result in candidates],
+                                          [self.temp_dir] * len(candidates))
+                    for result, check in zip(candidates, checks):
+                        result["quick_check"] = check
+
+        for result in results:
+            result["ok"] = result["status"] in ("ok", "unverified") and result.get("quick_check", "ok") == "ok"
+        self.stats = {
+            "files": len(results),
+            "failed": sum(not result["ok"] for result in results),
+            "unverified": sum(result["status"] == "unverified" for result in results),
+            "quick_checked": sum("quick_check" in result for result in results),
+            "bytes": sum(result["bytes"] for result in results),
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        return results
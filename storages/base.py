@@ -0,0 +1,65 @@
+from storages.container import ContainerWriter
+
+
+class StorageWriter:
+    """
+    Streaming writer for one backup object in a storage backend.
+
+    Data is not visible under its final name until commit(); abort()
+    discards whatever was written.
+    """
+
+    def write(self, data):
+        raise NotImplementedError
+
+    def commit(self):
+        """Publishes the object and returns its path or URL."""
+        raise NotImplementedError
+
+    def abort(self):
+        raise NotImplementedError
+
+
+class Storage:
+    """
+    Interface of the backup storage backends.
+
+    A backend stores finished backup files with save() and accepts streamed
+    backups through open(), which returns a StorageWriter usable as a
+    StreamingPipeline sink.
+    """
+
+    name = None
+
+    def save(self, backup_file):
+        """Stores an existing backup file (or per-table backup directory) and returns its location."""
+        raise NotImplementedError
+
+    def open(self, filename):
+        """Opens a streaming writer for a new backup called filename."""
+        raise NotImplementedError
+
+    def read(self, filename):
+        """
+        Returns an iterator over the bytes of the object stored as filename (as passed to open()).
+
+        :raises FileNotFoundError: If no such object is stored.
+        """
+        raise NotImplementedError
+
+    def delete(self, locations):
+        """Deletes the backups at locations (as returned by save() or a writer's commit()); missing ones are ignored."""
+        raise NotImplementedError
+
+    def open_container(self, filename, compressor=None, threads=1, default_entry="data", split_dump=None):
+        """
+        Opens a writer for a new random-access backup container.
+
+        :param compressor: Codec applied to each block; defaults to gzip.
+        :param threads: Number of threads compressing blocks.
+        :param default_entry: Entry receiving data written straight to the container.
+        :param split_dump: Database type of a SQL dump written straight to
+            the container, to store it as one entry per table.
+        """
+        return ContainerWriter(self.open(filename), compressor, threads=threads, default_entry=default_entry,
+                               split_dump=split_dump)
@@ -0,0 +1,376 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from storages.container import is_container
+from utils.checksum import is_checksum, read_checksum
+
+CATALOG_FILE = "catalog.sqlite"
+MANIFEST_FILE = "manifest.json"
+
+# <db>_<kind>_<timestamp>, as named by the backup services; dot-prefixed names and .part, .tmp and .snapshot
+# files are backups still being written
+_BACKUP_NAME = re.compile(r"^(?!\.)(?!.*\.(?:part|tmp|snapshot)$)"
+                          r"(?P<db>.+?)_(?:backup|full|incremental|differential|parallel|copy|base|wal)_"
+                          r"(?P<timestamp>\d{14,20})")
+IN_PROGRESS_SUFFIXES = (".part", ".tmp", ".snapshot")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS backups (
+    id INTEGER PRIMARY KEY,
+    db TEXT NOT NULL,
+    db_type TEXT,
+    type TEXT NOT NULL,
+    format TEXT NOT NULL,
+    created TEXT NOT NULL,
+    size INTEGER,
+    checksum TEXT,
+    parent_id INTEGER REFERENCES backups (id),
+    storage TEXT NOT NULL,
+    location TEXT NOT NULL UNIQUE
+);
+CREATE INDEX IF NOT EXISTS backups_db_created ON backups (db, created);
+CREATE INDEX IF NOT EXISTS backups_parent ON backups (parent_id);
+CREATE TABLE IF NOT EXISTS catalog_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+RETENTION_PERIODS = {
+    "daily": "%Y-%m-%d",
+    "weekly": "%G-W%V",
+    "monthly": "%Y-%m",
+}
+
+
+def _timestamp(value):
+    """
+    Normalises a datetime or ISO 8601 string to the sortable form stored in
+    the catalog: local time without an offset, always with microseconds, so
+    that timestamps compare correctly as strings.
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value.isoformat(timespec="microseconds")
+
+
+def _path_size(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def describe_backup(path):
+    """
+    Reads what a local backup says about itself.
+
+    :return: dict with format, type, created (or None), size, checksum and
+        parent (file name of the parent of a page-level backup, or None).
+    """
+    info = {"format": "file", "type": "full", "created": None, "size": _path_size(path), "checksum": None,
+            "parent": None}
+    if os.path.isdir(path):
+        # Only directory backups can be WAL generations; file backups never load the archiver
+        from backup_services.wal_archive import GENERATION_FILE
+
+        info["format"] = "directory"
+        if os.path.exists(os.path.join(path, GENERATION_FILE)):
+            # Continuously archived WAL generation
+            with open(os.path.join(path, GENERATION_FILE)) as f:
+                info.update(format="wal", type="wal", created=json.load(f)["created"])
+            return info
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            info["created"] = manifest.get("created")
+            if "page_size" in manifest:
+                # Page-level backups chain to their parent by directory name
+                info.update(format="pages", type=manifest["type"], parent=manifest.get("parent"))
+        return info
+    if is_container(path):
+        info["format"] = "container"
+    checksum = read_checksum(path)
+    if checksum is not None:
+        info["checksum"] = checksum["digest"]
+        info["created"] = checksum.get("created")
+    return info
+
+
+class BackupCatalog:
+    """
+    Embedded SQLite index of backups.
+
+    Each backup is recorded with its database, type, format, creation time,
+    size, checksum, storage location and, for incremental and differential
+    backups, the parent it was taken against. Lookups go through the
+    (db, created) index, so finding the latest backup before a point in
+    time is a single B-tree search however many backups are kept, and
+    retention is decided from one ordered scan instead of listing and
+    parsing file names.
+
+    :param path: Catalog database file; created on first use.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            # Inside _transaction(): the statements join its transaction
+            yield connection
+            return
+        # A connection per call keeps the catalog usable from the scheduler's worker threads
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA foreign_keys = ON")
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Runs the enclosed catalog calls of this thread in one write transaction."""
+        with self._connect() as connection:
+            # Taken up front, so another process doing the same waits instead of failing to upgrade its lock
+            connection.execute("BEGIN IMMEDIATE")
+            self._local.connection = connection
+            try:
+                yield connection
+            finally:
+                self._local.connection = None
+
+    def initialize(self, backup_dir):
+        """
+        Records the backups already in backup_dir, once per catalog.
+
+        The scan and a marker row are written in one write transaction, so
+        when several processes open a new catalog at the same time one of
+        them scans and the others wait for it and then skip the scan.
+
+        :return: Number of backups added.
+        """
+        with self._transaction() as connection:
+            if connection.execute("SELECT 1 FROM catalog_state WHERE key = 'initialized'").fetchone():
+                return 0
+            added = self.scan(backup_dir) if os.path.isdir(backup_dir) else 0
+            connection.execute("INSERT INTO catalog_state (key, value) VALUES ('initialized', ?)",
+                               (_timestamp(datetime.now()),))
+            return added
+
+    def add(self, db, location, backup_type="full", backup_format="file", created=None, size=None, checksum=None,
+            parent=None, storage="local", db_type=None):
+        """
+        Records a backup; a location already in the catalog is left as it is.
+
+        :param parent: Location of the backup this one was taken against.
+        :return: Id of the backup.
+        :raises ValueError: If parent is not in the catalog.
+        """
+        with self._connect() as connection:
+            existing = connection.execute("SELECT id FROM backups WHERE location = ?", (location,)).fetchone()
+            if existing is not None:
+                return existing["id"]
+            parent_id = None
+            if parent is not None:
+                row = connection.execute("SELECT id FROM backups WHERE location = ?", (parent,)).fetchone()
+                if row is None:
+                    raise ValueError(f"Parent backup is not in the catalog: {parent}")
+                parent_id = row["id"]
+            cursor = connection.execute(
+                "INSERT INTO backups (db, db_type, type, format, created, size, checksum, parent_id, storage, "
+                "location) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (db, db_type, backup_type, backup_format, _timestamp(created or datetime.now()), size, checksum,
+                 parent_id, storage, location),
+            )
+            return cursor.lastrowid
+
+    def record(self, path, db, db_type=None, storage="local", location=None, created=None):
+        """
+        Records a backup, reading its size, checksum, format and chain from the local copy at path.
+
+        A page-level backup whose parent is not in the catalog yet gets its
+        parent recorded first.
+
+        :param location: Where the backup is stored, if not at path (e.g. its s3:// URL).
+        :param created: Creation time to use if the backup does not record one.
+        :return: Id of the backup.
+        """
+        location = location or path
+        if not os.path.exists(path):
+            # Streamed straight to remote storage; only its location is known
+            return self.add(db, location, created=created, storage=storage, db_type=db_type)
+        info = describe_backup(path)
+        parent = None
+        if info["parent"] is not None:
+            parent = os.path.join(os.path.dirname(location), info["parent"])
+            if self.get(parent) is None:
+                self.record(os.path.join(os.path.dirname(path), info["parent"]), db, db_type, storage, parent)
+        return self.add(db, location, info["type"], info["format"], info["created"] or created, info["size"],
+                        info["checksum"], parent, storage, db_type)
+
+    def scan(self, backup_dir, db_type=None):
+        """
+        Records the backups already in a directory that the catalog does not know yet.
+
+        Backups are recognised by the names the backup services give them
+        (``<db>_<kind>_<timestamp>``); checksum manifests, files still being
+        written (dot-prefixed, .part, .tmp or .snapshot) and other files are
+        skipped.
+
+        :return: Number of backups added.
+        """
+        known = {row["location"] for row in self._query("SELECT location FROM backups")}
+        found = []
+        for name in os.listdir(backup_dir):
+            match = _BACKUP_NAME.match(name)
+            path = os.path.join(backup_dir, name)
+            if match is None or path in known or name.startswith(".") or name.endswith(IN_PROGRESS_SUFFIXES) or \
+                    is_checksum(name):
+                continue
+            found.append((match.group("timestamp"), match.group("db"), path))
+        # Oldest first, so the parents of page-level backups are recorded before their children
+        for timestamp, db, path in sorted(found):
+            self.record(path, db, db_type, created=datetime.strptime(timestamp[:14], "%Y%m%d%H%M%S"))
+        return len(found)
+
+    def _query(self, sql, parameters=()):
+        with self._connect() as connection:
+            return [dict(row) for row in connection.execute(sql, parameters)]
+
+    def get(self, location):
+        rows = self._query("SELECT * FROM backups WHERE location = ?", (location,))
+        return rows[0] if rows else None
+
+    def list(self, db=None):
+        """Returns the backups of db (or of every database), newest first."""
+        if db is None:
+            return self._query("SELECT * FROM backups ORDER BY db, created DESC, id DESC")
+        return self._query("SELECT * FROM backups WHERE db = ? ORDER BY created DESC, id DESC", (db,))
+
+    def databases(self):
+        return [row["db"] for row in self._query("SELECT DISTINCT db FROM backups ORDER BY db")]
+
+    def latest(self, db, before=None, backup_type=None, backup_format=None, storage=None):
+        """
+        Returns the newest backup of db taken at or before before (default: now), or None.
+
+        :param backup_type: Only consider backups of this type.
+        :param backup_format: Only consider backups of this format (e.g. "pages").
+        :param storage: Only consider backups in this storage (e.g. "local").
+        """
+        sql = "SELECT * FROM backups WHERE db = ? AND created <= ?"
+        parameters = [db, _timestamp(before or datetime.now())]
+        for column, value in (("type", backup_type), ("format", backup_format), ("storage", storage)):
+            if value is not None:
+                sql += f" AND {column} = ?"
+                parameters.append(value)
+        rows = self._query(sql + " ORDER BY created DESC, id DESC LIMIT 1", parameters)
+        return rows[0] if rows else None
+
+    def chain(self, location):
+        """Returns the backups needed to restore the backup at location, full backup first."""
+        rows = self._query(
+            "WITH RECURSIVE chain (id, depth) AS ("
+            "SELECT id, 0 FROM backups WHERE location = ? "
+            "UNION ALL SELECT backups.parent_id, chain.depth + 1 FROM backups JOIN chain ON backups.id = chain.id "
+            "WHERE backups.parent_id IS NOT NULL) "
+            "SELECT backups.* FROM chain JOIN backups ON backups.id = chain.id ORDER BY chain.depth DESC",
+            (location,),
+        )
+        if not rows:
+            raise KeyError(f"Backup is not in the catalog: {location}")
+        return rows
+
+    def children(self, location):
+        """Returns the backups taken against the backup at location; it must be kept while any exist."""
+        return self._query(
+            "SELECT child.* FROM backups AS child JOIN backups AS parent ON child.parent_id = parent.id "
+            "WHERE parent.location = ? ORDER BY child.created", (location,))
+
+    def remove(self, location):
+        """
+        Forgets a backup (the files are not touched).
+
+        :raises ValueError: If other backups still depend on it.
+        """
+        if self.children(location):
+            raise ValueError(f"Backup is still referenced by newer backups: {location}")
+        with self._connect() as connection:
+            connection.execute("DELETE FROM backups WHERE location = ?", (location,))
+
+    def retention_plan(self, db, keep_last=0, daily=0, weekly=0, monthly=0):
+        """
+        Decides which backups of db a keep-N-daily/weekly/monthly policy keeps.
+
+        The newest keep_last backups are kept, plus the newest backup of each
+        of the last daily days, weekly ISO weeks and monthly months that
+        have backups. Every backup a kept backup depends on is kept too, so
+        no incremental chain is broken.
+
+        :return: (kept, expired) lists of backups, newest first.
+        :raises ValueError: If the policy would keep nothing.
+        """
+        if not any((keep_last, daily, weekly, monthly)):
+            raise ValueError("A retention policy must keep at least one backup")
+        backups = self.list(db)
+        keep = {backup["id"] for backup in backups[:keep_last]}
+        for period, count in (("daily", daily), ("weekly", weekly), ("monthly", monthly)):
+            periods = set()
+            for backup in backups:
+                key = datetime.fromisoformat(backup["created"]).strftime(RETENTION_PERIODS[period])
+                if key in periods:
+                    continue
+                if len(periods) == count:
+                    break
+                periods.add(key)
+                keep.add(backup["id"])
+
+        by_id = {backup["id"]: backup for backup in backups}
+        for backup_id in list(keep):
+            parent_id = by_id[backup_id]["parent_id"]
+            while parent_id is not None and parent_id not in keep:
+                keep.add(parent_id)
+                parent_id = by_id[parent_id]["parent_id"] if parent_id in by_id else None
+        kept = [backup for backup in backups if backup["id"] in keep]
+        expired = [backup for backup in backups if backup["id"] not in keep]
+        return kept, expired
+
+    def prune(self, db, delete, keep_last=0, daily=0, weekly=0, monthly=0, dry_run=False):
+        """
+        Applies a retention policy to db (see retention_plan()).
+
+        The expired backups are passed to delete in one call, so storage
+        backends can remove them in bulk, and are then dropped from the
+        catalog in a single transaction. If delete raises, the catalog is
+        left untouched and the prune can simply be run again.
+
+        :param delete: Callable receiving the list of expired backups.
+        :return: The expired backups.
+        """
+        _, expired = self.retention_plan(db, keep_last, daily, weekly, monthly)
+        if dry_run or not expired:
+            return expired
+        delete(expired)
+        with self._connect() as connection:
+            # Newest first: children go before the parents they reference
+            connection.executemany("DELETE FROM backups WHERE id = ?", [(backup["id"],) for backup in expired])
+        return expired
@@ -0,0 +1,357 @@
+import hashlib
+import json
+import os
+import random
+import tempfile
+import time
+import zlib
+from datetime import datetime
+
+DEFAULT_MIN_CHUNK = 16 * 1024
+DEFAULT_AVG_CHUNK = 64 * 1024
+DEFAULT_MAX_CHUNK = 256 * 1024
+# Longer than any backup runs: gc() leaves younger chunks alone, as an uncommitted backup may still need them
+DEFAULT_GC_GRACE_SECONDS = 24 * 3600
+
+# Bytes of context that feed each rolling hash value
+_WINDOW = 4
+_rng = random.Random(0x6d7c)
+_WINDOW_TABLES = [bytes(_rng.randrange(256) for _ in range(256)) for _ in range(_WINDOW)]
+del _rng
+
+
+def _window_hash(data):
+    """
+    Returns one hash byte per input byte, derived from the next _WINDOW bytes.
+
+    Each byte is mapped through a random table per window offset and the
+    shifted results are XOR-ed together. The work is done on whole buffers
+    with bytes.translate and big-integer XOR, so it runs at C speed instead
+    of a per-byte Python loop.
+    """
+    n = len(data)
+    acc = 0
+    for offset, table in enumerate(_WINDOW_TABLES):
+        acc ^= int.from_bytes(data.translate(table), "big") << (8 * offset)
+    return (acc & ((1 << (8 * n)) - 1)).to_bytes(n, "big")
+
+
+class ContentDefinedChunker:
+    """
+    Splits a byte stream into chunks whose boundaries depend on content.
+
+    A boundary is placed where two consecutive rolling hash bytes fall below
+    a threshold chosen from avg_size, so inserting bytes into the stream only
+    changes the chunks around the insertion. Chunk sizes are kept between
+    min_size and max_size.
+    """
+
+    def __init__(self, min_size=DEFAULT_MIN_CHUNK, avg_size=DEFAULT_AVG_CHUNK, max_size=DEFAULT_MAX_CHUNK):
+        if not 0 < min_size <= avg_size <= max_size:
+            raise ValueError("Chunk sizes must satisfy 0 < min_size <= avg_size <= max_size")
+        self.min_size = min_size
+        self.max_size = max_size
+        # Two hash bytes below the threshold occur about once per (256 / threshold) ** 2 bytes
+        threshold = max(1, min(255, round(256 / max(1, avg_size - min_size) ** 0.5)))
+        self._boundary_table = bytes(0 if value < threshold else 1 for value in range(256))
+        self._scan_size = max(4 * 1024 * 1024, 4 * max_size)
+        self._buffer = bytearray()
+
+    def _cut(self, final):
+        data = bytes(self._buffer)
+        marks = _window_hash(data).translate(self._boundary_table)
+        chunks = []
+        start = 0
+        # Without more input, cut points closer than max_size + _WINDOW to the end are not final
+        while len(data) - start >= (1 if final else self.max_size + _WINDOW):
+            position = marks.find(b"\x00\x00", start + self.min_size, start + self.max_size)
+            end = position + 2 if position != -1 else min(start + self.max_size, len(data))
+            chunks.append(data[start:end])
+            start = end
+        del self._buffer[:start]
+        return chunks
+
+    def feed(self, data):
+        """Adds data and returns the chunks that are now complete."""
+        self._buffer += data
+        if len(self._buffer) < self._scan_size:
+            return []
+        return self._cut(final=False)
+
+    def finish(self):
+        """Returns the remaining chunks at the end of the stream."""
+        return self._cut(final=True)
+
+
+class FixedSizeChunker:
+    """
+    Splits a byte stream into fixed-size chunks.
+
+    Suited to SQLite files, whose pages never shift position, so aligned
+    chunks dedupe as well as content-defined ones at a fraction of the cost.
+    """
+
+    def __init__(self, chunk_size=DEFAULT_AVG_CHUNK):
+        self.chunk_size = chunk_size
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        self._buffer += data
+        count = len(self._buffer) // self.chunk_size
+        chunks = [bytes(self._buffer[i * self.chunk_size:(i + 1) * self.chunk_size]) for i in range(count)]
+        del self._buffer[:count * self.chunk_size]
+        return chunks
+
+    def finish(self):
+        chunks = [bytes(self._buffer)] if self._buffer else []
+        self._buffer = bytearray()
+        return chunks
+
+
+class ChunkStoreWriter:
+    """
+    Streaming writer that ingests one backup into a ChunkStore.
+
+    Compatible with the StreamingPipeline sink interface. Chunks that already
+    exist in the store are not written again; the manifest is only written on
+    commit.
+    """
+
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        self.chunker = store.new_chunker()
+        self.chunks = []
+        self.stats = {
+            "logical_bytes": 0,
+            "chunks": 0,
+            "new_chunks": 0,
+            "new_bytes": 0,
+            "stored_bytes": 0,
+        }
+        self._started = time.perf_counter()
+
+    def _add(self, chunks):
+        for chunk in chunks:
+            digest, stored = self.store.put_chunk(chunk)
+            self.chunks.append([digest, len(chunk)])
+            self.stats["chunks"] += 1
+            self.stats["logical_bytes"] += len(chunk)
+            if stored is not None:
+                self.stats["new_chunks"] += 1
+                self.stats["new_bytes"] += len(chunk)
+                self.stats["stored_bytes"] += stored
+
+    def write(self, data):
+        self._add(self.chunker.feed(data))
+
+    def commit(self):
+        self._add(self.chunker.finish())
+        seconds = time.perf_counter() - self._started
+        self.stats["seconds"] = round(seconds, 6)
+        # None when every chunk was already stored
+        new_bytes = self.stats["new_bytes"]
+        self.stats["dedup_ratio"] = round(self.stats["logical_bytes"] / new_bytes, 3) if new_bytes else None
+        self.stats["mb_per_s"] = round(self.stats["logical_bytes"] / seconds / 1e6, 2) if seconds else 0.0
+        manifest = {
+            "name": self.name,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "size": self.stats["logical_bytes"],
+            "stats": self.stats,
+            "chunks": self.chunks,
+        }
+        return self.store.write_manifest(self.name, manifest)
+
+    def abort(self):
+        # Chunks already written are harmless; gc() removes them once unreferenced and past the grace period
+        self.chunks = []
+
+
+def _remove_older(path, cutoff):
+    """Removes path if it was last modified before cutoff; returns whether it did."""
+    try:
+        if os.path.getmtime(path) > cutoff:
+            return False
+        os.remove(path)
+    except FileNotFoundError:
+        # Renamed into place or removed by another process meanwhile
+        return False
+    return True
+
+
+class ChunkStore:
+    """
+    Deduplicating backup store addressed by SHA-256 chunk digests.
+
+    Layout under root::
+
+        chunks/ab/ab12...ef   zlib-compressed chunk data
+        manifests/<name>.json ordered chunk list for one backup
+
+    :param root: Directory holding the store.
+    :param chunking: "cdc" for content-defined or "fixed" for aligned chunks.
+    :param level: zlib level used for stored chunks.
+    """
+
+    def __init__(self, root, chunking="cdc", min_size=DEFAULT_MIN_CHUNK, avg_size=DEFAULT_AVG_CHUNK,
+                 max_size=DEFAULT_MAX_CHUNK, level=6):
+        if chunking not in ("cdc", "fixed"):
+            raise ValueError(f"Unsupported chunking: {chunking}")
+        self.root = root
+        self.chunking = chunking
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        self.level = level
+        self.chunk_dir = os.path.join(root, "chunks")
+        self.manifest_dir = os.path.join(root, "manifests")
+        os.makedirs(self.chunk_dir, exist_ok=True)
+        os.makedirs(self.manifest_dir, exist_ok=True)
+
+    def new_chunker(self):
+        if self.chunking == "fixed":
+            return FixedSizeChunker(self.avg_size)
+        return ContentDefinedChunker(self.min_size, self.avg_size, self.max_size)
+
+    def _chunk_path(self, digest):
+        return os.path.join(self.chunk_dir, digest[:2], digest)
+
+    def _manifest_path(self, name):
+        return os.path.join(self.manifest_dir, f"{name}.json")
+
+    def put_chunk(self, chunk):
+        """
+        Stores a chunk unless it is already present.
+
+        :return: Tuple of (hex digest, bytes written or None if deduplicated).
+        """
+        digest = hashlib.sha256(chunk).hexdigest()
+        path = self._chunk_path(digest)
+        try:
+            # Refreshing the mtime keeps a concurrent gc() from deleting the chunk before our manifest exists
+            os.utime(path)
+            return digest, None
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = zlib.compress(chunk, self.level)
+        # A unique name per writer: threads of one process may store the same chunk at once
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return digest, len(data)
+
+    def get_chunk(self, digest):
+        with open(self._chunk_path(digest), "rb") as f:
+            chunk = zlib.decompress(f.read())
+        if hashlib.sha256(chunk).hexdigest() != digest:
+            raise ValueError(f"Chunk {digest} is corrupt")
+        return chunk
+
+    def write_manifest(self, name, manifest):
+        path = self._manifest_path(name)
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(path + ".tmp", path)
+        return path
+
+    def read_manifest(self, name):
+        with open(self._manifest_path(name)) as f:
+            return json.load(f)
+
+    def open(self, name):
+        """Opens a streaming writer for a new backup called name."""
+        return ChunkStoreWriter(self, name)
+
+    def save(self, backup_file, name=None):
+        """Ingests an existing backup file and returns its manifest path."""
+        writer = self.open(name or os.path.basename(backup_file))
+        with open(backup_file, "rb") as f:
+            while True:
+                data = f.read(1024 * 1024)
+                if not data:
+                    break
+                writer.write(data)
+        return writer.commit()
+
+    def iter_backup(self, name):
+        """Yields the content of the backup called name, chunk by chunk."""
+        manifest = self.read_manifest(name)
+        for digest, size in manifest["chunks"]:
+            chunk = self.get_chunk(digest)
+            if len(chunk) != size:
+                raise ValueError(f"Chunk {digest} has size {len(chunk)}, expected {size}")
+            yield chunk
+
+    def restore(self, name, output_file):
+        """Reassembles the backup called name into output_file."""
+        with open(output_file + ".part", "wb") as f:
+            for chunk in self.iter_backup(name):
+                f.write(chunk)
+        os.replace(output_file + ".part", output_file)
+        return output_file
+
+    def list(self):
+        """Returns the names of all backups in the store."""
+        return sorted(name[:-len(".json")] for name in os.listdir(self.manifest_dir) if name.endswith(".json"))
+
+    def delete(self, name):
+        """Removes a backup's manifest; call gc() to reclaim its chunks."""
+        os.remove(self._manifest_path(name))
+
+    def _stored_chunks(self):
+        for prefix in os.listdir(self.chunk_dir):
+            for digest in os.listdir(os.path.join(self.chunk_dir, prefix)):
+                if not digest.endswith(".tmp"):
+                    yield digest
+
+    def _temporary_files(self):
+        for prefix in os.listdir(self.chunk_dir):
+            for name in os.listdir(os.path.join(self.chunk_dir, prefix)):
+                if name.endswith(".tmp"):
+                    yield os.path.join(self.chunk_dir, prefix, name)
+
+    def gc(self, grace_seconds=DEFAULT_GC_GRACE_SECONDS):
+        """
+        Deletes chunks that no manifest references and returns how many were removed.
+
+        Chunks stored or reused within the last grace_seconds are kept: a
+        backup still running writes its manifest only on commit, so its
+        chunks are unreferenced until then. Temporary files left behind by
+        a crashed writer are removed once they are as old.
+
+        :param grace_seconds: Minimum age of a chunk before it may be deleted.
+        """
+        referenced = set()
+        for name in self.list():
+            referenced.update(digest for digest, _ in self.read_manifest(name)["chunks"])
+        cutoff = time.time() - grace_seconds
+        removed = 0
+        for digest in list(self._stored_chunks()):
+            if digest not in referenced and _remove_older(self._chunk_path(digest), cutoff):
+                removed += 1
+        for path in list(self._temporary_files()):
+            _remove_older(path, cutoff)
+        return removed
+
+    def usage(self):
+        """
+        Summarises disk usage for capacity planning.
+
+        :return: Dictionary with logical_bytes (sum of all backups),
+            stored_bytes (chunk files on disk) and the overall ratio.
+        """
+        logical = sum(self.read_manifest(name)["size"] for name in self.list())
+        stored = sum(os.path.getsize(self._chunk_path(digest)) for digest in self._stored_chunks())
+        return {
+            "backups": len(self.list()),
+            "logical_bytes": logical,
+            "stored_bytes": stored,
+            "ratio": round(logical / stored, 3) if stored else 0.0,
+        }
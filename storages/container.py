@@ -0,0 +1,341 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from utils.compression import DEFAULT_BLOCK_SIZE, GzipCompressor, get_compressor
+from utils.dump_sections import DumpSplitter
+
+CONTAINER_VERSION = 1
+
+_MAGIC = b"DBKCNTR1"
+_HEADER = struct.Struct(">8sI")
+# index offset, index length, trailer magic
+_TRAILER = struct.Struct(">QI8s")
+_TRAILER_MAGIC = b"DBKINDEX"
+
+
+def is_container(path):
+    """Returns True if path is a backup container file."""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(_MAGIC)) == _MAGIC
+    except (IsADirectoryError, FileNotFoundError):
+        return False
+
+
+class ContainerEntryWriter:
+    """
+    Streaming writer for one entry (a table, a schema section, a whole dump) of a container.
+
+    Data is cut into blocks that are compressed independently, so any
+    block can later be read without decompressing what precedes it.
+    Several entries can be written concurrently; their blocks interleave
+    in the file and the index keeps track of which belong to which.
+    """
+
+    def __init__(self, container, name, attributes):
+        self.container = container
+        self.name = name
+        self.attributes = attributes
+        self.blocks = []
+        self.bytes = 0
+        self._buffer = bytearray()
+        self._pending = deque()
+
+    def _submit(self, block):
+        container = self.container
+        if container.executor is None:
+            container.append_block(self, *container.compress_block(block))
+            return
+        self._pending.append(container.executor.submit(container.compress_block, block))
+        while self._pending and (len(self._pending) > container.threads * 2 or self._pending[0].done()):
+            container.append_block(self, *self._pending.popleft().result())
+
+    def write(self, data):
+        self._buffer += data
+        block_size = self.container.block_size
+        while len(self._buffer) >= block_size:
+            self._submit(bytes(self._buffer[:block_size]))
+            del self._buffer[:block_size]
+
+    def commit(self, **attributes):
+        """Finishes the entry; attributes (e.g. rows) are stored in its index record."""
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer = bytearray()
+        while self._pending:
+            self.container.append_block(self, *self._pending.popleft().result())
+        self.attributes.update(attributes)
+        self.container.finish_entry(self)
+        return self.name
+
+    def abort(self):
+        # Blocks already written stay in the file but are never indexed
+        self._buffer = bytearray()
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+
+
+class ContainerWriter:
+    """
+    Writes a random-access backup container.
+
+    Layout: a small header (magic, codec), independently compressed data
+    blocks, and a footer index mapping each entry name to its block
+    offsets, sizes and CRC32 checksums, followed by a fixed-size trailer
+    that locates the index. Listing, verifying and extracting a subset of
+    entries therefore only touch the index and the blocks involved.
+
+    The writer has the same write()/commit()/abort() interface as
+    LocalStorageWriter, writing into default_entry, and an open() method
+    like LocalStorage for per-table backups that stream several entries.
+
+    With split_dump, what is written is a mysqldump or pg_dump stream that
+    is split at its table boundaries (see DumpSplitter) into one entry per
+    section, in dump order: table sections become ``tables/<table>``
+    entries recording the table and its row count, the others are named
+    after their section ("header", "schema", ...). The index metadata then
+    records the dump's database type under "dump".
+
+    :param sink: LocalStorageWriter (or similar) receiving the container bytes.
+    :param compressor: Codec used for every block; defaults to gzip.
+    :param block_size: Uncompressed size of each block.
+    :param threads: Number of threads compressing blocks.
+    :param default_entry: Entry name used by write().
+    :param split_dump: "mysql" or "postgresql" to split a dump written with write().
+    """
+
+    def __init__(self, sink, compressor=None, block_size=DEFAULT_BLOCK_SIZE, threads=1, default_entry="data",
+                 split_dump=None):
+        self.sink = sink
+        self.compressor = compressor or GzipCompressor()
+        self.block_size = block_size
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="container") if threads > 1 else None
+        self.default_entry = default_entry
+        # Index attributes of default_entry
+        self.default_attributes = {}
+        self.metadata = {}
+        self.entries = []
+        self._current = None
+        self._splitter = None
+        self._section = None
+        if split_dump:
+            self._splitter = DumpSplitter(split_dump)
+            self.metadata["dump"] = split_dump
+        self._lock = threading.Lock()
+        header = json.dumps({
+            "version": CONTAINER_VERSION,
+            "codec": self.compressor.name,
+            "block_size": block_size,
+            "created": datetime.now().isoformat(timespec="seconds"),
+        }).encode()
+        self.sink.write(_HEADER.pack(_MAGIC, len(header)) + header)
+        self._offset = _HEADER.size + len(header)
+
+    def compress_block(self, block):
+        compressobj = self.compressor.compressobj()
+        return compressobj.compress(block) + compressobj.flush(), len(block)
+
+    def append_block(self, entry, payload, size):
+        with self._lock:
+            self.sink.write(payload)
+            entry.blocks.append([self._offset, len(payload), size, zlib.crc32(payload)])
+            self._offset += len(payload)
+        entry.bytes += size
+
+    def finish_entry(self, entry):
+        record = dict(entry.attributes)
+        record.update({
+            "name": entry.name,
+            "bytes": entry.bytes,
+            "stored_bytes": sum(block[1] for block in entry.blocks),
+            "blocks": entry.blocks,
+        })
+        with self._lock:
+            self.entries.append(record)
+
+    def open(self, name, **attributes):
+        """Opens a writer for a new entry."""
+        return ContainerEntryWriter(self, name, attributes)
+
+    def write(self, data):
+        if self._splitter is not None:
+            self._write_sections(self._splitter.feed(data))
+            return
+        if self._current is None:
+            self._current = self.open(self.default_entry, **self.default_attributes)
+        self._current.write(data)
+
+    def _write_sections(self, pieces):
+        for section, data in pieces:
+            if section is not self._section:
+                self._finish_section()
+                self._section = section
+                if section.table is None:
+                    self._current = self.open(section.name, section=section.name)
+                else:
+                    self._current = self.open(f"tables/{section.table}", section=section.name, table=section.table)
+            self._current.write(data)
+
+    def _finish_section(self):
+        if self._current is None:
+            return
+        if self._section.table is None:
+            self._current.commit()
+        else:
+            self._current.commit(rows=self._section.rows)
+        self._current = None
+
+    def commit(self, metadata=None):
+        """
+        Writes the index and trailer and commits the sink.
+
+        :param metadata: JSON-serializable data stored with the index, such as a backup manifest.
+        :return: Whatever the sink's commit() returns (the file path for local storage).
+        """
+        try:
+            if self._splitter is not None:
+                self._write_sections(self._splitter.close())
+                self._finish_section()
+            elif self._current is not None:
+                self._current.commit()
+            if metadata:
+                self.metadata.update(metadata)
+            index = zlib.compress(json.dumps({"metadata": self.metadata, "entries": self.entries}).encode())
+            self.sink.write(index + _TRAILER.pack(self._offset, len(index), _TRAILER_MAGIC))
+        except BaseException:
+            self.abort()
+            raise
+        self._shutdown()
+        return self.sink.commit()
+
+    def abort(self):
+        if self._current is not None:
+            self._current.abort()
+        self._shutdown()
+        self.sink.abort()
+
+    def _shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+
+class ContainerReader:
+    """
+    Random-access reader for backup containers.
+
+    The file is memory-mapped; opening it reads only the header and the
+    footer index, and each entry is decompressed block by block on demand.
+    Reads are thread-safe, so entries can be extracted in parallel.
+
+    :raises ValueError: If path is not a complete container.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path} is not a backup container")
+        try:
+            self._read_index()
+        except BaseException:
+            self.close()
+            raise
+
+    def _read_index(self):
+        data = self._map
+        if len(data) < _HEADER.size + _TRAILER.size:
+            raise ValueError(f"{self.path} is not a backup container")
+        magic, header_length = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{self.path} is not a backup container")
+        self.header = json.loads(data[_HEADER.size:_HEADER.size + header_length])
+        index_offset, index_length, trailer_magic = _TRAILER.unpack_from(data, len(data) - _TRAILER.size)
+        if trailer_magic != _TRAILER_MAGIC or index_offset + index_length + _TRAILER.size != len(data):
+            raise ValueError(f"{self.path} has no index; the backup is incomplete")
+        index = json.loads(zlib.decompress(data[index_offset:index_offset + index_length]))
+        self.metadata = index["metadata"]
+        self.entries = {entry["name"]: entry for entry in index["entries"]}
+        self.compressor = get_compressor(self.header["codec"])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def list(self):
+        """Returns the index records of all entries, in the order they were finished."""
+        return list(self.entries.values())
+
+    def entry(self, name):
+        try:
+            return self.entries[name]
+        except KeyError:
+            raise KeyError(f"Entry not found in the container: {name}")
+
+    def _block(self, block, check):
+        offset, stored, size, crc = block
+        payload = self._map[offset:offset + stored]
+        if check and zlib.crc32(payload) != crc:
+            raise ValueError(f"Block at offset {offset} of {self.path} is corrupt (CRC mismatch)")
+        return payload
+
+    def iter_entry(self, name, check=True):
+        """Yields the decompressed content of an entry, one block at a time."""
+        for block in self.entry(name)["blocks"]:
+            decompressobj = self.compressor.decompressobj()
+            data = decompressobj.decompress(self._block(block, check)) + decompressobj.flush()
+            if len(data) != block[2]:
+                raise ValueError(f"Block at offset {block[0]} of {self.path} decompressed to {len(data)} bytes, "
+                                 f"expected {block[2]}")
+            yield data
+
+    def read_entry(self, name):
+        return b"".join(self.iter_entry(name))
+
+    def extract(self, name, output_file):
+        """Writes one entry, decompressed, to output_file."""
+        with open(output_file + ".part", "wb") as f:
+            for data in self.iter_entry(name):
+                f.write(data)
+        os.replace(output_file + ".part", output_file)
+        return output_file
+
+    def verify(self, names=None, decompress=False):
+        """
+        Checks the CRC32 of every stored block of the given entries (all by default).
+
+        :param decompress: Also decompress each block and check its size.
+        :return: List of (entry name, error message) for the problems found.
+        """
+        problems = []
+        for name in names or list(self.entries):
+            try:
+                if decompress:
+                    for _ in self.iter_entry(name):
+                        pass
+                else:
+                    for block in self.entry(name)["blocks"]:
+                        self._block(block, check=True)
+            except (ValueError, KeyError, zlib.error, EOFError) as e:
+                problems.append((name, str(e)))
+        return problems
@@ -0,0 +1,385 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from storages.base import Storage, StorageWriter
+from utils.checksum import CHECKSUM_SUFFIX, checksum_path
+from utils.pipeline import DEFAULT_CHUNK_SIZE
+
+DEFAULT_PART_SIZE = 64 * 1024 * 1024
+# S3 rejects smaller parts, except for the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+# Keys per DeleteObjects request
+MAX_DELETE_KEYS = 1000
+DEFAULT_CONCURRENCY = 4
+# Google Cloud Storage speaks the S3 XML API (including multipart uploads) with HMAC keys
+GCS_ENDPOINT = "https://storage.googleapis.com"
+
+logger = logging.getLogger(__name__)
+
+
+def part_checksum(data):
+    """Returns the base64 MD5 of data, as sent in the Content-MD5 header."""
+    return base64.b64encode(hashlib.md5(data).digest()).decode()
+
+
+def _make_client(endpoint_url=None, region=None, max_connections=10):
+    try:
+        import boto3
+        from botocore.config import Config
+    except ImportError:
+        raise ImportError("S3 storage requires the 'boto3' package")
+    return boto3.client("s3", endpoint_url=endpoint_url, region_name=region,
+                        config=Config(max_pool_connections=max_connections))
+
+
+class MultipartUpload:
+    """
+    One S3 multipart upload: numbered parts uploaded concurrently, then
+    completed (or aborted) as a single object.
+
+    Every part is sent with a Content-MD5 header, so S3 rejects a part
+    damaged in transit. With a state_path, each finished part is recorded
+    in a small JSON file so an interrupted upload can be continued from
+    the parts S3 already holds.
+    """
+
+    def __init__(self, client, bucket, key, upload_id, state_path=None, state=None):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.upload_id = upload_id
+        self.state_path = state_path
+        self.state = state or {}
+        # Part number -> ETag
+        self.parts = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def start(cls, client, bucket, key, state_path=None, state=None):
+        response = client.create_multipart_upload(Bucket=bucket, Key=key)
+        upload = cls(client, bucket, key, response["UploadId"], state_path, state)
+        upload._save_state()
+        return upload
+
+    def _ids(self):
+        return {"Bucket": self.bucket, "Key": self.key, "UploadId": self.upload_id}
+
+    def stored_parts(self):
+        """Returns {part number: ETag} for the parts S3 holds for this upload."""
+        parts = {}
+        kwargs = self._ids()
+        while True:
+            response = self.client.list_parts(**kwargs)
+            for part in response.get("Parts", []):
+                parts[part["PartNumber"]] = part["ETag"]
+            if not response.get("IsTruncated"):
+                return parts
+            kwargs["PartNumberMarker"] = response["NextPartNumberMarker"]
+
+    def upload_part(self, number, data):
+        response = self.client.upload_part(PartNumber=number, Body=data, ContentMD5=part_checksum(data),
+                                           **self._ids())
+        with self._lock:
+            self.parts[number] = response["ETag"]
+            self._save_state()
+        return response["ETag"]
+
+    def complete(self):
+        parts = [{"PartNumber": number, "ETag": etag} for number, etag in sorted(self.parts.items())]
+        self.client.complete_multipart_upload(MultipartUpload={"Parts": parts}, **self._ids())
+        self._remove_state()
+
+    def abort(self):
+        try:
+            self.client.abort_multipart_upload(**self._ids())
+        finally:
+            self._remove_state()
+
+    def _save_state(self):
+        if self.state_path is None:
+            return
+        state = dict(self.state, bucket=self.bucket, key=self.key, upload_id=self.upload_id,
+                     parts={str(number): etag for number, etag in self.parts.items()})
+        with open(self.state_path + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def _remove_state(self):
+        if self.state_path is not None and os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+
+class S3StorageWriter(StorageWriter):
+    """
+    Streams a backup to S3 as a multipart upload.
+
+    Incoming data is cut into parts that are uploaded by a thread pool
+    while the backup keeps producing. Submitting a part waits for a free
+    upload slot, so at most concurrency parts plus the one being filled
+    are held in memory whatever the size of the backup. The part size
+    doubles every 1000 parts, so a stream of unknown length stays within
+    S3's 10,000 part limit. Backups smaller than one part are sent with a
+    single PUT.
+    """
+
+    def __init__(self, storage, key):
+        self.storage = storage
+        self.key = key
+        self.part_size = storage.part_size
+        self.bytes = 0
+        self._buffer = bytearray()
+        self._upload = None
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(storage.concurrency)
+        self._futures = []
+        self._next_part = 1
+
+    def _check_failures(self):
+        pending = []
+        for future in self._futures:
+            if future.done():
+                future.result()
+            else:
+                pending.append(future)
+        self._futures = pending
+
+    def _submit(self, data):
+        if self._upload is None:
+            self._upload = MultipartUpload.start(self.storage.client, self.storage.bucket, self.key)
+            self._executor = ThreadPoolExecutor(max_workers=self.storage.concurrency, thread_name_prefix="s3-upload")
+        self._check_failures()
+        self.storage._throttle(data)
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._upload.upload_part, self._next_part, data)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+        self._next_part += 1
+        if self._next_part % 1000 == 0:
+            self.part_size *= 2
+
+    def write(self, data):
+        self._buffer += data
+        self.bytes += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._submit(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+
+    def commit(self):
+        try:
+            if self._upload is None:
+                data = bytes(self._buffer)
+                self.storage._throttle(data)
+                self.storage.client.put_object(Bucket=self.storage.bucket, Key=self.key, Body=data,
+                                               ContentMD5=part_checksum(data))
+            else:
+                if self._buffer:
+                    self._submit(bytes(self._buffer))
+                for future in self._futures:
+                    future.result()
+                self._upload.complete()
+        except BaseException:
+            self.abort()
+            raise
+        self._shutdown()
+        self._buffer = bytearray()
+        return self.storage.url(self.key)
+
+    def abort(self):
+        for future in self._futures:
+            future.cancel()
+        self._shutdown()
+        self._futures = []
+        self._buffer = bytearray()
+        if self._upload is not None:
+            self._upload.abort()
+            self._upload = None
+
+    def _shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class S3Storage(Storage):
+    """
+    Stores backups in an S3-compatible object store (AWS S3, MinIO, Ceph,
+    or Google Cloud Storage through GCS_ENDPOINT with HMAC keys).
+
+    Streamed backups are uploaded as they are produced (see
+    S3StorageWriter). Finished files are uploaded with concurrent ranged
+    part reads; with a state_dir the upload is resumable: if the process
+    dies, calling save() again for the same unchanged file continues the
+    same multipart upload and only sends the parts S3 does not have yet.
+
+    :param bucket: Bucket name.
+    :param prefix: Key prefix for the backups.
+    :param client: boto3 S3 client; created from endpoint_url and region if omitted.
+    :param part_size: Multipart part size in bytes (at least 5 MiB).
+    :param concurrency: Number of parts uploaded at the same time.
+    :param state_dir: Directory for resume state of file uploads; None disables resuming.
+    :param throttle: Optional Throttle limiting the upload rate; each part is one operation.
+    """
+
+    name = "s3"
+
+    def __init__(self, bucket, prefix="", client=None, endpoint_url=None, region=None, part_size=DEFAULT_PART_SIZE,
+                 concurrency=DEFAULT_CONCURRENCY, state_dir=None, throttle=None):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"Part size must be at least {MIN_PART_SIZE} bytes")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.client = client or _make_client(endpoint_url, region, max_connections=max(10, concurrency))
+        self.part_size = part_size
+        self.concurrency = concurrency
+        self.state_dir = state_dir
+        self.throttle = throttle
+
+    def _throttle(self, data):
+        if self.throttle is not None:
+            self.throttle.throttle(len(data))
+
+    def key(self, filename):
+        return f"{self.prefix}/{filename}" if self.prefix else filename
+
+    def url(self, key):
+        return f"s3://{self.bucket}/{key}"
+
+    def open(self, filename):
+        return S3StorageWriter(self, self.key(filename))
+
+    def read(self, filename):
+        key = self.key(filename)
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=key)
+        except Exception as e:
+            # botocore's ClientError; a missing key is a 404 when the credentials may not list the bucket
+            if getattr(e, "response", {}).get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                raise FileNotFoundError(f"No object {self.url(key)}") from e
+            raise
+        return response["Body"].iter_chunks(DEFAULT_CHUNK_SIZE)
+
+    def _key_for_url(self, url):
+        prefix = f"s3://{self.bucket}/"
+        if not url.startswith(prefix):
+            raise ValueError(f"{url} is not in bucket {self.bucket}")
+        return url[len(prefix):]
+
+    def _list_keys(self, prefix):
+        kwargs = {"Bucket": self.bucket, "Prefix": prefix}
+        while True:
+            response = self.client.list_objects_v2(**kwargs)
+            yield from (item["Key"] for item in response.get("Contents", []))
+            if not response.get("IsTruncated"):
+                return
+            kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+    def delete(self, locations):
+        """Deletes backup files with their checksum manifests, and directories, with batched DeleteObjects calls."""
+        keys = []
+        for location in locations:
+            key = self._key_for_url(location)
+            keys.extend([key, key + CHECKSUM_SUFFIX])
+            keys.extend(self._list_keys(key + "/"))
+        for start in range(0, len(keys), MAX_DELETE_KEYS):
+            batch = keys[start:start + MAX_DELETE_KEYS]
+            response = self.client.delete_objects(
+                Bucket=self.bucket, Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True})
+            errors = response.get("Errors") or []
+            if errors:
+                raise RuntimeError(f"Could not delete {len(errors)} objects, e.g. {errors[0]['Key']}: "
+                                   f"{errors[0].get('Message')}")
+
+    def save(self, backup_file):
+        """
+        Uploads a backup file, or every file of a per-table backup directory under its name.
+
+        :return: s3:// URL of the backup.
+        """
+        if not os.path.isdir(backup_file):
+            url = self.upload_file(backup_file, self.key(os.path.basename(backup_file)))
+            # The checksum manifest travels with the backup so the remote copy can be verified too
+            if os.path.exists(checksum_path(backup_file)):
+                self.upload_file(checksum_path(backup_file), self.key(os.path.basename(checksum_path(backup_file))))
+            return url
+        base = os.path.basename(os.path.normpath(backup_file))
+        for root, _, files in os.walk(backup_file):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, backup_file).replace(os.sep, "/")
+                self.upload_file(path, self.key(f"{base}/{relative}"))
+        return self.url(self.key(base))
+
+    def upload_file(self, path, key):
+        """Uploads one file to key, resuming an interrupted upload of it when possible."""
+        size = os.path.getsize(path)
+        if size <= self.part_size:
+            with open(path, "rb") as f:
+                data = f.read()
+            self._throttle(data)
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentMD5=part_checksum(data))
+            return self.url(key)
+
+        # Deterministic for a given file size, so a resumed upload cuts the same parts
+        part_size = max(self.part_size, -(-size // MAX_PARTS))
+        upload = self._resume_upload(path, key, size, part_size)
+        count = -(-size // part_size)
+
+        def send(number):
+            with open(path, "rb") as f:
+                f.seek((number - 1) * part_size)
+                data = f.read(part_size)
+            self._throttle(data)
+            upload.upload_part(number, data)
+
+        missing = [number for number in range(1, count + 1) if number not in upload.parts]
+        if len(missing) < count:
+            logger.info("Resuming upload of %s: %d of %d parts already stored", key, count - len(missing), count)
+        # Each worker holds one part in memory; on failure the upload is kept so that save() can resume it
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="s3-upload") as executor:
+            for future in [executor.submit(send, number) for number in missing]:
+                future.result()
+        upload.complete()
+        return self.url(key)
+
+    def _state_path(self, key):
+        if self.state_dir is None:
+            return None
+        os.makedirs(self.state_dir, exist_ok=True)
+        digest = hashlib.sha1(f"{self.bucket}/{key}".encode()).hexdigest()
+        return os.path.join(self.state_dir, f"{digest}.json")
+
+    def _resume_upload(self, path, key, size, part_size):
+        state_path = self._state_path(key)
+        state = {"file": os.path.abspath(path), "size": size, "mtime": os.path.getmtime(path), "part_size": part_size}
+        if state_path is not None and os.path.exists(state_path):
+            with open(state_path) as f:
+                saved = json.load(f)
+            upload = MultipartUpload(self.client, self.bucket, key, saved["upload_id"], state_path, state)
+            if all(saved.get(name) == value for name, value in state.items()):
+                try:
+                    stored = upload.stored_parts()
+                except Exception as e:
+                    # Typically NoSuchUpload: the upload was aborted or expired
+                    logger.warning("Cannot resume upload of %s, starting over: %s", key, e)
+                else:
+                    # A part counts only if S3 holds exactly the one recorded as finished
+                    upload.parts = {int(number): etag for number, etag in saved["parts"].items()
+                                    if stored.get(int(number)) == etag}
+                    return upload
+            else:
+                logger.info("%s changed since its upload was interrupted, starting over", path)
+                try:
+                    upload.abort()
+                except Exception as e:
+                    logger.warning("Cannot abort stale upload of %s: %s", key, e)
+        return MultipartUpload.start(self.client, self.bucket, key, state_path, state)
@@ -0,0 +1,164 @@
+# tests/test_catalog.py
+import unittest
+import os
+import sqlite3
+import tempfile
+import threading
+import shutil
+from datetime import datetime, timedelta, timezone
+from backup_services.incremental_backup import SQLiteIncrementalBackup
+from storages.catalog import BackupCatalog
+from storages.local_storage import LocalStorage
+
+
+class TestBackupCatalog(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.backup_dir = os.path.join(self.work_dir, "backups")
+        os.makedirs(self.backup_dir)
+        self.catalog = BackupCatalog(os.path.join(self.work_dir, "catalog.sqlite"))
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def _file_backup(self, created, db="app.db"):
+        path = os.path.join(self.backup_dir, f"{db}_backup_{created.strftime('%Y%m%d%H%M%S')}.db.gz")
+        writer = LocalStorage(self.backup_dir).open(os.path.basename(path))
+        writer.write(b"backup")
+        writer.commit()
+        self.catalog.add(db, path, created=created, size=6, checksum=writer.checksum)
+        return path
+
+    def test_latest_before(self):
+        start = datetime(2024, 1, 1, 3, 0)
+        paths = [self._file_backup(start + timedelta(days=day)) for day in range(10)]
+        self._file_backup(start, db="other.db")
+        self.assertEqual(self.catalog.latest("app.db", before="2024-01-05T12:00:00")["location"], paths[4])
+        self.assertEqual(self.catalog.latest("app.db", before=datetime(2024, 1, 5, 3, 0))["location"], paths[4])
+        self.assertEqual(self.catalog.latest("app.db")["location"], paths[-1])
+        self.assertIsNone(self.catalog.latest("app.db", before="2023-12-31T00:00:00"))
+        self.assertEqual(self.catalog.databases(), ["app.db", "other.db"])
+        # The lookup is a search of the (db, created) index, not a table scan
+        connection = sqlite3.connect(self.catalog.path)
+        plan = " ".join(row[-1] for row in connection.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM backups WHERE db = ? AND created <= ? ORDER BY created DESC LIMIT 1",
+            ("app.db", "2024-01-05")))
+        connection.close()
+        self.assertIn("backups_db_created", plan)
+
+    def test_timestamps_compare_across_offsets_and_precision(self):
+        start = datetime(2024, 1, 1, 3, 0)
+        whole = self._file_backup(start)
+        fraction = self._file_backup(start + timedelta(microseconds=500000), db="other.db")
+        # Whole seconds are stored with microseconds too
+        self.assertEqual(self.catalog.get(whole)["created"], "2024-01-01T03:00:00.000000")
+        self.assertIsNone(self.catalog.latest("other.db", before="2024-01-01T03:00:00"))
+        self.assertEqual(self.catalog.latest("other.db", before="2024-01-01T03:00:00.5")["location"], fraction)
+        # Times with an offset are compared in local time; this one is five hours ahead of it
+        local = start.astimezone()
+        ahead = local.astimezone(timezone(local.utcoffset() + timedelta(hours=5)))
+        self.assertEqual(self.catalog.latest("app.db", before=ahead)["location"], whole)
+        self.assertEqual(self.catalog.latest("app.db", before=ahead.isoformat())["location"], whole)
+        self.assertIsNone(self.catalog.latest("app.db", before=ahead - timedelta(seconds=1)))
+        self.assertIsNone(self.catalog.latest("app.db", before=(ahead - timedelta(seconds=1)).isoformat()))
+
+    def test_retention_keeps_daily_weekly_monthly(self):
+        start = datetime(2024, 1, 1, 3, 0)
+        # Two backups a day for 90 days
+        for hour in range(90 * 2):
+            self._file_backup(start + timedelta(hours=12 * hour))
+        kept, expired = self.catalog.retention_plan("app.db", keep_last=3, daily=7, weekly=4, monthly=3)
+        kept_times = {backup["created"] for backup in kept}
+        # Last 3 and the 7 daily overlap (8 backups); the 4 weeks add 2 older Sundays, the 3 months 2 month ends
+        self.assertEqual(len(kept_times), 12)
+        for created in ("2024-03-30T03:00:00.000000", "2024-03-17T15:00:00.000000", "2024-03-10T15:00:00.000000",
+                        "2024-02-29T15:00:00.000000", "2024-01-31T15:00:00.000000"):
+            self.assertIn(created, kept_times)
+        self.assertEqual(len(kept) + len(expired), 180)
+
+        dry_run = self.catalog.prune("app.db", delete=self.fail, daily=7, dry_run=True)
+        self.assertEqual(len(dry_run), 173)
+        deleted = []
+        expired = self.catalog.prune("app.db", delete=lambda backups: deleted.extend(backups) or
+                                     LocalStorage(self.backup_dir).delete([b["location"] for b in backups]), daily=7)
+        self.assertEqual(len(deleted), 173)
+        self.assertEqual(len(self.catalog.list("app.db")), 7)
+        # Only the kept backups and their checksum manifests are left on disk
+        self.assertEqual(len(os.listdir(self.backup_dir)), 14)
+        self.assertFalse(any(os.path.exists(backup["location"]) for backup in expired))
+        with self.assertRaises(ValueError):
+            self.catalog.retention_plan("app.db")
+
+    def test_incremental_chain_is_kept(self):
+        db_path = os.path.join(self.work_dir, "app.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, value TEXT)")
+        conn.commit()
+        backup = SQLiteIncrementalBackup(db_path, self.backup_dir, catalog=self.catalog)
+        paths = []
+        for backup_type in ("full", "incremental", "incremental", "full", "incremental"):
+            conn.executemany("INSERT INTO t (value) VALUES (?)", [("x" * 100,)] * 200)
+            conn.commit()
+            paths.append(backup.backup(backup_type))
+        conn.close()
+
+        chain = self.catalog.chain(paths[2])
+        self.assertEqual([record["location"] for record in chain], paths[:3])
+        self.assertEqual([record["type"] for record in chain], ["full", "incremental", "incremental"])
+        self.assertEqual([record["location"] for record in self.catalog.children(paths[0])], [paths[1]])
+        with self.assertRaises(ValueError):
+            self.catalog.remove(paths[3])
+
+        # Keeping only the newest backup keeps its full backup too, and drops the older chain
+        kept, expired = self.catalog.retention_plan("app.db", keep_last=1)
+        self.assertEqual({record["location"] for record in kept}, {paths[3], paths[4]})
+        self.catalog.prune("app.db", lambda backups: LocalStorage(self.backup_dir).delete(
+            [record["location"] for record in backups]), keep_last=1)
+        self.assertEqual(sorted(os.listdir(self.backup_dir)), sorted(os.path.basename(path) for path in paths[3:]))
+
+    def test_scan_existing_directory(self):
+        # Backups written before the catalog existed are picked up by name
+        db_path = os.path.join(self.work_dir, "app.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY)")
+        conn.commit()
+        conn.close()
+        backup = SQLiteIncrementalBackup(db_path, self.backup_dir)
+        full = backup.backup("full")
+        incremental = backup.backup("incremental")
+        with open(os.path.join(self.backup_dir, "shop_full_20240101000000.sql.gz"), "wb") as f:
+            f.write(b"dump")
+        with open(os.path.join(self.backup_dir, "notes.txt"), "w") as f:
+            f.write("not a backup")
+        # Backups still being written
+        for name in (".app.db_backup_20240101000000.db.snapshot", "shop_full_20240102000000.sql.gz.tmp",
+                     ".shop_full_20240103000000.sql.gz", "shop_full_20240104000000.sql.gz.part"):
+            with open(os.path.join(self.backup_dir, name), "wb") as f:
+                f.write(b"partial")
+
+        self.assertEqual(self.catalog.scan(self.backup_dir), 3)
+        self.assertEqual(self.catalog.scan(self.backup_dir), 0)
+        self.assertEqual(self.catalog.get(incremental)["parent_id"], self.catalog.get(full)["id"])
+        self.assertEqual(self.catalog.get(full)["format"], "pages")
+        shop = self.catalog.latest("shop")
+        self.assertEqual((shop["created"], shop["size"]), ("2024-01-01T00:00:00.000000", 4))
+
+    def test_initialize_scans_once(self):
+        for day in range(1, 6):
+            with open(os.path.join(self.backup_dir, f"shop_full_202401{day:02d}000000.sql.gz"), "wb") as f:
+                f.write(b"dump")
+        path = os.path.join(self.work_dir, "new", "catalog.sqlite")
+        added = []
+        # Every process running a first backup initializes the new catalog at the same time
+        threads = [threading.Thread(target=lambda: added.append(BackupCatalog(path).initialize(self.backup_dir)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(added), [0, 0, 0, 5])
+        self.assertEqual(len(BackupCatalog(path).list("shop")), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
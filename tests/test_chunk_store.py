@@ -0,0 +1,121 @@
+# tests/test_chunk_store.py
+import unittest
+import os
+import random
+import sqlite3
+import tempfile
+import shutil
+from backup_services.sqlite_backup import SQLiteBackup
+from storages.chunk_store import ChunkStore, ContentDefinedChunker
+from storages.local_storage import LocalStorage
+from utils.pipeline import StreamingPipeline
+
+
+def sql_dump(rows, seed=1):
+    rng = random.Random(seed)
+    return "".join(
+        f"INSERT INTO test_table VALUES ({i},'name_{rng.randrange(10 ** 6)}',{rng.random():.6f});\n" for i in range(rows)
+    ).encode()
+
+
+class TestChunkStore(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.store = ChunkStore(os.path.join(self.work_dir, "store"), min_size=2048, avg_size=8192, max_size=32768)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def _write(self, name, data, store=None):
+        writer = (store or self.store).open(name)
+        for offset in range(0, len(data), 100000):
+            writer.write(data[offset:offset + 100000])
+        writer.commit()
+        return writer.stats
+
+    def test_chunking_is_deterministic_and_bounded(self):
+        # Chunk boundaries do not depend on how the stream is fed
+        data = sql_dump(150000)
+        whole = ContentDefinedChunker(2048, 8192, 32768)
+        chunks = whole.feed(data) + whole.finish()
+        pieces = ContentDefinedChunker(2048, 8192, 32768)
+        fed = []
+        for offset in range(0, len(data), 77777):
+            fed += pieces.feed(data[offset:offset + 77777])
+        fed += pieces.finish()
+        self.assertEqual(chunks, fed)
+        self.assertEqual(b"".join(chunks), data)
+        self.assertTrue(all(len(c) <= 32768 for c in chunks))
+
+    def test_shifted_dump_is_deduplicated(self):
+        # Inserting rows near the start of a dump only adds a few new chunks
+        data = sql_dump(30000)
+        first = self._write("day1", data)
+        changed = data[:50000] + b"INSERT INTO test_table VALUES (-1,'new',0.5);\n" + data[50000:]
+        second = self._write("day2", changed)
+
+        self.assertEqual(first["new_chunks"], first["chunks"])
+        self.assertLess(second["new_chunks"], 4)
+        self.assertGreater(second["dedup_ratio"], 10)
+
+        restored = os.path.join(self.work_dir, "restored.sql")
+        self.store.restore("day2", restored)
+        with open(restored, "rb") as f:
+            self.assertEqual(f.read(), changed)
+
+    def test_sqlite_files_share_chunks(self):
+        # Successive SQLite backups streamed through the pipeline store unchanged pages once
+        db_path = os.path.join(self.work_dir, "app.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE test_table (id INTEGER PRIMARY KEY, name TEXT)")
+        conn.executemany("INSERT INTO test_table (name) VALUES (?)", [(f"name_{i}" * 10,) for i in range(20000)])
+        conn.commit()
+
+        storage = LocalStorage(os.path.join(self.work_dir, "backups"))
+        backup = SQLiteBackup(db_path, storage.backup_dir)
+        first = storage.chunk_store("fixed").open("first")
+        StreamingPipeline(backup.iter_pages(), first).run()
+        conn.execute("UPDATE test_table SET name = 'changed' WHERE id = 5")
+        conn.commit()
+        conn.close()
+        second = storage.chunk_store("fixed").open("second")
+        StreamingPipeline(backup.iter_pages(), second).run()
+
+        self.assertEqual(second.stats["new_chunks"], 1)
+        self.assertEqual(storage.chunk_store().list(), ["first", "second"])
+        usage = storage.chunk_store().usage()
+        self.assertGreater(usage["ratio"], 2)
+
+    def test_delete_and_gc(self):
+        self._write("a", sql_dump(5000, seed=1))
+        self._write("b", sql_dump(5000, seed=2))
+        self.store.delete("a")
+        # Within the grace period the chunks could still belong to a backup being written
+        self.assertEqual(self.store.gc(), 0)
+        self.assertGreater(self.store.gc(grace_seconds=0), 0)
+        restored = os.path.join(self.work_dir, "b.sql")
+        self.store.restore("b", restored)
+        with open(restored, "rb") as f:
+            self.assertEqual(f.read(), sql_dump(5000, seed=2))
+
+    def test_gc_keeps_chunks_of_an_uncommitted_backup(self):
+        self._write("a", sql_dump(2000, seed=1))
+        old = os.path.getmtime(self.store._manifest_path("a")) - 2 * 3600
+        for digest in self.store._stored_chunks():
+            os.utime(self.store._chunk_path(digest), (old, old))
+        stale = os.path.join(self.store.chunk_dir, "00", "tmpcrashed.tmp")
+        os.makedirs(os.path.dirname(stale), exist_ok=True)
+        open(stale, "wb").close()
+        os.utime(stale, (old, old))
+        # A second backup reuses a's chunks but has not committed yet when a is deleted
+        writer = self.store.open("b")
+        writer.write(sql_dump(2000, seed=1))
+        writer._add(writer.chunker.finish())
+        self.store.delete("a")
+        self.assertEqual(self.store.gc(grace_seconds=3600), 0)
+        self.assertFalse(os.path.exists(stale))
+        self.assertEqual(len(list(self.store._stored_chunks())), len(writer.chunks))
+
+
+if __name__ == "__main__":
+    unittest.main()
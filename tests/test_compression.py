@@ -0,0 +1,94 @@
+# tests/test_compression.py
+import unittest
+import os
+import gzip
+import tempfile
+import shutil
+from utils.compression import codec_for_filename, compress_file, get_compressor, iter_decompress
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.payload = os.urandom(100 * 1024) + b"INSERT INTO test_table VALUES (1,'test_name');\n" * 20000
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def _compress(self, compressor, chunk_size=7000):
+        compressobj = compressor.compressobj()
+        output = [compressobj.compress(self.payload[i:i + chunk_size]) for i in range(0, len(self.payload), chunk_size)]
+        output.append(compressobj.flush())
+        return b"".join(output)
+
+    def test_parallel_gzip_is_standard_gzip(self):
+        # Block-parallel output is a concatenation of gzip members readable by gzip
+        compressor = get_compressor("gzip", level=6, threads=4)
+        compressor.block_size = 64 * 1024
+        data = self._compress(compressor)
+        self.assertEqual(gzip.decompress(data), self.payload)
+        self.assertGreater(data.count(b"\x1f\x8b\x08"), 1)
+
+    def test_abandoned_parallel_stream_stops_its_threads(self):
+        compressor = get_compressor("gzip", threads=4)
+        with compressor.compressobj() as compressobj:
+            compressobj.compress(self.payload)
+        self.assertTrue(compressobj._executor._shutdown)
+        # Without a level, gzip uses the same default for files as for streams
+        self.assertEqual(compressor.level, 6)
+
+    def test_compress_file_with_threads(self):
+        # compress_file accepts a codec, level and thread count
+        input_file = os.path.join(self.work_dir, "dump.sql")
+        with open(input_file, "wb") as f:
+            f.write(self.payload)
+        output_file = input_file + ".gz"
+        compress_file(input_file, output_file, level=1, threads=2)
+        with gzip.open(output_file, "rb") as f:
+            self.assertEqual(f.read(), self.payload)
+        # The default level matches a streamed gzip backup byte for byte
+        compress_file(input_file, output_file)
+        with open(output_file, "rb") as f:
+            self.assertEqual(f.read(), self._compress(get_compressor("gzip"), chunk_size=1024 * 1024))
+
+    def test_zstd_round_trip(self):
+        try:
+            import zstandard
+            compressor = get_compressor("zstd", level=3, threads=2)
+        except ImportError:
+            self.skipTest("zstandard is not installed")
+        data = self._compress(compressor)
+        self.assertEqual(zstandard.ZstdDecompressor().decompressobj().decompress(data), self.payload)
+
+    def test_lz4_round_trip(self):
+        try:
+            import lz4.frame
+            compressor = get_compressor("lz4", threads=2)
+        except ImportError:
+            self.skipTest("lz4 is not installed")
+        compressor.block_size = 64 * 1024
+        data = self._compress(compressor)
+        # Each parallel block is its own frame; decode them one after another
+        output = b""
+        while data:
+            decompressor = lz4.frame.LZ4FrameDecompressor()
+            output += decompressor.decompress(data)
+            data = decompressor.unused_data
+        self.assertEqual(output, self.payload)
+
+    def test_streaming_decompression(self):
+        # Multi-member parallel gzip decodes chunk by chunk, and truncation is detected
+        compressor = get_compressor("gzip", threads=3)
+        compressor.block_size = 32 * 1024
+        data = self._compress(compressor)
+        chunks = [data[i:i + 5000] for i in range(0, len(data), 5000)]
+        self.assertEqual(b"".join(iter_decompress(chunks, codec_for_filename("dump.sql.gz"))), self.payload)
+        with self.assertRaises(EOFError):
+            b"".join(iter_decompress([data[:-10]], "gzip"))
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            get_compressor("bzip3")
+
+if __name__ == "__main__":
+    unittest.main()
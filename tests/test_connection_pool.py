@@ -0,0 +1,108 @@
+# tests/test_connection_pool.py
+import unittest
+import unittest.mock
+import os
+import shutil
+import tempfile
+from db_connectors.pool import ConnectionPool
+from db_connectors.sqlite_connector import SQLiteConnector
+
+
+class FlakyConnector:
+    """Connector stand-in that fails a given number of connection attempts."""
+
+    def __init__(self, host, failures):
+        self.host = host
+        self.failures = failures
+        self.attempts = 0
+        self.connection = None
+
+    def connect(self):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            return False
+        self.connection = unittest.mock.Mock()
+        return True
+
+    def ping(self):
+        return True
+
+    def disconnect(self):
+        self.connection = None
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.work_dir, "app.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_released_connection_is_reused(self):
+        # The second acquire for the same parameters is a hit on the same connection
+        pool = ConnectionPool()
+        first = pool.acquire(SQLiteConnector(self.db_path))
+        connection = first.connection
+        pool.release(first)
+        second = pool.acquire(SQLiteConnector(self.db_path))
+        self.assertIs(second.connection, connection)
+        pool.release(second)
+        stats = pool.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["open"], stats["idle"]), (1, 1, 1, 1))
+        pool.close()
+        self.assertEqual(pool.stats()["open"], 0)
+
+    def test_dead_connection_is_replaced(self):
+        # A connection that fails its ping is reopened instead of handed out
+        pool = ConnectionPool()
+        connector = pool.acquire(SQLiteConnector(self.db_path))
+        pool.release(connector)
+        connector.connection.close()
+        reused = pool.acquire(SQLiteConnector(self.db_path))
+        self.assertTrue(reused.ping())
+        self.assertEqual(pool.stats()["ping_failures"], 1)
+        pool.release(reused)
+        pool.close()
+
+    def test_per_host_limit(self):
+        # A host at its limit makes further acquires wait and then time out
+        pool = ConnectionPool(max_per_host=1, acquire_timeout=0.1)
+        connector = pool.acquire(SQLiteConnector(self.db_path))
+        with self.assertRaises(TimeoutError):
+            pool.acquire(SQLiteConnector(os.path.join(self.work_dir, "other.db")))
+        pool.release(connector)
+        # An idle connection of another database on the same host is evicted to make room
+        other = pool.acquire(SQLiteConnector(os.path.join(self.work_dir, "other.db")))
+        self.assertEqual(pool.stats()["open"], 1)
+        pool.release(other)
+        pool.close()
+
+    def test_reserve_counts_against_host_limit(self):
+        # Reserved slots are granted up to what is free and block acquires until they are returned
+        pool = ConnectionPool(max_per_host=3, acquire_timeout=0.1)
+        connector = pool.acquire(FlakyConnector("db1", failures=0))
+        with pool.reserve(connector, 4) as granted:
+            self.assertEqual(granted, 2)
+            self.assertEqual(pool.stats()["open"], 3)
+            with self.assertRaises(TimeoutError):
+                pool.acquire(FlakyConnector("db1", failures=0))
+        self.assertEqual(pool.stats()["open"], 1)
+        pool.release(connector)
+        # Idle connectors of the host are closed to make room
+        with pool.reserve(connector, 3) as granted:
+            self.assertEqual((granted, pool.stats()["idle"]), (3, 0))
+        pool.close()
+
+    def test_connect_retries_with_backoff(self):
+        # Failed attempts are retried, and give up with ConnectionError after the last retry
+        pool = ConnectionPool(retries=3, backoff=0.001)
+        connector = pool.acquire(FlakyConnector("db1", failures=2))
+        self.assertEqual(connector.attempts, 3)
+        self.assertEqual(pool.stats()["connect_failures"], 2)
+        with self.assertRaises(ConnectionError):
+            pool.acquire(FlakyConnector("db2", failures=10))
+        self.assertEqual(pool.stats()["open"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
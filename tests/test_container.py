@@ -0,0 +1,152 @@
+# tests/test_container.py
+import unittest
+import os
+import sqlite3
+import tempfile
+import shutil
+from backup_services.sqlite_backup import SQLiteBackup
+from restore_services.sql_restore import SQLRestore
+from restore_services.sqlite_restore import SQLiteRestore
+from storages.container import ContainerReader, is_container
+from storages.local_storage import LocalStorage
+from utils.compression import GzipCompressor, NullCompressor
+from utils.defaults import CONTAINER_EXTENSION
+from utils.pipeline import StreamingPipeline
+
+
+def table_data(name, rows):
+    return "".join(f"INSERT INTO {name} VALUES ({i},'{name}_{i}');\n" for i in range(rows)).encode()
+
+
+class TestContainer(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.storage = LocalStorage(self.work_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_entries_round_trip(self):
+        # Entries written concurrently come back intact and can be read individually
+        container = self.storage.open_container("backup" + CONTAINER_EXTENSION, GzipCompressor(), threads=2)
+        container.block_size = 4096
+        users = container.open("users.sql", rows=3000)
+        orders = container.open("orders.sql")
+        users_data, orders_data = table_data("users", 3000), table_data("orders", 1000)
+        for offset in range(0, max(len(users_data), len(orders_data)), 1000):
+            users.write(users_data[offset:offset + 1000])
+            orders.write(orders_data[offset:offset + 1000])
+        users.commit()
+        orders.commit(rows=1000)
+        path = container.commit({"manifest": {"tables": ["users", "orders"]}})
+
+        self.assertTrue(is_container(path))
+        self.assertFalse(os.path.exists(path + ".part"))
+        with ContainerReader(path) as reader:
+            self.assertEqual(reader.metadata["manifest"]["tables"], ["users", "orders"])
+            self.assertEqual({entry["name"]: entry["rows"] for entry in reader.list()},
+                             {"users.sql": 3000, "orders.sql": 1000})
+            self.assertGreater(len(reader.entry("users.sql")["blocks"]), 1)
+            self.assertEqual(reader.read_entry("orders.sql"), orders_data)
+            self.assertEqual(reader.read_entry("users.sql"), users_data)
+            self.assertEqual(reader.verify(decompress=True), [])
+
+    def test_dump_split_into_table_entries(self):
+        # A mysqldump stream written to the container lands in one entry per table, with row counts
+        dump = (b"/*!40101 SET NAMES utf8mb4 */;\n"
+                b"--\n-- Table structure for table `users`\n--\n"
+                b"CREATE TABLE `users` (\n  `id` int,\n  `name` text\n);\n"
+                b"INSERT INTO `users` VALUES (1,'a),(b'),(2,'it\\'s'),(3,'c');\n"
+                b"INSERT INTO `users` VALUES (4,'d');\n"
+                b"--\n-- Table structure for table `orders`\n--\n"
+                b"CREATE TABLE `orders` (\n  `id` int\n);\n"
+                + b"".join(b"INSERT INTO `orders` VALUES (%d);\n" % i for i in range(5000)) +
+                b"/*!40103 SET TIME_ZONE=@OLD_TIME_ZONE */;\n")
+        container = self.storage.open_container("shop" + CONTAINER_EXTENSION, GzipCompressor(), split_dump="mysql")
+        for offset in range(0, len(dump), 777):
+            container.write(dump[offset:offset + 777])
+        path = container.commit()
+
+        with ContainerReader(path) as reader:
+            self.assertEqual(reader.metadata["dump"], "mysql")
+            self.assertEqual([(entry["name"], entry.get("rows")) for entry in reader.list()],
+                             [("header", None), ("tables/users", 4), ("tables/orders", 5000), ("footer", None)])
+            self.assertEqual(b"".join(reader.read_entry(entry["name"]) for entry in reader.list()), dump)
+
+        class RecordingRestore(SQLRestore):
+            def restore_stream(self, chunks):
+                self.sent = b"".join(chunks)
+
+        restore = RecordingRestore("mysql", None, tables=["users"])
+        self.assertEqual(restore.restore(path)["tables"], 1)
+        self.assertTrue(restore.sent.startswith(b"/*!40101 SET NAMES utf8mb4 */;"))
+        self.assertIn(b"INSERT INTO `users` VALUES (4,'d');", restore.sent)
+        self.assertNotIn(b"orders", restore.sent)
+        restore = RecordingRestore("mysql", None)
+        restore.restore(path)
+        self.assertEqual(restore.sent, dump)
+
+    def test_verify_detects_corruption(self):
+        # A flipped byte is reported for its entry only, from the block checksums
+        container = self.storage.open_container("backup" + CONTAINER_EXTENSION, NullCompressor())
+        for name in ("a", "b"):
+            entry = container.open(name)
+            entry.write(table_data(name, 100))
+            entry.commit()
+        path = container.commit()
+        with ContainerReader(path) as reader:
+            offset = reader.entry("b")["blocks"][0][0]
+        with open(path, "r+b") as f:
+            f.seek(offset + 10)
+            byte = f.read(1)
+            f.seek(offset + 10)
+            f.write(bytes([byte[0] ^ 0xFF]))
+
+        with ContainerReader(path) as reader:
+            problems = reader.verify()
+            self.assertEqual([name for name, _ in problems], ["b"])
+            self.assertEqual(reader.read_entry("a"), table_data("a", 100))
+            with self.assertRaises(ValueError):
+                reader.read_entry("b")
+
+    def test_incomplete_container_is_rejected(self):
+        # A container without its index (an interrupted backup) cannot be opened
+        path = os.path.join(self.work_dir, "broken" + CONTAINER_EXTENSION)
+        container = self.storage.open_container("full" + CONTAINER_EXTENSION)
+        container.write(table_data("t", 100))
+        full_path = container.commit()
+        with open(full_path, "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data[:-20])
+        with self.assertRaises(ValueError):
+            ContainerReader(path)
+
+    def test_sqlite_backup_to_container(self):
+        # A SQLite snapshot streamed into a container restores like a compressed file
+        db_path = os.path.join(self.work_dir, "app.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)")
+        conn.executemany("INSERT INTO users (name) VALUES (?)", [(f"user_{i}",) for i in range(2000)])
+        conn.commit()
+        conn.close()
+
+        backup = SQLiteBackup(db_path, self.work_dir)
+        source = backup.iter_snapshot(count_rows=True)
+        sink = self.storage.open_container(backup.backup_filename() + CONTAINER_EXTENSION, GzipCompressor(), threads=2)
+        sink.default_attributes["tables"] = backup.tables
+        path = StreamingPipeline(source, sink, NullCompressor()).run()
+        with ContainerReader(path) as reader:
+            self.assertEqual(reader.entry("data")["tables"], [{"name": "users", "rows": 2000}])
+
+        target = os.path.join(self.work_dir, "restored.db")
+        SQLiteRestore(target).restore(path)
+        conn = sqlite3.connect(target)
+        try:
+            self.assertEqual(conn.execute("SELECT count(*) FROM users").fetchone()[0], 2000)
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+# tests/test_incremental_backup.py
+import unittest
+import os
+import filecmp
+import sqlite3
+import tempfile
+import shutil
+from backup_services.incremental_backup import SQLiteIncrementalBackup, backup_chain, read_manifest, restore_chain
+from restore_services.verify import BackupVerifier
+
+
+class TestSQLiteIncrementalBackup(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.work_dir, "app.db")
+        self.backup_dir = os.path.join(self.work_dir, "backups")
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute("CREATE TABLE test_table (id INTEGER PRIMARY KEY, name TEXT)")
+        self.conn.executemany("INSERT INTO test_table (name) VALUES (?)", [("x" * 100,) for _ in range(5000)])
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.work_dir)
+
+    def _snapshot(self, name):
+        # Keep a copy of the database as it is now to compare restores against
+        path = os.path.join(self.work_dir, name)
+        shutil.copyfile(self.db_path, path)
+        return path
+
+    def test_incremental_stores_only_changed_pages(self):
+        backup = SQLiteIncrementalBackup(self.db_path, self.backup_dir)
+        full = backup.backup("incremental")
+        self.assertEqual(read_manifest(full)["type"], "full")
+        total_pages = backup.stats["pages"]
+
+        self.conn.execute("UPDATE test_table SET name = 'changed' WHERE id = 10")
+        self.conn.commit()
+        incremental = backup.backup("incremental")
+        self.assertLess(backup.stats["changed_pages"], 5)
+        self.assertEqual(backup.stats["pages"], total_pages)
+
+        self.conn.executemany("INSERT INTO test_table (name) VALUES (?)", [("y" * 100,) for _ in range(2000)])
+        self.conn.commit()
+        expected = self._snapshot("expected.db")
+        latest = backup.backup("incremental")
+
+        self.assertEqual(backup_chain(latest), [full, incremental, latest])
+        restored = restore_chain(latest, os.path.join(self.work_dir, "restored.db"))
+        self.assertTrue(filecmp.cmp(restored, expected, shallow=False))
+        # Every file of the backup can be checked with --verify
+        results = BackupVerifier(workers=2).verify([latest])
+        self.assertEqual([result["status"] for result in results], ["ok"] * 3)
+
+    def test_differential_is_relative_to_last_full(self):
+        backup = SQLiteIncrementalBackup(self.db_path, self.backup_dir)
+        full = backup.backup("full")
+        self.conn.execute("UPDATE test_table SET name = 'first' WHERE id = 1")
+        self.conn.commit()
+        first = backup.backup("differential")
+        first_changed = backup.stats["changed_pages"]
+
+        self.conn.execute("UPDATE test_table SET name = 'last' WHERE id = 5000")
+        self.conn.commit()
+        expected = self._snapshot("expected.db")
+        second = backup.backup("differential")
+
+        self.assertEqual(read_manifest(first)["parent"], os.path.basename(full))
+        self.assertEqual(read_manifest(second)["parent"], os.path.basename(full))
+        self.assertGreater(backup.stats["changed_pages"], first_changed)
+        self.assertEqual(backup_chain(second), [full, second])
+        restored = restore_chain(second, os.path.join(self.work_dir, "restored.db"))
+        self.assertTrue(filecmp.cmp(restored, expected, shallow=False))
+
+    def test_restore_detects_corruption(self):
+        backup = SQLiteIncrementalBackup(self.db_path, self.backup_dir)
+        full = backup.backup("full")
+        with open(os.path.join(full, "hashes.bin"), "r+b") as f:
+            f.write(b"\x00" * 16)
+        with self.assertRaises(ValueError):
+            restore_chain(full, os.path.join(self.work_dir, "restored.db"))
+
+if __name__ == "__main__":
+    unittest.main()
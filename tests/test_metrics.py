@@ -0,0 +1,77 @@
+# tests/test_metrics.py
+import unittest
+import os
+import tempfile
+import shutil
+import threading
+import urllib.request
+from storages.local_storage import LocalStorage
+from utils.compression import GzipCompressor
+from utils.metrics import OPENMETRICS_CONTENT_TYPE, BackupMetrics, MetricsRegistry
+from utils.pipeline import StreamingPipeline
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def _metrics(self):
+        metrics = BackupMetrics({"job": "app", "db_type": "sqlite"})
+        with metrics.stage("connect"):
+            pass
+        # Two pipelines (e.g. two tables) add up into the same stages
+        for name in ("a.sql.gz", "b.sql.gz"):
+            sink = LocalStorage(self.work_dir).open(name)
+            pipeline = StreamingPipeline([b"INSERT INTO t VALUES (1);\n" * 20000], sink, GzipCompressor())
+            pipeline.run()
+            metrics.add_pipeline(pipeline)
+        return metrics
+
+    def test_pipeline_stages_are_recorded(self):
+        records = {record["stage"]: record for record in self._metrics().records()}
+        self.assertEqual(list(records), ["connect", "dump", "compress", "store"])
+        compress = records["compress"]
+        self.assertEqual(compress["job"], "app")
+        self.assertEqual(compress["bytes_in"], 2 * 26 * 20000)
+        self.assertEqual(compress["bytes_out"], records["store"]["bytes_in"])
+        self.assertGreater(compress["ratio"], 50)
+        self.assertGreater(compress["cpu_seconds"], 0)
+        # The process peak is a lifetime figure, reported once per run
+        self.assertNotIn("peak_rss_bytes", compress)
+
+    def test_stage_counts_only_its_own_thread(self):
+        metrics = BackupMetrics()
+        busy = threading.Thread(target=lambda: sum(range(10 ** 7)))
+        with metrics.stage("connect"):
+            busy.start()
+            busy.join()
+        self.assertLess(metrics.records()[0]["cpu_seconds"], 0.05)
+        self.assertGreater(metrics.summary()["peak_rss_bytes"], 0)
+
+    def test_openmetrics_text_and_endpoint(self):
+        registry = MetricsRegistry(textfile=os.path.join(self.work_dir, "dbbackup.prom"))
+        registry.observe_stages('app "main"', self._metrics())
+        registry.observe_run('app "main"', "success", 1.5)
+        registry.observe_run('app "main"', "failed", 0.5)
+
+        with open(registry.textfile) as f:
+            text = f.read()
+        self.assertTrue(text.endswith("# EOF\n"))
+        self.assertIn('dbbackup_job_runs_total{job="app \\"main\\"",status="success"} 1', text)
+        self.assertIn('dbbackup_job_last_duration_seconds{job="app \\"main\\""} 0.5', text)
+        self.assertIn('dbbackup_stage_ratio{job="app \\"main\\"",stage="compress"}', text)
+
+        port = registry.serve(0, host="127.0.0.1")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+                self.assertEqual(response.headers["Content-Type"], OPENMETRICS_CONTENT_TYPE)
+                self.assertIn("dbbackup_stage_bytes_in", response.read().decode())
+        finally:
+            registry.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
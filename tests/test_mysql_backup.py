@@ -1,9 +1,15 @@
 # tests/test_mysql_backup.py
 import unittest
 import os
+import json
+import shutil
+import tempfile
 import pymysql
 from db_connectors.mysql_connector import MySQLConnector
 from backup_services.full_backup import FullBackup
+from backup_services.mysql_export import MySQLTableExporter
+from backup_services.parallel_dump import ParallelDump
+from restore_services.sql_restore import SQLRestore
 from storages.local_storage import LocalStorage
 from utils.compression import compress_file
 
@@ -105,5 +111,65 @@ class TestMySQLBackup(unittest.TestCase):
             self.assertTrue(os.path.exists(os.path.join(self.backup_dir, os.path.basename(backup_file))))
             connector.disconnect()
 
+    def test_mysql_parallel_backup(self):
+        # Test if every table is dumped to its own compressed file with a manifest
+        connector = MySQLConnector(self.host, self.port, self.user, self.password, self.database)
+        if connector.connect():
+            output_dir = tempfile.mkdtemp()
+            try:
+                backup_path = ParallelDump("mysql", connector, output_dir, workers=2).backup()
+                with open(os.path.join(backup_path, "manifest.json")) as f:
+                    manifest = json.load(f)
+                tables = {table["name"]: table for table in manifest["tables"]}
+                self.assertIn("test_table", tables)
+                for part in tables["test_table"]["parts"]:
+                    self.assertTrue(os.path.exists(os.path.join(backup_path, part["file"])))
+                # Views, routines, triggers and events are kept in the post-data script
+                self.assertTrue(os.path.exists(os.path.join(backup_path, manifest["schema"]["post-data"])))
+            finally:
+                shutil.rmtree(output_dir)
+                connector.disconnect()
+
+    def test_mysql_chunked_export(self):
+        # Test if a table with an integer primary key is split into range parts covering every row
+        connector = MySQLConnector(self.host, self.port, self.user, self.password, self.database)
+        if connector.connect():
+            cursor = connector.connection.cursor()
+            cursor.execute("ANALYZE TABLE test_table")
+            cursor.fetchall()
+            cursor.execute("SELECT COUNT(*) FROM test_table")
+            row_count = cursor.fetchone()[0]
+            cursor.close()
+            output_dir = tempfile.mkdtemp()
+            try:
+                exporter = MySQLTableExporter(batch_rows=2, chunk_rows=1)
+                backup_path = ParallelDump("mysql", connector, output_dir, workers=2, table_exporter=exporter).backup()
+                with open(os.path.join(backup_path, "manifest.json")) as f:
+                    manifest = json.load(f)
+                tables = {table["name"]: table for table in manifest["tables"]}
+                self.assertEqual(tables["test_table"]["rows"], row_count)
+            finally:
+                shutil.rmtree(output_dir)
+                connector.disconnect()
+
+    def test_mysql_selective_restore(self):
+        # Test if one table is restored from a parallel backup without touching the others
+        connector = MySQLConnector(self.host, self.port, self.user, self.password, self.database)
+        if connector.connect():
+            output_dir = tempfile.mkdtemp()
+            try:
+                backup_path = ParallelDump("mysql", connector, output_dir, workers=2).backup()
+                cursor = connector.connection.cursor()
+                cursor.execute("DELETE FROM test_table")
+                connector.connection.commit()
+                stats = SQLRestore("mysql", connector, workers=2, tables=["test_table"]).restore(backup_path)
+                self.assertEqual(stats["tables"], 1)
+                cursor.execute("SELECT COUNT(*) FROM test_table")
+                self.assertEqual(cursor.fetchone()[0], 1)
+                cursor.close()
+            finally:
+                shutil.rmtree(output_dir)
+                connector.disconnect()
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,176 @@
+# tests/test_mysql_export.py
+import unittest
+from backup_services.mysql_export import MySQLTableExporter, binlog_coordinates, format_objects, schema_objects
+
+try:
+    from pymysql.converters import escape_item
+    from pymysql.err import OperationalError, ProgrammingError
+except ImportError:
+    escape_item = None
+
+
+class FakeCursor:
+    """Stand-in for a pymysql cursor: records the queries and answers from canned results."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+
+    def execute(self, query, params=None):
+        self.connection.queries.append((query, params))
+        for marker, result in self.connection.results.items():
+            if marker in query:
+                if isinstance(result, Exception):
+                    raise result
+                self.rows = list(result(params) if callable(result) else result)
+                return
+        self.rows = []
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        self.connection.closed_cursors += 1
+
+
+class FakeConnection:
+    """
+    Answers queries containing one of the results' keys with its rows (or a
+    callable taking the query parameters); other queries return nothing.
+    """
+
+    def __init__(self, results=None):
+        self.results = results or {}
+        self.queries = []
+        self.closed_cursors = 0
+
+    def cursor(self, cursor_class=None):
+        return FakeCursor(self)
+
+    def escape(self, row):
+        return escape_item(row, "utf8mb4")
+
+
+def table_rows(count, payload=""):
+    return [(i, f"name-{i}{payload}") for i in range(1, count + 1)]
+
+
+@unittest.skipIf(escape_item is None, "pymysql is not installed")
+class TestMySQLTableExporter(unittest.TestCase):
+    def _statements(self, exporter, rows, part=None):
+        connection = FakeConnection({"SELECT * FROM": lambda params: [
+            row for row in rows if params is None or params[0] <= row[0] <= params[1]]})
+        stats = {}
+        output = b"".join(exporter.iter_inserts(connection, "users", part, stats))
+        self.assertEqual(connection.closed_cursors, 1)
+        lines = output.decode().splitlines()
+        self.assertEqual(lines[0], "SET NAMES utf8mb4;")
+        return lines[1:], stats, connection.queries
+
+    def test_rows_are_batched_into_statements(self):
+        statements, stats, queries = self._statements(MySQLTableExporter(batch_rows=4), table_rows(10))
+        self.assertEqual(stats["rows"], 10)
+        self.assertEqual(queries, [("SELECT * FROM `users`", None)])
+        self.assertEqual(len(statements), 3)
+        self.assertEqual(statements[0], "INSERT INTO `users` VALUES (1,'name-1'),(2,'name-2'),(3,'name-3'),"
+                                        "(4,'name-4');")
+        self.assertEqual(statements[2], "INSERT INTO `users` VALUES (9,'name-9'),(10,'name-10');")
+
+    def test_statements_stay_under_max_statement_bytes(self):
+        exporter = MySQLTableExporter(batch_rows=1000, max_statement_bytes=300)
+        statements, stats, _ = self._statements(exporter, table_rows(40, payload="x" * 30))
+        self.assertGreater(len(statements), 1)
+        self.assertTrue(all(len(statement.encode()) <= 300 for statement in statements))
+        values = ",".join(statement[len("INSERT INTO `users` VALUES "):-1] for statement in statements)
+        self.assertEqual(values, ",".join(f"({i},'name-{i}{'x' * 30}')" for i in range(1, 41)))
+        # A row larger than the limit still goes out, alone in its statement
+        statements, _, _ = self._statements(exporter, [(1, "a"), (2, "b" * 500), (3, "c")])
+        self.assertEqual(len(statements), 3)
+
+    def test_part_bounds_filter_on_the_key(self):
+        part = {"key": "id", "bounds": [3, 5]}
+        statements, stats, queries = self._statements(MySQLTableExporter(), table_rows(10), part)
+        self.assertEqual(queries, [("SELECT * FROM `users` WHERE `id` BETWEEN %s AND %s", (3, 5))])
+        self.assertEqual(stats["rows"], 3)
+        self.assertEqual(statements, ["INSERT INTO `users` VALUES (3,'name-3'),(4,'name-4'),(5,'name-5');"])
+
+    def test_plan_parts(self):
+        exporter = MySQLTableExporter(chunk_rows=100)
+        key = {"key_column_usage": [("id", "bigint")], "MIN(": [(1, 1000)]}
+        whole = [{"key": None, "bounds": None}]
+
+        # Small tables are not split, without asking the server anything
+        connection = FakeConnection(key)
+        self.assertEqual(exporter.plan_parts(connection.cursor(), "shop", "users", 100), whole)
+        self.assertEqual(connection.queries, [])
+
+        parts = exporter.plan_parts(FakeConnection(key).cursor(), "shop", "users", 350)
+        self.assertEqual([part["bounds"] for part in parts], [[1, 250], [251, 500], [501, 750], [751, 1000]])
+        self.assertTrue(all(part["key"] == "id" for part in parts))
+        # Consecutive ranges cover the key space without gaps or overlaps
+        self.assertEqual(parts[-1]["bounds"][1], 1000)
+
+        # Text, composite and missing primary keys, and empty tables, are exported whole
+        for results in ({"key_column_usage": [("code", "varchar")]},
+                        {"key_column_usage": [("a", "int"), ("b", "int")]},
+                        {"key_column_usage": []},
+                        {"key_column_usage": [("id", "int")], "MIN(": [(None, None)]}):
+            self.assertEqual(exporter.plan_parts(FakeConnection(results).cursor(), "shop", "users", 1000), whole)
+
+        # A key range narrower than the part count still yields ranges of at least one key
+        parts = exporter.plan_parts(FakeConnection({"key_column_usage": [("id", "int")], "MIN(": [(5, 6)]}).cursor(),
+                                    "shop", "users", 1000)
+        self.assertEqual([part["bounds"] for part in parts], [[5, 5], [6, 6]])
+
+    def test_binlog_coordinates(self):
+        connection = FakeConnection({"SHOW MASTER STATUS": [("binlog.000042", "1234", "", "")]})
+        self.assertEqual(binlog_coordinates(connection.cursor()), ("binlog.000042", 1234))
+        # MySQL 8.4 removed SHOW MASTER STATUS
+        connection = FakeConnection({"SHOW MASTER STATUS": ProgrammingError(1064, "syntax error"),
+                                     "SHOW BINARY LOG STATUS": [("binlog.000007", 4)]})
+        self.assertEqual(binlog_coordinates(connection.cursor()), ("binlog.000007", 4))
+        self.assertIsNone(binlog_coordinates(FakeConnection().cursor()))
+        # Without REPLICATION CLIENT the dump goes on without coordinates, and the new name is not tried
+        connection = FakeConnection({"SHOW MASTER STATUS": OperationalError(1227, "Access denied"),
+                                     "SHOW BINARY LOG STATUS": [("binlog.000007", 4)]})
+        self.assertIsNone(binlog_coordinates(connection.cursor()))
+        self.assertEqual(len(connection.queries), 1)
+
+    def test_schema_objects(self):
+        connection = FakeConnection({
+            "information_schema.routines": [("FUNCTION", "total")],
+            "SHOW CREATE FUNCTION": [("total", "", "CREATE FUNCTION `total`() RETURNS int\nBEGIN\n"
+                                                   "  RETURN 1;\nEND", "utf8mb4")],
+            "information_schema.views": [("active_users",)],
+            "SHOW CREATE VIEW": [("active_users", "CREATE VIEW `active_users` AS select 1 AS `1`")],
+            "information_schema.triggers": [("users_bi",)],
+            "SHOW CREATE TRIGGER": [("users_bi", "", "CREATE TRIGGER `users_bi` BEFORE INSERT ON `users` "
+                                                    "FOR EACH ROW SET NEW.id = NEW.id + 0")],
+        })
+        statements = schema_objects(connection.cursor(), "shop")
+        self.assertEqual(statements[0::2], ["DROP FUNCTION IF EXISTS `total`", "DROP VIEW IF EXISTS `active_users`",
+                                            "DROP TRIGGER IF EXISTS `users_bi`"])
+        self.assertTrue(statements[1].startswith("CREATE FUNCTION"))
+        self.assertTrue(statements[5].startswith("CREATE TRIGGER"))
+        script = format_objects(statements).decode().splitlines()
+        self.assertEqual(script[0], "DELIMITER ;;")
+        self.assertEqual(script[-1], "DELIMITER ;")
+        self.assertIn("END ;;", script)
+
+        # A routine whose body the user may not read fails the dump rather than being left out
+        connection = FakeConnection({"information_schema.routines": [("PROCEDURE", "cleanup")],
+                                     "SHOW CREATE PROCEDURE": [("cleanup", "", None)]})
+        with self.assertRaises(RuntimeError):
+            schema_objects(connection.cursor(), "shop")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,217 @@
+# tests/test_notifications.py
+import unittest
+import json
+import os
+import tempfile
+import shutil
+import threading
+import time
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from notifications import notifications
+from notifications.notifications import EVENT_COMPLETED, EVENT_FAILED, EVENT_STAGE, EVENT_STARTED, EventBus, \
+    FileSink, NotificationDispatcher, SlackSink, WebhookSink
+from utils.metrics import BackupMetrics
+
+
+class StandInServer:
+    """Local HTTP server standing in for a webhook; answers with the queued statuses, then 200."""
+
+    def __init__(self, statuses=(), delay=0.0):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.requests = []
+        self.release = threading.Event()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if server.delay:
+                    server.release.wait(server.delay)
+                status = server.statuses.pop(0) if server.statuses else 200
+                if status == 200:
+                    server.requests.append(body)
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/hook"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.release.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def delivered(self):
+        return [event for request in self.requests for event in request["events"]]
+
+
+class TestNotifications(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.spool_dir = os.path.join(self.work_dir, "spool")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def _dispatcher(self, sinks, **kwargs):
+        kwargs.setdefault("batch_interval", 0.05)
+        kwargs.setdefault("rate_limit", 0)
+        kwargs.setdefault("backoff", 0.01)
+        return NotificationDispatcher(sinks, spool_dir=self.spool_dir, **kwargs).start()
+
+    def test_batches_events_in_order(self):
+        server = StandInServer()
+        self.addCleanup(server.close)
+        dispatcher = self._dispatcher([WebhookSink(server.url, name="hook")], batch_size=10)
+        bus = EventBus()
+        bus.subscribe(dispatcher)
+        for number in range(25):
+            bus.publish(EVENT_STAGE, "shop", stage="dump", number=number)
+        stats = dispatcher.close()
+        self.assertEqual([event["data"]["number"] for event in server.delivered()], list(range(25)))
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(stats["hook"]["delivered"], 25)
+
+    def test_retries_server_errors(self):
+        server = StandInServer(statuses=[500, 503, 429])
+        self.addCleanup(server.close)
+        dispatcher = self._dispatcher([WebhookSink(server.url, name="hook")])
+        dispatcher.submit(EventBus().publish(EVENT_COMPLETED, "shop", location="/backups/shop.sql.gz"))
+        stats = dispatcher.close()
+        self.assertEqual(stats["hook"]["retries"], 3)
+        self.assertEqual([event["job"] for event in server.delivered()], ["shop"])
+
+    def test_client_error_drops_batch(self):
+        server = StandInServer(statuses=[400])
+        self.addCleanup(server.close)
+        dispatcher = self._dispatcher([WebhookSink(server.url, name="hook")])
+        dispatcher.submit(EventBus().publish(EVENT_COMPLETED, "shop"))
+        stats = dispatcher.close()
+        self.assertEqual(stats["hook"], {"delivered": 0, "batches": 0, "retries": 0, "spooled": 0, "dropped": 1})
+
+    def test_slow_sink_spools_without_blocking_publisher(self):
+        server = StandInServer(delay=5.0)
+        self.addCleanup(server.close)
+        sink = WebhookSink(server.url, name="hook", timeout=10)
+        dispatcher = self._dispatcher([sink], batch_size=5, max_pending=10)
+        bus = EventBus()
+        bus.subscribe(dispatcher)
+        started = time.perf_counter()
+        for number in range(100):
+            bus.publish(EVENT_STAGE, "shop", number=number)
+        self.assertLess(time.perf_counter() - started, 0.5)
+        started = time.perf_counter()
+        stats = dispatcher.close(timeout=0.2)
+        self.assertLess(time.perf_counter() - started, 2.0)
+        # Nothing is lost: what the hung sink did not take is on disk
+        self.assertEqual(stats["hook"]["delivered"], 0)
+        self.assertGreaterEqual(stats["hook"]["spooled"], 100)
+
+        # The next run delivers the spool first, in order
+        server.release.set()
+        server.delay = 0
+        dispatcher = self._dispatcher([WebhookSink(server.url, name="hook")], batch_size=50)
+        dispatcher.submit(EventBus().publish(EVENT_COMPLETED, "shop"))
+        stats = dispatcher.close()
+        numbers = [event["data"].get("number") for event in server.delivered()]
+        # The cut-off batch may arrive twice; the order of first deliveries is kept
+        first_seen = list(dict.fromkeys(numbers))
+        self.assertEqual(first_seen, list(range(100)) + [None])
+        self.assertEqual(os.path.getsize(os.path.join(self.spool_dir, "hook.jsonl")), 0)
+
+    def test_close_during_spool_read_keeps_the_events(self):
+        os.makedirs(self.spool_dir)
+        spool_path = os.path.join(self.spool_dir, "hook.jsonl")
+        with open(spool_path, "w") as f:
+            for number in range(5):
+                f.write(json.dumps(EventBus().publish(EVENT_STAGE, "shop", number=number).as_dict()) + "\n")
+        read_spool = notifications._read_spool
+        reading = threading.Event()
+
+        def slow_read(path, count):
+            reading.set()
+            time.sleep(0.3)
+            return read_spool(path, count)
+
+        with mock.patch.object(notifications, "_read_spool", slow_read):
+            dispatcher = self._dispatcher([WebhookSink("http://127.0.0.1:9/hook", name="hook")])
+            self.assertTrue(reading.wait(5))
+            # The worker is cancelled while the spool thread takes the events out of the file
+            dispatcher.close(timeout=0)
+            for thread in threading.enumerate():
+                if thread.name == "notify-spool":
+                    thread.join(5)
+        with open(spool_path) as f:
+            self.assertEqual([json.loads(line)["data"]["number"] for line in f], list(range(5)))
+
+    def test_dispatchers_share_a_spool_dir(self):
+        # Two processes backing up to the same output directory spool to the same files
+        server = StandInServer(delay=5.0)
+        self.addCleanup(server.close)
+        dispatchers = [self._dispatcher([WebhookSink(server.url, name="hook", timeout=10)], batch_size=5,
+                                        max_pending=10) for _ in range(2)]
+        for index, dispatcher in enumerate(dispatchers):
+            for number in range(50):
+                dispatcher.submit(EventBus().publish(EVENT_STAGE, f"db{index}", number=number))
+        closers = [threading.Thread(target=dispatcher.close, args=(0.2,)) for dispatcher in dispatchers]
+        for closer in closers:
+            closer.start()
+        for closer in closers:
+            closer.join()
+        # The delivery threads stuck on the hung sink do not keep the process alive
+        self.assertTrue(all(thread.daemon for thread in threading.enumerate() if thread.name == "notify-hook"))
+        with open(os.path.join(self.spool_dir, "hook.jsonl")) as f:
+            events = [json.loads(line) for line in f]
+        for index in range(2):
+            numbers = [event["data"]["number"] for event in events if event["job"] == f"db{index}"]
+            self.assertEqual(sorted(set(numbers)), list(range(50)))
+
+    def test_rate_limit_spaces_deliveries(self):
+        server = StandInServer()
+        self.addCleanup(server.close)
+        dispatcher = self._dispatcher([WebhookSink(server.url, name="hook")], batch_size=1, rate_limit=20)
+        for number in range(5):
+            dispatcher.submit(EventBus().publish(EVENT_STAGE, "shop", number=number))
+        started = time.perf_counter()
+        dispatcher.close(timeout=5)
+        self.assertEqual(len(server.requests), 5)
+        self.assertGreaterEqual(time.perf_counter() - started, 0.15)
+
+    def test_slack_and_file_sinks(self):
+        server = StandInServer()
+        self.addCleanup(server.close)
+        path = os.path.join(self.work_dir, "events.jsonl")
+        dispatcher = self._dispatcher([SlackSink(server.url, name="slack"), FileSink(path)])
+        bus = EventBus()
+        bus.subscribe(dispatcher)
+        metrics = BackupMetrics({"database": "shop"},
+                                on_stage=lambda record: bus.publish(EVENT_STAGE, "shop", **record))
+        bus.publish(EVENT_STARTED, "shop")
+        metrics.add("dump", 1.5, 1.0, 1000, 400)
+        bus.publish(EVENT_COMPLETED, "shop", location="/backups/shop.sql.gz", **metrics.totals())
+        bus.publish(EVENT_FAILED, "billing", error="connection refused")
+        dispatcher.close()
+
+        self.assertEqual(len(server.requests), 1)
+        text = server.requests[0]["text"].splitlines()
+        self.assertEqual(len(text), 2)
+        self.assertIn("Backup of shop completed", text[0])
+        self.assertIn("/backups/shop.sql.gz", text[0])
+        self.assertIn("connection refused", text[1])
+        with open(path) as f:
+            events = [json.loads(line) for line in f]
+        self.assertEqual([event["type"] for event in events],
+                         [EVENT_STARTED, EVENT_STAGE, EVENT_COMPLETED, EVENT_FAILED])
+        self.assertEqual(events[1]["data"]["bytes_out"], 400)
+        self.assertEqual(events[2]["data"]["bytes_in"], 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
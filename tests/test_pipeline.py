@@ -0,0 +1,101 @@
+# tests/test_pipeline.py
+import unittest
+import os
+import gzip
+import sqlite3
+import sys
+import tempfile
+import shutil
+from backup_services.sqlite_backup import SQLiteBackup
+from storages.local_storage import LocalStorage
+from utils.compression import GzipCompressor
+from utils.pipeline import PushSource, StreamingPipeline, iter_file, iter_process
+
+
+class TestStreamingPipeline(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.backup_dir = os.path.join(self.work_dir, "backups")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_file_source_is_compressed_into_storage(self):
+        # Stream a file through gzip into local storage and check the round trip
+        source_path = os.path.join(self.work_dir, "dump.sql")
+        payload = os.urandom(64 * 1024) + b"INSERT INTO t VALUES (1);\n" * 50000
+        with open(source_path, "wb") as f:
+            f.write(payload)
+
+        sink = LocalStorage(self.backup_dir).open("dump.sql.gz")
+        pipeline = StreamingPipeline(iter_file(source_path, chunk_size=4096), sink, GzipCompressor(level=1), queue_depth=2)
+        backup_file = pipeline.run()
+
+        with gzip.open(backup_file, "rb") as f:
+            self.assertEqual(f.read(), payload)
+        self.assertEqual(pipeline.stats["dump"].bytes_in, len(payload))
+        self.assertEqual(pipeline.stats["compress"].bytes_in, len(payload))
+        self.assertEqual(pipeline.stats["compress"].bytes_out, os.path.getsize(backup_file))
+        self.assertEqual(pipeline.stats["store"].bytes_out, os.path.getsize(backup_file))
+
+    def test_process_source_streams_stdout(self):
+        # A dump command's stdout is streamed without an intermediate file
+        command = [sys.executable, "-c", "import sys; sys.stdout.write('x' * 100000)"]
+        sink = LocalStorage(self.backup_dir).open("out.gz")
+        backup_file = StreamingPipeline(iter_process(command, chunk_size=1024), sink, GzipCompressor()).run()
+        with gzip.open(backup_file, "rb") as f:
+            self.assertEqual(f.read(), b"x" * 100000)
+        self.assertEqual(sorted(os.listdir(self.backup_dir)), ["out.gz", "out.gz.checksum.json"])
+
+    def test_failed_source_aborts_sink(self):
+        # A failing dump must not leave a partial backup behind
+        command = [sys.executable, "-c", "import sys; sys.stdout.write('partial'); sys.exit(3)"]
+        sink = LocalStorage(self.backup_dir).open("failed.gz")
+        with self.assertRaises(RuntimeError):
+            StreamingPipeline(iter_process(command), sink, GzipCompressor()).run()
+        self.assertEqual(os.listdir(self.backup_dir), [])
+
+    def test_sqlite_page_stream(self):
+        # The SQLite page stream produces a usable database copy
+        db_path = os.path.join(self.work_dir, "app.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE test_table (id INTEGER PRIMARY KEY, name TEXT)")
+        conn.executemany("INSERT INTO test_table (name) VALUES (?)", [(f"name_{i}",) for i in range(1000)])
+        conn.commit()
+        conn.close()
+
+        backup = SQLiteBackup(db_path, self.backup_dir)
+        sink = LocalStorage(self.backup_dir).open("app.db.gz")
+        backup_file = StreamingPipeline(backup.iter_pages(chunk_size=8192), sink, GzipCompressor()).run()
+
+        restored_path = os.path.join(self.work_dir, "restored.db")
+        with gzip.open(backup_file, "rb") as f_in, open(restored_path, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        conn = sqlite3.connect(restored_path)
+        self.assertEqual(conn.execute("SELECT count(*) FROM test_table").fetchone()[0], 1000)
+        conn.close()
+
+    def test_push_source_feeds_pipeline(self):
+        # A producer that calls write() streams through the pipeline in another thread
+        source = PushSource(chunk_size=1000, queue_depth=2)
+        pipeline = StreamingPipeline(source, LocalStorage(self.backup_dir).open("copy.gz"), GzipCompressor())
+        wait = pipeline.run_in_thread()
+        for i in range(10000):
+            source.write(f"{i}\tname_{i}\n".encode())
+        source.close()
+        backup_file = wait()
+        with gzip.open(backup_file, "rb") as f:
+            self.assertEqual(f.read(), b"".join(f"{i}\tname_{i}\n".encode() for i in range(10000)))
+
+    def test_push_source_failure_aborts_sink(self):
+        # A producer error fails the pipeline instead of committing a truncated file
+        source = PushSource()
+        wait = StreamingPipeline(source, LocalStorage(self.backup_dir).open("copy.gz"), GzipCompressor()).run_in_thread()
+        source.write(b"partial")
+        source.fail(IOError("connection lost"))
+        with self.assertRaises(RuntimeError):
+            wait()
+        self.assertEqual(os.listdir(self.backup_dir), [])
+
+if __name__ == "__main__":
+    unittest.main()
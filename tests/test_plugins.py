@@ -0,0 +1,53 @@
+# tests/test_plugins.py
+import unittest
+import json
+import os
+import subprocess
+import sys
+from utils.plugins import CONNECTORS, PluginRegistry
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestPluginRegistry(unittest.TestCase):
+    def test_resolves_references_lazily(self):
+        registry = PluginRegistry("codec")
+        registry.register("json", "json:dumps")
+        registry.register("missing", "not_a_real_module:Thing", requires="not_a_real_module")
+        self.assertEqual(registry.names(), ["json", "missing"])
+        self.assertIs(registry.load("json"), json.dumps)
+        with self.assertRaises(ValueError):
+            registry.load("yaml")
+        with self.assertRaises(ImportError) as raised:
+            registry.load("missing")
+        self.assertIn("requires the 'not_a_real_module' package", str(raised.exception))
+
+    def test_builtin_connectors(self):
+        self.assertEqual(CONNECTORS.names(), ["mysql", "postgresql", "sqlite"])
+        self.assertEqual(CONNECTORS.load("sqlite").__name__, "SQLiteConnector")
+
+    def test_main_imports_no_database_drivers(self):
+        probe = "import json, sys, main; print(json.dumps(sorted(sys.modules)))"
+        output = subprocess.run([sys.executable, "-c", probe], check=True, capture_output=True, text=True,
+                                cwd=REPO_DIR, env=dict(os.environ, PYTHONPATH=REPO_DIR)).stdout
+        modules = set(json.loads(output))
+        for module in ("pymysql", "psycopg2", "boto3", "asyncio", "multiprocessing", "http.server",
+                       "concurrent.futures", "db_connectors.mysql_connector", "notifications.notifications",
+                       "controllers.batch", "controllers.backup", "backup_services.wal_archive",
+                       "backup_services.parallel_dump", "backup_services.incremental_backup",
+                       "backup_services.sqlite_backup", "backup_services.mysql_export",
+                       "backup_services.sqlite_online_backup", "storages.catalog", "storages.container",
+                       "storages.s3_storage", "utils.compression", "utils.pipeline", "utils.throttle",
+                       "utils.metrics"):
+            self.assertNotIn(module, modules)
+
+    def test_parser_codecs_match_the_compressors(self):
+        # main.py offers the codecs without importing utils.compression
+        from utils.compression import COMPRESSORS
+        from utils.defaults import COMPRESSION_CODECS
+
+        self.assertEqual(list(COMPRESSION_CODECS), sorted(COMPRESSORS))
+
+
+if __name__ == "__main__":
+    unittest.main()
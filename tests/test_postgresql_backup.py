@@ -2,10 +2,16 @@
 # "postgresqlpasswordgarrido"
 import unittest
 import os
+import json
+import shutil
+import tempfile
 import psycopg2
 from psycopg2 import sql
 from db_connectors.postgresql_connector import PostgreSQLConnector
 from backup_services.full_backup import FullBackup
+from backup_services.parallel_dump import ParallelDump
+from backup_services.postgresql_copy_export import PostgreSQLCopyExport
+from restore_services.sql_restore import SQLRestore
 from storages.local_storage import LocalStorage
 from utils.compression import compress_file
 
@@ -118,5 +124,56 @@ class TestPostgreSQLBackup(unittest.TestCase):
             self.assertTrue(os.path.exists(os.path.join(self.backup_dir, os.path.basename(backup_file))))
             connector.disconnect()
 
+    def test_postgresql_parallel_backup(self):
+        # Test if every table is dumped to its own compressed file with a manifest
+        connector = PostgreSQLConnector(self.host, self.port, self.user, self.password, self.database)
+        if connector.connect():
+            output_dir = tempfile.mkdtemp()
+            try:
+                backup_path = ParallelDump("postgresql", connector, output_dir, workers=2).backup()
+                with open(os.path.join(backup_path, "manifest.json")) as f:
+                    manifest = json.load(f)
+                tables = {table["name"]: table for table in manifest["tables"]}
+                self.assertIn("public.test_table", tables)
+                self.assertTrue(os.path.exists(os.path.join(backup_path, tables["public.test_table"]["file"])))
+            finally:
+                shutil.rmtree(output_dir)
+                connector.disconnect()
+
+    def test_postgresql_copy_export(self):
+        # Test if table data is exported with COPY and the schema is captured separately
+        connector = PostgreSQLConnector(self.host, self.port, self.user, self.password, self.database)
+        if connector.connect():
+            output_dir = tempfile.mkdtemp()
+            try:
+                backup_path = PostgreSQLCopyExport(connector, output_dir).backup()
+                with open(os.path.join(backup_path, "manifest.json")) as f:
+                    manifest = json.load(f)
+                tables = {table["name"]: table for table in manifest["tables"]}
+                self.assertEqual(tables["public.test_table"]["rows"], 1)
+                self.assertEqual(tables["public.test_table"]["columns"], ["id", "name"])
+                self.assertTrue(os.path.exists(os.path.join(backup_path, manifest["schema"]["pre-data"])))
+            finally:
+                shutil.rmtree(output_dir)
+                connector.disconnect()
+
+    def test_postgresql_copy_restore(self):
+        # Test if table data from a COPY export is loaded back into the existing table
+        connector = PostgreSQLConnector(self.host, self.port, self.user, self.password, self.database)
+        if connector.connect():
+            output_dir = tempfile.mkdtemp()
+            try:
+                backup_path = PostgreSQLCopyExport(connector, output_dir).backup()
+                cursor = connector.connection.cursor()
+                cursor.execute("DELETE FROM test_table")
+                connector.connection.commit()
+                SQLRestore("postgresql", connector, tables=["test_table"]).restore(backup_path)
+                cursor.execute("SELECT COUNT(*) FROM test_table")
+                self.assertEqual(cursor.fetchone()[0], 1)
+                cursor.close()
+            finally:
+                shutil.rmtree(output_dir)
+                connector.disconnect()
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,280 @@
+# tests/test_restore.py
+import unittest
+import os
+import sqlite3
+import gzip
+import tempfile
+import shutil
+from backup_services.incremental_backup import SQLiteIncrementalBackup
+from backup_services.mysql_export import format_objects
+from backup_services.sqlite_backup import SQLiteBackup
+from restore_services.sql_restore import SQLRestore, defer_mysql_indexes, iter_statements
+from restore_services.sqlite_restore import SQLiteRestore
+from storages.local_storage import LocalStorage
+from utils.compression import GzipCompressor
+from utils.dump_sections import iter_dump_sections
+from utils.pipeline import StreamingPipeline
+
+try:
+    from pymysql.err import ProgrammingError
+except ImportError:
+    ProgrammingError = None
+
+
+class TestSQLiteRestore(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.work_dir, "app.db")
+        self.backup_dir = os.path.join(self.work_dir, "backups")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)")
+        conn.execute("CREATE INDEX users_name ON users (name)")
+        conn.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY, user_id INTEGER)")
+        conn.executemany("INSERT INTO users (name) VALUES (?)", [(f"user_{i}",) for i in range(2000)])
+        conn.executemany("INSERT INTO orders (user_id) VALUES (?)", [(i,) for i in range(500)])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def _compressed_backup(self):
+        backup = SQLiteBackup(self.db_path, self.backup_dir)
+        sink = LocalStorage(self.backup_dir).open(backup.backup_filename() + ".gz")
+        return StreamingPipeline(backup.iter_snapshot(), sink, GzipCompressor(threads=2, block_size=8192)).run()
+
+    def _count(self, db_path, table):
+        conn = sqlite3.connect(db_path)
+        try:
+            return conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_restore_compressed_snapshot(self):
+        # A gzip snapshot is decompressed on the fly into a new database
+        backup_file = self._compressed_backup()
+        target = os.path.join(self.work_dir, "restored.db")
+        SQLiteRestore(target).restore(backup_file)
+        self.assertEqual(self._count(target, "users"), 2000)
+        self.assertEqual(self._count(target, "orders"), 500)
+        self.assertFalse(os.path.exists(target + ".restore"))
+
+    def test_restore_page_level_chain(self):
+        # The incremental chain is applied before the database is restored
+        backup = SQLiteIncrementalBackup(self.db_path, self.backup_dir)
+        backup.backup("full")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("DELETE FROM orders WHERE id > 100")
+        conn.commit()
+        conn.close()
+        latest = backup.backup("incremental")
+        target = os.path.join(self.work_dir, "restored.db")
+        SQLiteRestore(target).restore(latest)
+        self.assertEqual(self._count(target, "orders"), 100)
+
+    def test_selective_restore(self):
+        # Only the named table is replaced; other tables in the target are untouched
+        backup_file = self._compressed_backup()
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("DELETE FROM users")
+        conn.execute("DELETE FROM orders")
+        conn.commit()
+        conn.close()
+        SQLiteRestore(self.db_path, tables=["users"]).restore(backup_file)
+        self.assertEqual(self._count(self.db_path, "users"), 2000)
+        self.assertEqual(self._count(self.db_path, "orders"), 0)
+        conn = sqlite3.connect(self.db_path)
+        indexes = conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'users'").fetchall()
+        conn.close()
+        self.assertEqual(indexes, [("users_name",)])
+        with self.assertRaises(ValueError):
+            SQLiteRestore(self.db_path, tables=["missing"]).restore(backup_file)
+
+
+class TestSQLStatements(unittest.TestCase):
+    def test_iter_statements(self):
+        # Statements are split at lines ending in ';', across chunk boundaries
+        chunks = [b"SET NAMES utf8mb4;\nINSERT INTO `t` VALUES (1,'a;\\nb');\nCREATE TABLE `u` (\n  `id` int", b"\n) ENGINE=InnoDB;\n"]
+        self.assertEqual(list(iter_statements(chunks)), [
+            b"SET NAMES utf8mb4;",
+            b"INSERT INTO `t` VALUES (1,'a;\\nb');",
+            b"CREATE TABLE `u` (\n  `id` int\n) ENGINE=InnoDB;",
+        ])
+
+    def test_defer_mysql_indexes(self):
+        # Secondary indexes and foreign keys move to an ALTER TABLE; the primary key stays
+        create = ("CREATE TABLE `t` (\n  `id` int NOT NULL AUTO_INCREMENT,\n  `a` int DEFAULT NULL,\n"
+                  "  PRIMARY KEY (`id`),\n  KEY `ia` (`a`),\n"
+                  "  CONSTRAINT `fk` FOREIGN KEY (`a`) REFERENCES `p` (`id`)\n) ENGINE=InnoDB;")
+        table, alter = defer_mysql_indexes(create)
+        self.assertEqual(table, "CREATE TABLE `t` (\n  `id` int NOT NULL AUTO_INCREMENT,\n  `a` int DEFAULT NULL,\n"
+                                "  PRIMARY KEY (`id`)\n) ENGINE=InnoDB;")
+        self.assertEqual(alter, "ALTER TABLE `t` ADD KEY `ia` (`a`), "
+                                "ADD CONSTRAINT `fk` FOREIGN KEY (`a`) REFERENCES `p` (`id`)")
+
+    def test_defer_mysql_indexes_keeps_partitioning(self):
+        create = ("CREATE TABLE `t` (\n  `id` int NOT NULL,\n  `a` int DEFAULT NULL,\n  PRIMARY KEY (`id`),\n"
+                  "  KEY `ia` (`a`)\n) ENGINE=InnoDB\n/*!50100 PARTITION BY RANGE (`id`)\n"
+                  "(PARTITION p0 VALUES LESS THAN (10) ENGINE = InnoDB,\n"
+                  " PARTITION p1 VALUES LESS THAN MAXVALUE ENGINE = InnoDB) */;")
+        table, alter = defer_mysql_indexes(create)
+        self.assertEqual(table, "CREATE TABLE `t` (\n  `id` int NOT NULL,\n  `a` int DEFAULT NULL,\n"
+                                "  PRIMARY KEY (`id`)\n) ENGINE=InnoDB\n/*!50100 PARTITION BY RANGE (`id`)\n"
+                                "(PARTITION p0 VALUES LESS THAN (10) ENGINE = InnoDB,\n"
+                                " PARTITION p1 VALUES LESS THAN MAXVALUE ENGINE = InnoDB) */;")
+        self.assertEqual(alter, "ALTER TABLE `t` ADD KEY `ia` (`a`)")
+
+    @unittest.skipIf(ProgrammingError is None, "pymysql is not installed")
+    def test_mysql_objects_are_created_in_dependency_order(self):
+        class Connection:
+            def __init__(self):
+                self.created = []
+
+            def cursor(self):
+                return self
+
+            def execute(self, statement):
+                # The view over a view fails until the view it selects from exists
+                if "FROM `recent`" in statement and "CREATE VIEW `recent` AS SELECT 1" not in self.created:
+                    raise ProgrammingError(1146, "Table 'shop.recent' doesn't exist")
+                self.created.append(statement)
+
+            def close(self):
+                pass
+
+        class Connector:
+            connection = Connection()
+
+        script = format_objects(["CREATE VIEW `top` AS SELECT * FROM `recent`", "CREATE VIEW `recent` AS SELECT 1",
+                                 "CREATE PROCEDURE `p`()\nBEGIN\n  SELECT 1;\n  SELECT 2;\nEND"])
+        SQLRestore("mysql", Connector())._create_mysql_objects([script[:20], script[20:]])
+        self.assertEqual(Connector.connection.created, ["CREATE VIEW `recent` AS SELECT 1",
+                                                        "CREATE PROCEDURE `p`()\nBEGIN\n  SELECT 1;\n  SELECT 2;\nEND",
+                                                        "CREATE VIEW `top` AS SELECT * FROM `recent`"])
+
+
+MYSQL_DUMP = b"""/*!40101 SET NAMES utf8mb4 */;
+
+--
+-- Table structure for table `orders`
+--
+
+CREATE TABLE `orders` (
+  `id` int NOT NULL
+) ENGINE=InnoDB;
+INSERT INTO `orders` VALUES (1),(2);
+
+--
+-- Table structure for table `users`
+--
+
+CREATE TABLE `users` (
+  `id` int NOT NULL
+) ENGINE=InnoDB;
+
+--
+-- Dumping data for table `users`
+--
+
+INSERT INTO `users` VALUES (1),(2),(3);
+
+--
+-- Final view structure for view `recent`
+--
+
+CREATE VIEW `recent` AS SELECT 1;
+/*!40103 SET TIME_ZONE=@OLD_TIME_ZONE */;
+-- Dump completed
+"""
+
+POSTGRESQL_DUMP = b"""SET client_encoding = 'UTF8';
+
+--
+-- Name: users; Type: TABLE; Schema: public; Owner: app
+--
+
+CREATE TABLE public.users (id integer, name text);
+
+--
+-- Data for Name: users; Type: TABLE DATA; Schema: public; Owner: app
+--
+
+COPY public.users (id, name) FROM stdin;
+1\t-- Name: not a boundary
+\\.
+
+COPY public."Order Items" (id) FROM stdin;
+7
+\\.
+
+--
+-- Name: users users_pkey; Type: CONSTRAINT; Schema: public; Owner: app
+--
+
+ALTER TABLE ONLY public.users ADD CONSTRAINT users_pkey PRIMARY KEY (id);
+
+--
+-- PostgreSQL database dump complete
+--
+"""
+
+
+class RecordingRestore(SQLRestore):
+    """Collects the SQL that would be sent to the command-line client."""
+
+    def restore_stream(self, chunks):
+        self.sent = b"".join(chunks)
+
+
+class TestDumpSections(unittest.TestCase):
+    def _sections(self, dump, db_type, chunk_size):
+        sections = []
+        for section, data in iter_dump_sections([dump[i:i + chunk_size] for i in range(0, len(dump), chunk_size)],
+                                                db_type):
+            if sections and sections[-1][0] is section:
+                sections[-1][1] += data
+            else:
+                sections.append([section, data])
+        self.assertEqual(b"".join(data for _, data in sections), dump)
+        return [(section.name, section.table) for section, _ in sections]
+
+    def test_split_at_table_boundaries(self):
+        for chunk_size in (5, 64, len(MYSQL_DUMP)):
+            self.assertEqual(self._sections(MYSQL_DUMP, "mysql", chunk_size),
+                             [("header", None), ("orders", "orders"), ("users", "users"), ("objects-1", None),
+                              ("footer", None)])
+            self.assertEqual(self._sections(POSTGRESQL_DUMP, "postgresql", chunk_size),
+                             [("header", None), ("schema", None), ("public.users", "public.users"),
+                              ("public.Order Items", "public.Order Items"), ("post-data", None),
+                              ("footer", None)])
+
+    def test_selective_restore_of_single_dump(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        path = os.path.join(work_dir, "shop_full_20240101000000.sql.gz")
+        with gzip.open(path, "wb") as f:
+            f.write(MYSQL_DUMP)
+        restore = RecordingRestore("mysql", None, tables=["users"])
+        self.assertEqual(restore.restore(path)["tables"], 1)
+        self.assertIn(b"SET NAMES utf8mb4", restore.sent)
+        self.assertIn(b"INSERT INTO `users` VALUES (1),(2),(3);", restore.sent)
+        self.assertIn(b"SET TIME_ZONE=@OLD_TIME_ZONE", restore.sent)
+        self.assertNotIn(b"orders", restore.sent)
+        self.assertNotIn(b"VIEW", restore.sent)
+
+        path = os.path.join(work_dir, "billing_full_20240101000000.sql.gz")
+        with gzip.open(path, "wb") as f:
+            f.write(POSTGRESQL_DUMP)
+        restore = RecordingRestore("postgresql", None, tables=["users"])
+        restore.restore(path)
+        # PostgreSQL loads the data into the existing table
+        self.assertTrue(restore.sent.startswith(b"SET client_encoding = 'UTF8';"))
+        self.assertIn(b"COPY public.users (id, name) FROM stdin;\n1\t-- Name: not a boundary\n\\.\n", restore.sent)
+        self.assertNotIn(b"CREATE TABLE", restore.sent)
+        self.assertNotIn(b"Order Items", restore.sent)
+        with self.assertRaises(ValueError):
+            RecordingRestore("postgresql", None, tables=["missing"]).restore(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,228 @@
+# tests/test_s3_storage.py
+import unittest
+import base64
+import hashlib
+import os
+import random
+import tempfile
+import shutil
+import threading
+from storages.s3_storage import MIN_PART_SIZE, S3Storage
+from utils.checksum import write_checksum
+from utils.compression import GzipCompressor
+from utils.pipeline import StreamingPipeline
+
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+
+class FakeBody:
+    def __init__(self, data):
+        self.data = data
+
+    def iter_chunks(self, chunk_size):
+        for start in range(0, len(self.data), chunk_size):
+            yield self.data[start:start + chunk_size]
+
+
+class FakeS3Client:
+    """In-memory stand-in for the subset of the boto3 S3 client used by S3Storage."""
+
+    def __init__(self, fail_part=None):
+        self.objects = {}
+        self.uploads = {}
+        self.part_calls = []
+        self.fail_part = fail_part
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _check_md5(self, body, content_md5):
+        if base64.b64encode(hashlib.md5(body).digest()).decode() != content_md5:
+            raise ValueError("BadDigest")
+
+    def put_object(self, Bucket, Key, Body, ContentMD5):
+        self._check_md5(Body, ContentMD5)
+        self.objects[(Bucket, Key)] = Body
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            error = Exception("NoSuchKey")
+            error.response = {"Error": {"Code": "NoSuchKey"}}
+            raise error
+        return {"Body": FakeBody(self.objects[(Bucket, Key)])}
+
+    def create_multipart_upload(self, Bucket, Key):
+        upload_id = f"upload-{len(self.uploads)}"
+        self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, ContentMD5):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if PartNumber == self.fail_part:
+                raise ConnectionError("Connection reset")
+            self._check_md5(Body, ContentMD5)
+            etag = f'"{hashlib.md5(Body).hexdigest()}"'
+            self.uploads[UploadId][PartNumber] = (etag, Body)
+            self.part_calls.append(PartNumber)
+            return {"ETag": etag}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def list_parts(self, Bucket, Key, UploadId, PartNumberMarker=0):
+        parts = sorted(self.uploads[UploadId].items())
+        return {"Parts": [{"PartNumber": number, "ETag": etag} for number, (etag, _) in parts]}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        body = b""
+        for part in MultipartUpload["Parts"]:
+            etag, data = parts[part["PartNumber"]]
+            assert etag == part["ETag"]
+            body += data
+        self.objects[(Bucket, Key)] = body
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        del self.uploads[UploadId]
+
+    def list_objects_v2(self, Bucket, Prefix, ContinuationToken=None, page_size=2):
+        keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        page = keys[start:start + page_size]
+        response = {"Contents": [{"Key": key} for key in page], "IsTruncated": start + page_size < len(keys)}
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = str(start + page_size)
+        return response
+
+    def delete_objects(self, Bucket, Delete):
+        self.delete_calls = getattr(self, "delete_calls", 0) + 1
+        for item in Delete["Objects"]:
+            self.objects.pop((Bucket, item["Key"]), None)
+        return {}
+
+
+class TestS3Storage(unittest.TestCase):
+    part_size = MIN_PART_SIZE
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.data = random.Random(7).randbytes(3 * self.part_size + 12345)
+        self.backup_file = os.path.join(self.work_dir, "backup.db.gz")
+        with open(self.backup_file, "wb") as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def _storage(self, client):
+        return S3Storage("backups", prefix="nightly", client=client, part_size=self.part_size, concurrency=3,
+                         state_dir=os.path.join(self.work_dir, "state"))
+
+    def test_streamed_multipart_upload(self):
+        # A pipeline sink upload is split into concurrent parts and reassembled by S3
+        client = FakeS3Client()
+        sink = self._storage(client).open("stream.db")
+        chunks = (self.data[i:i + 1000000] for i in range(0, len(self.data), 1000000))
+        url = StreamingPipeline(chunks, sink).run()
+        self.assertEqual(url, "s3://backups/nightly/stream.db")
+        self.assertEqual(client.objects[("backups", "nightly/stream.db")], self.data)
+        self.assertEqual(sorted(client.part_calls), [1, 2, 3, 4])
+        self.assertLessEqual(client.max_in_flight, 3)
+
+    def test_small_backup_is_single_put(self):
+        client = FakeS3Client()
+        writer = self._storage(client).open("small.sql.gz")
+        writer.write(b"x" * 1000)
+        writer.commit()
+        self.assertEqual(client.objects[("backups", "nightly/small.sql.gz")], b"x" * 1000)
+        self.assertEqual(client.uploads, {})
+
+    def test_read_back(self):
+        client = FakeS3Client()
+        storage = self._storage(client)
+        writer = storage.open("pg_wal/000000010000000000000001.gz")
+        writer.write(self.data)
+        writer.commit()
+        self.assertEqual(b"".join(storage.read("pg_wal/000000010000000000000001.gz")), self.data)
+        with self.assertRaises(FileNotFoundError):
+            storage.read("pg_wal/000000010000000000000002.gz")
+
+    def test_failed_stream_aborts_upload(self):
+        client = FakeS3Client(fail_part=2)
+        sink = self._storage(client).open("stream.db.gz")
+        chunks = (self.data[i:i + 1000000] for i in range(0, len(self.data), 1000000))
+        with self.assertRaises(RuntimeError):
+            StreamingPipeline(chunks, sink, GzipCompressor(level=1)).run()
+        self.assertEqual(client.uploads, {})
+        self.assertEqual(client.objects, {})
+
+    def test_file_upload_resumes_after_crash(self):
+        # Parts stored before the failure are not sent again by the next save()
+        client = FakeS3Client(fail_part=3)
+        with self.assertRaises(ConnectionError):
+            self._storage(client).save(self.backup_file)
+        self.assertEqual(len(client.uploads), 1)
+        sent_before = set(client.part_calls)
+        self.assertIn(1, sent_before)
+
+        client.fail_part = None
+        client.part_calls = []
+        url = self._storage(client).save(self.backup_file)
+        self.assertEqual(url, "s3://backups/nightly/backup.db.gz")
+        self.assertEqual(client.objects[("backups", "nightly/backup.db.gz")], self.data)
+        self.assertEqual(set(client.part_calls), {1, 2, 3, 4} - sent_before)
+        self.assertEqual(os.listdir(os.path.join(self.work_dir, "state")), [])
+
+    def test_delete_files_and_directories(self):
+        # A file goes with its checksum manifest, a directory with everything under it
+        client = FakeS3Client()
+        storage = self._storage(client)
+        write_checksum(self.backup_file, "0" * 64, len(self.data))
+        file_url = storage.save(self.backup_file)
+        self.assertIn(("backups", "nightly/backup.db.gz.checksum.json"), client.objects)
+        backup_dir = os.path.join(self.work_dir, "shop_parallel_20240101000000")
+        os.makedirs(backup_dir)
+        for name in ("manifest.json", "a.sql.gz", "b.sql.gz", "c.sql.gz"):
+            with open(os.path.join(backup_dir, name), "wb") as f:
+                f.write(b"x")
+        dir_url = storage.save(backup_dir)
+        storage.save(os.path.join(backup_dir, "a.sql.gz"))
+
+        storage.delete([file_url, dir_url])
+        self.assertEqual(list(client.objects), [("backups", "nightly/a.sql.gz")])
+        self.assertEqual(client.delete_calls, 1)
+        with self.assertRaises(ValueError):
+            storage.delete(["s3://other/nightly/a.sql.gz"])
+
+
+@unittest.skipIf(mock_aws is None, "boto3 and moto are not installed")
+class TestS3StorageMoto(unittest.TestCase):
+    def test_save_directory(self):
+        work_dir = tempfile.mkdtemp()
+        try:
+            backup_dir = os.path.join(work_dir, "shop_20240101000000")
+            os.makedirs(backup_dir)
+            data = random.Random(3).randbytes(MIN_PART_SIZE + 100)
+            for name, content in (("manifest.json", b"{}"), ("orders.sql.gz", data)):
+                with open(os.path.join(backup_dir, name), "wb") as f:
+                    f.write(content)
+            with mock_aws():
+                client = boto3.client("s3", region_name="us-east-1")
+                client.create_bucket(Bucket="backups")
+                storage = S3Storage("backups", client=client, part_size=MIN_PART_SIZE, state_dir=work_dir)
+                self.assertEqual(storage.save(backup_dir), "s3://backups/shop_20240101000000")
+                body = client.get_object(Bucket="backups", Key="shop_20240101000000/orders.sql.gz")["Body"].read()
+                self.assertEqual(body, data)
+        finally:
+            shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
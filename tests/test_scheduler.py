@@ -0,0 +1,107 @@
+# tests/test_scheduler.py
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import sqlite3
+import threading
+from datetime import datetime
+from utils.scheduler import BackupScheduler, CronSchedule, ScheduledJob, job_arguments, run_backup_job
+
+
+class TestBackupScheduler(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.state_path = os.path.join(self.work_dir, "state.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_cron_next_after(self):
+        # Steps, ranges and the day-of-month/day-of-week OR rule
+        self.assertEqual(CronSchedule("*/15 * * * *").next_after(datetime(2024, 1, 1, 10, 7)),
+                         datetime(2024, 1, 1, 10, 15))
+        self.assertEqual(CronSchedule("30 2 * * 1-5").next_after(datetime(2024, 1, 5, 3, 0)),
+                         datetime(2024, 1, 8, 2, 30))
+        self.assertEqual(CronSchedule("0 0 13 * 5").next_after(datetime(2024, 1, 1)),
+                         datetime(2024, 1, 5, 0, 0))
+        self.assertEqual(CronSchedule("@monthly").next_after(datetime(2024, 1, 31, 12, 0)),
+                         datetime(2024, 2, 1, 0, 0))
+        with self.assertRaises(ValueError):
+            CronSchedule("61 * * * *")
+
+    def test_job_arguments(self):
+        # Job options map onto main.py flags
+        argv = job_arguments({"db_type": "sqlite", "db_path": "app.db", "dedup": True, "workers": None}, "x.log")
+        self.assertEqual(argv, ["--db-type", "sqlite", "--db-path", "app.db", "--dedup", "--log-file", "x.log"])
+        argv = job_arguments({"notify_webhook": ["http://a/", "http://b/"]})
+        self.assertEqual(argv, ["--notify-webhook", "http://a/", "--notify-webhook", "http://b/"])
+
+    def test_job_publishes_events(self):
+        db_path = os.path.join(self.work_dir, "app.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY)")
+        conn.commit()
+        conn.close()
+        events_path = os.path.join(self.work_dir, "events.jsonl")
+        job = ScheduledJob("nightly-app", "0 2 * * *", {"db_type": "sqlite", "db_path": db_path,
+                                                        "output_dir": os.path.join(self.work_dir, "backups"),
+                                                        "notify_file": events_path})
+        run_backup_job(job)
+        with open(events_path) as f:
+            events = [json.loads(line) for line in f]
+        self.assertEqual(events[0]["type"], "backup.started")
+        self.assertEqual(events[-1]["type"], "backup.completed")
+        self.assertEqual({event["job"] for event in events}, {"nightly-app"})
+
+    def test_per_host_limit(self):
+        # Jobs against the same host never overlap beyond the per-host limit
+        active = {}
+        peak = {}
+        release = threading.Event()
+        lock = threading.Lock()
+
+        def runner(job):
+            with lock:
+                active[job.host] = active.get(job.host, 0) + 1
+                peak[job.host] = max(peak.get(job.host, 0), active[job.host])
+            release.wait(5)
+            with lock:
+                active[job.host] -= 1
+
+        jobs = [ScheduledJob(f"db{i}", "* * * * *", {"db_type": "mysql", "host": f"host{i % 2}"}) for i in range(6)]
+        # SQLite jobs are limited per database file, not all together
+        jobs += [ScheduledJob(f"file{i}", "* * * * *", {"db_type": "sqlite", "db_path": f"app{i % 2}.db"})
+                 for i in range(4)]
+        scheduler = BackupScheduler(jobs, self.state_path, max_workers=10, per_host=1, runner=runner)
+        scheduler.tick(datetime(2024, 1, 1, 0, 0))
+        scheduler.tick(datetime(2024, 1, 1, 0, 1))
+        self.assertEqual(len(scheduler.running), 4)
+        release.set()
+        while scheduler.state["queue"]:
+            scheduler.wakeup.wait(5)
+            scheduler.wakeup.clear()
+            scheduler.tick(datetime(2024, 1, 1, 0, 1, 30))
+        scheduler.shutdown()
+        self.assertEqual(peak, {"host0": 1, "host1": 1, "sqlite:" + os.path.abspath("app0.db"): 1,
+                                "sqlite:" + os.path.abspath("app1.db"): 1})
+
+    def test_missed_run_is_caught_up_after_restart(self):
+        # State persisted before a shutdown makes the next process run the missed schedule once
+        runs = []
+        jobs = [ScheduledJob("app", "0 2 * * *", {"db_type": "sqlite"})]
+        scheduler = BackupScheduler(jobs, self.state_path, runner=runs.append)
+        scheduler.tick(datetime(2024, 1, 1, 12, 0))
+        scheduler.shutdown()
+        self.assertEqual(runs, [])
+
+        scheduler = BackupScheduler(jobs, self.state_path, runner=runs.append)
+        scheduler.tick(datetime(2024, 1, 4, 9, 0))
+        scheduler.shutdown()
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(scheduler.state["jobs"]["app"]["last_status"], "success")
+        self.assertEqual(scheduler.state["queue"], [])
+
+if __name__ == "__main__":
+    unittest.main()
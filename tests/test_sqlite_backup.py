@@ -1,10 +1,16 @@
 # tests/test_sqlite_backup.py
 import unittest
 import os
+import shutil
 import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
 from db_connectors.sqlite_connector import SQLiteConnector
 from backup_services.sqlite_backup import SQLiteBackup
 from storages.local_storage import LocalStorage
+from utils.checksum import hash_file, read_checksum
 from utils.compression import compress_file
 
 class TestSQLiteBackup(unittest.TestCase):
@@ -37,6 +43,13 @@ class TestSQLiteBackup(unittest.TestCase):
         backup = SQLiteBackup(self.test_db_path, self.backup_dir)
         backup_file = backup.backup()
         self.assertTrue(os.path.exists(backup_file))
+        # The copy is a valid database and matches its checksum manifest
+        conn = sqlite3.connect(backup_file)
+        self.assertEqual(conn.execute("PRAGMA quick_check").fetchone()[0], "ok")
+        self.assertEqual(conn.execute("SELECT name FROM test_table").fetchall(), [("test_name",)])
+        conn.close()
+        manifest = read_checksum(backup_file)
+        self.assertEqual((manifest["digest"], manifest["bytes"]), hash_file(backup_file))
 
     def test_sqlite_backup_compression(self):
         # Test if the backup file is compressed
@@ -54,5 +67,84 @@ class TestSQLiteBackup(unittest.TestCase):
         storage.save(backup_file)
         self.assertTrue(os.path.exists(os.path.join(self.backup_dir, os.path.basename(backup_file))))
 
+    def test_wal_snapshot_with_idle_reader_and_writers(self):
+        # Neither a reader pinning the WAL nor steady writes keep the snapshot from being taken
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        db_path = os.path.join(work_dir, "app.db")
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA wal_autocheckpoint = 0")
+        conn.execute("CREATE TABLE events (id INTEGER PRIMARY KEY, payload TEXT)")
+        conn.commit()
+        reader = sqlite3.connect(db_path)
+        reader.execute("BEGIN")
+        reader.execute("SELECT count(*) FROM events").fetchone()
+        self.addCleanup(reader.close)
+        # Nothing written from here on can be checkpointed while the reader is open
+        conn.executemany("INSERT INTO events (payload) VALUES (?)", [("x" * 200,)] * 2000)
+        conn.commit()
+        stop = threading.Event()
+        written = threading.Semaphore(0)
+
+        def write():
+            while not stop.is_set():
+                conn.executemany("INSERT INTO events (payload) VALUES (?)", [("y" * 200,)] * 20)
+                conn.commit()
+                written.release()
+
+        writer = threading.Thread(target=write, daemon=True)
+        writer.start()
+        try:
+            # A writer thread that died does not hang the suite
+            for _ in range(5):
+                self.assertTrue(written.acquire(timeout=10), "the writer thread stopped writing")
+            backup = SQLiteBackup(db_path, os.path.join(work_dir, "out"))
+            for number, chunks in enumerate((backup.iter_pages(chunk_size=8192), backup.iter_snapshot())):
+                path = os.path.join(work_dir, f"copy{number}.db")
+                with open(path, "wb") as f:
+                    for chunk in chunks:
+                        f.write(chunk)
+                copy = sqlite3.connect(path)
+                self.assertEqual(copy.execute("PRAGMA integrity_check").fetchone()[0], "ok")
+                self.assertEqual(copy.execute("SELECT count(*) FROM events").fetchone()[0] % 20, 0)
+                copy.close()
+        finally:
+            stop.set()
+            writer.join(10)
+            conn.close()
+        # Nothing was staged next to the backups
+        self.assertFalse(os.path.exists(os.path.join(work_dir, "out")))
+
+    def test_snapshot_keeps_the_connectors_locks(self):
+        # A WAL connection holds a shared lock on the database file for as long as it is open
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        db_path = os.path.join(work_dir, "app.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("CREATE TABLE events (id INTEGER PRIMARY KEY)")
+        conn.commit()
+        conn.close()
+        probe = ("import fcntl, sys\n"
+                 "f = open(sys.argv[1], 'r+b')\n"
+                 "try:\n"
+                 "    fcntl.lockf(f, fcntl.LOCK_EX | fcntl.LOCK_NB, 510, 0x40000002)\n"
+                 "except OSError:\n"
+                 "    sys.exit(1)\n")
+        connector = SQLiteConnector(db_path)
+        self.assertTrue(connector.connect())
+        try:
+            connector.connection.execute("SELECT count(*) FROM events").fetchone()
+            self.assertEqual(subprocess.run([sys.executable, "-c", probe, db_path]).returncode, 1)
+            backup = SQLiteBackup(db_path, work_dir, connection=connector.connection, db_file=connector.db_file)
+            self.assertGreater(len(b"".join(backup.iter_snapshot())), 0)
+            # Another process still cannot take the database over from the connector
+            self.assertEqual(subprocess.run([sys.executable, "-c", probe, db_path]).returncode, 1)
+        finally:
+            connector.disconnect()
+        self.assertEqual(subprocess.run([sys.executable, "-c", probe, db_path]).returncode, 0)
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,90 @@
+# tests/test_sqlite_online_backup.py
+import unittest
+import os
+import sqlite3
+import tempfile
+import shutil
+import threading
+from db_connectors.sqlite_connector import SQLiteConnector
+from backup_services.sqlite_backup import SQLiteBackup
+from backup_services.sqlite_online_backup import SQLiteOnlineBackup
+from controllers.sqlite import SQLiteBackupUtility
+
+
+class TestSQLiteOnlineBackup(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.work_dir, "app.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE test_table (id INTEGER PRIMARY KEY, name TEXT)")
+        conn.executemany("INSERT INTO test_table (name) VALUES (?)", [("x" * 200,) for _ in range(2000)])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def _count_rows(self, path):
+        conn = sqlite3.connect(path)
+        try:
+            self.assertEqual(conn.execute("PRAGMA integrity_check").fetchone()[0], "ok")
+            return conn.execute("SELECT count(*) FROM test_table").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_copies_in_steps_with_connector_connection(self):
+        # The engine reuses the connector's connection and copies a few pages per step
+        connector = SQLiteConnector(self.db_path)
+        self.assertTrue(connector.connect())
+        target = os.path.join(self.work_dir, "copy.db")
+        stats = SQLiteOnlineBackup(connector.connection, pages_per_step=10).copy_to(target)
+        connector.disconnect()
+
+        self.assertGreater(stats["steps"], 1)
+        self.assertEqual(stats["restarts"], 0)
+        self.assertEqual(self._count_rows(target), 2000)
+        self.assertFalse(os.path.exists(target + ".part"))
+
+    def test_concurrent_writer_restarts_cleanly(self):
+        # Writes from another connection during the copy restart it; the result stays consistent
+        source = sqlite3.connect(self.db_path, check_same_thread=False)
+        stop = threading.Event()
+
+        def writer():
+            conn = sqlite3.connect(self.db_path)
+            while not stop.is_set():
+                conn.execute("INSERT INTO test_table (name) VALUES ('new')")
+                conn.commit()
+            conn.close()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            target = os.path.join(self.work_dir, "copy.db")
+            stats = SQLiteOnlineBackup(source, pages_per_step=5, step_sleep=0.001, max_restarts=3).copy_to(target)
+        finally:
+            stop.set()
+            thread.join()
+            source.close()
+
+        self.assertLessEqual(stats["restarts"], 4)
+        self.assertGreaterEqual(self._count_rows(target), 2000)
+
+    def test_backup_services_use_online_copy(self):
+        # SQLiteBackup and SQLiteBackupUtility both produce valid copies of a WAL database
+        backup_dir = os.path.join(self.work_dir, "backups")
+        os.makedirs(backup_dir)
+        backup_file = SQLiteBackup(self.db_path, backup_dir, pages_per_step=50).backup()
+        self.assertEqual(self._count_rows(backup_file), 2000)
+
+        compressed = SQLiteBackupUtility(self.db_path, backup_dir, pages_per_step=50).backup()
+        self.assertTrue(compressed.endswith(".db.gz"))
+        self.assertTrue(os.path.exists(compressed))
+
+    def test_invalid_step_size(self):
+        with self.assertRaises(ValueError):
+            SQLiteOnlineBackup(sqlite3.connect(":memory:"), pages_per_step=0)
+
+if __name__ == "__main__":
+    unittest.main()
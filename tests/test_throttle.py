@@ -0,0 +1,114 @@
+# tests/test_throttle.py
+import unittest
+import os
+import sqlite3
+import tempfile
+import shutil
+from unittest import mock
+from backup_services.sqlite_online_backup import SQLiteOnlineBackup
+from utils.throttle import LoadMonitor, Throttle, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.slept = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        self.now += seconds
+
+
+class MySQLConnector:
+    """Stand-in named like the real connector; each connect() opens a mock connection."""
+
+    loads = []
+
+    def __init__(self, host, port, user, password, database):
+        self.host, self.port, self.user, self.password, self.database = host, port, user, password, database
+        self.connection = None
+
+    def connect(self):
+        self.connection = mock.MagicMock()
+        cursor = self.connection.cursor.return_value
+        cursor.fetchone.side_effect = lambda: ("Threads_running", str(self.loads.pop(0)))
+        return True
+
+    def disconnect(self):
+        self.connection = None
+
+
+class TestThrottle(unittest.TestCase):
+    def test_token_bucket_paces_to_rate(self):
+        # After the initial burst, 10 MB at 1 MB/s takes 10 seconds
+        clock = FakeClock()
+        bucket = TokenBucket(1000000, clock=clock, sleep=clock.sleep)
+        for _ in range(100):
+            bucket.consume(100000)
+        self.assertAlmostEqual(clock.now, 9.0, places=6)
+        # Idle time refills the bucket up to its burst; at half speed the next 1 MB beyond it takes 2 seconds
+        clock.now += 60
+        clock.slept = 0.0
+        bucket.consume(2000000, factor=0.5)
+        self.assertAlmostEqual(clock.slept, 2.0, places=6)
+
+    def test_throttle_limits_bytes_and_ops(self):
+        clock = FakeClock()
+        throttle = Throttle(bytes_per_second=10 ** 9, ops_per_second=100, clock=clock, sleep=clock.sleep)
+        chunks = list(throttle.iter_chunks([b"x" * 10] * 300))
+        self.assertEqual(len(chunks), 300)
+        # The ops limit dominates: 200 operations beyond the burst of 100
+        self.assertAlmostEqual(clock.now, 2.0, places=6)
+        self.assertEqual(throttle.stats["ops"], 300)
+        self.assertEqual(throttle.stats["bytes"], 3000)
+
+    def test_load_monitor_adapts_factor(self):
+        # Busy polls halve the speed, quiet polls bring it back gradually
+        # Threads_running counts the monitor and the backup's two sessions as well
+        MySQLConnector.loads = [5, 20, 20, 20, 2, 2]
+        monitor = LoadMonitor(MySQLConnector("db", 3306, "u", "p", "shop"), busy_threshold=8, interval=3600,
+                              sessions=2)
+        monitor.start()
+        try:
+            self.assertEqual(monitor.load, 2)
+            factors = [monitor.poll() for _ in range(5)]
+        finally:
+            monitor.stop()
+        self.assertEqual(factors, [0.5, 0.25, 0.125, 0.375, 0.625])
+        self.assertEqual(monitor.load, 0)
+
+        # Without a byte limit, the factor turns into pauses proportional to the work done
+        clock = FakeClock()
+        throttle = Throttle(monitor=monitor, clock=clock, sleep=clock.sleep)
+        monitor.factor = 0.25
+        throttle.throttle(1000)
+        clock.now += 1.0
+        throttle.throttle(1000)
+        self.assertAlmostEqual(clock.slept, 3.0, places=6)
+
+    def test_sqlite_page_copy_is_throttled(self):
+        work_dir = tempfile.mkdtemp()
+        try:
+            db_path = os.path.join(work_dir, "app.db")
+            conn = sqlite3.connect(db_path)
+            conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, payload TEXT)")
+            conn.executemany("INSERT INTO t (payload) VALUES (?)", [("x" * 500,) for _ in range(2000)])
+            conn.commit()
+            pages = conn.execute("PRAGMA page_count").fetchone()[0]
+
+            clock = FakeClock()
+            throttle = Throttle(ops_per_second=pages / 4, clock=clock, sleep=clock.sleep)
+            SQLiteOnlineBackup(conn, pages_per_step=10, throttle=throttle).copy_to(os.path.join(work_dir, "copy.db"))
+            conn.close()
+            # Every step but the last is accounted for; the burst covers the first second
+            self.assertGreater(throttle.stats["ops"], pages - 10)
+            self.assertGreater(clock.now, 2.5)
+        finally:
+            shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+# tests/test_wal_archive.py
+import unittest
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+import shutil
+from datetime import datetime
+from backup_services.wal_archive import PostgreSQLWALArchiver, SQLiteWALArchiver, binlog_position, \
+    find_generation, replay_generation, write_recovery_config
+from restore_services.sqlite_restore import SQLiteRestore
+from storages.catalog import BackupCatalog
+from storages.local_storage import LocalStorage
+
+
+class FakeClock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestSQLiteWALArchive(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.work_dir, "app.db")
+        self.archive_dir = os.path.join(self.work_dir, "archive")
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("CREATE TABLE events (id INTEGER PRIMARY KEY, payload TEXT)")
+        self.conn.executemany("INSERT INTO events (payload) VALUES (?)", [("initial",)] * 100)
+        self.conn.commit()
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.work_dir)
+
+    def _insert(self, payload, rows=50):
+        self.conn.executemany("INSERT INTO events (payload) VALUES (?)", [(payload * 20,)] * rows)
+        self.conn.commit()
+
+    def _archiver(self, **kwargs):
+        return SQLiteWALArchiver(self.db_path, LocalStorage(self.archive_dir), clock=self.clock, **kwargs).start()
+
+    def _rows(self, path):
+        conn = sqlite3.connect(path)
+        try:
+            return conn.execute("SELECT id, payload FROM events ORDER BY id").fetchall()
+        finally:
+            conn.close()
+
+    def test_replay_to_point_in_time(self):
+        archiver = self._archiver(segment_seconds=60)
+        self._insert("first")
+        self.clock.now += 10
+        self.assertEqual(archiver.poll(), 1)
+        middle = self._rows(self.db_path)
+        self._insert("second")
+        self.conn.execute("DELETE FROM events WHERE id <= 10")
+        self.conn.commit()
+        self.clock.now += 10
+        self.assertEqual(archiver.poll(), 2)
+        archiver.close()
+        self.assertEqual(archiver.stats["segments"], 1)
+
+        generation = find_generation(self.archive_dir, "app.db")
+        restored = os.path.join(self.work_dir, "restored.db")
+        stats = replay_generation(generation, restored)
+        self.assertEqual(stats["transactions"], 3)
+        self.assertEqual(self._rows(restored), self._rows(self.db_path))
+
+        until = datetime.fromtimestamp(self.clock.now - 5)
+        self.assertEqual(replay_generation(generation, restored, until)["transactions"], 1)
+        self.assertEqual(self._rows(restored), middle)
+        # SQLiteRestore replays generations too
+        target = os.path.join(self.work_dir, "target.db")
+        SQLiteRestore(target, until=until.isoformat()).restore(generation)
+        self.assertEqual(self._rows(target), middle)
+
+    def test_checkpoint_keeps_wal_small_without_losing_frames(self):
+        catalog = BackupCatalog(os.path.join(self.work_dir, "catalog.sqlite"))
+        archiver = self._archiver(checkpoint_frames=20, segment_bytes=64 * 1024, catalog=catalog)
+        for batch in range(40):
+            self._insert(f"batch{batch}", rows=30)
+            self.clock.now += 1
+            archiver.poll()
+        archiver.close()
+        # The WAL was restarted by the application's writes after the archiver's checkpoints
+        self.assertGreater(archiver.stats["checkpoints"], 3)
+        self.assertEqual(archiver.stats["generations"], 1)
+        self.assertLess(os.path.getsize(self.db_path + "-wal"), 200 * 4096)
+        self.assertGreater(archiver.stats["segments"], 1)
+
+        backup = catalog.latest("app.db", backup_format="wal")
+        restored = os.path.join(self.work_dir, "restored.db")
+        replay_generation(backup["location"], restored)
+        self.assertEqual(self._rows(restored), self._rows(self.db_path))
+
+    def test_reset_wal_starts_new_generation(self):
+        archiver = self._archiver()
+        self._insert("first")
+        archiver.poll()
+        # Another process truncates the WAL while the archiver is not holding it open
+        archiver._release_reader()
+        self._insert("lost")
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self._insert("after")
+        self.clock.now += 1
+        archiver.poll()
+        self._insert("later")
+        archiver.poll()
+        archiver.close()
+        self.assertEqual(archiver.stats["generations"], 2)
+
+        generation = find_generation(self.archive_dir, "app.db")
+        self.assertEqual(os.path.basename(generation), archiver.generation)
+        restored = os.path.join(self.work_dir, "restored.db")
+        replay_generation(generation, restored)
+        self.assertEqual(self._rows(restored), self._rows(self.db_path))
+
+    def test_needs_wal_mode(self):
+        path = os.path.join(self.work_dir, "journal.db")
+        sqlite3.connect(path).close()
+        with self.assertRaises(ValueError):
+            SQLiteWALArchiver(path, LocalStorage(self.archive_dir)).start()
+
+
+class TestServerArchiveHelpers(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def test_binlog_position_from_dump(self):
+        dump = os.path.join(self.work_dir, "shop_full_20240101000000.sql.gz")
+        with gzip.open(dump, "wt") as f:
+            f.write("-- MySQL dump\n--\n-- CHANGE MASTER TO MASTER_LOG_FILE='binlog.000042', MASTER_LOG_POS=1337;\n")
+        self.assertEqual(binlog_position(dump), ("binlog.000042", 1337))
+        plain = os.path.join(self.work_dir, "plain.sql")
+        with open(plain, "w") as f:
+            f.write("CREATE TABLE t (id INT);\n")
+        with self.assertRaises(ValueError):
+            binlog_position(plain)
+        # Parallel dumps record the coordinates in their manifest
+        parallel = os.path.join(self.work_dir, "shop_parallel_20240101000000")
+        os.makedirs(parallel)
+        with open(os.path.join(parallel, "manifest.json"), "w") as f:
+            json.dump({"tables": [], "binlog": {"file": "binlog.000007", "position": 4}}, f)
+        self.assertEqual(binlog_position(parallel), ("binlog.000007", 4))
+
+    def test_wal_segment_round_trip(self):
+        # Segments are read back through the storage backend they were archived to
+        segment = os.path.join(self.work_dir, "000000010000000000000003")
+        with open(segment, "wb") as f:
+            f.write(os.urandom(4096))
+        archiver = PostgreSQLWALArchiver(LocalStorage(os.path.join(self.work_dir, "archive"), sync=True))
+        archiver.archive_segment(segment)
+        restored = os.path.join(self.work_dir, "RECOVERYXLOG")
+        self.assertTrue(archiver.restore_segment("000000010000000000000003", restored))
+        with open(segment, "rb") as f, open(restored, "rb") as g:
+            self.assertEqual(f.read(), g.read())
+        self.assertFalse(archiver.restore_segment("000000010000000000000004", restored))
+
+    def test_recovery_config(self):
+        write_recovery_config(self.work_dir, "restore '%f' %p", until="2024-01-01 12:00:00")
+        self.assertTrue(os.path.exists(os.path.join(self.work_dir, "recovery.signal")))
+        with open(os.path.join(self.work_dir, "postgresql.auto.conf")) as f:
+            config = f.read()
+        self.assertIn("restore_command = 'restore ''%f'' %p'", config)
+        self.assertIn("recovery_target_time = '2024-01-01 12:00:00'", config)
+
+
+if __name__ == "__main__":
+    unittest.main()
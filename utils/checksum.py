@@ -0,0 +1,85 @@
+import hashlib
+import json
+import mmap
+import os
+from datetime import datetime
+
+CHECKSUM_ALGORITHM = "sha256"
+CHECKSUM_SUFFIX = ".checksum.json"
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def checksum_path(path):
+    """Path of the sidecar checksum manifest of a backup file."""
+    return path + CHECKSUM_SUFFIX
+
+
+def is_checksum(path):
+    return path.endswith(CHECKSUM_SUFFIX)
+
+
+def new_hash():
+    return hashlib.new(CHECKSUM_ALGORITHM)
+
+
+def write_checksum(path, digest, size):
+    """
+    Writes the sidecar manifest of a backup file.
+
+    :param digest: Hex digest of the file's bytes as written.
+    :param size: Size of the file in bytes.
+    :return: Path of the sidecar.
+    """
+    sidecar = checksum_path(path)
+    record = {
+        "file": os.path.basename(path),
+        "algorithm": CHECKSUM_ALGORITHM,
+        "digest": digest,
+        "bytes": size,
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }
+    temp_path = sidecar + ".part"
+    with open(temp_path, "w") as f:
+        json.dump(record, f, indent=2)
+    os.replace(temp_path, sidecar)
+    return sidecar
+
+
+def read_checksum(path):
+    """Returns the sidecar manifest of a backup file, or None if it has none."""
+    try:
+        with open(checksum_path(path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def hash_file(path, algorithm=CHECKSUM_ALGORITHM, block_size=HASH_BLOCK_SIZE):
+    """
+    Hashes a file through a read-only memory map.
+
+    Blocks are hashed straight from the page cache without copying them
+    into Python buffers, and hashlib releases the GIL while hashing, so
+    several files can be hashed in parallel threads.
+
+    :return: (hex digest, size in bytes)
+    """
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return digest.hexdigest(), 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            view = memoryview(data)
+            try:
+                for offset in range(0, size, block_size):
+                    digest.update(view[offset:offset + block_size])
+            finally:
+                view.release()
+    return digest.hexdigest(), size
+
+
+def checksum_file(path):
+    """Hashes an existing backup file and writes its sidecar manifest."""
+    digest, size = hash_file(path)
+    return write_checksum(path, digest, size)
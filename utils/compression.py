@@ -1,7 +1,305 @@
-import gzip
-import shutil
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-def compress_file(input_file, output_file):
-    with open(input_file, 'rb') as f_in:
-        with gzip.open(output_file, 'wb') as f_out:
-            shutil.copyfileobj(f_in, f_out)
\ No newline at end of file
+from utils.checksum import checksum_file
+
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+def compress_file(input_file, output_file, codec="gzip", level=None, threads=1):
+    """
+    Compresses input_file into output_file and writes its checksum manifest.
+
+    :param codec: Compression codec ("gzip", "zstd", "lz4" or "none").
+    :param level: Codec-specific level; defaults to the codec's own default,
+        as for streamed backups.
+    :param threads: Number of compression threads.
+    """
+    compressobj = get_compressor(codec, level, threads).compressobj()
+    try:
+        with open(input_file, 'rb') as f_in:
+            with open(output_file, 'wb') as f_out:
+                while True:
+                    chunk = f_in.read(DEFAULT_BLOCK_SIZE)
+                    if not chunk:
+                        break
+                    f_out.write(compressobj.compress(chunk))
+                f_out.write(compressobj.flush())
+    finally:
+        close_compressobj(compressobj)
+    checksum_file(output_file)
+
+
+def close_compressobj(compressobj):
+    """Stops the threads of a block-parallel compressor object; other compressor objects hold none."""
+    close = getattr(compressobj, "close", None)
+    if close is not None:
+        close()
+
+
+class _PassThrough:
+    """Compressor or decompressor object that returns its input unchanged."""
+
+    def compress(self, data):
+        return data
+
+    decompress = compress
+
+    def flush(self):
+        return b""
+
+
+class _ConcatenatedDecompressObj:
+    """
+    Decompressor object for a stream of concatenated members or frames.
+
+    Block-parallel compression writes one gzip member or LZ4 frame per
+    block; a fresh decompressor from ``new_decompressor`` is started
+    whenever the current one reaches the end of its member.
+    """
+
+    def __init__(self, new_decompressor):
+        self._new_decompressor = new_decompressor
+        self._decompressor = new_decompressor()
+        self._started = False
+
+    def decompress(self, data):
+        output = []
+        while data:
+            self._started = True
+            output.append(self._decompressor.decompress(data))
+            if not self._decompressor.eof:
+                break
+            data = self._decompressor.unused_data
+            self._decompressor = self._new_decompressor()
+            self._started = False
+        return b"".join(output)
+
+    def flush(self):
+        if self._started and not self._decompressor.eof:
+            raise EOFError("Compressed stream ended before the end-of-stream marker")
+        return b""
+
+
+class _BlockParallelCompressObj:
+    """
+    Compressor object that compresses fixed-size blocks in a thread pool.
+
+    Each block is compressed independently by ``compress_block`` and the
+    results are emitted in input order. Only a bounded number of blocks are
+    in flight at once, so memory stays proportional to threads * block_size.
+
+    flush() stops the threads; a stream abandoned before its flush() must
+    be closed with close(), or used as a context manager.
+    """
+
+    def __init__(self, compress_block, threads, block_size):
+        self._compress_block = compress_block
+        self._block_size = block_size
+        self._max_pending = threads * 2
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="compress")
+        self._pending = deque()
+        self._buffer = bytearray()
+
+    def _submit(self, block):
+        self._pending.append(self._executor.submit(self._compress_block, block))
+
+    def _collect(self, wait_all=False):
+        output = []
+        while self._pending and (wait_all or len(self._pending) >= self._max_pending or self._pending[0].done()):
+            output.append(self._pending.popleft().result())
+        return b"".join(output)
+
+    def compress(self, data):
+        self._buffer += data
+        while len(self._buffer) >= self._block_size:
+            self._submit(bytes(self._buffer[:self._block_size]))
+            del self._buffer[:self._block_size]
+        return self._collect()
+
+    def flush(self):
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer = bytearray()
+        try:
+            return self._collect(wait_all=True)
+        finally:
+            self.close()
+
+    def close(self):
+        """Drops the blocks not compressed yet and stops the threads."""
+        self._pending.clear()
+        self._executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class NullCompressor:
+    """Pipeline compressor that stores data uncompressed."""
+
+    name = "none"
+    extension = ""
+
+    def compressobj(self):
+        return _PassThrough()
+
+    def decompressobj(self):
+        return _PassThrough()
+
+
+class GzipCompressor:
+    """
+    Streaming gzip compressor for the backup pipeline.
+
+    With more than one thread the input is split into blocks that are
+    compressed concurrently (zlib releases the GIL) and written as
+    consecutive gzip members, which standard gzip tools read as one stream.
+
+    :param level: zlib compression level (1-9).
+    :param threads: Number of compression threads.
+    :param block_size: Uncompressed size of each parallel block.
+    """
+
+    name = "gzip"
+    extension = ".gz"
+
+    def __init__(self, level=6, threads=1, block_size=DEFAULT_BLOCK_SIZE):
+        self.level = level
+        self.threads = threads
+        self.block_size = block_size
+
+    def _compress_block(self, block):
+        compressobj = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressobj.compress(block) + compressobj.flush()
+
+    def compressobj(self):
+        if self.threads > 1:
+            return _BlockParallelCompressObj(self._compress_block, self.threads, self.block_size)
+        # wbits=31 makes zlib emit a gzip header and trailer
+        return zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+    def decompressobj(self):
+        return _ConcatenatedDecompressObj(lambda: zlib.decompressobj(31))
+
+
+class ZstdCompressor:
+    """
+    Streaming zstd compressor; requires the ``zstandard`` package.
+
+    zstd does its own multi-threading, so threads are passed straight to
+    the library.
+
+    :param level: zstd compression level (1-22).
+    :param threads: Number of compression threads.
+    """
+
+    name = "zstd"
+    extension = ".zst"
+
+    def __init__(self, level=3, threads=1):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd compression requires the 'zstandard' package")
+        self._zstandard = zstandard
+        self.level = level
+        self.threads = threads
+
+    def compressobj(self):
+        threads = self.threads if self.threads > 1 else 0
+        return self._zstandard.ZstdCompressor(level=self.level, threads=threads).compressobj()
+
+    def decompressobj(self):
+        return _ConcatenatedDecompressObj(self._zstandard.ZstdDecompressor().decompressobj)
+
+
+class _Lz4CompressObj:
+    def __init__(self, level):
+        import lz4.frame
+        self._compressor = lz4.frame.LZ4FrameCompressor(compression_level=level)
+        self._header = self._compressor.begin()
+
+    def compress(self, data):
+        output = self._header + self._compressor.compress(data)
+        self._header = b""
+        return output
+
+    def flush(self):
+        return self._header + self._compressor.flush()
+
+
+class Lz4Compressor:
+    """
+    Streaming LZ4 frame compressor; requires the ``lz4`` package.
+
+    With more than one thread each block becomes an independent LZ4 frame;
+    concatenated frames decode as one stream.
+
+    :param level: LZ4 compression level (0 is fast mode, 3+ is HC).
+    :param threads: Number of compression threads.
+    :param block_size: Uncompressed size of each parallel block.
+    """
+
+    name = "lz4"
+    extension = ".lz4"
+
+    def __init__(self, level=0, threads=1, block_size=DEFAULT_BLOCK_SIZE):
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ImportError("lz4 compression requires the 'lz4' package")
+        self._lz4_frame = lz4.frame
+        self.level = level
+        self.threads = threads
+        self.block_size = block_size
+
+    def _compress_block(self, block):
+        return self._lz4_frame.compress(block, compression_level=self.level)
+
+    def compressobj(self):
+        if self.threads > 1:
+            return _BlockParallelCompressObj(self._compress_block, self.threads, self.block_size)
+        return _Lz4CompressObj(self.level)
+
+    def decompressobj(self):
+        return _ConcatenatedDecompressObj(self._lz4_frame.LZ4FrameDecompressor)
+
+
+COMPRESSORS = {
+    "gzip": GzipCompressor,
+    "zstd": ZstdCompressor,
+    "lz4": Lz4Compressor,
+    "none": NullCompressor,
+}
+
+def get_compressor(name="gzip", level=None, threads=1):
+    """Returns a pipeline compressor by name."""
+    if name not in COMPRESSORS:
+        raise ValueError(f"Unsupported compression codec: {name}")
+    if name == "none":
+        return NullCompressor()
+    if level is None:
+        return COMPRESSORS[name](threads=threads)
+    return COMPRESSORS[name](level=level, threads=threads)
+
+def codec_for_filename(filename):
+    """Guesses the compression codec from a backup file's extension."""
+    for name, compressor in COMPRESSORS.items():
+        if compressor.extension and filename.endswith(compressor.extension):
+            return name
+    return "none"
+
+def iter_decompress(chunks, codec):
+    """Decompresses a stream of compressed chunks without materializing it."""
+    decompressobj = get_compressor(codec).decompressobj()
+    for chunk in chunks:
+        data = decompressobj.decompress(chunk)
+        if data:
+            yield data
+    tail = decompressobj.flush()
+    if tail:
+        yield tail
@@ -0,0 +1,11 @@
+# Defaults shared by main.py's command line and the modules that apply them.
+# This module imports nothing, so building the parser loads no backup service.
+
+BACKUP_TYPES = ("full", "incremental", "differential")
+COMPRESSION_CODECS = ("gzip", "lz4", "none", "zstd")
+CONTAINER_EXTENSION = ".dbk"
+# MySQL tables with an integer primary key are exported in ranges of about this many rows
+DEFAULT_CHUNK_ROWS = 500000
+# SQLite online backup API steps
+DEFAULT_PAGES_PER_STEP = 256
+DEFAULT_STEP_SLEEP = 0.0
@@ -0,0 +1,175 @@
+import re
+
+HEADER = "header"
+FOOTER = "footer"
+
+_MYSQL_TABLE = re.compile(rb"^-- (?:Table structure|Dumping data) for table `((?:[^`]|``)+)`")
+_MYSQL_OBJECTS = re.compile(rb"^-- (?:Temporary view structure|Final view structure|Dumping routines|Dumping events"
+                            rb"|Current Database)")
+_MYSQL_FOOTER = re.compile(rb"^/\*!40103 SET TIME_ZONE=@OLD_TIME_ZONE \*/;|^-- Dump completed")
+_POSTGRESQL_OBJECT = re.compile(rb"^-- (?:Data for )?Name: ")
+_POSTGRESQL_COPY = re.compile(rb'^COPY ((?:"(?:[^"]|"")*"|[^\s."]+)(?:\.(?:"(?:[^"]|"")*"|[^\s."]+))?) .*FROM stdin;$')
+_POSTGRESQL_IDENTIFIER = re.compile(r'"((?:[^"]|"")*)"|([^."]+)')
+_POSTGRESQL_FOOTER = re.compile(rb"^-- PostgreSQL database dump complete")
+_MYSQL_STRING = re.compile(rb"'(?:[^'\\\\]|\\\\.)*'")
+
+
+class DumpSection:
+    """
+    A contiguous part of a SQL dump.
+
+    :param name: Unique within the dump: the table name for table sections,
+        otherwise "header", "schema", "post-data", "objects-<n>" or "footer".
+    :param table: Table whose definition (MySQL) or data (MySQL and
+        PostgreSQL) the section holds, or None.
+    """
+
+    def __init__(self, name, table=None):
+        self.name = name
+        self.table = table
+        self.rows = 0
+
+    def __repr__(self):
+        return f"DumpSection({self.name!r})"
+
+
+def _postgresql_name(quoted):
+    """public."Order Items" -> public.Order Items, the form the per-table backups record."""
+    parts = []
+    for match in _POSTGRESQL_IDENTIFIER.finditer(quoted):
+        parts.append(match.group(1).replace('""', '"') if match.group(1) is not None else match.group(2))
+    return ".".join(parts)
+
+
+class DumpSplitter:
+    """
+    Splits a plain mysqldump or pg_dump stream into sections at table boundaries.
+
+    mysqldump writes each table's definition and data together, after a
+    ``-- Table structure for table`` comment; its views, routines and
+    events become ``objects-<n>`` sections. pg_dump writes all definitions
+    first (the "schema" section), then each table's data as a ``COPY ...
+    FROM stdin`` block, then the constraints and indexes ("post-data").
+    The session settings before the first object and the dump's closing
+    statements are the "header" and "footer" sections. Data lines are
+    never taken for boundaries: INSERT statements start with INSERT, and
+    COPY blocks run until their ``\\.`` line.
+
+    Table sections count their rows as they pass: the lines of a COPY
+    block, or the value tuples of mysqldump's INSERT statements.
+
+    :param db_type: "mysql" or "postgresql".
+    """
+
+    def __init__(self, db_type):
+        if db_type not in ("mysql", "postgresql"):
+            raise ValueError(f"Unsupported database type: {db_type}")
+        self.db_type = db_type
+        self.section = DumpSection(HEADER)
+        # Lines that can start a section (or, for MySQL, hold rows) begin with one of these
+        self.starts = (b"-", b"/", b"I") if db_type == "mysql" else (b"-", b"C")
+        self.in_copy = False
+        self.objects = 0
+        self._pending = b""
+
+    def _objects(self):
+        self.objects += 1
+        return DumpSection(f"objects-{self.objects}")
+
+    def _boundary(self, line):
+        """Returns the section line starts, or None if it continues the current one."""
+        section = self.section
+        if section.name == FOOTER:
+            return None
+        if self.db_type == "mysql":
+            if line.startswith(b"-- "):
+                match = _MYSQL_TABLE.match(line)
+                if match:
+                    table = match.group(1).decode().replace("``", "`")
+                    return None if section.table == table else DumpSection(table, table)
+                if _MYSQL_OBJECTS.match(line):
+                    return self._objects()
+                if _MYSQL_FOOTER.match(line):
+                    return DumpSection(FOOTER)
+            elif line.startswith(b"/*!40103") and _MYSQL_FOOTER.match(line):
+                return DumpSection(FOOTER)
+            elif line.startswith(b"INSERT INTO ") and section.table is not None:
+                section.rows += _mysql_rows(line)
+            return None
+        if line.startswith(b"COPY "):
+            match = _POSTGRESQL_COPY.match(line)
+            if match:
+                self.in_copy = True
+                table = _postgresql_name(match.group(1).decode())
+                return DumpSection(table, table)
+        elif line.startswith(b"-- "):
+            if _POSTGRESQL_FOOTER.match(line):
+                return DumpSection(FOOTER)
+            if _POSTGRESQL_OBJECT.match(line):
+                if section.name == HEADER:
+                    return DumpSection("schema")
+                if section.table is not None:
+                    # Everything after the data (sequence values, constraints, indexes) is one section
+                    return DumpSection("post-data")
+        return None
+
+    def feed(self, chunk):
+        """
+        Splits the next chunk of the dump.
+
+        :return: List of (DumpSection, bytes) for the complete lines so far;
+            consecutive pieces of one section share the same DumpSection.
+        """
+        lines = (self._pending + chunk).split(b"\n")
+        self._pending = lines.pop()
+        pieces = []
+        start = 0
+        for index, line in enumerate(lines):
+            if self.in_copy:
+                if line == b"\\.":
+                    self.in_copy = False
+                else:
+                    self.section.rows += 1
+                continue
+            if line[:1] not in self.starts:
+                continue
+            section = self._boundary(line)
+            if section is not None:
+                if index > start:
+                    pieces.append((self.section, b"\n".join(lines[start:index]) + b"\n"))
+                self.section = section
+                start = index
+        if start < len(lines):
+            pieces.append((self.section, b"\n".join(lines[start:]) + b"\n"))
+        return pieces
+
+    def close(self):
+        """Returns the pieces of a last line without a line break."""
+        pending, self._pending = self._pending, b""
+        if not pending:
+            return []
+        pieces = self.feed(pending + b"\n")
+        section, data = pieces[-1]
+        pieces[-1] = (section, data[:-1])
+        return pieces
+
+
+def _mysql_rows(statement):
+    """Counts the value tuples of an INSERT statement."""
+    values = _MYSQL_STRING.sub(b"''", statement)
+    return values.count(b"),(") + 1
+
+
+def iter_dump_sections(chunks, db_type):
+    """
+    Splits a plain mysqldump or pg_dump stream into sections (see DumpSplitter).
+
+    :param chunks: Iterable of uncompressed dump bytes.
+    :return: Iterator of (DumpSection, bytes); consecutive pieces of one
+        section share the same DumpSection object, and concatenating all
+        pieces gives back the dump.
+    """
+    splitter = DumpSplitter(db_type)
+    for chunk in chunks:
+        yield from splitter.feed(chunk)
+    yield from splitter.close()
@@ -0,0 +1,251 @@
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+METRIC_PREFIX = "dbbackup"
+
+
+def peak_rss_bytes():
+    """Returns the peak resident set size of this process in bytes, or None where unsupported."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageMetrics:
+    """Wall time, CPU time and byte counts of one backup stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @property
+    def ratio(self):
+        """bytes_in / bytes_out, e.g. the compression ratio of the compress stage."""
+        return round(self.bytes_in / self.bytes_out, 3) if self.bytes_out else None
+
+    def as_dict(self):
+        return {
+            "stage": self.name,
+            "wall_seconds": round(self.wall_seconds, 6),
+            "cpu_seconds": round(self.cpu_seconds, 6),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": self.ratio,
+            "mb_per_s": round(self.bytes_in / self.wall_seconds / 1e6, 2) if self.wall_seconds else None,
+        }
+
+
+class BackupMetrics:
+    """
+    Collects per-stage metrics (connect, dump, compress, store, upload, verify) for one backup.
+
+    Stages are recorded either around a block of code with stage(), which
+    measures wall time and the CPU time of the calling thread, or from a
+    finished StreamingPipeline with add_pipeline(), whose stages measure the
+    busy time and CPU time of their own threads. Recording the same stage
+    twice (e.g. one pipeline per table) adds up the figures. Safe to use
+    from several threads. The process's peak RSS is a lifetime figure, so
+    it is reported once per run, in summary().
+
+    :param labels: Identifying fields added to every record (job, db_type, ...).
+    :param on_stage: Optional callable receiving a record of each recorded
+        stage as it finishes (its own figures, not the running totals); it
+        runs in the recording thread, so it must return quickly.
+    """
+
+    def __init__(self, labels=None, on_stage=None):
+        self.labels = dict(labels or {})
+        self.on_stage = on_stage
+        self.stages = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def add(self, name, wall_seconds=0.0, cpu_seconds=0.0, bytes_in=0, bytes_out=0):
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = StageMetrics(name)
+            stage.wall_seconds += wall_seconds
+            stage.cpu_seconds += cpu_seconds
+            stage.bytes_in += bytes_in
+            stage.bytes_out += bytes_out
+        if self.on_stage is not None:
+            self.on_stage(dict(self.labels, stage=name, wall_seconds=round(wall_seconds, 6),
+                               cpu_seconds=round(cpu_seconds, 6), bytes_in=bytes_in, bytes_out=bytes_out))
+        return stage
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times the enclosed block as stage name.
+
+        CPU time is that of the calling thread, so backups running in other
+        threads (the scheduler's jobs, a batch's targets) do not inflate it;
+        work the block hands to worker threads is not counted either.
+
+        Yields a dictionary in which the block can set bytes_in and bytes_out.
+        """
+        counts = {"bytes_in": 0, "bytes_out": 0}
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield counts
+        finally:
+            self.add(name, time.perf_counter() - wall, time.thread_time() - cpu, counts["bytes_in"],
+                     counts["bytes_out"])
+
+    def add_pipeline(self, pipeline):
+        """Adds the dump, compress and store stages of a finished StreamingPipeline."""
+        for stats in pipeline.stats.values():
+            self.add(stats.name, stats.seconds, stats.cpu_seconds, stats.bytes_in, stats.bytes_out)
+
+    def records(self):
+        """Returns one dictionary per stage, with the labels, in the order the stages were first recorded."""
+        with self._lock:
+            return [dict(self.labels, **stage.as_dict()) for stage in self.stages.values()]
+
+    def totals(self):
+        """
+        Returns the bytes read from the database (dump stage), the bytes
+        written (store stage, or dump when nothing was stored separately)
+        and the wall time so far.
+        """
+        with self._lock:
+            dump, store = self.stages.get("dump"), self.stages.get("store")
+            return {"bytes_in": dump.bytes_in if dump else 0,
+                    "bytes_out": store.bytes_out if store and store.bytes_out else (dump.bytes_out if dump else 0),
+                    "wall_seconds": round(time.time() - self.started, 3)}
+
+    def summary(self):
+        return dict(self.labels, stage="total", wall_seconds=round(time.time() - self.started, 3),
+                    peak_rss_bytes=peak_rss_bytes())
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _sample(name, labels, value):
+    rendered = ",".join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+    return f"{METRIC_PREFIX}_{name}{{{rendered}}} {value}"
+
+
+class MetricsRegistry:
+    """
+    Aggregates backup metrics of the scheduler daemon's jobs for Prometheus.
+
+    Keeps run counters per job and status, the last run's duration and
+    stage figures per job, and renders them in the OpenMetrics text format,
+    either into a file (for node_exporter's textfile collector) or over
+    HTTP on /metrics.
+
+    :param textfile: Path rewritten after every observed run, or None.
+    """
+
+    def __init__(self, textfile=None):
+        self.textfile = textfile
+        self.runs = {}
+        self.last = {}
+        self.stages = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def observe_stages(self, job, metrics):
+        """Stores the stage records of the latest run of job."""
+        with self._lock:
+            self.stages[job] = metrics.records()
+
+    def observe_run(self, job, status, seconds):
+        with self._lock:
+            self.runs[(job, status)] = self.runs.get((job, status), 0) + 1
+            last = self.last.setdefault(job, {})
+            last["duration"] = seconds
+            if status == "success":
+                last["success"] = time.time()
+        if self.textfile:
+            self.write_textfile(self.textfile)
+
+    def render(self):
+        """Returns the metrics in the OpenMetrics text format."""
+        with self._lock:
+            lines = [f"# TYPE {METRIC_PREFIX}_job_runs counter",
+                     f"# HELP {METRIC_PREFIX}_job_runs Finished backup runs by status."]
+            for (job, status), count in sorted(self.runs.items()):
+                lines.append(_sample("job_runs_total", {"job": job, "status": status}, count))
+            lines.append(f"# TYPE {METRIC_PREFIX}_job_last_duration_seconds gauge")
+            for job, last in sorted(self.last.items()):
+                lines.append(_sample("job_last_duration_seconds", {"job": job}, last["duration"]))
+            lines.append(f"# TYPE {METRIC_PREFIX}_job_last_success_timestamp_seconds gauge")
+            for job, last in sorted(self.last.items()):
+                if "success" in last:
+                    lines.append(_sample("job_last_success_timestamp_seconds", {"job": job}, round(last["success"], 3)))
+            for field, name, kind in (("wall_seconds", "stage_wall_seconds", "gauge"),
+                                      ("cpu_seconds", "stage_cpu_seconds", "gauge"),
+                                      ("bytes_in", "stage_bytes_in", "gauge"),
+                                      ("bytes_out", "stage_bytes_out", "gauge"),
+                                      ("ratio", "stage_ratio", "gauge")):
+                lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+                for job, records in sorted(self.stages.items()):
+                    for record in records:
+                        if record[field] is not None:
+                            lines.append(_sample(name, {"job": job, "stage": record["stage"]}, record[field]))
+        peak = peak_rss_bytes()
+        if peak is not None:
+            lines.append(f"# TYPE {METRIC_PREFIX}_process_peak_rss_bytes gauge")
+            lines.append(f"{METRIC_PREFIX}_process_peak_rss_bytes {peak}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """Writes render() to path atomically, so a scraper never reads a partial file."""
+        with open(path + ".part", "w") as f:
+            f.write(self.render())
+        os.replace(path + ".part", path)
+        return path
+
+    def serve(self, port, host=""):
+        """Serves the metrics on http://host:port/metrics from a background thread."""
+        # Only the scheduler daemon serves metrics; one-shot backups skip importing http.server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        return self._server.server_address[1]
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,442 @@
+import queue
+import subprocess
+import threading
+import time
+
+from utils.compression import NullCompressor, close_compressobj
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_QUEUE_DEPTH = 8
+
+_EOF = object()
+
+
+class _ProducerFailed:
+    def __init__(self, error):
+        self.error = error
+
+
+class StageStats:
+    """Byte counters, busy time and CPU time (of the stage's own thread) for one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+        self.cpu_seconds = 0.0
+
+    @property
+    def throughput(self):
+        """Input bytes per second of busy time."""
+        return self.bytes_in / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        return {
+            "stage": self.name,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "seconds": round(self.seconds, 6),
+            "cpu_seconds": round(self.cpu_seconds, 6),
+        }
+
+    def __repr__(self):
+        return f"StageStats({self.name!r}, in={self.bytes_in}, out={self.bytes_out}, seconds={self.seconds:.3f})"
+
+
+def iter_file(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields the contents of a file in chunks of at most chunk_size bytes."""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def iter_process(command, env=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Runs a command and yields its stdout in chunks.
+
+    :param command: Argument list passed to subprocess.Popen (no shell).
+    :param env: Optional environment for the child process.
+    :param chunk_size: Maximum size of each yielded chunk.
+    :raises RuntimeError: If the command exits with a non-zero status.
+    """
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    # Drain stderr concurrently so a chatty child cannot block on a full pipe
+    stderr_chunks = []
+    stderr_thread = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    stderr_thread.start()
+    finished = False
+    try:
+        while True:
+            chunk = process.stdout.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        finished = True
+    finally:
+        if not finished and process.poll() is None:
+            # Consumer stopped early; do not leave the dump running
+            process.kill()
+        process.stdout.close()
+        returncode = process.wait()
+        stderr_thread.join()
+    if returncode != 0:
+        stderr = b"".join(stderr_chunks).decode(errors="replace").strip()
+        raise RuntimeError(f"Failed to execute {command[0]} (exit code {returncode}): {stderr}")
+
+
+def feed_process(command, chunks, env=None):
+    """
+    Runs a command and writes chunks to its stdin.
+
+    :param command: Argument list passed to subprocess.Popen (no shell).
+    :param chunks: Iterable of bytes written to the command in order.
+    :param env: Optional environment for the child process.
+    :return: Number of bytes written.
+    :raises RuntimeError: If the command exits with a non-zero status.
+    """
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                               env=env)
+    stderr_chunks = []
+    stderr_thread = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    stderr_thread.start()
+    written = 0
+    finished = False
+    try:
+        for chunk in chunks:
+            process.stdin.write(chunk)
+            written += len(chunk)
+        finished = True
+    except BrokenPipeError:
+        # The command exited early; its exit status and stderr say why
+        finished = True
+    finally:
+        if not finished:
+            # The input failed; do not let the command act on a truncated stream
+            process.kill()
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = process.wait()
+        stderr_thread.join()
+    if returncode != 0:
+        stderr = b"".join(stderr_chunks).decode(errors="replace").strip()
+        raise RuntimeError(f"Failed to execute {command[0]} (exit code {returncode}): {stderr}")
+    return written
+
+
+def iter_prefetch(chunks, queue_depth=DEFAULT_QUEUE_DEPTH):
+    """
+    Runs an iterator in a background thread, keeping up to queue_depth items ready.
+
+    Lets reading and decompression overlap with a consumer that blocks on
+    the database, such as a restore.
+    """
+    source = PushSource(queue_depth=queue_depth)
+
+    def produce():
+        try:
+            for chunk in chunks:
+                source._put(chunk)
+            source._put(_EOF)
+        except BrokenPipeError:
+            pass
+        except BaseException as e:
+            source.fail(e)
+
+    thread = threading.Thread(target=produce, name="prefetch", daemon=True)
+    thread.start()
+    try:
+        yield from source
+    finally:
+        thread.join()
+
+
+class IterReader:
+    """
+    Read-only file-like object over an iterable of bytes chunks.
+
+    Used to hand a decompressed stream to APIs that read from a file, such
+    as psycopg2's copy_expert().
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+        self._position = 0
+        self.bytes_read = 0
+
+    def _fill(self):
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        # Only the unread tail is copied, so small reads from large chunks stay linear
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+        return True
+
+    def _take(self, end):
+        data = self._buffer[self._position:end]
+        self._position = end
+        self.bytes_read += len(data)
+        return data
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) - self._position < size:
+            if not self._fill():
+                break
+        if size < 0:
+            return self._take(len(self._buffer))
+        return self._take(min(self._position + size, len(self._buffer)))
+
+    def readline(self, size=-1):
+        while self._buffer.find(b"\n", self._position) < 0:
+            if not self._fill():
+                break
+        end = self._buffer.find(b"\n", self._position) + 1 or len(self._buffer)
+        if size >= 0:
+            end = min(end, self._position + size)
+        return self._take(end)
+
+
+class PushSource:
+    """
+    Pipeline source fed by a producer that writes instead of being read.
+
+    Producers such as psycopg2's copy_expert() call write() on a file-like
+    object. Writes are gathered into chunk_size pieces and handed to the
+    pipeline through a bounded queue, so a slow pipeline blocks the
+    producer. Call close() when the producer is done.
+
+    :raises BrokenPipeError: From write() once the pipeline stops reading.
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, queue_depth=DEFAULT_QUEUE_DEPTH):
+        self.chunk_size = chunk_size
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._buffer = bytearray()
+        self._abandoned = threading.Event()
+
+    def _put(self, item):
+        while not self._abandoned.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise BrokenPipeError("Backup pipeline stopped reading")
+
+    def write(self, data):
+        self._buffer += data
+        if len(self._buffer) >= self.chunk_size:
+            self._put(bytes(self._buffer))
+            self._buffer = bytearray()
+        return len(data)
+
+    def close(self):
+        if self._buffer:
+            self._put(bytes(self._buffer))
+            self._buffer = bytearray()
+        self._put(_EOF)
+
+    def fail(self, error):
+        """Makes the pipeline fail with error instead of committing a truncated stream."""
+        self._buffer = bytearray()
+        try:
+            self._put(_ProducerFailed(error))
+        except BrokenPipeError:
+            pass
+
+    def __iter__(self):
+        try:
+            while True:
+                chunk = self._queue.get()
+                if chunk is _EOF:
+                    return
+                if isinstance(chunk, _ProducerFailed):
+                    raise chunk.error
+                yield chunk
+        finally:
+            self._abandoned.set()
+
+
+class StreamingPipeline:
+    """
+    Streams a backup from a source through a compressor into a storage sink.
+
+    Each stage runs in its own thread and stages are connected by bounded
+    queues, so a slow sink blocks the compressor, which in turn blocks the
+    source. At most ``2 * queue_depth`` chunks are held in memory.
+
+    :param source: Iterable yielding bytes chunks (e.g. iter_process()).
+    :param sink: Object with write(data), commit() and abort() methods.
+    :param compressor: Compressor providing compressobj(); defaults to none.
+    :param queue_depth: Maximum number of chunks buffered between stages.
+    """
+
+    def __init__(self, source, sink, compressor=None, queue_depth=DEFAULT_QUEUE_DEPTH):
+        self.source = source
+        self.sink = sink
+        self.compressor = compressor or NullCompressor()
+        self.queue_depth = queue_depth
+        self.stats = {
+            "dump": StageStats("dump"),
+            "compress": StageStats("compress"),
+            "store": StageStats("store"),
+        }
+        self._failed = threading.Event()
+        self._errors = []
+
+    def _put(self, q, item):
+        while not self._failed.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._failed.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _EOF
+
+    def _fail(self, error):
+        self._errors.append(error)
+        self._failed.set()
+
+    def _read_source(self, out_queue):
+        stats = self.stats["dump"]
+        iterator = None
+        try:
+            iterator = iter(self.source)
+            while True:
+                started, cpu = time.perf_counter(), time.thread_time()
+                chunk = next(iterator, _EOF)
+                stats.seconds += time.perf_counter() - started
+                stats.cpu_seconds += time.thread_time() - cpu
+                if chunk is _EOF:
+                    break
+                stats.bytes_in += len(chunk)
+                stats.bytes_out += len(chunk)
+                if not self._put(out_queue, chunk):
+                    return
+            self._put(out_queue, _EOF)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    def _compress(self, in_queue, out_queue):
+        stats = self.stats["compress"]
+        compressobj = None
+        try:
+            compressobj = self.compressor.compressobj()
+            while True:
+                chunk = self._get(in_queue)
+                if chunk is _EOF:
+                    break
+                started, cpu = time.perf_counter(), time.thread_time()
+                data = compressobj.compress(chunk)
+                stats.seconds += time.perf_counter() - started
+                stats.cpu_seconds += time.thread_time() - cpu
+                stats.bytes_in += len(chunk)
+                if data:
+                    stats.bytes_out += len(data)
+                    if not self._put(out_queue, data):
+                        return
+            if self._failed.is_set():
+                return
+            started, cpu = time.perf_counter(), time.thread_time()
+            data = compressobj.flush()
+            stats.seconds += time.perf_counter() - started
+            stats.cpu_seconds += time.thread_time() - cpu
+            if data:
+                stats.bytes_out += len(data)
+                self._put(out_queue, data)
+            self._put(out_queue, _EOF)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            # A failed or stopped pipeline never reaches flush(), which would stop the compression threads
+            close_compressobj(compressobj)
+
+    def run(self):
+        """
+        Runs the pipeline to completion.
+
+        :return: The value returned by sink.commit() (usually the stored path).
+        :raises RuntimeError: If any stage fails; the sink is aborted first.
+        """
+        raw_queue = queue.Queue(maxsize=self.queue_depth)
+        compressed_queue = queue.Queue(maxsize=self.queue_depth)
+        threads = [
+            threading.Thread(target=self._read_source, args=(raw_queue,), daemon=True),
+            threading.Thread(target=self._compress, args=(raw_queue, compressed_queue), daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+
+        stats = self.stats["store"]
+        try:
+            while True:
+                data = self._get(compressed_queue)
+                if data is _EOF:
+                    break
+                started, cpu = time.perf_counter(), time.thread_time()
+                self.sink.write(data)
+                stats.seconds += time.perf_counter() - started
+                stats.cpu_seconds += time.thread_time() - cpu
+                stats.bytes_in += len(data)
+                stats.bytes_out += len(data)
+        except Exception as e:
+            self._fail(e)
+
+        for thread in threads:
+            thread.join()
+
+        if self._errors:
+            self.sink.abort()
+            raise RuntimeError(f"Backup pipeline failed: {self._errors[0]}") from self._errors[0]
+        # Committing can wait on buffered work (e.g. uploads still in flight), so it counts as storing
+        started, cpu = time.perf_counter(), time.thread_time()
+        result = self.sink.commit()
+        stats.seconds += time.perf_counter() - started
+        stats.cpu_seconds += time.thread_time() - cpu
+        return result
+
+    def run_in_thread(self):
+        """
+        Starts run() in a background thread.
+
+        Used with PushSource, where the calling thread is busy producing.
+
+        :return: Function that waits for the pipeline and returns or raises
+            what run() did.
+        """
+        outcome = {}
+
+        def target():
+            try:
+                outcome["result"] = self.run()
+            except BaseException as e:
+                outcome["error"] = e
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+
+        def wait():
+            thread.join()
+            if "error" in outcome:
+                raise outcome["error"]
+            return outcome["result"]
+
+        return wait
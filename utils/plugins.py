@@ -0,0 +1,87 @@
+import importlib
+
+
+class PluginRegistry:
+    """
+    Resolves connectors, backup services and storages by name, importing
+    their modules on first use.
+
+    Entries are ``"module:attribute"`` references, so registering one costs
+    nothing and a SQLite backup never imports pymysql or psycopg2. Other
+    packages can add entries with register().
+
+    :param kind: What the registry holds, used in error messages.
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self._references = {}
+        self._requires = {}
+        self._loaded = {}
+
+    def register(self, name, reference, requires=None):
+        """
+        Registers a plugin.
+
+        :param reference: ``"module:attribute"``, or the object itself.
+        :param requires: Third-party package the module needs, named in the
+            error raised when it is not installed.
+        """
+        self._references[name] = reference
+        self._requires[name] = requires
+        self._loaded.pop(name, None)
+
+    def names(self):
+        return sorted(self._references)
+
+    def __contains__(self, name):
+        return name in self._references
+
+    def load(self, name):
+        """
+        Returns the plugin registered as name, importing its module if needed.
+
+        :raises ValueError: If nothing is registered as name.
+        :raises ImportError: If the plugin's driver package is not installed.
+        """
+        if name in self._loaded:
+            return self._loaded[name]
+        if name not in self._references:
+            raise ValueError(f"Unsupported {self.kind}: {name}")
+        reference = self._references[name]
+        if isinstance(reference, str):
+            module_name, _, attribute = reference.partition(":")
+            try:
+                module = importlib.import_module(module_name)
+            except ImportError as e:
+                requires = self._requires[name]
+                if requires is None or e.name not in (requires, requires.split(".")[0]):
+                    raise
+                raise ImportError(f"The {name} {self.kind} requires the '{requires}' package") from e
+            reference = getattr(module, attribute)
+        self._loaded[name] = reference
+        return reference
+
+
+CONNECTORS = PluginRegistry("database type")
+CONNECTORS.register("sqlite", "db_connectors.sqlite_connector:SQLiteConnector")
+CONNECTORS.register("mysql", "db_connectors.mysql_connector:MySQLConnector", requires="pymysql")
+CONNECTORS.register("postgresql", "db_connectors.postgresql_connector:PostgreSQLConnector", requires="psycopg2")
+
+BACKUP_SERVICES = PluginRegistry("backup service")
+BACKUP_SERVICES.register("sqlite", "backup_services.sqlite_backup:SQLiteBackup")
+BACKUP_SERVICES.register("sqlite-incremental", "backup_services.incremental_backup:SQLiteIncrementalBackup")
+BACKUP_SERVICES.register("sqlite-wal", "backup_services.wal_archive:SQLiteWALArchiver")
+BACKUP_SERVICES.register("dump", "backup_services.full_backup:FullBackup")
+BACKUP_SERVICES.register("parallel-dump", "backup_services.parallel_dump:ParallelDump")
+BACKUP_SERVICES.register("mysql-table-export", "backup_services.mysql_export:MySQLTableExporter")
+BACKUP_SERVICES.register("mysql-binlog", "backup_services.wal_archive:MySQLBinlogArchiver")
+BACKUP_SERVICES.register("postgresql-copy", "backup_services.postgresql_copy_export:PostgreSQLCopyExport")
+BACKUP_SERVICES.register("postgresql-base", "backup_services.wal_archive:PostgreSQLBaseBackup")
+BACKUP_SERVICES.register("postgresql-wal", "backup_services.wal_archive:PostgreSQLWALArchiver")
+
+STORAGES = PluginRegistry("storage")
+STORAGES.register("local", "storages.local_storage:LocalStorage")
+# GCS is reached through its S3-compatible XML API
+STORAGES.register("s3", "storages.s3_storage:S3Storage")
+STORAGES.register("gcs", "storages.s3_storage:S3Storage")
@@ -0,0 +1,418 @@
+import argparse
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from db_connectors.pool import ConnectionPool
+from utils.metrics import BackupMetrics, MetricsRegistry
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_PER_HOST = 1
+DEFAULT_POLL_INTERVAL = 30.0
+
+CRON_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+    "@yearly": "0 0 1 1 *",
+}
+# minute, hour, day of month, month, day of week (0 = Sunday; 7 is accepted as well)
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_cron_field(field, low, high):
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step = part.split("/", 1)
+            step = int(step)
+            if step < 1:
+                raise ValueError(f"Invalid cron step: {step}")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(value) for value in part.split("-", 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end:
+            raise ValueError(f"Cron value out of range {low}-{high}: {part}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """
+    Five-field cron expression (minute hour day month weekday).
+
+    Supports ``*``, lists, ranges, steps and the usual ``@daily`` style
+    aliases. As in cron, when both day of month and day of week are
+    restricted a day matching either one is due.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        fields = CRON_ALIASES.get(expression, expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression}")
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_cron_field(field, low, high) for field, (low, high) in zip(fields, CRON_FIELDS)
+        )
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        # Python counts Monday as 0, cron counts Sunday as 0
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment):
+        """Returns the first due minute strictly after moment."""
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression never matches: {self.expression}")
+
+
+class ScheduledJob:
+    """
+    One backup target and its schedule.
+
+    :param name: Unique job name; it keys the persisted state.
+    :param schedule: Cron expression.
+    :param options: Backup options, named like main.py's command-line flags
+        (e.g. {"db_type": "sqlite", "db_path": "app.db", "output_dir": "backups"}).
+    :param jitter: Maximum random delay in seconds added to each run; None
+        uses the scheduler default.
+    """
+
+    def __init__(self, name, schedule, options, jitter=None):
+        self.name = name
+        self.schedule = CronSchedule(schedule)
+        self.options = options
+        self.jitter = jitter
+
+    @property
+    def host(self):
+        """
+        Key used for the per-host concurrency limit.
+
+        SQLite jobs are keyed by their database file, so backups of
+        different files run concurrently while two jobs of one file do not.
+        """
+        if self.options.get("db_type") == "sqlite":
+            return "sqlite:" + os.path.abspath(self.options.get("db_path") or "")
+        return self.options.get("host") or "localhost"
+
+    @classmethod
+    def from_config(cls, config):
+        config = dict(config)
+        return cls(config.pop("name"), config.pop("schedule"), config.pop("options", {}), config.pop("jitter", None))
+
+
+def job_arguments(options, log_file=None):
+    """Turns a job's options into main.py command-line arguments."""
+    argv = []
+    for key, value in options.items():
+        flag = "--" + key.replace("_", "-")
+        if value is True:
+            argv.append(flag)
+        elif isinstance(value, list):
+            # Repeatable flags such as --notify-webhook
+            for item in value:
+                argv.extend([flag, str(item)])
+        elif value not in (None, False):
+            argv.extend([flag, str(value)])
+    if log_file and "log_file" not in options:
+        argv.extend(["--log-file", log_file])
+    return argv
+
+
+def run_backup_job(job, log_file=None, pool=None, registry=None):
+    """
+    Default job runner: runs the backup in-process through controllers.backup.
+
+    Events go to the job's own --notify-* sinks (notify_webhook, notify_slack
+    and notify_file options), published under the job's name.
+
+    :param pool: Optional ConnectionPool shared by all jobs.
+    :param registry: Optional MetricsRegistry receiving the run's stage metrics.
+    :return: Path of the backup.
+    """
+    from controllers.backup import run_backup
+    from controllers.notifications import start_notifications, stop_notifications
+    from main import build_parser
+
+    args = build_parser().parse_args(job_arguments(job.options, log_file or os.devnull))
+    metrics = BackupMetrics({"job": job.name, "db_type": args.db_type})
+    events, dispatcher = start_notifications(args)
+    try:
+        backup_path = run_backup(args, pool=pool, metrics=metrics, events=events, job=job.name)
+    finally:
+        stop_notifications(args, dispatcher)
+        if registry is not None:
+            registry.observe_stages(job.name, metrics)
+    if backup_path is None:
+        raise RuntimeError(f"Backup job {job.name} failed")
+    return backup_path
+
+
+class BackupScheduler:
+    """
+    Long-running scheduler that runs many backup jobs in one process.
+
+    Jobs run on a shared thread pool, limited to max_workers at once and to
+    per_host at once against the same database host. Each run is delayed by
+    a random jitter so jobs sharing a schedule do not all hit the servers
+    at the same second.
+
+    Queued runs and the last scheduled time of every job are persisted to
+    state_path. After a restart, runs that were queued or in progress are
+    run again, and a job whose schedule passed while the daemon was down
+    gets one catch-up run (missed runs are coalesced, not replayed).
+
+    :param jobs: ScheduledJob instances.
+    :param state_path: JSON file holding the persisted queue.
+    :param max_workers: Global concurrency limit.
+    :param per_host: Concurrency limit per database host.
+    :param jitter: Default maximum jitter in seconds.
+    :param catch_up: Run missed schedules after a restart.
+    :param runner: Callable taking a ScheduledJob; defaults to run_backup_job.
+    :param registry: Optional MetricsRegistry counting runs and their durations.
+    """
+
+    def __init__(self, jobs, state_path, max_workers=DEFAULT_MAX_WORKERS, per_host=DEFAULT_PER_HOST, jitter=0,
+                 catch_up=True, runner=None, registry=None):
+        self.jobs = {job.name: job for job in jobs}
+        if len(self.jobs) != len(jobs):
+            raise ValueError("Job names must be unique")
+        self.state_path = state_path
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.jitter = jitter
+        self.catch_up = catch_up
+        self.runner = runner or run_backup_job
+        self.registry = registry
+        self.executor = None
+        self.running = {}
+        self.host_counts = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.state = self._load_state()
+
+    def _load_state(self):
+        state = {"jobs": {}, "queue": []}
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                state.update(json.load(f))
+        # Drop queued runs of jobs that were removed from the configuration
+        state["queue"] = [entry for entry in state["queue"] if entry["job"] in self.jobs]
+        return state
+
+    def _save_state(self):
+        temp_path = self.state_path + ".part"
+        with open(temp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(temp_path, self.state_path)
+
+    def _enqueue_due(self, now):
+        changed = False
+        queued = {entry["job"] for entry in self.state["queue"]}
+        for job in self.jobs.values():
+            job_state = self.state["jobs"].setdefault(job.name, {})
+            last = job_state.get("last_scheduled")
+            if last is None:
+                # A new job starts with its next scheduled run, not a catch-up
+                job_state["last_scheduled"] = now.isoformat(timespec="seconds")
+                changed = True
+                continue
+            due = job.schedule.next_after(datetime.fromisoformat(last))
+            if due > now:
+                continue
+            if not self.catch_up:
+                # Skip whatever was missed and only run a schedule that is due right now
+                latest = due
+                while True:
+                    following = job.schedule.next_after(latest)
+                    if following > now:
+                        break
+                    latest = following
+                if now - latest >= timedelta(minutes=1):
+                    job_state["last_scheduled"] = latest.isoformat(timespec="seconds")
+                    changed = True
+                    continue
+            job_state["last_scheduled"] = now.isoformat(timespec="seconds")
+            changed = True
+            if job.name in queued:
+                continue
+            jitter = self.jitter if job.jitter is None else job.jitter
+            not_before = now + timedelta(seconds=random.uniform(0, jitter))
+            self.state["queue"].append({
+                "job": job.name,
+                "scheduled": due.isoformat(timespec="seconds"),
+                "not_before": not_before.isoformat(timespec="seconds"),
+            })
+        return changed
+
+    def _dispatch(self, now):
+        """Starts queued runs whose jitter has elapsed, within the concurrency limits."""
+        for entry in self.state["queue"]:
+            if len(self.running) >= self.max_workers:
+                break
+            job = self.jobs[entry["job"]]
+            if job.name in self.running or datetime.fromisoformat(entry["not_before"]) > now:
+                continue
+            if self.host_counts.get(job.host, 0) >= self.per_host:
+                continue
+            self.host_counts[job.host] = self.host_counts.get(job.host, 0) + 1
+            self.running[job.name] = self.executor.submit(self._run, job, entry)
+
+    def _run(self, job, entry):
+        started = time.perf_counter()
+        status = "success"
+        try:
+            logger.info("Backup job %s started", job.name)
+            self.runner(job)
+        except Exception as e:
+            status = "failed"
+            logger.error("Backup job %s failed: %s", job.name, e)
+        seconds = round(time.perf_counter() - started, 3)
+        with self.lock:
+            self.state["queue"].remove(entry)
+            self.state["jobs"][job.name].update({
+                "last_finished": datetime.now().isoformat(timespec="seconds"),
+                "last_status": status,
+                "last_seconds": seconds,
+            })
+            self.host_counts[job.host] -= 1
+            del self.running[job.name]
+            self._save_state()
+        if self.registry is not None:
+            self.registry.observe_run(job.name, status, seconds)
+        logger.info("Backup job %s finished: %s in %.1fs", job.name, status, seconds)
+        self.wakeup.set()
+
+    def tick(self, now=None):
+        """Queues due runs and starts whatever the limits allow."""
+        now = now or datetime.now()
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="backup-job")
+            if self._enqueue_due(now):
+                self._save_state()
+            self._dispatch(now)
+
+    def run_forever(self, poll_interval=DEFAULT_POLL_INTERVAL):
+        """Runs until stop() is called, then waits for running jobs to finish."""
+        try:
+            while not self.stopped.is_set():
+                self.tick()
+                # Finished jobs wake the loop early so queued runs start without waiting a full interval
+                self.wakeup.wait(poll_interval)
+                self.wakeup.clear()
+        finally:
+            self.shutdown()
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+
+    def shutdown(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+
+
+def load_config(path):
+    """
+    Reads a scheduler configuration file::
+
+        {
+            "state_file": "scheduler-state.json",
+            "max_workers": 8,
+            "per_host": 2,
+            "jitter": 300,
+            "metrics_file": "/var/lib/node_exporter/dbbackup.prom",
+            "metrics_port": 9464,
+            "jobs": [
+                {"name": "app", "schedule": "0 2 * * *",
+                 "options": {"db_type": "sqlite", "db_path": "app.db", "output_dir": "backups"}}
+            ]
+        }
+    """
+    with open(path) as f:
+        config = json.load(f)
+    config["jobs"] = [ScheduledJob.from_config(job) for job in config.get("jobs", [])]
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Database backup scheduler daemon")
+    parser.add_argument("--config", required=True, help="JSON scheduler configuration")
+    parser.add_argument("--log-file", help="Log file path")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="Seconds between schedule checks")
+    parser.add_argument("--metrics-file", help="Write OpenMetrics text to this file after every run")
+    parser.add_argument("--metrics-port", type=int, help="Serve OpenMetrics on this port at /metrics")
+    args = parser.parse_args()
+
+    logging.basicConfig(filename=args.log_file, level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    config = load_config(args.config)
+    log_file = args.log_file or config.get("log_file")
+    per_host = config.get("per_host", DEFAULT_PER_HOST)
+    # Jobs on the same host reuse connections instead of paying a handshake each. per_host limits jobs, the
+    # pool limits connections: a parallel job holds one connection plus one per worker
+    connections = max([1 + (job.options.get("workers") or 0) for job in config["jobs"]] or [1])
+    pool = ConnectionPool(max_per_host=per_host * connections)
+    registry = MetricsRegistry(textfile=args.metrics_file or config.get("metrics_file"))
+    metrics_port = args.metrics_port or config.get("metrics_port")
+    if metrics_port:
+        registry.serve(metrics_port)
+        logger.info("Serving metrics on port %d", metrics_port)
+    scheduler = BackupScheduler(
+        config["jobs"],
+        config.get("state_file", os.path.splitext(args.config)[0] + "-state.json"),
+        max_workers=config.get("max_workers", DEFAULT_MAX_WORKERS),
+        per_host=per_host,
+        jitter=config.get("jitter", 0),
+        catch_up=config.get("catch_up", True),
+        runner=lambda job: run_backup_job(job, log_file, pool, registry),
+        registry=registry,
+    )
+    try:
+        scheduler.run_forever(args.poll_interval)
+    except KeyboardInterrupt:
+        scheduler.stop()
+    finally:
+        logger.info("Connection pool: %s", pool.stats())
+        pool.close()
+        registry.close()
+
+
+if __name__ == "__main__":
+    main()
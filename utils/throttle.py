@@ -0,0 +1,222 @@
+import logging
+import threading
+import time
+
+DEFAULT_POLL_INTERVAL = 5.0
+DEFAULT_BUSY_THRESHOLD = 8
+DEFAULT_MIN_FACTOR = 0.1
+# PostgreSQL sessions of the backup (connectors and pg_dump) carry this
+# application_name, so that LoadMonitor does not count them as server load
+APPLICATION_NAME = "dbbackup"
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    Tokens accrue at rate per second up to burst. consume() takes tokens
+    and, when the bucket runs dry, sleeps until the debt is paid back, so
+    requests larger than the burst are allowed but still paced.
+
+    :param rate: Tokens per second.
+    :param burst: Bucket capacity; defaults to one second of tokens.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst or rate
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def consume(self, amount, factor=1.0):
+        """
+        Takes amount tokens, sleeping as needed.
+
+        :param factor: Scales the refill rate, e.g. 0.5 halves the throughput.
+        :return: Seconds slept.
+        """
+        with self._lock:
+            now = self._clock()
+            rate = self.rate * factor
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * rate)
+            self._updated = now
+            self._tokens -= amount
+            wait = -self._tokens / rate if self._tokens < 0 else 0.0
+        # Sleeping outside the lock lets other threads queue up their own debt
+        if wait:
+            self._sleep(wait)
+        return wait
+
+
+class LoadMonitor:
+    """
+    Polls a MySQL or PostgreSQL server for its load and derives a speed factor.
+
+    A separate connection is opened from the connector's parameters so
+    polling never interferes with the dump's own connection. The load is
+    the number of sessions running a query, not counting the backup's own:
+    ``pg_stat_activity`` rows in state ``active`` without the backup's
+    application_name (APPLICATION_NAME), or MySQL's ``Threads_running``
+    less the monitor and the backup's sessions, which MySQL cannot tell
+    apart from other clients there. While it exceeds
+    busy_threshold the factor is halved on every poll, down to min_factor;
+    once the server is quiet again it recovers by a quarter of full speed
+    per poll.
+
+    :param connector: MySQLConnector or PostgreSQLConnector of the backed-up database.
+    :param busy_threshold: Load above which the backup slows down.
+    :param interval: Seconds between polls.
+    :param min_factor: Lowest speed factor.
+    :param sessions: Number of MySQL connections the backup runs queries on
+        (e.g. the workers of a parallel dump).
+    """
+
+    def __init__(self, connector, busy_threshold=DEFAULT_BUSY_THRESHOLD, interval=DEFAULT_POLL_INTERVAL,
+                 min_factor=DEFAULT_MIN_FACTOR, sessions=1):
+        name = type(connector).__name__
+        if name.startswith("MySQL"):
+            self.query = "SHOW GLOBAL STATUS LIKE 'Threads_running'"
+            self.params = None
+        elif name.startswith("PostgreSQL"):
+            self.query = ("SELECT count(*) FROM pg_stat_activity WHERE state = 'active' AND pid <> pg_backend_pid() "
+                          "AND application_name IS DISTINCT FROM %s")
+            self.params = (APPLICATION_NAME,)
+        else:
+            raise ValueError(f"Load monitoring is not supported for {name}")
+        self.connector = connector
+        self.busy_threshold = busy_threshold
+        self.interval = interval
+        self.min_factor = min_factor
+        self.sessions = sessions
+        self.factor = 1.0
+        self.load = None
+        self._monitor = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _read_load(self):
+        cursor = self._monitor.connection.cursor()
+        try:
+            cursor.execute(self.query, self.params)
+            value = cursor.fetchone()[-1]
+        finally:
+            cursor.close()
+        if self.query.startswith("SHOW"):
+            # Threads_running includes the monitoring connection itself and the backup's sessions
+            return max(0, int(value) - 1 - self.sessions)
+        self._monitor.connection.rollback()
+        return int(value)
+
+    def poll(self):
+        """Reads the current load once and updates the factor."""
+        self.load = self._read_load()
+        if self.load > self.busy_threshold:
+            factor = max(self.min_factor, self.factor / 2)
+        else:
+            factor = min(1.0, self.factor + 0.25)
+        if factor != self.factor:
+            logger.info("Server load %d (threshold %d): backup speed factor %.2f", self.load, self.busy_threshold,
+                        factor)
+        self.factor = factor
+        return factor
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                # A failed poll must not fail the backup; keep the last factor
+                logger.warning("Load poll failed: %s", e)
+
+    def start(self):
+        connector = self.connector
+        self._monitor = type(connector)(connector.host, connector.port, connector.user, connector.password,
+                                        connector.database)
+        if not self._monitor.connect():
+            raise RuntimeError("Failed to open the load monitoring connection")
+        self.poll()
+        self._thread = threading.Thread(target=self._run, name="load-monitor", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._monitor is not None:
+            self._monitor.disconnect()
+            self._monitor = None
+
+
+class Throttle:
+    """
+    Rate limiter for the backup stages: dump output, SQLite page copy and uploads.
+
+    Limits bytes per second and operations (chunks read, SQLite pages,
+    upload parts) per second with token buckets. With a LoadMonitor, both
+    rates are scaled by its speed factor; without a byte rate the factor
+    instead inserts pauses so that the stage only works for that fraction
+    of the time.
+
+    A Throttle is thread-safe and one instance can be shared by the
+    workers of a parallel dump, which then share its limits.
+
+    :param bytes_per_second: Byte rate limit, or None.
+    :param ops_per_second: Operation rate limit, or None.
+    :param monitor: Optional started LoadMonitor.
+    """
+
+    def __init__(self, bytes_per_second=None, ops_per_second=None, monitor=None, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.bytes = TokenBucket(bytes_per_second, clock=clock, sleep=sleep) if bytes_per_second else None
+        self.ops = TokenBucket(ops_per_second, clock=clock, sleep=sleep) if ops_per_second else None
+        self.monitor = monitor
+        self.stats = {"bytes": 0, "ops": 0, "waited": 0.0}
+        self._clock = clock
+        self._sleep = sleep
+        # End of each thread's last pause; every worker paces its own work
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def factor(self):
+        return self.monitor.factor if self.monitor is not None else 1.0
+
+    def throttle(self, nbytes, ops=1):
+        """Accounts for nbytes and ops just processed, sleeping as the limits require."""
+        factor = self.factor
+        waited = 0.0
+        if self.bytes is not None:
+            waited += self.bytes.consume(nbytes, factor)
+        else:
+            waited += self._duty_cycle(factor)
+        if self.ops is not None:
+            waited += self.ops.consume(ops, factor)
+        with self._lock:
+            self.stats["bytes"] += nbytes
+            self.stats["ops"] += ops
+            self.stats["waited"] += waited
+
+    def _duty_cycle(self, factor):
+        # Pause so that this thread's working time is factor of the total
+        last = getattr(self._local, "last", None)
+        busy = self._clock() - last if last is not None else 0.0
+        pause = busy * (1.0 / factor - 1.0) if factor < 1.0 else 0.0
+        if pause:
+            self._sleep(pause)
+        self._local.last = self._clock()
+        return pause
+
+    def iter_chunks(self, chunks):
+        """Wraps a pipeline source; each chunk counts as one operation."""
+        for chunk in chunks:
+            self.throttle(len(chunk))
+            yield chunk